@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+"""
+Compares preprocessing of every datachunk separately with preprocessing of the whole day before slicing.
+
+Run with ``python benchmarks/datachunk_preprocessing.py``.
+"""
+
+import argparse
+import datetime
+import time
+
+import numpy as np
+import obspy
+from loguru import logger
+
+from noiz.models.processing_params import DatachunkParams
+from noiz.models.timespan import Timespan
+from noiz.processing.datachunk import prepare_datachunk_streams
+
+
+def _prepare_day(sampling_rate: float, hours: float) -> obspy.Stream:
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal(int(hours * 3600 * sampling_rate))
+    header = {"sampling_rate": sampling_rate, "starttime": obspy.UTCDateTime(2020, 1, 1)}
+    return obspy.Stream([obspy.Trace(data=data, header=header)])
+
+
+def _prepare_timespans(hours: float, length_minutes: int, step_minutes: int):
+    day_start = datetime.datetime(2020, 1, 1)
+    length = datetime.timedelta(minutes=length_minutes)
+    step = datetime.timedelta(minutes=step_minutes)
+    timespans = []
+    starttime = day_start
+    while starttime + length <= day_start + datetime.timedelta(hours=hours):
+        timespans.append(Timespan(starttime=starttime, midtime=starttime + length / 2, endtime=starttime + length))
+        starttime += step
+    return timespans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sampling_rate", type=float, default=100.0)
+    parser.add_argument("--target_sampling_rate", type=float, default=25.0)
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--timespan_minutes", type=int, default=30)
+    parser.add_argument("--step_minutes", type=int, default=15)
+    args = parser.parse_args()
+
+    logger.remove()
+    timespans = _prepare_timespans(
+        hours=args.hours, length_minutes=args.timespan_minutes, step_minutes=args.step_minutes
+    )
+    print(f"{len(timespans)} timespans of {args.timespan_minutes} min every {args.step_minutes} min")
+
+    for mode in ("per_datachunk", "whole_day"):
+        params = DatachunkParams(
+            sampling_rate=args.target_sampling_rate,
+            prefiltering_low=0.01,
+            prefiltering_high=args.target_sampling_rate / 2 * 0.9,
+            remove_response=False,
+            response_constant_coefficient=None,
+            preprocessing_mode=mode,
+        )
+        st = _prepare_day(sampling_rate=args.sampling_rate, hours=args.hours)
+
+        start = time.perf_counter()
+        count = sum(
+            1
+            for _ in prepare_datachunk_streams(
+                st=st,
+                timespans=timespans,
+                inventory=None,  # type: ignore
+                processing_params=params,
+                original_samplerate=args.sampling_rate,
+            )
+        )
+        elapsed = time.perf_counter() - start
+        print(f"{mode:>14}: {count} datachunks in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+"""
+Compares reading of a single channel from a multiplexed day file by decoding the whole file with reading
+only the section of that channel, as indexed by mseedindex, and with reading only the records of a single timespan.
+
+Run with ``python benchmarks/miniseed_byte_range.py``.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import obspy
+from obspy.io.mseed.util import get_record_information
+
+from noiz.processing.miniseed_helpers import read_miniseed_byte_range
+
+
+def _write_multiplexed_day(path: Path, channels: int, sampling_rate: float, hours: float) -> None:
+    rng = np.random.default_rng(0)
+    npts = int(hours * 3600 * sampling_rate)
+    traces = []
+    for i in range(channels):
+        data = np.cumsum(rng.integers(-50, 50, npts)).astype(np.int32)
+        header = {
+            "network": "XX",
+            "station": "AA",
+            "location": f"{i // 3:02d}",
+            "channel": "HH" + "ZNE"[i % 3],
+            "sampling_rate": sampling_rate,
+            "starttime": obspy.UTCDateTime(2020, 1, 1),
+        }
+        traces.append(obspy.Trace(data=data, header=header))
+    obspy.Stream(traces).write(str(path), format="MSEED", reclen=4096, encoding="STEIM2")
+
+
+def _index_sections(path: Path, timeindex_seconds: float) -> dict:
+    sections: dict = {}
+    offset = 0
+    filesize = path.stat().st_size
+    while offset < filesize:
+        info = get_record_information(str(path), offset)
+        seed_id = f"{info['network']}.{info['station']}.{info['location']}.{info['channel']}"
+        section = sections.setdefault(seed_id, {"byteoffset": offset, "bytes": 0, "timeindex": {}, "next": None})
+        record_start = info["starttime"].timestamp
+        if section["next"] is None or record_start >= section["next"]:
+            section["timeindex"][f"{record_start:.6f}"] = str(offset)
+            section["next"] = record_start - record_start % timeindex_seconds + timeindex_seconds
+        section["bytes"] += info["record_length"]
+        offset += info["record_length"]
+    return sections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--channels", type=int, default=12)
+    parser.add_argument("--sampling_rate", type=float, default=100.0)
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--timespan_minutes", type=float, default=30.0)
+    parser.add_argument("--timeindex_seconds", type=float, default=600.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir).joinpath("multiplexed.mseed")
+        _write_multiplexed_day(path=path, channels=args.channels, sampling_rate=args.sampling_rate, hours=args.hours)
+        sections = _index_sections(path=path, timeindex_seconds=args.timeindex_seconds)
+        seed_id = sorted(sections)[len(sections) // 2]
+        section = sections[seed_id]
+        print(f"{args.channels} channels, {path.stat().st_size / 1e6:.1f} MB file, reading {seed_id}")
+
+        timespan_start = obspy.UTCDateTime(2020, 1, 1) + args.hours * 3600 / 2
+        timespan_end = timespan_start + args.timespan_minutes * 60
+
+        def full_read():
+            start = time.perf_counter()
+            st = obspy.read(str(path), format="MSEED").select(id=seed_id)
+            return st, path.stat().st_size, time.perf_counter() - start
+
+        def section_read():
+            st, stats = read_miniseed_byte_range(
+                filename=path, byteoffset=section["byteoffset"], nbytes=section["bytes"], seed_id=seed_id
+            )
+            return st, stats.bytes_read, stats.decode_time
+
+        def timespan_read():
+            st, stats = read_miniseed_byte_range(
+                filename=path,
+                byteoffset=section["byteoffset"],
+                nbytes=section["bytes"],
+                seed_id=seed_id,
+                starttime=timespan_start,
+                endtime=timespan_end,
+                timeindex=section["timeindex"],
+            )
+            return st, stats.bytes_read, stats.decode_time
+
+        reference = full_read()[0]
+        readers = (("whole file", full_read), ("channel section", section_read), ("timespan", timespan_read))
+        for name, reader in readers:
+            results = [reader() for _ in range(args.repeats)]
+            st, bytes_read, _ = results[0]
+            decode_time = min(x[2] for x in results)
+            expected = reference.slice(timespan_start, timespan_end)[0].data
+            assert np.array_equal(expected, st.slice(timespan_start, timespan_end)[0].data)
+            print(f"{name:<16} {bytes_read / 1e6:8.2f} MB read {decode_time * 1e3:9.1f} ms decode")
+
+
+if __name__ == "__main__":
+    main()
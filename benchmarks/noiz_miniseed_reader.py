@@ -0,0 +1,92 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+"""
+Compares decoding of datachunk files with :py:func:`obspy.read` and with the fast path reader of MiniSEED
+written by noiz, for samples stored as float64 and as float32.
+
+Every configuration writes the same number of chunks of white noise, as noiz writes datachunks of a component-day,
+and reads all of them back. Files are read once before timing, so they are served from the page cache
+and the reported throughput is the decoding throughput.
+
+Run with ``python benchmarks/noiz_miniseed_reader.py``.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import obspy
+
+from noiz.processing.miniseed_helpers import read_noiz_miniseed
+
+
+def _write_chunks(directory: Path, chunks: int, npts: int, sampling_rate: float, dtype: str) -> list:
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(chunks):
+        header = {
+            "network": "XX",
+            "station": "AA",
+            "channel": "HHZ",
+            "sampling_rate": sampling_rate,
+            "starttime": obspy.UTCDateTime(2020, 1, 1) + i * npts / sampling_rate,
+        }
+        path = directory.joinpath(f"chunk_{dtype}_{i}.mseed")
+        obspy.Trace(data=rng.standard_normal(npts).astype(dtype), header=header).write(str(path), format="mseed")
+        paths.append(path)
+    return paths
+
+
+def _time_reader(reader, paths: list, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for path in paths:
+            reader(path)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=96)
+    parser.add_argument("--sampling_rate", type=float, default=25.0)
+    parser.add_argument("--chunk_minutes", type=float, default=30.0)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    npts = int(args.chunk_minutes * 60 * args.sampling_rate)
+    print(f"{args.chunks} chunks of {npts} samples")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for dtype in ("float64", "float32"):
+            paths = _write_chunks(Path(tmpdir), args.chunks, npts, args.sampling_rate, dtype)
+            size = sum(path.stat().st_size for path in paths)
+
+            for path in paths:
+                expected = obspy.read(str(path), format="MSEED")[0]
+                obtained = read_noiz_miniseed(path)[0]
+                assert np.array_equal(expected.data, obtained.data)
+                assert expected.stats.starttime == obtained.stats.starttime
+
+            readers = (
+                ("obspy.read", lambda path: obspy.read(str(path), format="MSEED")),
+                ("read_noiz_miniseed", read_noiz_miniseed),
+            )
+            reference_time = None
+            for name, reader in readers:
+                elapsed = _time_reader(reader, paths, args.repeats)
+                reference_time = reference_time or elapsed
+                print(
+                    f"{dtype:<8} {name:<20} {size / 1e6:7.1f} MB {elapsed * 1e3:8.1f} ms "
+                    f"{size / 1e6 / elapsed:8.1f} MB/s {args.chunks / elapsed:9.1f} chunks/s "
+                    f"x{reference_time / elapsed:.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+"""
+Compares accuracy and throughput of padded FFT resampling with polyphase resampling of day long traces.
+
+Input is a sum of tones below the target Nyquist frequency and one tone above it that should be removed.
+Accuracy is reported as relative RMS difference from the analytic in-band signal and as the worst amplitude
+and phase error of the in-band tones, measured away from the edges of the trace.
+
+Run with ``python benchmarks/resampling.py``.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import obspy
+from loguru import logger
+
+from noiz.models.processing_params import DatachunkResamplingMethod
+from noiz.processing.datachunk import resample_with_padding
+
+_TONES = ((0.05, 0.1), (1.3, 0.7), (4.1, 1.1), (8.7, 2.0))
+
+
+def _tones(t: np.ndarray) -> np.ndarray:
+    return sum(np.sin(2 * np.pi * freq * t + phase) for freq, phase in _TONES)
+
+
+def _fit_tones(t: np.ndarray, data: np.ndarray):
+    """Jointly fits amplitude and phase of all in-band tones."""
+    columns = []
+    for freq, _ in _TONES:
+        columns.extend((np.sin(2 * np.pi * freq * t), np.cos(2 * np.pi * freq * t)))
+    coefficients, *_ = np.linalg.lstsq(np.column_stack(columns), data, rcond=None)
+    sin_coefficients, cos_coefficients = coefficients[0::2], coefficients[1::2]
+    return np.hypot(sin_coefficients, cos_coefficients), np.arctan2(cos_coefficients, sin_coefficients)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--edge_seconds", type=float, default=120.0)
+    parser.add_argument("--ratios", type=str, default="100:25,200:50,100:40,100:24")
+    args = parser.parse_args()
+
+    logger.remove()
+    print(
+        f"{'ratio':>9} {'method':<11} {'time':>9} {'Msamples/s':>11} {'rel. RMS':>9} {'ampl. err':>9} {'phase err':>9}"
+    )
+    for ratio in args.ratios.split(","):
+        original, target = (float(x) for x in ratio.split(":"))
+        t = np.arange(int(args.hours * 3600 * original)) / original
+        data = _tones(t) + 0.5 * np.sin(2 * np.pi * 0.45 * original * t)
+
+        for method in DatachunkResamplingMethod:
+            header = {"sampling_rate": original, "starttime": obspy.UTCDateTime(2020, 1, 1)}
+            st = obspy.Stream([obspy.Trace(data=data.copy(), header=header)])
+
+            start = time.perf_counter()
+            resampled = resample_with_padding(st=st, sampling_rate=target, method=method)[0]
+            elapsed = time.perf_counter() - start
+
+            edge = int(args.edge_seconds * target)
+            t_out = (np.arange(resampled.stats.npts) / target)[edge:-edge]
+            out = resampled.data[edge:-edge]
+            reference = _tones(t_out)
+            rms = np.sqrt(np.mean((out - reference) ** 2) / np.mean(reference**2))
+
+            amplitudes, phases = _fit_tones(t_out, out)
+            amplitude_error = np.max(np.abs(amplitudes - 1))
+            phase_error = np.max(np.abs(np.angle(np.exp(1j * (phases - np.array([x[1] for x in _TONES]))))))
+
+            print(
+                f"{ratio:>9} {method.value:<11} {elapsed:8.3f}s {len(data) / elapsed / 1e6:11.1f} "
+                f"{rms:9.1e} {amplitude_error:9.1e} {phase_error:9.1e}"
+            )
+
+
+if __name__ == "__main__":
+    main()
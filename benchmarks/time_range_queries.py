@@ -0,0 +1,198 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+"""
+Compares plans and execution times of day lookups on Tsindex and Timespan done with ``date_part`` of a timestamp
+with lookups done with half-open timestamp ranges.
+
+Tables with the schema of noiz models are created in a separate schema of a PostgreSQL database and filled
+with synthetic rows. The schema is dropped afterwards.
+Database needs the ``hstore`` extension, the same as the noiz database.
+
+Run with ``python benchmarks/time_range_queries.py --dsn "host=localhost dbname=noiz user=noiz password=noiz"``.
+If ``--dsn`` is not provided, ``POSTGRES_*`` environment variables are used.
+"""
+
+import argparse
+import os
+import random
+import statistics
+
+import psycopg2
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import psycopg2 as psycopg2_dialect
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from noiz.models.timeseries import Tsindex
+from noiz.models.timespan import Timespan
+from noiz.processing.time_utils import get_year_doy_bounds
+
+_SCHEMA = "noiz_query_benchmark"
+_FIRST_DAY = "2010-01-01"
+
+
+def _compile(statement):
+    compiled = statement.compile(dialect=psycopg2_dialect.dialect())
+    return str(compiled), compiled.params
+
+
+def _tsindex_date_part_query(network: str, station: str, component: str, year: int, doy: int):
+    return select(Tsindex.id).filter(
+        Tsindex.network == network,
+        Tsindex.station == station,
+        Tsindex.component == component,
+        Tsindex.starttime_year == year,
+        Tsindex.starttime_doy == doy,
+    )
+
+
+def _tsindex_range_query(network: str, station: str, component: str, year: int, doy: int):
+    day_start, day_end = get_year_doy_bounds(year=year, doy=doy)
+    return select(Tsindex.id).filter(
+        Tsindex.network == network,
+        Tsindex.station == station,
+        Tsindex.component == component,
+        Tsindex.starttime >= day_start,
+        Tsindex.starttime < day_end,
+    )
+
+
+def _timespan_date_part_query(year: int, doy: int):
+    return select(Timespan.id).filter(Timespan.midtime_year == year, Timespan.midtime_doy == doy)
+
+
+def _timespan_range_query(year: int, doy: int):
+    day_start, day_end = get_year_doy_bounds(year=year, doy=doy)
+    return select(Timespan.id).filter(Timespan.midtime >= day_start, Timespan.midtime < day_end)
+
+
+def _collect_scans(plan: dict) -> list:
+    scans = []
+    if "Scan" in plan["Node Type"]:
+        scans.append(plan["Node Type"])
+    for child in plan.get("Plans", []):
+        scans.extend(_collect_scans(child))
+    return scans
+
+
+def _explain(cursor, statements) -> tuple:
+    times = []
+    scans = set()
+    for statement in statements:
+        sql, params = _compile(statement)
+        cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+        result = cursor.fetchone()[0][0]
+        times.append(result["Execution Time"])
+        scans.update(_collect_scans(result["Plan"]))
+    return statistics.median(times), ", ".join(sorted(scans))
+
+
+def _fill_tables(cursor, stations: int, days: int, timespan_step_minutes: int) -> None:
+    cursor.execute(
+        f"""
+        INSERT INTO tsindex (network, station, location, channel, starttime, endtime, samplerate, filename,
+                             byteoffset, filemodtime, updated, scanned)
+        SELECT 'XX', 'S' || lpad(st::text, 4, '0'), '', 'HH' || ch, day, day + interval '86399.99 seconds', 100,
+               '/data/' || st || '.' || ch || '.' || day::date, 0, now(), now(), now()
+        FROM generate_series(1, %(stations)s) AS st,
+             unnest(ARRAY['Z', 'N', 'E']) AS ch,
+             generate_series(timestamptz '{_FIRST_DAY}',
+                             timestamptz '{_FIRST_DAY}' + (%(days)s - 1) * interval '1 day',
+                             interval '1 day') AS day
+        """,
+        {"stations": stations, "days": days},
+    )
+    cursor.execute(
+        f"""
+        INSERT INTO timespan (starttime, midtime, endtime)
+        SELECT t, t + %(step)s * interval '1 minute', t + 2 * %(step)s * interval '1 minute'
+        FROM generate_series(timestamptz '{_FIRST_DAY}',
+                             timestamptz '{_FIRST_DAY}' + %(days)s * interval '1 day' - %(step)s * interval '1 minute',
+                             %(step)s * interval '1 minute') AS t
+        """,
+        {"days": days, "step": timespan_step_minutes},
+    )
+    cursor.execute("ANALYZE tsindex")
+    cursor.execute("ANALYZE timespan")
+
+
+def _default_dsn() -> str:
+    return " ".join(
+        f"{key}={os.environ[variable]}"
+        for key, variable in (
+            ("host", "POSTGRES_HOST"),
+            ("port", "POSTGRES_PORT"),
+            ("user", "POSTGRES_USER"),
+            ("password", "POSTGRES_PASSWORD"),
+            ("dbname", "POSTGRES_DB"),
+        )
+        if os.environ.get(variable)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", type=str, default=None)
+    parser.add_argument("--stations", type=int, default=200)
+    parser.add_argument("--days", type=int, default=3650)
+    parser.add_argument("--timespan_step_minutes", type=int, default=2)
+    parser.add_argument("--lookups", type=int, default=20)
+    args = parser.parse_args()
+
+    dsn = args.dsn if args.dsn is not None else _default_dsn()
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    cursor.execute("SET TIME ZONE 'UTC'")
+    cursor.execute(f"DROP SCHEMA IF EXISTS {_SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {_SCHEMA}")
+    cursor.execute(f"SET search_path TO {_SCHEMA}, public")
+
+    try:
+        dialect = psycopg2_dialect.dialect()
+        for table in (Tsindex.__table__, Timespan.__table__):
+            cursor.execute(str(CreateTable(table).compile(dialect=dialect)))
+
+        print(f"Filling tables for {args.stations} stations over {args.days} days")
+        _fill_tables(
+            cursor=cursor, stations=args.stations, days=args.days, timespan_step_minutes=args.timespan_step_minutes
+        )
+        for table in ("tsindex", "timespan"):
+            cursor.execute(f"SELECT count(*) FROM {table}")
+            print(f"{table}: {cursor.fetchone()[0]} rows")
+
+        rng = random.Random(0)
+        years = max(1, args.days // 366)
+        lookups = [
+            (
+                f"S{rng.randint(1, args.stations):04d}",
+                rng.choice("ZNE"),
+                2010 + rng.randrange(years),
+                rng.randint(1, 365),
+            )
+            for _ in range(args.lookups)
+        ]
+
+        def run_tsindex(label: str) -> None:
+            for name, query in (("date_part", _tsindex_date_part_query), ("range", _tsindex_range_query)):
+                median, scans = _explain(cursor, [query("XX", sta, cmp, year, doy) for sta, cmp, year, doy in lookups])
+                print(f"tsindex   {label:<15} {name:<10} {median:10.3f} ms  {scans}")
+
+        run_tsindex(label="without index")
+        for index in Tsindex.__table__.indexes:
+            cursor.execute(str(CreateIndex(index).compile(dialect=dialect)))
+        cursor.execute("ANALYZE tsindex")
+        run_tsindex(label="with index")
+
+        for name, query in (("date_part", _timespan_date_part_query), ("range", _timespan_range_query)):
+            median, scans = _explain(cursor, [query(year, doy) for _, _, year, doy in lookups])
+            print(f"timespan  {'unique midtime':<15} {name:<10} {median:10.3f} ms  {scans}")
+    finally:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {_SCHEMA} CASCADE")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+"""
+Compares throughput of spectral whitening with full complex FFTs and with real FFTs and cached kernels.
+
+Every configuration whitens the same number of chunks of white noise with a few tones, as a single worker would do
+for one component. First call of the cached engine builds the kernels and is reported separately.
+Largest difference between both methods is reported relative to the largest whitened sample.
+
+Run with ``python benchmarks/whitening.py``.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import obspy
+from loguru import logger
+
+from noiz.models.processing_params import ProcessedDatachunkParams
+from noiz.processing.datachunk_processing import whiten_trace
+from noiz.processing.whitening import _build_whitening_kernels, whiten_trace_cached
+
+
+def _whiten_with_full_fft(tr: obspy.Trace, params: ProcessedDatachunkParams) -> obspy.Trace:
+    return whiten_trace(
+        tr,
+        tr.stats.sampling_rate,
+        params.waterlevel_ratio_to_max,
+        params.filtering_low,
+        params.filtering_high,
+        params.convolution_sliding_window_min_samples,
+        params.convolution_sliding_window_max_ratio_to_fmin,
+        params.convolution_sliding_window_ratio_to_bandwidth,
+        params.quefrency_filter_lowpass_pct,
+        params.quefrency_filter_taper_min_samples,
+        params.quefrency_filter_taper_length_ratio_to_length_cepstrum,
+        params.quefrency,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=48)
+    parser.add_argument("--sampling_rate", type=float, default=25.0)
+    parser.add_argument("--lengths_minutes", type=str, default="10,30,60")
+    args = parser.parse_args()
+
+    logger.remove()
+    rng = np.random.default_rng(0)
+    print(
+        f"{'minutes':>7} {'npts':>7} {'quefrency':>9} {'full_fft':>10} {'cached_rfft':>11} "
+        f"{'first call':>10} {'speedup':>7} {'max diff':>9}"
+    )
+    for minutes in (float(x) for x in args.lengths_minutes.split(",")):
+        npts = int(minutes * 60 * args.sampling_rate)
+        t = np.arange(npts) / args.sampling_rate
+        chunks = [
+            obspy.Trace(
+                data=rng.standard_normal(npts) + 10 * np.sin(2 * np.pi * 0.2 * t) + 3 * np.sin(2 * np.pi * 1.7 * t),
+                header={"sampling_rate": args.sampling_rate},
+            )
+            for _ in range(args.chunks)
+        ]
+        for quefrency in (True, False):
+            params = ProcessedDatachunkParams(
+                filtering_low=0.1, filtering_high=3, filtering_order=4, quefrency=quefrency
+            )
+
+            start = time.perf_counter()
+            expected = [_whiten_with_full_fft(tr.copy(), params).data for tr in chunks]
+            full_fft = (time.perf_counter() - start) / args.chunks
+
+            _build_whitening_kernels.cache_clear()
+            start = time.perf_counter()
+            whiten_trace_cached(chunks[0].copy(), params)
+            first_call = time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = [whiten_trace_cached(tr.copy(), params).data for tr in chunks]
+            cached = (time.perf_counter() - start) / args.chunks
+
+            max_diff = max(np.max(np.abs(a - b)) / np.max(np.abs(a)) for a, b in zip(expected, results))
+            print(
+                f"{minutes:7.0f} {npts:7d} {str(quefrency):>9} {full_fft * 1e3:8.2f}ms {cached * 1e3:9.2f}ms "
+                f"{first_call * 1e3:8.2f}ms {full_fft / cached:6.1f}x {max_diff:9.1e}"
+            )
+
+
+if __name__ == "__main__":
+    main()
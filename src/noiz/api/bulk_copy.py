@@ -0,0 +1,441 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+"""
+COPY based bulk writer.
+
+Instead of emitting one ``INSERT ... ON CONFLICT`` per row, rows are streamed with PostgreSQL ``COPY`` into a
+temporary staging table and merged into the target table with a single ``INSERT ... SELECT ... ON CONFLICT``.
+"""
+
+import datetime
+import io
+import math
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import Table, UniqueConstraint, inspect
+from sqlalchemy.dialects.postgresql.dml import OnConflictDoNothing, OnConflictDoUpdate
+from sqlalchemy.orm import RelationshipProperty
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.sql import Insert
+from typing import Any, Collection, Dict, List, Optional, Sequence, Tuple, Type
+
+from noiz.database import db
+from noiz.exceptions import InconsistentDataException
+from noiz.models.type_aliases import BulkAddableObjects, BulkAddableFileObjects
+
+_COPY_ROW_NUMBER_COLUMN = "_noiz_copy_row"
+
+
+def copy_upsert_objects(
+    objects_to_upsert: Collection[BulkAddableObjects],
+    conflict_constraint: Optional[str] = None,
+    assign_ids: bool = False,
+    commit: bool = True,
+    conflict_update_columns: Optional[Collection[str]] = None,
+) -> None:
+    """
+    Upserts provided objects with a COPY into a staging table followed by a single merge statement per model.
+    Objects of different models can be mixed, they are grouped by their class before being written.
+    If the same unique key is present more than once in the provided objects, the last one wins, the same way it
+    would with row by row upserts.
+
+    :param objects_to_upsert: Objects to be upserted
+    :type objects_to_upsert: Collection[BulkAddableObjects]
+    :param conflict_constraint: Name of the unique constraint to be used for conflict resolution. If not provided,
+        the named unique constraint of each of the models is used.
+    :type conflict_constraint: Optional[str]
+    :param assign_ids: If ids of inserted or updated rows should be brought back with ``RETURNING`` and set on
+        the objects, so objects depending on them can be written afterwards.
+    :type assign_ids: bool
+    :param commit: If the session should be committed afterwards
+    :type commit: bool
+    :param conflict_update_columns: Names of columns that are updated on conflict. If not provided, all columns
+        besides the unique key are updated. If empty, conflicting rows are left untouched.
+    :type conflict_update_columns: Optional[Collection[str]]
+    :return: None
+    :rtype: NoneType
+    """
+    logger.info(f"Starting COPY upsert procedure. There are {len(objects_to_upsert)} elements to be processed.")
+
+    cursor = _get_raw_cursor()
+    for model, objects in _group_objects_by_model(objects_to_upsert).items():
+        table = model.__table__
+        constraint = _find_conflict_constraint(table=table, constraint_name=conflict_constraint)
+        columns = _get_copied_columns(table)
+        rows = [_extract_column_values(obj=obj, columns=columns) for obj in objects]
+
+        staging_table = _copy_rows_to_staging_table(cursor=cursor, table=table, columns=columns, rows=rows)
+        logger.debug(f"Merging {len(rows)} rows from {staging_table} into {table.name}")
+        cursor.execute(
+            _build_merge_statement(
+                table=table,
+                staging_table=staging_table,
+                columns=columns,
+                constraint=constraint,
+                returning=assign_ids,
+                update_column_names=conflict_update_columns,
+            )
+        )
+        if assign_ids:
+            _assign_returned_ids(
+                objects=objects, columns=columns, rows=rows, constraint=constraint, returned=cursor.fetchall()
+            )
+
+    if commit:
+        logger.debug("Commiting session.")
+        db.session.commit()
+
+
+def copy_upsert_objects_with_files(
+    objects_to_upsert: Collection[BulkAddableObjects],
+    file_attribute: str = "file",
+    conflict_constraint: Optional[str] = None,
+    dependent_attribute: Optional[str] = None,
+    extra_file_attributes: Collection[str] = (),
+    conflict_update_columns: Optional[Collection[str]] = None,
+) -> None:
+    """
+    Writes provided objects together with the file objects they are pointing to in two phases.
+    First, all file objects that are not yet in the DB are COPY-ed into a staging table and inserted into their
+    table. Ids assigned by the DB are brought back with ``RETURNING`` and set on the file objects.
+    Afterwards, dependent objects are upserted with :py:func:`~noiz.api.bulk_copy.copy_upsert_objects`.
+    If ``dependent_attribute`` is provided, objects stored under that attribute of the upserted ones are upserted
+    as a third phase, with their foreign keys taken from the objects they belong to.
+    All phases are committed together.
+
+    :param objects_to_upsert: Objects to be upserted
+    :type objects_to_upsert: Collection[BulkAddableObjects]
+    :param file_attribute: Name of the relationship pointing to the file object
+    :type file_attribute: str
+    :param conflict_constraint: Name of the unique constraint to be used for conflict resolution of dependent objects
+    :type conflict_constraint: Optional[str]
+    :param dependent_attribute: Name of the relationship pointing to objects that depend on the upserted ones
+    :type dependent_attribute: Optional[str]
+    :param extra_file_attributes: Names of other relationships pointing to file objects, that are optional
+    :type extra_file_attributes: Collection[str]
+    :param conflict_update_columns: Names of columns of upserted objects that are updated on conflict,
+        see :py:func:`~noiz.api.bulk_copy.copy_upsert_objects`. Dependent objects are always fully updated.
+    :type conflict_update_columns: Optional[Collection[str]]
+    :return: None
+    :rtype: NoneType
+    """
+    files_by_identity: Dict[int, BulkAddableFileObjects] = {}
+    for obj in objects_to_upsert:
+        for attribute in (file_attribute, *extra_file_attributes):
+            file = getattr(obj, attribute, None)
+            if file is not None and file.id is None:
+                files_by_identity.setdefault(id(file), file)
+
+    if len(files_by_identity) > 0:
+        cursor = _get_raw_cursor()
+        for model, files in _group_objects_by_model(files_by_identity.values()).items():
+            _copy_insert_files(cursor=cursor, table=model.__table__, files=files)
+
+    if dependent_attribute is None:
+        copy_upsert_objects(
+            objects_to_upsert=objects_to_upsert,
+            conflict_constraint=conflict_constraint,
+            conflict_update_columns=conflict_update_columns,
+        )
+        return
+
+    copy_upsert_objects(
+        objects_to_upsert=objects_to_upsert,
+        conflict_constraint=conflict_constraint,
+        assign_ids=True,
+        commit=False,
+        conflict_update_columns=conflict_update_columns,
+    )
+    dependents = [getattr(obj, dependent_attribute) for obj in objects_to_upsert]
+    copy_upsert_objects(objects_to_upsert=[x for x in dependents if x is not None])
+
+
+def _copy_insert_files(cursor, table: Table, files: Sequence[BulkAddableFileObjects]) -> None:
+    """
+    Inserts file objects through a staging table and assigns ids returned by the DB to them.
+    The returned rows are matched back to the objects through their filepath.
+    """
+    columns = _get_copied_columns(table)
+    rows = [_extract_column_values(obj=file, columns=columns) for file in files]
+
+    staging_table = _copy_rows_to_staging_table(cursor=cursor, table=table, columns=columns, rows=rows)
+    column_names = ", ".join(_quote(col.name) for col in columns)
+    logger.debug(f"Inserting {len(rows)} files from {staging_table} into {table.name}")
+    cursor.execute(
+        f"INSERT INTO {_quote(table.name)} ({column_names}) "
+        f"SELECT {column_names} FROM {staging_table} ORDER BY {_COPY_ROW_NUMBER_COLUMN} "
+        f'RETURNING "id", "filepath"'
+    )
+    returned = cursor.fetchall()
+
+    files_by_path: Dict[str, List[BulkAddableFileObjects]] = defaultdict(list)
+    for file in files:
+        files_by_path[str(file.filepath)].append(file)
+
+    for file_id, filepath in returned:
+        try:
+            files_by_path[filepath].pop(0).id = file_id
+        except IndexError:
+            raise InconsistentDataException(
+                f"Database returned an unexpected file {filepath} with id {file_id}"
+            ) from None
+
+    if any(len(x) > 0 for x in files_by_path.values()):
+        raise InconsistentDataException(f"Not all files inserted into {table.name} received their ids.")
+
+
+def get_upsert_conflict_resolution(upsert_command: Insert) -> Tuple[Optional[str], Optional[List[str]]]:
+    """
+    Reads name of the unique constraint and names of updated columns from the ``ON CONFLICT`` clause of
+    an upsert command, so :py:func:`~noiz.api.bulk_copy.copy_upsert_objects` can resolve conflicts
+    in the same way as the command does.
+    Returns Nones for commands without ``ON CONFLICT`` clause and an empty list of columns for ``DO NOTHING``.
+
+    The clause is read from a non-public attribute of SQLAlchemy's insert construct. If it cannot be found or
+    it is not of a known type, ValueError is raised instead of silently falling back to a plain insert.
+
+    :param upsert_command: Upsert command prepared for any of the objects to be upserted
+    :type upsert_command: Insert
+    :return: Name of the constraint and names of the updated columns
+    :rtype: Tuple[Optional[str], Optional[List[str]]]
+    :raises: ValueError
+    """
+    missing = object()
+    on_conflict = getattr(upsert_command, "_post_values_clause", missing)
+    if on_conflict is missing:
+        raise ValueError(
+            f"Cannot read ON CONFLICT clause of {type(upsert_command)}. "
+            f"Installed version of SQLAlchemy is not supported by COPY upserts."
+        )
+    if on_conflict is None:
+        return None, None
+    if not isinstance(on_conflict, (OnConflictDoNothing, OnConflictDoUpdate)):
+        raise ValueError(f"Unsupported ON CONFLICT clause {type(on_conflict)} of upsert command.")
+
+    constraint = on_conflict.constraint_target
+    constraint_name = constraint if isinstance(constraint, str) else getattr(constraint, "name", None)
+
+    if isinstance(on_conflict, OnConflictDoNothing):
+        return constraint_name, []
+    return constraint_name, [getattr(key, "name", key) for key, _ in on_conflict.update_values_to_set]
+
+
+def _get_raw_cursor():
+    """
+    Returns a DBAPI cursor bound to the connection and transaction of the current session.
+    """
+    return db.session.connection().connection.cursor()
+
+
+def _group_objects_by_model(objects: Collection[Any]) -> Dict[Type, List[Any]]:
+    grouped: Dict[Type, List[Any]] = defaultdict(list)
+    for obj in objects:
+        grouped[type(obj)].append(obj)
+    return grouped
+
+
+def _find_conflict_constraint(table: Table, constraint_name: Optional[str] = None) -> UniqueConstraint:
+    """
+    Finds unique constraint that should be used for ``ON CONFLICT`` clause of a given table.
+    If no name is provided, the table has to have exactly one named unique constraint.
+    """
+    constraints = [c for c in table.constraints if isinstance(c, UniqueConstraint) and c.name is not None]
+
+    if constraint_name is not None:
+        constraints = [c for c in constraints if c.name == constraint_name]
+        if len(constraints) == 0:
+            raise ValueError(f"Table {table.name} does not have unique constraint named {constraint_name}")
+        return constraints[0]
+
+    if len(constraints) != 1:
+        raise ValueError(
+            f"Expected exactly one named unique constraint on table {table.name}. Found {len(constraints)}. "
+            f"Provide `conflict_constraint` explicitly."
+        )
+    return constraints[0]
+
+
+def _get_copied_columns(table: Table) -> List:
+    """
+    Returns all columns of the table besides the primary key which is always generated by the DB.
+    """
+    return [col for col in table.columns if not col.primary_key]
+
+
+def _extract_column_values(obj: Any, columns: Sequence) -> Tuple[Any, ...]:
+    """
+    Extracts values of provided columns from a mapped object.
+    Foreign keys that are not set directly are taken from the related objects, if they are present.
+    """
+    mapper = inspect(type(obj))
+    values = {col.key: getattr(obj, mapper.get_property_by_column(col).key) for col in columns}
+
+    for relationship in mapper.relationships:
+        if not isinstance(relationship, RelationshipProperty) or relationship.direction is not MANYTOONE:
+            continue
+        related = getattr(obj, relationship.key, None)
+        if related is None:
+            continue
+        related_mapper = inspect(type(related))
+        for local, remote in relationship.local_remote_pairs:
+            if local.key in values and values[local.key] is None:
+                values[local.key] = getattr(related, related_mapper.get_property_by_column(remote).key)
+
+    return tuple(values[col.key] for col in columns)
+
+
+def _copy_rows_to_staging_table(cursor, table: Table, columns: Sequence, rows: Sequence[Sequence[Any]]) -> str:
+    """
+    Creates a temporary staging table with the same types of columns as the target one and streams
+    provided rows into it with ``COPY``. Staging table is dropped on commit.
+    """
+    staging_table = _quote(f"noiz_copy_{table.name}_{uuid.uuid4().hex[:8]}")
+    column_names = ", ".join(_quote(col.name) for col in columns)
+
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {staging_table} ON COMMIT DROP AS "
+        f"SELECT {column_names}, 0::bigint AS {_COPY_ROW_NUMBER_COLUMN} FROM {_quote(table.name)} WITH NO DATA"
+    )
+
+    buffer = io.StringIO()
+    _serialize_copy_rows(buffer=buffer, rows=rows)
+    buffer.seek(0)
+
+    cursor.copy_expert(
+        f"COPY {staging_table} ({column_names}, {_COPY_ROW_NUMBER_COLUMN}) FROM STDIN",
+        buffer,
+    )
+    return staging_table
+
+
+def _build_merge_statement(
+    table: Table,
+    staging_table: str,
+    columns: Sequence,
+    constraint: UniqueConstraint,
+    returning: bool = False,
+    update_column_names: Optional[Collection[str]] = None,
+) -> str:
+    """
+    Builds a single ``INSERT ... SELECT ... ON CONFLICT`` statement moving rows from staging table to the target one.
+    Only the last occurrence of each unique key is merged.
+    On conflict, columns named in ``update_column_names`` are updated, all columns besides the unique key if it is
+    not provided.
+    If ``returning`` is set, primary key and unique key of every merged row are returned.
+    """
+    if constraint.name is None:
+        raise ValueError(f"Unique constraint used for conflict resolution of table {table.name} has to be named")
+
+    column_names = ", ".join(_quote(col.name) for col in columns)
+    key_names = ", ".join(_quote(col.name) for col in constraint.columns)
+    key_set = {col.name for col in constraint.columns}
+    update_columns = [col for col in columns if col.name not in key_set]
+    if update_column_names is not None:
+        update_columns = [col for col in update_columns if col.name in update_column_names]
+
+    if len(update_columns) > 0:
+        conflict_action = "DO UPDATE SET " + ", ".join(
+            f"{_quote(col.name)} = EXCLUDED.{_quote(col.name)}" for col in update_columns
+        )
+    elif returning:
+        # DO NOTHING would not return ids of already existing rows, so the key is updated to itself instead
+        key_name = _quote(next(iter(constraint.columns)).name)
+        conflict_action = f"DO UPDATE SET {key_name} = EXCLUDED.{key_name}"
+    else:
+        conflict_action = "DO NOTHING"
+
+    statement = (
+        f"INSERT INTO {_quote(table.name)} ({column_names}) "
+        f"SELECT DISTINCT ON ({key_names}) {column_names} FROM {staging_table} "
+        f"ORDER BY {key_names}, {_COPY_ROW_NUMBER_COLUMN} DESC "
+        f"ON CONFLICT ON CONSTRAINT {_quote(constraint.name)} {conflict_action}"
+    )
+    if returning:
+        primary_key_names = ", ".join(_quote(col.name) for col in table.primary_key.columns)
+        statement += f" RETURNING {primary_key_names}, {key_names}"
+    return statement
+
+
+def _assign_returned_ids(
+    objects: Sequence[Any],
+    columns: Sequence,
+    rows: Sequence[Sequence[Any]],
+    constraint: UniqueConstraint,
+    returned: Sequence[Sequence[Any]],
+) -> None:
+    """
+    Sets primary keys returned by a merge statement on the objects, matching them through their unique key.
+    All objects sharing the same unique key receive the same id.
+    """
+    key_positions = [[col.name for col in columns].index(col.name) for col in constraint.columns]
+    ids_by_key = {tuple(row[1:]): row[0] for row in returned}
+
+    for obj, row in zip(objects, rows):
+        key = tuple(row[i] for i in key_positions)
+        try:
+            returned_id = ids_by_key[key]
+        except KeyError:
+            raise InconsistentDataException(f"Database did not return an id for {obj} with unique key {key}") from None
+        mapper = inspect(type(obj))
+        setattr(obj, mapper.get_property_by_column(mapper.primary_key[0]).key, returned_id)
+
+
+def _serialize_copy_rows(buffer: io.StringIO, rows: Sequence[Sequence[Any]]) -> None:
+    """
+    Writes rows in the PostgreSQL ``COPY`` text format. Row number is appended as a last column of each row.
+    """
+    for row_number, row in enumerate(rows):
+        fields = [_format_copy_value(value) for value in row]
+        fields.append(str(row_number))
+        buffer.write("\t".join(fields))
+        buffer.write("\n")
+
+
+def _format_copy_value(value: Any) -> str:
+    """
+    Formats a single value according to the PostgreSQL ``COPY`` text format.
+    """
+    if value is None:
+        return r"\N"
+    if isinstance(value, (bool, np.bool_)):
+        return "t" if value else "f"
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "Infinity" if value > 0 else "-Infinity"
+        return repr(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return f"{value.total_seconds()} seconds"
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return _escape_copy_text("{" + ",".join(_format_array_element(x) for x in value) + "}")
+    if isinstance(value, Path):
+        value = str(value)
+    return _escape_copy_text(str(value))
+
+
+def _format_array_element(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, (str, Path)):
+        return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return _format_copy_value(value)
+
+
+def _escape_copy_text(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
@@ -4,14 +4,16 @@
 
 import datetime
 import more_itertools
+from collections import defaultdict
 
 from loguru import logger
 from obspy.signal.cross_correlation import correlate
 from pathlib import Path
 from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import func
 from sqlalchemy.orm import subqueryload, Query
 from sqlalchemy.sql import Insert
-from typing import List, Union, Optional, Collection, Dict, Generator, Tuple, Any, FrozenSet
+from typing import List, Union, Optional, Collection, Dict, Generator, Tuple, Any, FrozenSet, DefaultDict, Set
 
 from noiz.api.component import fetch_components_by_id
 from noiz.api.component_pair import (
@@ -29,7 +31,7 @@ from noiz.api.processing_config import (
     fetch_crosscorrelation_cartesian_params_by_id,
     fetch_crosscorrelation_cylindrical_params_by_id,
 )
-from noiz.api.timespan import fetch_timespans_between_dates
+from noiz.api.timespan import fetch_timespans_between_dates, fetch_timespans_between_dates_in_batches
 from noiz.database import db
 from noiz.exceptions import InconsistentDataException, CorruptedDataException
 from noiz.models import (
@@ -38,6 +40,9 @@ from noiz.models import (
     CrosscorrelationCartesian,
     Datachunk,
     ProcessedDatachunk,
+    ProcessedDatachunkFile,
+    ProcessedDatachunkReference,
+    ProcessedDatachunkSpectrumFile,
     CrosscorrelationCartesianParams,
     Timespan,
     CrosscorrelationCylindrical,
@@ -45,20 +50,23 @@ from noiz.models import (
     CrosscorrelationCylindricalFile,
     CrosscorrelationCylindricalParams,
 )
+from noiz.models.processing_params import CrosscorrelationMethod, CrosscorrelationStorage
 from noiz.models.type_aliases import CrosscorrelationCartesianRunnerInputs, CrosscorrelationCylindricalRunnerInputs
 from noiz.processing.crosscorrelations import (
     validate_component_code_pairs,
-    group_chunks_by_timespanid_componentid,
     load_data_for_chunks,
+    crosscorrelate_with_cached_spectra,
+    crosscorrelate_with_stored_spectra,
+    load_spectra_for_chunks,
     extract_component_ids_from_component_pairs_cartesian,
     assembly_ccf_cartesian_dataframe,
     group_xcrorrcartesian_by_timespanid_componentids,
-    _fetch_R_T_xcoor,
-    _computation_cylindrical_correlation_R_T,
-    _fetch_RT_Z_xcoor,
-    _computation_cylindrical_correlation_RT_Z,
-    _fetch_Z_TR_xcoor,
-    _computation_cylindrical_correlation_Z_TR,
+    assembly_cartesian_ccf_tensor,
+    rotate_cartesian_ccf_tensor,
+    select_missing_component_pairs,
+    split_component_pairs_into_tiles,
+    get_spectra_load_cache,
+    get_trace_load_cache,
 )
 from noiz.processing.io import write_ccfs_to_npz
 from noiz.processing.path_helpers import (
@@ -146,17 +154,22 @@ def _query_crosscorrelation_cartesian(
 
 
 def _prepare_upsert_command_crosscorrelation_cartesian(xcorr: CrosscorrelationCartesian) -> Insert:
+    file_id = xcorr.file.id if xcorr.file is not None else xcorr.crosscorrelation_cartesian_file_id
     insert_command = (
         insert(CrosscorrelationCartesian)
         .values(
             crosscorrelation_cartesian_params_id=xcorr.crosscorrelation_cartesian_params_id,
             componentpair_id=xcorr.componentpair_id,
             timespan_id=xcorr.timespan_id,
-            ccf=xcorr.ccf,
+            crosscorrelation_cartesian_file_id=file_id,
+            container_offset=xcorr.container_offset,
         )
         .on_conflict_do_update(
-            constraint="unique_ccf_per_timespan_per_componentpair_per_config",
-            set_={"ccf": xcorr.ccf},
+            constraint="unique_ccfn_per_timespan_per_componentpair_per_config",
+            set_={
+                "crosscorrelation_cartesian_file_id": file_id,
+                "container_offset": xcorr.container_offset,
+            },
         )
     )
     return insert_command
@@ -180,6 +193,8 @@ def perform_crosscorrelations_cartesian(
     raise_errors: bool = False,
     batch_size: int = 5000,
     parallel: bool = True,
+    skip_existing: bool = True,
+    tile_size: Optional[int] = None,
 ) -> None:
     """
     Performs crosscorrelations_cartesian according to provided set of selectors.
@@ -220,6 +235,11 @@ def perform_crosscorrelations_cartesian(
     :type batch_size: int
     :param parallel: If the calculations should be done in parallel
     :type parallel: bool
+    :param skip_existing: If component pairs that already have a crosscorrelation for given timespan should be skipped
+    :type skip_existing: bool
+    :param tile_size: If provided, pair matrix of every timespan is split into tiles of that many components
+        and every tile is processed as a separate task.
+    :type tile_size: Optional[int]
     :return: None
     :rtype: NoneType
     """
@@ -239,6 +259,8 @@ def perform_crosscorrelations_cartesian(
         include_intracorrelation=include_intracorrelation,
         only_autocorrelation=only_autocorrelation,
         only_intracorrelation=only_intracorrelation,
+        skip_existing=skip_existing,
+        tile_size=tile_size,
     )
 
     if parallel:
@@ -248,6 +270,7 @@ def perform_crosscorrelations_cartesian(
             calculation_task=_crosscorrelate_for_timespan_wrapper,  # type: ignore
             upserter_callable=_prepare_upsert_command_crosscorrelation_cartesian,
             raise_errors=raise_errors,
+            worker_key=_tile_row_block_key,  # type: ignore
         )
     else:
         _run_calculate_and_upsert_sequentially(
@@ -276,11 +299,26 @@ def _prepare_inputs_for_crosscorrelations_cartesian(
     include_intracorrelation: Optional[bool] = False,
     only_autocorrelation: Optional[bool] = False,
     only_intracorrelation: Optional[bool] = False,
+    skip_existing: bool = True,
+    timespan_batch_size: int = 100,
+    tile_size: Optional[int] = None,
 ) -> Generator[CrosscorrelationCartesianRunnerInputs, None, None]:
     """
     Performs all the database queries to prepare all the data required for running crosscorrelations_cartesian.
     Returns a tuple of inputs specific for the further calculations.
 
+    If :paramref:`skip_existing` is set, timespans that have crosscorrelations for all of the selected component
+    pairs are excluded from the query with an anti-join. Inputs of timespans that have only some of them are
+    restricted to the missing component pairs.
+
+    Timespans are paged through with keyset pagination in batches of :paramref:`timespan_batch_size`.
+    ProcessedDatachunks of each batch are streamed with a server-side cursor as plain data references,
+    so memory of the main process does not grow with the length of processed period.
+
+    If :paramref:`tile_size` is provided, pair matrix of every timespan is split into tiles with
+    :py:func:`~noiz.processing.crosscorrelations.split_component_pairs_into_tiles` and a separate input is
+    prepared for each of the tiles.
+
     :param crosscorrelation_cartesian_params_id: ID of CrosscorrelationCartesianParams object to use
     :type crosscorrelation_cartesian_params_id: int
     :param starttime: Date from where to start the query
@@ -307,14 +345,16 @@ def _prepare_inputs_for_crosscorrelations_cartesian(
     :type only_autocorrelation: Optional[bool]
     :param only_intracorrelation: If only intracorrelation pairs should be selected
     :type only_intracorrelation: Optional[bool]
+    :param skip_existing: If component pairs that already have a crosscorrelation for given timespan should be skipped
+    :type skip_existing: bool
+    :param timespan_batch_size: Count of timespans for which inputs are fetched at once
+    :type timespan_batch_size: int
+    :param tile_size: Count of components in a single block of a tile. No tiling is done if not provided.
+    :type tile_size: Optional[int]
     :return:
     :rtype:
     """
 
-    fetched_timespans = fetch_timespans_between_dates(starttime=starttime, endtime=endtime)
-    fetched_timespans_ids = extract_object_ids(fetched_timespans)
-    logger.info(f"There are {len(fetched_timespans_ids)} timespan to process")
-
     if accepted_component_code_pairs is not None:
         accepted_component_code_pairs = validate_component_code_pairs(
             component_pairs_cartesian=validate_to_tuple(accepted_component_code_pairs, str)
@@ -334,35 +374,224 @@ def _prepare_inputs_for_crosscorrelations_cartesian(
         only_intracorrelation=only_intracorrelation,
     )
     logger.info(f"There are {len(fetched_component_pairs)} component pairs to process.")
+    component_pairs_cartesian = tuple(fetched_component_pairs)
+    componentpair_ids = extract_object_ids(fetched_component_pairs)
 
     single_component_ids = extract_component_ids_from_component_pairs_cartesian(fetched_component_pairs)
     logger.info(f"There are in total {len(single_component_ids)} unique components to be fetched from db.")
 
     params = fetch_crosscorrelation_cartesian_params_by_id(id=crosscorrelation_cartesian_params_id)
     logger.info(f"Fetched correlation_params object {params}")
-    fetched_processed_datachunks = (
-        db.session.query(Timespan, ProcessedDatachunk)
-        .join(Datachunk, Timespan.id == Datachunk.timespan_id)
+
+    for i, timespan_batch in enumerate(
+        fetch_timespans_between_dates_in_batches(starttime=starttime, endtime=endtime, batch_size=timespan_batch_size)
+    ):
+        timespans = extract_object_ids_keep_objects(timespan_batch)
+        logger.info(f"Preparing inputs for batch no.{i} of {len(timespans)} timespans")
+
+        existing_pairs: Dict[int, Set[int]] = {}
+        if skip_existing:
+            existing_pairs = _fetch_existing_componentpair_ids_of_incomplete_timespans(
+                params_id=params.id,
+                timespan_ids=list(timespans.keys()),
+                componentpair_ids=componentpair_ids,
+            )
+            logger.info(f"There are {len(existing_pairs)} partially processed timespans in the batch.")
+
+        grouped_processed_chunks = _fetch_processed_datachunk_references(
+            timespan_ids=list(timespans.keys()),
+            processed_datachunk_params_id=params.processed_datachunk_params_id,
+            component_ids=single_component_ids,
+            skip_complete_for_params_id=params.id if skip_existing else None,
+            componentpair_ids=componentpair_ids,
+        )
+        db.session.expunge_all()
+
+        for timespan_id, chunks in grouped_processed_chunks.items():
+            timespan_pairs = component_pairs_cartesian
+            if timespan_id in existing_pairs:
+                timespan_pairs, chunks = select_missing_component_pairs(
+                    component_pairs_cartesian=timespan_pairs,
+                    grouped_processed_chunks=chunks,
+                    existing_componentpair_ids=existing_pairs[timespan_id],
+                )
+                if len(timespan_pairs) == 0:
+                    continue
+            if tile_size is None:
+                yield CrosscorrelationCartesianRunnerInputs(
+                    timespan=timespans[timespan_id],
+                    crosscorrelation_cartesian_params=params,
+                    grouped_processed_chunks=chunks,
+                    component_pairs_cartesian=timespan_pairs,
+                    tile=None,
+                    tile_size=None,
+                )
+                continue
+
+            for tile, tile_pairs, tile_chunks in split_component_pairs_into_tiles(
+                component_pairs_cartesian=timespan_pairs,
+                grouped_processed_chunks=chunks,
+                tile_size=tile_size,
+            ):
+                yield CrosscorrelationCartesianRunnerInputs(
+                    timespan=timespans[timespan_id],
+                    crosscorrelation_cartesian_params=params,
+                    grouped_processed_chunks=tile_chunks,
+                    component_pairs_cartesian=tile_pairs,
+                    tile=tile,
+                    tile_size=tile_size,
+                )
+    return
+
+
+def _fetch_processed_datachunk_references(
+    timespan_ids: Collection[int],
+    processed_datachunk_params_id: int,
+    component_ids: Collection[int],
+    skip_complete_for_params_id: Optional[int] = None,
+    componentpair_ids: Collection[int] = (),
+    fetch_batch_size: int = 10000,
+) -> Dict[int, Dict[int, ProcessedDatachunkReference]]:
+    """
+    Fetches ProcessedDatachunks of provided timespans as plain data references grouped by timespan id and then by
+    component id. Rows are streamed with a server-side cursor, no ORM instances are created.
+
+    If :paramref:`skip_complete_for_params_id` is provided, timespans which already have CrosscorrelationCartesians
+    for all of :paramref:`componentpair_ids` are excluded with an anti-join.
+    """
+    filters = [
+        Datachunk.timespan_id.in_(timespan_ids),
+        ProcessedDatachunk.processed_datachunk_params_id == processed_datachunk_params_id,
+        Datachunk.component_id.in_(component_ids),
+    ]
+    if skip_complete_for_params_id is not None:
+        existing_counts = _query_existing_ccf_counts_per_timespan(
+            params_id=skip_complete_for_params_id,
+            timespan_ids=timespan_ids,
+            componentpair_ids=componentpair_ids,
+        ).subquery()
+        filters.append(
+            ~Datachunk.timespan_id.in_(
+                db.session.query(existing_counts.c.timespan_id).filter(
+                    existing_counts.c.ccf_count >= len(componentpair_ids)
+                )
+            )
+        )
+
+    rows = (
+        db.session.query(
+            Datachunk.timespan_id,
+            Datachunk.component_id,
+            ProcessedDatachunk.id,
+            ProcessedDatachunkFile.filepath,
+            ProcessedDatachunkSpectrumFile.filepath,
+            ProcessedDatachunk.spectrum_offset,
+            ProcessedDatachunkSpectrumFile.npts,
+            ProcessedDatachunkSpectrumFile.nfft,
+            ProcessedDatachunk.container_offset,
+            ProcessedDatachunk.container_length,
+        )
         .join(ProcessedDatachunk, Datachunk.id == ProcessedDatachunk.datachunk_id)
+        .join(ProcessedDatachunkFile, ProcessedDatachunk.processed_datachunk_file_id == ProcessedDatachunkFile.id)
+        .outerjoin(
+            ProcessedDatachunkSpectrumFile,
+            ProcessedDatachunk.processed_datachunk_spectrum_file_id == ProcessedDatachunkSpectrumFile.id,
+        )
+        .filter(*filters)
+        .yield_per(fetch_batch_size)
+    )
+
+    grouped: DefaultDict[int, Dict[int, ProcessedDatachunkReference]] = defaultdict(dict)
+    for (
+        timespan_id,
+        component_id,
+        processed_datachunk_id,
+        filepath,
+        spectrum_filepath,
+        spectrum_offset,
+        spectrum_npts,
+        spectrum_nfft,
+        container_offset,
+        container_length,
+    ) in rows:
+        grouped[timespan_id][component_id] = ProcessedDatachunkReference(
+            id=processed_datachunk_id,
+            component_id=component_id,
+            filepath=filepath,
+            spectrum_filepath=spectrum_filepath,
+            spectrum_offset=spectrum_offset,
+            spectrum_npts=spectrum_npts,
+            spectrum_nfft=spectrum_nfft,
+            container_offset=container_offset,
+            container_length=container_length,
+        )
+    return dict(grouped)
+
+
+def _query_existing_ccf_counts_per_timespan(
+    params_id: int,
+    timespan_ids: Collection[int],
+    componentpair_ids: Collection[int],
+) -> Query:
+    """
+    Prepares a query counting existing CrosscorrelationCartesians for each of the timespans
+    within provided component pairs.
+    """
+    return (
+        db.session.query(
+            CrosscorrelationCartesian.timespan_id.label("timespan_id"),
+            func.count(CrosscorrelationCartesian.id).label("ccf_count"),
+        )
         .filter(
-            Timespan.id.in_(fetched_timespans_ids),  # type: ignore
-            ProcessedDatachunk.processed_datachunk_params_id == params.processed_datachunk_params_id,
-            Datachunk.component_id.in_(single_component_ids),
+            CrosscorrelationCartesian.crosscorrelation_cartesian_params_id == params_id,
+            CrosscorrelationCartesian.timespan_id.in_(timespan_ids),
+            CrosscorrelationCartesian.componentpair_id.in_(componentpair_ids),
         )
-        .options(subqueryload(ProcessedDatachunk.datachunk))
-        .all()
+        .group_by(CrosscorrelationCartesian.timespan_id)
     )
-    grouped_datachunks = group_chunks_by_timespanid_componentid(processed_datachunks=fetched_processed_datachunks)
 
-    for timespan, grouped_processed_chunks in grouped_datachunks.items():
-        db.session.expunge_all()
-        yield CrosscorrelationCartesianRunnerInputs(
-            timespan=timespan,
-            crosscorrelation_cartesian_params=params,
-            grouped_processed_chunks=grouped_processed_chunks,
-            component_pairs_cartesian=tuple(fetched_component_pairs),
+
+def _fetch_existing_componentpair_ids_of_incomplete_timespans(
+    params_id: int,
+    timespan_ids: Collection[int],
+    componentpair_ids: Collection[int],
+) -> Dict[int, Set[int]]:
+    """
+    Fetches ids of component pairs that already have a CrosscorrelationCartesian, but only for timespans where
+    some of the component pairs are still missing.
+    """
+    existing_counts = _query_existing_ccf_counts_per_timespan(
+        params_id=params_id,
+        timespan_ids=timespan_ids,
+        componentpair_ids=componentpair_ids,
+    ).subquery()
+
+    fetched = (
+        db.session.query(CrosscorrelationCartesian.timespan_id, CrosscorrelationCartesian.componentpair_id)
+        .join(existing_counts, existing_counts.c.timespan_id == CrosscorrelationCartesian.timespan_id)
+        .filter(
+            existing_counts.c.ccf_count < len(componentpair_ids),
+            CrosscorrelationCartesian.crosscorrelation_cartesian_params_id == params_id,
+            CrosscorrelationCartesian.componentpair_id.in_(componentpair_ids),
         )
-    return
+        .all()
+    )
+
+    existing_pairs: DefaultDict[int, Set[int]] = defaultdict(set)
+    for timespan_id, componentpair_id in fetched:
+        existing_pairs[timespan_id].add(componentpair_id)
+    return dict(existing_pairs)
+
+
+def _tile_row_block_key(inputs: CrosscorrelationCartesianRunnerInputs) -> Optional[Tuple[int, int]]:
+    """
+    Groups tiles of a timespan by their row block, so they can be processed by the same worker and reuse
+    data of that block cached in its memory. Inputs that are not tiles are not grouped.
+    """
+    tile = inputs["tile"]
+    if tile is None:
+        return None
+    return inputs["timespan"].id, tile[0]
 
 
 def _crosscorrelate_for_timespan_wrapper(
@@ -383,6 +612,8 @@ def _crosscorrelate_for_timespan_wrapper(
             params=inputs["crosscorrelation_cartesian_params"],
             grouped_processed_chunks=inputs["grouped_processed_chunks"],
             component_pairs_cartesian=inputs["component_pairs_cartesian"],
+            tile=inputs["tile"],
+            tile_size=inputs["tile_size"],
         )
     )
 
@@ -433,31 +664,126 @@ def assembly_ccf_dir(component_pair_cartesian: ComponentPairCartesian, timespan:
     )
 
 
+def assembly_ccf_container_filename(
+    params: CrosscorrelationCartesianParams,
+    timespan: Timespan,
+    count: int = 0,
+    tile: Optional[Tuple[int, int]] = None,
+) -> str:
+    """
+    Assembles a filename of a container holding all ccfs computed for a single timespan with given params.
+    If the timespan was split into tiles, each of the tiles has its own container.
+
+    :param params: Params used to compute ccfs
+    :type params: CrosscorrelationCartesianParams
+    :param timespan: Timespan object containing information about time
+    :type timespan: Timespan
+    :param count: counter for increasing if filename exists, defaults to 0
+    :type count: int
+    :param tile: Index of the tile of which ccfs are stored in the container
+    :type tile: Optional[Tuple[int, int]]
+    :return: Filename of the container
+    :rtype: str
+    """
+    year = str(timespan.starttime.year)
+    doy_time = timespan.starttime.strftime("%j.%H%M")
+
+    parts = ["ccf_container", f"params{params.id}", year, doy_time]
+    if tile is not None:
+        parts.append(f"tile{tile[0]}-{tile[1]}")
+    return ".".join([*parts, str(count), "npy"])
+
+
+def assembly_ccf_container_dir(timespan: Timespan) -> Path:
+    """
+    Assembles a Path object of directory containing ccf containers. Object consists of year/month/containers.
+
+    :param timespan: Timespan object containing information about time
+    :type timespan: Timespan
+    :return: Path object containing directory hierarchy
+    :rtype: Path
+    """
+    return Path(str(timespan.starttime.year)).joinpath(str(timespan.starttime.month)).joinpath("containers")
+
+
 def _crosscorrelate_for_timespan(
     timespan: Timespan,
     params: CrosscorrelationCartesianParams,
-    grouped_processed_chunks: Dict[int, ProcessedDatachunk],
+    grouped_processed_chunks: Dict[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]],
     component_pairs_cartesian: Tuple[ComponentPairCartesian, ...],
+    tile: Optional[Tuple[int, int]] = None,
+    tile_size: Optional[int] = None,
 ) -> List[CrosscorrelationCartesian]:
-    """filldocs"""
-    from noiz.globals import PROCESSED_DATA_DIR
-    from noiz.processing.path_helpers import (
-        assembly_filepath,
-        increment_filename_counter,
-        parent_directory_exists_or_create,
-    )
-
-    import numpy as np
-
+    """
+    Crosscorrelates all provided component pairs of a single timespan.
+    If the inputs are a single tile of the pair matrix, data are loaded through a process-wide
+    :py:class:`~noiz.processing.crosscorrelations.TraceLoadCache`, so blocks of components shared between tiles
+    processed one after another by the same worker are read only once.
+    With :py:attr:`~noiz.models.processing_params.CrosscorrelationMethod.CACHED_SPECTRA`, spectra of the tile
+    are cached instead in a :py:class:`~noiz.processing.crosscorrelations.SpectraLoadCache`, so shared blocks are
+    not transformed again either.
+
+    If :py:attr:`~noiz.models.processing_params.CrosscorrelationMethod.CACHED_SPECTRA` is used and all of the chunks
+    have stored spectra long enough for the max lag of crosscorrelations, spectra are read directly instead and
+    neither MiniSEED files are read nor forward FFTs computed.
+    """
     logger.info(f"Running crosscorrelation_cartesian for {timespan}")
 
+    all_references = all(isinstance(x, ProcessedDatachunkReference) for x in grouped_processed_chunks.values())
+    use_stored_spectra = params.correlation_method is CrosscorrelationMethod.CACHED_SPECTRA and (
+        _stored_spectra_cover_max_lag(
+            grouped_processed_chunks=grouped_processed_chunks, max_lag_samples=params.correlation_max_lag_samples
+        )
+    )
+    spectra_cache = None
+    if (
+        params.correlation_method is CrosscorrelationMethod.CACHED_SPECTRA
+        and not use_stored_spectra
+        and tile_size is not None
+        and all_references
+    ):
+        spectra_cache = get_spectra_load_cache(max_spectra=3 * tile_size)
+
+    if use_stored_spectra or spectra_cache is not None:
+        pairs_with_data = [
+            pair
+            for pair in component_pairs_cartesian
+            if pair.component_a_id in grouped_processed_chunks.keys()
+            and pair.component_b_id in grouped_processed_chunks.keys()
+        ]
+        if spectra_cache is None:
+            logger.debug(f"Loading stored spectra for timespan {timespan}")
+            spectra, nfft = load_spectra_for_chunks(chunks=grouped_processed_chunks)
+        else:
+            logger.debug(f"Loading spectra of tile {tile} of timespan {timespan}")
+            try:
+                spectra, nfft = spectra_cache.load(
+                    chunks=grouped_processed_chunks,  # type: ignore
+                    max_lag_samples=params.correlation_max_lag_samples,
+                )
+            except CorruptedDataException as e:
+                logger.error(e)
+                raise CorruptedDataException(e) from e
+        ccfs = crosscorrelate_with_stored_spectra(
+            spectra=spectra,
+            nfft=nfft,
+            component_pairs_cartesian=pairs_with_data,
+            max_lag_samples=params.correlation_max_lag_samples,
+        )
+        return _save_ccfs(timespan=timespan, params=params, pairs_with_data=pairs_with_data, ccfs=ccfs, tile=tile)
+
     logger.debug(f"Loading data for timespan {timespan}")
     try:
-        streams = load_data_for_chunks(chunks=grouped_processed_chunks)
+        if tile_size is not None and all_references:
+            streams = get_trace_load_cache(max_traces=3 * tile_size).load(
+                chunks=grouped_processed_chunks  # type: ignore
+            )
+        else:
+            streams = load_data_for_chunks(chunks=grouped_processed_chunks)
     except CorruptedDataException as e:
         logger.error(e)
         raise CorruptedDataException(e) from e
-    xcorrs = []
+    pairs_with_data = []
     for pair in component_pairs_cartesian:
         cmp_a_id = pair.component_a_id
         cmp_b_id = pair.component_b_id
@@ -477,12 +803,66 @@ def _crosscorrelate_for_timespan(
             logger.error(msg)
             raise InconsistentDataException(msg)
 
-        ccf_data = correlate(
-            a=streams[cmp_a_id],
-            b=streams[cmp_b_id],
-            shift=params.correlation_max_lag_samples,
+        pairs_with_data.append(pair)
+
+    if params.correlation_method is CrosscorrelationMethod.CACHED_SPECTRA:
+        ccfs = crosscorrelate_with_cached_spectra(
+            traces=streams,
+            component_pairs_cartesian=pairs_with_data,
+            max_lag_samples=params.correlation_max_lag_samples,
+        )
+    else:
+        ccfs = {
+            pair.id: correlate(
+                a=streams[pair.component_a_id],
+                b=streams[pair.component_b_id],
+                shift=params.correlation_max_lag_samples,
+            )
+            for pair in pairs_with_data
+        }
+
+    return _save_ccfs(timespan=timespan, params=params, pairs_with_data=pairs_with_data, ccfs=ccfs, tile=tile)
+
+
+def _stored_spectra_cover_max_lag(
+    grouped_processed_chunks: Dict[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]],
+    max_lag_samples: int,
+) -> bool:
+    """
+    Checks if all of the provided ProcessedDatachunks have stored spectra that are long enough to compute
+    crosscorrelations with given max lag without wrap-around.
+    """
+    for chunk in grouped_processed_chunks.values():
+        spectrum_max_lag_samples = chunk.spectrum_max_lag_samples
+        if spectrum_max_lag_samples is None or spectrum_max_lag_samples < max_lag_samples:
+            return False
+    return True
+
+
+def _save_ccfs(
+    timespan: Timespan,
+    params: CrosscorrelationCartesianParams,
+    pairs_with_data: List[ComponentPairCartesian],
+    ccfs: Dict[int, Any],
+    tile: Optional[Tuple[int, int]] = None,
+) -> List[CrosscorrelationCartesian]:
+    """
+    Saves computed ccfs according to :py:attr:`~noiz.models.processing_params.CrosscorrelationCartesianParams.ccf_storage`
+    and prepares CrosscorrelationCartesian objects pointing to them.
+    """
+    from noiz.globals import PROCESSED_DATA_DIR
+
+    import numpy as np
+
+    if params.ccf_storage is CrosscorrelationStorage.TIMESPAN_CONTAINER:
+        return _write_ccfs_to_timespan_container(
+            timespan=timespan, params=params, pairs_with_data=pairs_with_data, ccfs=ccfs, tile=tile
         )
 
+    xcorrs = []
+    for pair in pairs_with_data:
+        ccf_data = ccfs[pair.id]
+
         filepath = assembly_filepath(
             PROCESSED_DATA_DIR,  # type: ignore
             "ccf",
@@ -514,6 +894,71 @@ def _crosscorrelate_for_timespan(
     return xcorrs
 
 
+def _write_ccfs_to_timespan_container(
+    timespan: Timespan,
+    params: CrosscorrelationCartesianParams,
+    pairs_with_data: List[ComponentPairCartesian],
+    ccfs: Dict[int, Any],
+    tile: Optional[Tuple[int, int]] = None,
+) -> List[CrosscorrelationCartesian]:
+    """
+    Writes all ccfs of a single timespan into one 2D `.npy` container.
+    Each of returned :py:class:`~noiz.models.crosscorrelation.CrosscorrelationCartesian` points to the same
+    :py:class:`~noiz.models.crosscorrelation.CrosscorrelationCartesianFile` and keeps the row in which its
+    ccf is stored as a :py:attr:`~noiz.models.crosscorrelation.CrosscorrelationCartesian.container_offset`.
+
+    :param timespan: Timespan for which ccfs were calculated
+    :type timespan: Timespan
+    :param params: Params used to calculate ccfs
+    :type params: CrosscorrelationCartesianParams
+    :param pairs_with_data: Component pairs for which ccfs were calculated, in order of rows of the container
+    :type pairs_with_data: List[ComponentPairCartesian]
+    :param ccfs: Calculated ccfs keyed by id of component pair
+    :type ccfs: Dict[int, Any]
+    :param tile: Indices of row and column blocks of pairs, if ccfs were calculated for a single tile
+    :type tile: Optional[Tuple[int, int]]
+    :return: Crosscorrelations pointing to rows of the written container
+    :rtype: List[CrosscorrelationCartesian]
+    """
+    from noiz.globals import PROCESSED_DATA_DIR
+
+    import numpy as np
+
+    if len(pairs_with_data) == 0:
+        return []
+
+    filepath = assembly_filepath(
+        PROCESSED_DATA_DIR,  # type: ignore
+        "ccf",
+        assembly_ccf_container_dir(timespan=timespan).joinpath(
+            assembly_ccf_container_filename(params=params, timespan=timespan, count=0, tile=tile)
+        ),
+    )
+
+    if filepath.exists():
+        logger.debug(f"Filepath {filepath} exists. Trying to find next free one.")
+        filepath = increment_filename_counter(filepath=filepath, extension=True)
+        logger.debug(f"Free filepath found. CCF container will be saved to {filepath}")
+
+    logger.info(f"CCF container with {len(pairs_with_data)} ccfs will be written to {str(filepath)}")
+    parent_directory_exists_or_create(filepath)
+
+    ccf_file = CrosscorrelationCartesianFile(filepath=str(filepath))
+
+    np.save(file=ccf_file.filepath, arr=np.vstack([ccfs[pair.id] for pair in pairs_with_data]))
+
+    return [
+        CrosscorrelationCartesian(
+            crosscorrelation_cartesian_params_id=params.id,
+            componentpair_id=pair.id,
+            timespan_id=timespan.id,
+            file=ccf_file,
+            container_offset=offset,
+        )
+        for offset, pair in enumerate(pairs_with_data)
+    ]
+
+
 def fetch_crosscorrelations_cartesian_and_save(
     crosscorrelation_cartesian_params_id: int,
     starttime: Union[datetime.date, datetime.datetime],
@@ -803,27 +1248,110 @@ def _crosscorrelate_cylindrical_for_timespan(
     grouped_processed_xcorrcartisian,
     component_pairs_cylindrical: Tuple[ComponentPairCylindrical, ...],
 ) -> List[CrosscorrelationCylindrical]:
-    from noiz.globals import PROCESSED_DATA_DIR
-    from noiz.processing.path_helpers import (
-        assembly_filepath,
-        increment_filename_counter,
-        parent_directory_exists_or_create,
+    """
+    Computes cylindrical crosscorrelations for a timespan.
+    Cylindrical component pairs are grouped by station pair. For every station pair, cartesian crosscorrelations are
+    loaded once into a 3×3×lag tensor and all requested cylindrical code pairs are obtained in a single vectorized
+    rotation.
+    """
+    logger.info(f"Running crosscorrelation_cylindrical for {timespan}")
+
+    grouped_pairs: DefaultDict[Tuple[Optional[int], ...], List[ComponentPairCylindrical]] = defaultdict(list)
+    for cp in component_pairs_cylindrical:
+        grouped_pairs[_station_pair_key(cp)].append(cp)
+
+    xcorrs_cylindrical = []
+    for station_pairs in grouped_pairs.values():
+        xcorrs_cylindrical.extend(
+            _rotate_station_pair(
+                component_pairs_cylindrical=station_pairs,
+                grouped_processed_xcorrcartisian=grouped_processed_xcorrcartisian,
+                timespan=timespan,
+                params=crosscorrelation_cylindrical_params,
+            )
+        )
+
+    return xcorrs_cylindrical
+
+
+def _station_pair_key(cp: ComponentPairCylindrical) -> Tuple[Optional[int], ...]:
+    return (
+        cp.component_aE_id,
+        cp.component_aN_id,
+        cp.component_aZ_id,
+        cp.component_bE_id,
+        cp.component_bN_id,
+        cp.component_bZ_id,
+        cp.backazimuth,
     )
 
-    import numpy as np
 
-    logger.info(f"Running crosscorrelation_cylindrical for {timespan}")
+_CARTESIAN_CODE_PAIRS_OF_CYLINDRICAL: Dict[str, Tuple[str, ...]] = {
+    "RR": ("NN", "EE", "NE", "EN"),
+    "TT": ("NN", "EE", "NE", "EN"),
+    "RT": ("NN", "EE", "NE", "EN"),
+    "TR": ("NN", "EE", "NE", "EN"),
+    "RZ": ("EZ", "NZ"),
+    "TZ": ("EZ", "NZ"),
+    "ZR": ("ZE", "ZN"),
+    "ZT": ("ZE", "ZN"),
+}
 
-    logger.debug(f"Loading data for timespan {timespan}")
-    xcorrs_cylindrical = []
 
+def _rotate_station_pair(
+    component_pairs_cylindrical: List[ComponentPairCylindrical],
+    grouped_processed_xcorrcartisian: Dict[FrozenSet[int], CrosscorrelationCartesian],
+    timespan: Timespan,
+    params: CrosscorrelationCylindricalParams,
+) -> List[CrosscorrelationCylindrical]:
+    """
+    Computes all cylindrical crosscorrelations of a single station pair and writes them to disk.
+    All of the provided component pairs have to share the same stations and backazimuth.
+    """
+    tensor, mask, used_xcorrs = assembly_cartesian_ccf_tensor(
+        gr_xcors_cart=grouped_processed_xcorrcartisian,
+        comp_pairs_cyl=component_pairs_cylindrical[0],
+    )
+    rotated = rotate_cartesian_ccf_tensor(
+        tensor=tensor,
+        mask=mask,
+        back_az=component_pairs_cylindrical[0].backazimuth,
+        codes=[cp.component_cylindrical_code_pair for cp in component_pairs_cylindrical],
+    )
+
+    xcorrs = []
     for cp in component_pairs_cylindrical:
-        xcorr_cylindrical_all = cylindrical_correlation_computation(
-            cp, grouped_processed_xcorrcartisian, timespan, crosscorrelation_cylindrical_params
-        )
-        xcorrs_cylindrical.append(xcorr_cylindrical_all)
+        code = cp.component_cylindrical_code_pair
+        if code not in rotated:
+            logger.error(f"No cartesian correlation for pair {cp} ")
+            continue
 
-    return xcorrs_cylindrical
+        ccf_file = _create_cylindrical_correlation_file(cp, rotated[code], timespan)
+
+        cartesian_code_pairs: List[Optional[str]] = [
+            x for x in _CARTESIAN_CODE_PAIRS_OF_CYLINDRICAL[code] if x in used_xcorrs
+        ]
+        cartesian_ids: List[Optional[int]] = [used_xcorrs[x].id for x in cartesian_code_pairs if x in used_xcorrs]
+        cartesian_code_pairs.extend([None] * (4 - len(cartesian_code_pairs)))
+        cartesian_ids.extend([None] * (4 - len(cartesian_ids)))
+
+        xcorrs.append(
+            CrosscorrelationCylindrical(
+                componentpair_cylindrical_id=cp.id,
+                timespan_id=timespan.id,
+                crosscorrelation_cartesian_1_id=cartesian_ids[0],
+                crosscorrelation_cartesian_1_code_pair=cartesian_code_pairs[0],
+                crosscorrelation_cartesian_2_id=cartesian_ids[1],
+                crosscorrelation_cartesian_2_code_pair=cartesian_code_pairs[1],
+                crosscorrelation_cartesian_3_id=cartesian_ids[2],
+                crosscorrelation_cartesian_3_code_pair=cartesian_code_pairs[2],
+                crosscorrelation_cartesian_4_id=cartesian_ids[3],
+                crosscorrelation_cartesian_4_code_pair=cartesian_code_pairs[3],
+                crosscorrelation_cylindrical_params_id=params.id,
+                file=ccf_file,
+            )
+        )
+    return xcorrs
 
 
 def _prepare_upsert_command_crosscorrelation_cylindrical(xcorr: CrosscorrelationCylindrical) -> Insert:
@@ -841,12 +1369,11 @@ def _prepare_upsert_command_crosscorrelation_cylindrical(xcorr: Crosscorrelation
             crosscorrelation_cartesian_3_code_pair=xcorr.crosscorrelation_cartesian_3_code_pair,
             crosscorrelation_cartesian_4_id=xcorr.crosscorrelation_cartesian_4_id,
             crosscorrelation_cartesian_4_code_pair=xcorr.crosscorrelation_cartesian_4_code_pair,
-            crosscorrelation_cylindrical_file_id=xcorr.crosscorrelation_cylindrical_file_id,
-            ccf=xcorr.ccf,
+            crosscorrelation_cylindrical_file_id=xcorr.file.id,
         )
         .on_conflict_do_update(
             constraint="unique_ccfcylindrical_per_timespan_cylindrical_per_config",
-            set_={"ccf": xcorr.ccf},
+            set_={"crosscorrelation_cylindrical_file_id": xcorr.file.id},
         )
     )
     return insert_command
@@ -888,95 +1415,33 @@ def cylindrical_correlation_computation(
     grouped_processed_xcorrcartisian: Dict[FrozenSet[int], CrosscorrelationCartesian],
     timespan: Timespan,
     params: CrosscorrelationCylindricalParams,
-):
-    """_summary_
-
-    :param component_pair_cylindrical: _description_
-    :type component_pair_cylindrical: _type_
-    :param grouped_processed_xcorrcartisian: _description_
-    :type grouped_processed_xcorrcartisian: _type_
-    :param timespan: _description_
-    :type timespan: _type_
-    :param params: _description_
-    :type params: _type_
-    :return: _description_
-    :rtype: _type_
+) -> Optional[CrosscorrelationCylindrical]:
     """
+    Computes a cylindrical crosscorrelation of a single component pair and writes it to disk.
+    It is done with the same rotation of a cartesian tensor as in
+    :py:func:`~noiz.api.crosscorrelations._rotate_station_pair`, which should be preferred when more
+    component pairs of the same station pair are computed.
 
-    code = component_pair_cylindrical.component_cylindrical_code_pair
-    back_az = component_pair_cylindrical.backazimuth
-    try:
-        if (code == "RR") | (code == "TT") | (code == "RT") | (code == "TR"):
-            xcorr_aN_bN, xcorr_aE_bE, xcorr_aN_bE, xcorr_aE_bN = _fetch_R_T_xcoor(
-                grouped_processed_xcorrcartisian, component_pair_cylindrical
-            )
-            xcorr_cylindrical = _computation_cylindrical_correlation_R_T(
-                code, xcorr_aN_bN, xcorr_aE_bE, xcorr_aN_bE, xcorr_aE_bN, back_az
-            )
-            ccf_file = _create_cylindrical_correlation_file(component_pair_cylindrical, xcorr_cylindrical, timespan)
-
-            logger.info(f"ccf_file is {str(ccf_file)}")
-            xcorr = CrosscorrelationCylindrical(
-                componentpair_cylindrical_id=component_pair_cylindrical.id,
-                timespan_id=timespan.id,
-                crosscorrelation_cartesian_1_id=xcorr_aN_bN.id,
-                crosscorrelation_cartesian_1_code_pair="NN",
-                crosscorrelation_cartesian_2_id=xcorr_aE_bE.id,
-                crosscorrelation_cartesian_2_code_pair="EE",
-                crosscorrelation_cartesian_3_id=xcorr_aN_bE.id,
-                crosscorrelation_cartesian_3_code_pair="NE",
-                crosscorrelation_cartesian_4_id=xcorr_aE_bN.id,
-                crosscorrelation_cartesian_4_code_pair="EN",
-                crosscorrelation_cylindrical_params_id=params.id,
-                crosscorrelation_cylindrical_file_id=ccf_file.id,
-                file=ccf_file,
-            )
-
-        elif (code == "RZ") | (code == "TZ"):
-            xcorr_aE_bZ, xcorr_aN_bZ = _fetch_RT_Z_xcoor(grouped_processed_xcorrcartisian, component_pair_cylindrical)
-            xcorr_cylindrical = _computation_cylindrical_correlation_RT_Z(code, xcorr_aE_bZ, xcorr_aN_bZ, back_az)
-            ccf_file = _create_cylindrical_correlation_file(component_pair_cylindrical, xcorr_cylindrical, timespan)
-
-            xcorr = CrosscorrelationCylindrical(
-                componentpair_cylindrical_id=component_pair_cylindrical.id,
-                timespan_id=timespan.id,
-                crosscorrelation_cartesian_1_id=xcorr_aE_bZ.id,
-                crosscorrelation_cartesian_1_code_pair="EZ",
-                crosscorrelation_cartesian_2_id=xcorr_aN_bZ.id,
-                crosscorrelation_cartesian_2_code_pair="NZ",
-                crosscorrelation_cartesian_3_id=None,  # type: ignore
-                crosscorrelation_cartesian_3_code_pair=None,  # type: ignore
-                crosscorrelation_cartesian_4_id=None,  # type: ignore
-                crosscorrelation_cartesian_4_code_pair=None,  # type: ignore
-                crosscorrelation_cylindrical_params_id=params.id,
-                crosscorrelation_cylindrical_file_id=ccf_file.id,
-                file=ccf_file,
-            )
-
-        elif (code == "ZR") | (code == "ZT"):
-            xcorr_aZ_bE, xcorr_aZ_bN = _fetch_Z_TR_xcoor(grouped_processed_xcorrcartisian, component_pair_cylindrical)
-            xcorr_cylindrical = _computation_cylindrical_correlation_Z_TR(code, xcorr_aZ_bE, xcorr_aZ_bN, back_az)
-            ccf_file = _create_cylindrical_correlation_file(component_pair_cylindrical, xcorr_cylindrical, timespan)
-
-            xcorr = CrosscorrelationCylindrical(
-                componentpair_cylindrical_id=component_pair_cylindrical.id,
-                timespan_id=timespan.id,
-                crosscorrelation_cartesian_1_id=xcorr_aZ_bE.id,
-                crosscorrelation_cartesian_1_code_pair="ZE",
-                crosscorrelation_cartesian_2_id=xcorr_aZ_bN.id,
-                crosscorrelation_cartesian_2_code_pair="ZN",
-                crosscorrelation_cartesian_3_id=None,  # type: ignore
-                crosscorrelation_cartesian_3_code_pair=None,  # type: ignore
-                crosscorrelation_cartesian_4_id=None,  # type: ignore
-                crosscorrelation_cartesian_4_code_pair=None,  # type: ignore
-                crosscorrelation_cylindrical_params_id=params.id,
-                crosscorrelation_cylindrical_file_id=ccf_file.id,
-                file=ccf_file,
-            )
-        return xcorr
-    except Exception:
-        logger.error(f"No cartesian correlation for pair {component_pair_cylindrical} ")
+    :param component_pair_cylindrical: Component pair to compute crosscorrelation for
+    :type component_pair_cylindrical: ComponentPairCylindrical
+    :param grouped_processed_xcorrcartisian: Cartesian crosscorrelations of the timespan grouped by component ids
+    :type grouped_processed_xcorrcartisian: Dict[FrozenSet[int], CrosscorrelationCartesian]
+    :param timespan: Timespan of the crosscorrelations
+    :type timespan: Timespan
+    :param params: Parameters of cylindrical crosscorrelations
+    :type params: CrosscorrelationCylindricalParams
+    :return: Cylindrical crosscorrelation or None if cartesian crosscorrelations required for it are missing
+    :rtype: Optional[CrosscorrelationCylindrical]
+    """
+    xcorrs = _rotate_station_pair(
+        component_pairs_cylindrical=[component_pair_cylindrical],
+        grouped_processed_xcorrcartisian=grouped_processed_xcorrcartisian,
+        timespan=timespan,
+        params=params,
+    )
+    if len(xcorrs) == 0:
         return None
+    return xcorrs[0]
 
 
 def _prepare_inputs_for_crosscorrelations_cylindrical(
@@ -1104,12 +1569,13 @@ def perform_crosscorrelations_cylindrical(
             calculation_task=_crosscorrelate_cylindrical_for_timespan_wrapper,  # type: ignore
             upserter_callable=_prepare_upsert_command_crosscorrelation_cylindrical,
             raise_errors=raise_errors,
+            with_file=True,
         )
     else:
         _run_calculate_and_upsert_sequentially(
             batch_size=batch_size,
             inputs=calculation_inputs,
-            calculation_task=_crosscorrelate_for_timespan_wrapper,  # type: ignore
+            calculation_task=_crosscorrelate_cylindrical_for_timespan_wrapper,  # type: ignore
             upserter_callable=_prepare_upsert_command_crosscorrelation_cylindrical,
             raise_errors=raise_errors,
             with_file=True,
@@ -3,15 +3,15 @@
 # Copyright © 2019-2023 Contributors to the Noiz project.
 
 import datetime
-import itertools
 import more_itertools
 from loguru import logger
 import pendulum
 import numpy as np
+from pathlib import Path
 from sqlalchemy.dialects.postgresql import Insert, insert
 
 from sqlalchemy.orm import subqueryload, Query
-from typing import List, Tuple, Collection, Optional, Dict, Union, Generator
+from typing import Callable, List, Tuple, Collection, Optional, Dict, Union, Generator, Iterable, Type
 
 from noiz.api.component import fetch_components
 from noiz.api.helpers import (
@@ -20,28 +20,47 @@ from noiz.api.helpers import (
     _run_calculate_and_upsert_sequentially,
 )
 from noiz.api.processing_config import fetch_datachunkparams_by_id, fetch_processed_datachunk_params_by_id
-from noiz.api.timeseries import fetch_raw_timeseries
-from noiz.api.timespan import fetch_timespans_for_doy, fetch_timespans_between_dates
+from noiz.api.timespan import fetch_timespans_between_dates
 from noiz.database import db
-from noiz.exceptions import NoDataException
+from noiz.exceptions import MissingDataFileException
 from noiz.models import (
     AveragedSohGps,
     Component,
     Datachunk,
+    DatachunkFile,
     DatachunkParams,
     DatachunkStats,
     ProcessedDatachunk,
+    ProcessedDatachunkFile,
+    ProcessedDatachunkParams,
     QCOneConfig,
     QCOneResults,
     Timespan,
+    Tsindex,
 )
+from noiz.models.processing_params import DatachunkStorage
 from noiz.models.type_aliases import (
     CalculateDatachunkStatsInputs,
+    InputsForMassCalculations,
     RunDatachunkPreparationInputs,
     ProcessDatachunksInputs,
 )
-from noiz.processing.datachunk import create_datachunks_for_component_wrapper, calculate_datachunk_stats_wrapper
-from noiz.processing.datachunk_processing import process_datachunk_wrapper
+from noiz.processing.datachunk import (
+    DataAvailabilityReport,
+    calculate_datachunk_stats_wrapper,
+    create_datachunks_for_component_wrapper,
+    create_datachunks_for_file_group_wrapper,
+    group_datachunk_preparation_inputs_by_file,
+    plan_datachunk_preparation,
+    precheck_data_availability,
+    write_chunks_to_component_day_containers,
+)
+from noiz.processing.datachunk_processing import (
+    group_datachunk_processing_inputs,
+    process_datachunk_wrapper,
+    process_datachunks_batch_wrapper,
+)
+from noiz.processing.time_utils import get_day_bounds, get_utc_date
 from noiz.validation_helpers import validate_maximum_one_argument_provided
 
 
@@ -399,6 +418,8 @@ def _prepare_upsert_command_datachunk(datachunk: Datachunk) -> Insert:
             npts=datachunk.npts,
             datachunk_file=datachunk.file,
             padded_npts=datachunk.padded_npts,
+            container_offset=datachunk.container_offset,
+            container_length=datachunk.container_length,
         )
         .on_conflict_do_update(
             constraint="unique_datachunk_per_timespan_per_station_per_processing",
@@ -407,6 +428,8 @@ def _prepare_upsert_command_datachunk(datachunk: Datachunk) -> Insert:
                 "padded_npts": datachunk.padded_npts,
                 "sampling_rate": datachunk.sampling_rate,
                 "npts": datachunk.npts,
+                "container_offset": datachunk.container_offset,
+                "container_length": datachunk.container_length,
             },
         )
     )
@@ -420,64 +443,90 @@ def _generate_datachunk_preparation_inputs(
     enddate: datetime.datetime,
     processing_config_id: int,
     skip_existing: bool = True,
+    compute_stats: bool = False,
+    availability_report: Optional[DataAvailabilityReport] = None,
 ) -> Generator[RunDatachunkPreparationInputs, None, None]:
-    date_period = pendulum.Interval(startdate, enddate)  # type: ignore
+    """
+    Fetches everything that is needed for planning of datachunk preparation for the whole date range with
+    a few range queries and streams work only for component-days that have at least one missing datachunk.
+    Matching is done in memory with :py:func:`~noiz.processing.datachunk.plan_datachunk_preparation`.
+
+    If ``availability_report`` is provided, timespans that cannot be prepared according to tsindex metadata
+    are dropped with :py:func:`~noiz.processing.datachunk.precheck_data_availability` and counted in the report.
+    Number of existing datachunks is stored in the report too.
+    """
+    days = [get_utc_date(date) for date in pendulum.Interval(startdate, enddate).range("days")]  # type: ignore
+    range_start, _ = get_day_bounds(days[0])
+    _, range_end = get_day_bounds(days[-1])
 
     logger.info("Fetching processing config, timespans and components from db. ")
     processing_params = fetch_datachunkparams_by_id(id=processing_config_id)
 
-    all_timespans = [
-        (date, fetch_timespans_for_doy(year=date.year, doy=date.timetuple().tm_yday))
-        for date in date_period.range("days")
-    ]
-
-    if len(all_timespans) == 0:
+    timespans = Timespan.query.filter(Timespan.midtime >= range_start, Timespan.midtime < range_end).all()
+    if len(timespans) == 0:
         raise ValueError("There were no timespans for requested dates. Check if you created timespans at all.")
 
     fetched_components = fetch_components(networks=None, stations=stations, components=components)
+    if len(fetched_components) == 0:
+        return
+
+    logger.info("Fetching raw data index for requested dates.")
+    time_series = Tsindex.query.filter(
+        Tsindex.network.in_(sorted({cmp.network for cmp in fetched_components})),
+        Tsindex.station.in_(sorted({cmp.station for cmp in fetched_components})),
+        Tsindex.starttime >= range_start,
+        Tsindex.starttime < range_end,
+    ).all()
+
+    existing_datachunks: List[Tuple[int, int]] = []
+    if skip_existing:
+        logger.info("Fetching existing datachunks for requested dates.")
+        existing_datachunks = [
+            (component_id, timespan_id)
+            for component_id, timespan_id in db.session.query(Datachunk.component_id, Datachunk.timespan_id)
+            .join(Timespan, Datachunk.timespan_id == Timespan.id)
+            .filter(
+                Datachunk.datachunk_params_id == processing_params.id,
+                Datachunk.component_id.in_([cmp.id for cmp in fetched_components]),
+                Timespan.midtime >= range_start,
+                Timespan.midtime < range_end,
+            )
+            .yield_per(10000)
+        ]
+        logger.info(f"There are {len(existing_datachunks)} existing datachunks that will be skipped.")
 
-    for component, (date, timespans) in itertools.product(fetched_components, all_timespans):
-        logger.info(f"Looking for data on {date} for {component}")
+    if availability_report is not None:
+        availability_report.existing = len(existing_datachunks)
 
-        try:
-            time_series = fetch_raw_timeseries(component=component, execution_date=date)
-        except NoDataException as e:
-            logger.warning(f"{e} Skipping.")
-            continue
+    db.session.expunge_all()
 
-        if skip_existing:
-            logger.debug("Checking if some timespans already exists")
-            existing_count = count_datachunks(
-                components=(component,),
-                timespans=timespans,
-                datachunk_params=processing_params,
+    for component, date, time_series_entry, missing_timespans in plan_datachunk_preparation(
+        components=fetched_components,
+        days=days,
+        timespans=timespans,
+        time_series=time_series,
+        existing_datachunks=existing_datachunks,
+    ):
+        if availability_report is not None:
+            planned_count = len(missing_timespans)
+            missing_timespans, rejected_timespans = precheck_data_availability(
+                time_series=time_series_entry, timespans=missing_timespans, params=processing_params
             )
-            if existing_count == len(timespans):
-                logger.debug("Number of existing timespans is sufficient. Skipping")
-                continue
-            if existing_count > 0:
-                logger.debug(
-                    f"There are only {existing_count} existing Datachunks. "
-                    f"Looking for those that are missing one by one."
+            availability_report.add(planned=planned_count, predicted_rejected=len(rejected_timespans))
+            if len(rejected_timespans) > 0:
+                logger.info(
+                    f"{len(rejected_timespans)} timespans of {component} on {date} cannot be prepared "
+                    f"according to tsindex metadata. Skipping them."
                 )
-                new_timespans = [
-                    timespan
-                    for timespan in timespans
-                    if count_datachunks(
-                        components=(component,), timespans=(timespan,), datachunk_params=processing_params
-                    )
-                    == 0
-                ]
-                timespans = new_timespans
-
-        logger.info(f"There are {len(timespans)} to be sliced for that seismic file.")
-
-        db.session.expunge_all()
+            if len(missing_timespans) == 0:
+                continue
+        logger.info(f"There are {len(missing_timespans)} to be sliced for {component} on {date}.")
         yield RunDatachunkPreparationInputs(
             component=component,
-            timespans=timespans,
-            time_series=time_series,
+            timespans=missing_timespans,
+            time_series=time_series_entry,
             processing_params=processing_params,
+            compute_stats=compute_stats,
         )
 
 
@@ -489,15 +538,42 @@ def run_datachunk_preparation(
     processing_config_id: int,
     parallel: bool = True,
     batch_size: int = 1000,
+    group_by_file: bool = False,
+    compute_stats: bool = False,
+    precheck_availability: bool = False,
 ):
+    """
+    Prepares datachunks of requested components for requested dates.
+
+    If ``group_by_file`` is set, components which raw data are stored in the same, multiplexed, file are processed
+    by a single task that reads and decodes that file once. Grouping needs the whole plan of the run
+    to be known before the first task is started.
+
+    If ``compute_stats`` is set, :class:`~noiz.models.datachunk.DatachunkStats` are calculated from samples that
+    are in memory before writing and are upserted together with their datachunks, so there is no need to run
+    :py:func:`~noiz.api.datachunk.run_stats_calculation` afterwards.
+
+    If ``precheck_availability`` is set, timespans for which there is not enough data according to
+    ``timespans`` and ``timerates`` stored in tsindex are skipped without reading raw files.
+    After the run, the predicted rejection rate is compared with the number of datachunks that were prepared.
+    """
     logger.info("Preparing jobs for execution")
-    calculation_inputs = _generate_datachunk_preparation_inputs(
+    availability_report = DataAvailabilityReport() if precheck_availability else None
+    calculation_inputs: Iterable[InputsForMassCalculations] = _generate_datachunk_preparation_inputs(
         stations=stations,
         components=components,
         startdate=startdate,
         enddate=enddate,
         processing_config_id=processing_config_id,
+        compute_stats=compute_stats,
+        availability_report=availability_report,
     )
+    calculation_task: Callable = create_datachunks_for_component_wrapper
+
+    if group_by_file:
+        calculation_inputs = group_datachunk_preparation_inputs_by_file(calculation_inputs)  # type: ignore
+        logger.info(f"Components were grouped into {len(calculation_inputs)} tasks by their raw file.")  # type: ignore
+        calculation_task = create_datachunks_for_file_group_wrapper
 
     # TODO add more checks for bad seed files because they are crashing.
     # And instead of datachunk id there was something weird produced. It was found on TD26 in
@@ -507,18 +583,60 @@ def run_datachunk_preparation(
         _run_calculate_and_upsert_on_dask(
             batch_size=batch_size,
             inputs=calculation_inputs,
-            calculation_task=create_datachunks_for_component_wrapper,  # type: ignore
+            calculation_task=calculation_task,  # type: ignore
             upserter_callable=_prepare_upsert_command_datachunk,
             with_file=True,
+            with_stats=compute_stats,
         )
     else:
         _run_calculate_and_upsert_sequentially(
             batch_size=batch_size,
             inputs=calculation_inputs,
-            calculation_task=create_datachunks_for_component_wrapper,  # type: ignore
+            calculation_task=calculation_task,  # type: ignore
             upserter_callable=_prepare_upsert_command_datachunk,
             with_file=True,
+            with_stats=compute_stats,
+        )
+
+    if availability_report is not None:
+        prepared = (
+            _count_datachunks_in_date_range(
+                stations=stations,
+                components=components,
+                startdate=startdate,
+                enddate=enddate,
+                processing_config_id=processing_config_id,
+            )
+            - availability_report.existing
         )
+        logger.info(availability_report.summary(prepared=prepared))
+
+
+def _count_datachunks_in_date_range(
+    stations: Optional[Tuple[str]],
+    components: Optional[Tuple[str]],
+    startdate: datetime.datetime,
+    enddate: datetime.datetime,
+    processing_config_id: int,
+) -> int:
+    """
+    Counts datachunks of requested components which timespans are within the same days as planned by
+    :py:func:`~noiz.api.datachunk._generate_datachunk_preparation_inputs`.
+    """
+    range_start, _ = get_day_bounds(get_utc_date(startdate))
+    _, range_end = get_day_bounds(get_utc_date(enddate))
+    fetched_components = fetch_components(networks=None, stations=stations, components=components)
+    return (
+        db.session.query(Datachunk.id)
+        .join(Timespan, Datachunk.timespan_id == Timespan.id)
+        .filter(
+            Datachunk.datachunk_params_id == processing_config_id,
+            Datachunk.component_id.in_([cmp.id for cmp in fetched_components]),
+            Timespan.midtime >= range_start,
+            Timespan.midtime < range_end,
+        )
+        .count()
+    )
 
 
 def run_stats_calculation(
@@ -616,6 +734,50 @@ def _prepare_upsert_command_datachunk_stats(datachunk_stats: DatachunkStats) ->
     return insert_command
 
 
+def _validate_processing_batch_by(params: ProcessedDatachunkParams, batch_by: Optional[str]) -> Optional[str]:
+    """
+    Selects grouping of datachunks for processing that is required by storage of the params.
+    Stored spectra need datachunks batched by timespan and component-day containers need them batched by
+    component-day. Each of the containers has to be written by a single task, otherwise concurrent tasks would
+    split chunks of one component-day into several containers.
+
+    :param params: Params used for processing
+    :type params: ProcessedDatachunkParams
+    :param batch_by: Requested grouping
+    :type batch_by: Optional[str]
+    :return: Grouping to be used
+    :rtype: Optional[str]
+    :raises: ValueError
+    """
+    uses_container = params.processed_datachunk_storage is DatachunkStorage.COMPONENT_DAY_CONTAINER
+    if params.spectrum_max_lag is not None and uses_container:
+        raise ValueError(
+            "Spectra of processed datachunks need datachunks to be batched by timespan, "
+            "which cannot be combined with component-day container storage."
+        )
+    if params.spectrum_max_lag is not None:
+        if batch_by is None:
+            logger.info("Spectra of processed datachunks will be stored. Datachunks will be batched by timespan.")
+            return "timespan"
+        if batch_by != "timespan":
+            raise ValueError(
+                f"Spectra of processed datachunks are stored in one container per timespan. "
+                f"Datachunks cannot be batched by {batch_by}, use `timespan` instead."
+            )
+    if uses_container:
+        if batch_by is None:
+            logger.info(
+                "Processed datachunks will be stored in containers. Datachunks will be batched by component-day."
+            )
+            return "component_day"
+        if batch_by != "component_day":
+            raise ValueError(
+                f"Processed datachunks are stored in component-day containers. "
+                f"Datachunks cannot be batched by {batch_by}, use `component_day` instead."
+            )
+    return batch_by
+
+
 def run_datachunk_processing(
     processed_datachunk_params_id: int,
     starttime: Union[datetime.date, datetime.datetime],
@@ -627,9 +789,27 @@ def run_datachunk_processing(
     batch_size: int = 2500,
     parallel: bool = True,
     skip_existing: bool = True,
+    batch_by: Optional[str] = None,
 ):
-    # filldocs
-    calculation_inputs = _select_datachunks_for_processing(
+    """
+    Processes datachunks of requested components and dates with selected ProcessedDatachunkParams.
+
+    If ``batch_by`` is provided, datachunks are grouped by ``timespan`` or by ``component_day`` and every group is
+    processed by a single task with :py:func:`~noiz.processing.datachunk_processing.process_datachunks_batch`,
+    that processes datachunks with the same number of samples as a single 2D array. Grouping needs all the inputs
+    of the run to be selected before the first task is started.
+
+    If selected params have :py:attr:`~noiz.models.processing_params.ProcessedDatachunkParams.spectrum_max_lag` set,
+    spectra of processed datachunks are stored in one container per timespan, so datachunks have to be batched
+    by timespan. In that case ``batch_by`` defaults to ``timespan`` and any other grouping raises ValueError.
+    If processed datachunks are stored in component-day containers, ``batch_by`` defaults to ``component_day``
+    and any other grouping raises ValueError, so each of the containers is written by a single task.
+    Spectra cannot be combined with component-day containers.
+    """
+    params = fetch_processed_datachunk_params_by_id(id=processed_datachunk_params_id)
+    batch_by = _validate_processing_batch_by(params=params, batch_by=batch_by)
+
+    calculation_inputs: Iterable[InputsForMassCalculations] = _select_datachunks_for_processing(
         processed_datachunk_params_id=processed_datachunk_params_id,
         starttime=starttime,
         endtime=endtime,
@@ -640,22 +820,30 @@ def run_datachunk_processing(
         skip_existing=skip_existing,
         batch_size=batch_size,
     )
+    calculation_task: Callable = process_datachunk_wrapper
+
+    if batch_by is not None:
+        calculation_inputs = group_datachunk_processing_inputs(calculation_inputs, batch_by=batch_by)  # type: ignore
+        logger.info(f"Datachunks were grouped into {len(calculation_inputs)} batches by {batch_by}.")  # type: ignore
+        calculation_task = process_datachunks_batch_wrapper
 
     if parallel:
         _run_calculate_and_upsert_on_dask(
             batch_size=batch_size,
             inputs=calculation_inputs,
-            calculation_task=process_datachunk_wrapper,  # type: ignore
+            calculation_task=calculation_task,  # type: ignore
             upserter_callable=_prepare_upsert_command_processed_datachunk,
             with_file=True,
+            extra_file_attributes=("spectrum_file",),
         )
     else:
         _run_calculate_and_upsert_sequentially(
             batch_size=batch_size,
             inputs=calculation_inputs,
-            calculation_task=process_datachunk_wrapper,  # type: ignore
+            calculation_task=calculation_task,  # type: ignore
             upserter_callable=_prepare_upsert_command_processed_datachunk,
             with_file=True,
+            extra_file_attributes=("spectrum_file",),
         )
 
     return
@@ -783,10 +971,191 @@ def _prepare_upsert_command_processed_datachunk(proc_datachunk):
             processed_datachunk_params_id=proc_datachunk.processed_datachunk_params_id,
             datachunk_id=proc_datachunk.datachunk_id,
             processed_datachunk_file_id=proc_datachunk.processed_datachunk_file_id,
+            processed_datachunk_spectrum_file_id=proc_datachunk.processed_datachunk_spectrum_file_id,
+            spectrum_offset=proc_datachunk.spectrum_offset,
+            container_offset=proc_datachunk.container_offset,
+            container_length=proc_datachunk.container_length,
         )
         .on_conflict_do_update(
             constraint="unique_processing_per_datachunk_per_config",
-            set_={"processed_datachunk_file_id": proc_datachunk.processed_datachunk_file_id},
+            set_={
+                "processed_datachunk_file_id": proc_datachunk.processed_datachunk_file_id,
+                "processed_datachunk_spectrum_file_id": proc_datachunk.processed_datachunk_spectrum_file_id,
+                "spectrum_offset": proc_datachunk.spectrum_offset,
+                "container_offset": proc_datachunk.container_offset,
+                "container_length": proc_datachunk.container_length,
+            },
         )
     )
     return insert_command
+
+
+def pack_datachunks_into_containers(
+    starttime: Union[datetime.date, datetime.datetime],
+    endtime: Union[datetime.date, datetime.datetime],
+    datachunk_params_id: int,
+    stations: Optional[Tuple[str]] = None,
+    components: Optional[Tuple[str]] = None,
+    remove_old_files: bool = False,
+) -> int:
+    """
+    Moves datachunks stored as separate MiniSEED files into containers holding all datachunks of a component-day,
+    see :py:mod:`noiz.processing.chunk_container`.
+    Content of files is copied as is, without decoding. Every component-day is committed separately,
+    so an interrupted run can be simply started again.
+
+    :param starttime: Starting date of the range
+    :type starttime: Union[datetime.date, datetime.datetime]
+    :param endtime: Ending date of the range
+    :type endtime: Union[datetime.date, datetime.datetime]
+    :param datachunk_params_id: Id of DatachunkParams of datachunks to be moved
+    :type datachunk_params_id: int
+    :param stations: Selection of stations
+    :type stations: Optional[Tuple[str]]
+    :param components: Selection of components
+    :type components: Optional[Tuple[str]]
+    :param remove_old_files: If separate files and their db entries should be removed after moving
+    :type remove_old_files: bool
+    :return: Number of moved datachunks
+    :rtype: int
+    """
+    packed = 0
+    for component, day_start, day_end in _generate_component_days(starttime, endtime, stations, components):
+        datachunks = (
+            db.session.query(Datachunk)
+            .join(Timespan, Datachunk.timespan_id == Timespan.id)
+            .filter(
+                Datachunk.datachunk_params_id == datachunk_params_id,
+                Datachunk.component_id == component.id,
+                Datachunk.container_offset.is_(None),
+                Timespan.midtime >= day_start,
+                Timespan.midtime < day_end,
+            )
+            .options(subqueryload(Datachunk.timespan), subqueryload(Datachunk.file))
+            .all()
+        )
+        packed += _pack_chunks_of_component_day(
+            chunks=datachunks,
+            timespans=[datachunk.timespan for datachunk in datachunks],
+            component=component,
+            file_model=DatachunkFile,
+            params_id=datachunk_params_id,
+            processing_type="datachunk",
+            remove_old_files=remove_old_files,
+        )
+    logger.info(f"{packed} datachunks were moved into component-day containers")
+    return packed
+
+
+def pack_processed_datachunks_into_containers(
+    starttime: Union[datetime.date, datetime.datetime],
+    endtime: Union[datetime.date, datetime.datetime],
+    processed_datachunk_params_id: int,
+    stations: Optional[Tuple[str]] = None,
+    components: Optional[Tuple[str]] = None,
+    remove_old_files: bool = False,
+) -> int:
+    """
+    Moves processed datachunks stored as separate MiniSEED files into containers holding all processed datachunks
+    of a component-day.
+    Works in the same way as :py:func:`~noiz.api.datachunk.pack_datachunks_into_containers`.
+
+    :param starttime: Starting date of the range
+    :type starttime: Union[datetime.date, datetime.datetime]
+    :param endtime: Ending date of the range
+    :type endtime: Union[datetime.date, datetime.datetime]
+    :param processed_datachunk_params_id: Id of ProcessedDatachunkParams of processed datachunks to be moved
+    :type processed_datachunk_params_id: int
+    :param stations: Selection of stations
+    :type stations: Optional[Tuple[str]]
+    :param components: Selection of components
+    :type components: Optional[Tuple[str]]
+    :param remove_old_files: If separate files and their db entries should be removed after moving
+    :type remove_old_files: bool
+    :return: Number of moved processed datachunks
+    :rtype: int
+    """
+    packed = 0
+    for component, day_start, day_end in _generate_component_days(starttime, endtime, stations, components):
+        processed_datachunks = (
+            db.session.query(ProcessedDatachunk)
+            .join(Datachunk, ProcessedDatachunk.datachunk_id == Datachunk.id)
+            .join(Timespan, Datachunk.timespan_id == Timespan.id)
+            .filter(
+                ProcessedDatachunk.processed_datachunk_params_id == processed_datachunk_params_id,
+                Datachunk.component_id == component.id,
+                ProcessedDatachunk.container_offset.is_(None),
+                Timespan.midtime >= day_start,
+                Timespan.midtime < day_end,
+            )
+            .options(
+                subqueryload(ProcessedDatachunk.datachunk).subqueryload(Datachunk.timespan),
+                subqueryload(ProcessedDatachunk.file),
+            )
+            .all()
+        )
+        packed += _pack_chunks_of_component_day(
+            chunks=processed_datachunks,
+            timespans=[processed_datachunk.datachunk.timespan for processed_datachunk in processed_datachunks],
+            component=component,
+            file_model=ProcessedDatachunkFile,
+            params_id=processed_datachunk_params_id,
+            processing_type="processed_datachunk",
+            remove_old_files=remove_old_files,
+        )
+    logger.info(f"{packed} processed datachunks were moved into component-day containers")
+    return packed
+
+
+def _generate_component_days(
+    starttime: Union[datetime.date, datetime.datetime],
+    endtime: Union[datetime.date, datetime.datetime],
+    stations: Optional[Tuple[str]],
+    components: Optional[Tuple[str]],
+) -> Generator[Tuple[Component, datetime.datetime, datetime.datetime], None, None]:
+    fetched_components = fetch_components(networks=None, stations=stations, components=components)
+    for date in pendulum.Interval(starttime, endtime).range("days"):  # type: ignore
+        day_start, day_end = get_day_bounds(date)
+        for component in fetched_components:
+            yield component, day_start, day_end
+
+
+def _pack_chunks_of_component_day(
+    chunks: List[Union[Datachunk, ProcessedDatachunk]],
+    timespans: List[Timespan],
+    component: Component,
+    file_model: Union[Type[DatachunkFile], Type[ProcessedDatachunkFile]],
+    params_id: int,
+    processing_type: str,
+    remove_old_files: bool,
+) -> int:
+    if len(chunks) == 0:
+        return 0
+
+    old_files = [chunk.file for chunk in chunks]
+    encoded = []
+    for old_file, timespan in zip(old_files, timespans):
+        if not Path(old_file.filepath).exists():
+            raise MissingDataFileException(f"Data file {old_file.filepath} is missing")
+        encoded.append((component, timespan, Path(old_file.filepath).read_bytes()))
+
+    locations = write_chunks_to_component_day_containers(
+        chunks=encoded, params_id=params_id, processing_type=processing_type
+    )
+
+    container_files = {}
+    for chunk, (filepath, offset, length) in zip(chunks, locations):
+        if filepath not in container_files:
+            container_files[filepath] = file_model(filepath=filepath)
+        chunk.file = container_files[filepath]
+        chunk.container_offset = offset
+        chunk.container_length = length
+    db.session.commit()
+
+    if remove_old_files:
+        for old_file in old_files:
+            Path(old_file.filepath).unlink()
+            db.session.delete(old_file)
+        db.session.commit()
+
+    return len(chunks)
@@ -2,21 +2,47 @@
 # Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
 # Copyright © 2019-2023 Contributors to the Noiz project.
 
+from dataclasses import dataclass
 from loguru import logger
 import more_itertools
 import pandas as pd
-from time import sleep
 from sqlalchemy.orm import Query
 from sqlalchemy.exc import IntegrityError, InvalidRequestError
 from sqlalchemy.orm.exc import UnmappedInstanceError
 from sqlalchemy.sql import Insert
-from typing import Iterable, Union, List, Tuple, Any, Collection, Callable, get_args, Dict, TypeVar
+from typing import Iterable, Union, List, Tuple, Any, Collection, Callable, get_args, Dict, Hashable, TypeVar, Optional
 
+from noiz.api.bulk_copy import (
+    copy_upsert_objects,
+    copy_upsert_objects_with_files,
+    get_upsert_conflict_resolution,
+)
 from noiz.database import db
 from noiz.exceptions import CorruptedDataException, InconsistentDataException, ObspyError
 from noiz.models.type_aliases import BulkAddableObjects, InputsForMassCalculations, BulkAddableFileObjects
 
 
+@dataclass
+class DaskRunnerConfig:
+    """
+    Configuration of the Dask cluster used by :py:func:`~noiz.api.helpers._run_calculate_and_upsert_on_dask`.
+    If scheduler_address is provided, noiz connects to an existing cluster and all the other
+    cluster sizing values are ignored.
+    Workers are restarted between batches only if any of them uses more than restart_memory_fraction
+    of its memory limit.
+    """
+
+    n_workers: Optional[int] = None
+    threads_per_worker: Optional[int] = None
+    memory_limit: Optional[str] = "auto"
+    scheduler_address: Optional[str] = None
+    restart_memory_fraction: float = 0.8
+
+
+_dask_runner_config = DaskRunnerConfig()
+_dask_client = None
+
+
 def extract_object_ids(
     instances: Iterable[Any],
 ) -> List[int]:
@@ -89,6 +115,7 @@ def bulk_add_or_upsert_objects(
     objects_to_add: Union[BulkAddableObjects, Collection[BulkAddableObjects]],
     upserter_callable: Callable[[BulkAddableObjects], Insert],
     bulk_insert: bool = True,
+    use_copy: bool = True,
 ) -> None:
     """
     Adds in bulk or upserts provided Collection of objects to DB.
@@ -99,6 +126,9 @@ def bulk_add_or_upsert_objects(
     :type upserter_callable: Callable[[Collection[BulkAddableObjects]], None]
     :param bulk_insert: If bulk add should be even attempted
     :type bulk_insert: bool
+    :param use_copy: If upsert should be done with COPY into a staging table and a single merge statement instead of
+        executing upsert command for each of the objects
+    :type use_copy: bool
     :return: None
     :rtype: NoneType
     """
@@ -117,10 +147,10 @@ def bulk_add_or_upsert_objects(
             db.session.rollback()
 
             logger.warning("Retrying with upsert")
-            _run_upsert_commands(objects_to_add=valid_objects, upserter_callable=upserter_callable)
+            _run_upsert(objects_to_add=valid_objects, upserter_callable=upserter_callable, use_copy=use_copy)
     else:
         logger.info("Starting to perform careful upsert")
-        _run_upsert_commands(objects_to_add=valid_objects, upserter_callable=upserter_callable)
+        _run_upsert(objects_to_add=valid_objects, upserter_callable=upserter_callable, use_copy=use_copy)
     return
 
 
@@ -190,11 +220,27 @@ def bulk_add_and_check_objects(
     return
 
 
-def _run_upsert_commands(
-    objects_to_add: Collection[BulkAddableObjects], upserter_callable: Callable[[BulkAddableObjects], Insert]
+def _run_upsert(
+    objects_to_add: Collection[BulkAddableObjects],
+    upserter_callable: Callable[[BulkAddableObjects], Insert],
+    use_copy: bool = True,
 ) -> None:
-    logger.info(f"Starting upsert procedure. There are {len(objects_to_add)} elements to be processed.")
-    insert_commands = []
+    if use_copy:
+        valid_objects = _select_bulk_addable_objects(objects_to_add)
+        if len(valid_objects) == 0:
+            return
+        conflict_constraint, update_columns = get_upsert_conflict_resolution(upserter_callable(valid_objects[0]))
+        copy_upsert_objects(
+            objects_to_upsert=valid_objects,
+            conflict_constraint=conflict_constraint,
+            conflict_update_columns=update_columns,
+        )
+    else:
+        _run_upsert_commands(objects_to_add=objects_to_add, upserter_callable=upserter_callable)
+
+
+def _select_bulk_addable_objects(objects_to_add: Collection[BulkAddableObjects]) -> List[BulkAddableObjects]:
+    valid_objects = []
     for results in objects_to_add:
         if not isinstance(results, get_args(BulkAddableObjects)):
             logger.warning(
@@ -204,7 +250,16 @@ def _run_upsert_commands(
                 f"Skipping."
             )
             continue
+        valid_objects.append(results)
+    return valid_objects
+
 
+def _run_upsert_commands(
+    objects_to_add: Collection[BulkAddableObjects], upserter_callable: Callable[[BulkAddableObjects], Insert]
+) -> None:
+    logger.info(f"Starting upsert procedure. There are {len(objects_to_add)} elements to be processed.")
+    insert_commands = []
+    for results in _select_bulk_addable_objects(objects_to_add):
         logger.debug(f"Generating upsert command for {results}")
         insert_command = upserter_callable(results)
         insert_commands.append(insert_command)
@@ -216,6 +271,101 @@ def _run_upsert_commands(
     db.session.commit()
 
 
+def configure_dask_runner(config: DaskRunnerConfig) -> None:
+    """
+    Sets configuration of the Dask cluster that will be used by all subsequent parallel runs.
+    If a client was already started with previous configuration, it is closed.
+
+    :param config: Configuration of the cluster
+    :type config: DaskRunnerConfig
+    :return: None
+    :rtype: NoneType
+    """
+    global _dask_runner_config
+
+    close_dask_client()
+    _dask_runner_config = config
+    return
+
+
+def get_dask_client():
+    """
+    Returns Dask client that is shared by all the parallel runs within the process.
+    It is created on the first call, according to config set by
+    :py:func:`~noiz.api.helpers.configure_dask_runner`, and reused afterwards.
+
+    :return: Dask client
+    :rtype: dask.distributed.Client
+    """
+    from dask.distributed import Client, LocalCluster
+
+    global _dask_client
+
+    if _dask_client is not None:
+        return _dask_client
+
+    config = _dask_runner_config
+    if config.scheduler_address is not None:
+        logger.info(f"Connecting to existing Dask scheduler at {config.scheduler_address}")
+        _dask_client = Client(address=config.scheduler_address)
+    else:
+        cluster = LocalCluster(
+            n_workers=config.n_workers,
+            threads_per_worker=config.threads_per_worker,
+            memory_limit=config.memory_limit,
+        )
+        _dask_client = Client(cluster)
+    logger.info(f"Dask client started successfully. You can monitor execution on {_dask_client.dashboard_link}")
+    return _dask_client
+
+
+def close_dask_client() -> None:
+    """
+    Closes the shared Dask client and the local cluster if it was started by noiz.
+
+    :return: None
+    :rtype: NoneType
+    """
+    global _dask_client
+
+    if _dask_client is None:
+        return
+
+    cluster = _dask_client.cluster
+    _dask_client.close()
+    if cluster is not None and _dask_runner_config.scheduler_address is None:
+        cluster.close()
+    _dask_client = None
+    return
+
+
+def _find_workers_exceeding_memory_threshold(
+    workers_info: Dict[str, Dict[str, Any]], memory_fraction: float
+) -> List[str]:
+    """
+    Checks memory used by every worker described in the `workers` section of
+    :py:meth:`dask.distributed.Client.scheduler_info` and returns addresses of the ones that use more
+    than memory_fraction of their memory limit.
+    Workers without memory limit are never reported.
+
+    :param workers_info: Workers section of scheduler info
+    :type workers_info: Dict[str, Dict[str, Any]]
+    :param memory_fraction: Fraction of memory limit above which worker should be restarted
+    :type memory_fraction: float
+    :return: Addresses of workers exceeding the threshold
+    :rtype: List[str]
+    """
+    exceeding = []
+    for address, info in workers_info.items():
+        memory_limit = info.get("memory_limit")
+        if not memory_limit:
+            continue
+        used_memory = info.get("metrics", {}).get("memory", 0)
+        if used_memory > memory_fraction * memory_limit:
+            exceeding.append(address)
+    return exceeding
+
+
 def _run_calculate_and_upsert_on_dask(
     inputs: Iterable[InputsForMassCalculations],
     calculation_task: Callable[[InputsForMassCalculations], Tuple[BulkAddableObjects, ...]],
@@ -225,18 +375,28 @@ def _run_calculate_and_upsert_on_dask(
     with_file: bool = False,
     is_beamforming: bool = False,
     is_event_confirmation: bool = False,
+    with_stats: bool = False,
+    extra_file_attributes: Tuple[str, ...] = (),
+    worker_key: Optional[Callable[[InputsForMassCalculations], Optional[Hashable]]] = None,
 ):
-    from dask.distributed import Client
-
-    client = Client()
-    logger.info(f"Dask client started successfully. You can monitor execution on {client.dashboard_link}")
+    """
+    Submits calculation tasks for all inputs to the Dask client in batches of :paramref:`batch_size` and upserts
+    their results on the fly.
+    If :paramref:`worker_key` is provided, all inputs with the same key are preferably executed by the same worker,
+    so they can reuse data cached in its memory. Workers are assigned to keys in a round-robin manner and other
+    workers are still allowed to steal the tasks. Inputs with key of None are scheduled freely.
+    """
+    client = get_dask_client()
     logger.info(f"Processing will be executed in batches. The chunks size is {batch_size}")
     for i, input_batch in enumerate(more_itertools.chunked(iterable=inputs, n=batch_size)):
         if i != 0:
-            logger.info("Restarting client to clear unmanaged memory.")
-            # Prevents client.restart() crash if exception occured in the previous tasks.
-            sleep(2)
-            client.restart()
+            exceeding_workers = _find_workers_exceeding_memory_threshold(
+                workers_info=client.scheduler_info()["workers"],
+                memory_fraction=_dask_runner_config.restart_memory_fraction,
+            )
+            if len(exceeding_workers) > 0:
+                logger.info(f"Workers {exceeding_workers} exceeded memory threshold. Restarting client.")
+                client.restart()
         logger.info(f"Starting processing of chunk no.{i}")
         _submit_task_to_client_and_add_results_to_db(
             client=client,
@@ -247,8 +407,10 @@ def _run_calculate_and_upsert_on_dask(
             with_file=with_file,
             is_beamforming=is_beamforming,
             is_event_confirmation=is_event_confirmation,
+            with_stats=with_stats,
+            extra_file_attributes=extra_file_attributes,
+            worker_key=worker_key,
         )
-    client.close()
     return
 
 
@@ -261,14 +423,29 @@ def _submit_task_to_client_and_add_results_to_db(
     with_file: bool = False,
     is_beamforming: bool = False,
     is_event_confirmation: bool = False,
+    with_stats: bool = False,
+    extra_file_attributes: Tuple[str, ...] = (),
+    worker_key: Optional[Callable[[InputsForMassCalculations], Optional[Hashable]]] = None,
 ):
     from dask.distributed import as_completed
 
     logger.info("Submitting tasks to Dask client")
+    worker_addresses = sorted(client.scheduler_info()["workers"].keys()) if worker_key is not None else []
+    workers_of_keys: Dict[Hashable, str] = {}
     futures = []
     for input_dict in inputs_to_process:
         try:
-            futures.append(client.submit(calculation_task, input_dict))
+            key = worker_key(input_dict) if worker_key is not None else None
+            if key is None or len(worker_addresses) == 0:
+                futures.append(client.submit(calculation_task, input_dict))
+            else:
+                if key not in workers_of_keys:
+                    workers_of_keys[key] = worker_addresses[len(workers_of_keys) % len(worker_addresses)]
+                futures.append(
+                    client.submit(
+                        calculation_task, input_dict, workers=[workers_of_keys[key]], allow_other_workers=True
+                    )
+                )
         except CorruptedDataException as e:
             if raise_errors:
                 logger.error(f"Cought error {e}. Finishing execution.")
@@ -293,32 +470,16 @@ def _submit_task_to_client_and_add_results_to_db(
     for future_batch in as_completed(futures, with_results=True, raise_errors=False).batches():
         results_nested: List[Tuple[BulkAddableObjects, ...]] = [x[1] for x in future_batch if x[0].status != "error"]
         results: List[BulkAddableObjects] = list(more_itertools.flatten(results_nested))
-        logger.info(f"Running bulk_add_or_upsert for {len(results)} results")
-
-        if with_file:
-            files_to_add = [x.file for x in results if x.file is not None]
-            if len(files_to_add) > 0:
-                bulk_add_and_check_objects(
-                    objects_to_add=files_to_add,
-                )
-        if is_beamforming:
-            peaks_to_add = []
-            for res in results:
-                peaks_to_add.extend(res.average_abspower_peaks)
-                peaks_to_add.extend(res.average_relpower_peaks)
-                peaks_to_add.extend(res.all_abspower_peaks)
-                peaks_to_add.extend(res.all_relpower_peaks)
-            if len(peaks_to_add) > 0:
-                bulk_add_and_check_objects(
-                    objects_to_add=peaks_to_add,
-                )
 
-        if is_event_confirmation:
-            bulk_merge_or_upsert_objects(
-                objects_to_merge=results, upserter_callable=upserter_callable, bulk_insert=True
-            )
-        else:
-            bulk_add_or_upsert_objects(objects_to_add=results, upserter_callable=upserter_callable, bulk_insert=True)
+        _add_results_to_db(
+            results=results,
+            upserter_callable=upserter_callable,
+            with_file=with_file,
+            is_beamforming=is_beamforming,
+            is_event_confirmation=is_event_confirmation,
+            with_stats=with_stats,
+            extra_file_attributes=extra_file_attributes,
+        )
 
     return
 
@@ -332,6 +493,8 @@ def _run_calculate_and_upsert_sequentially(
     with_file: bool = False,
     is_beamforming: bool = False,
     is_event_confirmation: bool = False,
+    with_stats: bool = False,
+    extra_file_attributes: Tuple[str, ...] = (),
 ):
     for i, input_batch in enumerate(more_itertools.chunked(iterable=inputs, n=batch_size)):
         logger.info(f"Starting processing of chunk no.{i}")
@@ -363,34 +526,96 @@ def _run_calculate_and_upsert_sequentially(
         logger.info("Calculations finished for a batch. Starting upsert operation.")
 
         results: List[BulkAddableObjects] = list(more_itertools.flatten(results_nested))
-        if with_file:
-            files_to_add = [x.file for x in results if x.file is not None]
-            if len(files_to_add) > 0:
-                bulk_add_and_check_objects(
-                    objects_to_add=files_to_add,
-                )
+        _add_results_to_db(
+            results=results,
+            upserter_callable=upserter_callable,
+            with_file=with_file,
+            is_beamforming=is_beamforming,
+            is_event_confirmation=is_event_confirmation,
+            with_stats=with_stats,
+            extra_file_attributes=extra_file_attributes,
+        )
 
-        if is_beamforming:
-            peaks_to_add = []
-            for res in results:
-                peaks_to_add.extend(res.average_abspower_peaks)
-                peaks_to_add.extend(res.average_relpower_peaks)
-                peaks_to_add.extend(res.all_abspower_peaks)
-                peaks_to_add.extend(res.all_relpower_peaks)
-            if len(peaks_to_add) > 0:
-                bulk_add_and_check_objects(
-                    objects_to_add=peaks_to_add,
-                )
+    logger.info("All processing is done.")
+    return
 
-        if is_event_confirmation:
-            bulk_merge_or_upsert_objects(
-                objects_to_merge=results, upserter_callable=upserter_callable, bulk_insert=True
+
+def _add_results_to_db(
+    results: List[BulkAddableObjects],
+    upserter_callable: Callable[[BulkAddableObjects], Insert],
+    with_file: bool = False,
+    is_beamforming: bool = False,
+    is_event_confirmation: bool = False,
+    with_stats: bool = False,
+    extra_file_attributes: Tuple[str, ...] = (),
+) -> None:
+    """
+    Saves a batch of calculation results to the DB.
+    Results that are only pointing to a file are written together with their files with COPY based two phase writer.
+    Conflicting rows are resolved as ``upserter_callable`` would do it, with the same constraint and updated columns.
+    Results with many-to-many relationships, i.e. beamforming peaks and confirmation runs, are added through the ORM.
+
+    :param results: Results to be saved
+    :type results: List[BulkAddableObjects]
+    :param upserter_callable: Callable with upsert method to be used in case of bulk add failure
+    :type upserter_callable: Callable[[BulkAddableObjects], Insert]
+    :param with_file: If results have files that should be saved too
+    :type with_file: bool
+    :param is_beamforming: If results are beamforming results with peaks
+    :type is_beamforming: bool
+    :param is_event_confirmation: If results are event confirmation results that should be merged
+    :type is_event_confirmation: bool
+    :param with_stats: If results carry their stats that should be upserted together with them
+    :type with_stats: bool
+    :param extra_file_attributes: Names of other relationships of results pointing to optional files
+    :type extra_file_attributes: Tuple[str, ...]
+    :return: None
+    :rtype: NoneType
+    """
+    if len(results) == 0:
+        return
+
+    if with_file and not is_beamforming and not is_event_confirmation:
+        logger.info(f"Running COPY upsert for {len(results)} results and their files")
+        valid_results = _select_bulk_addable_objects(results)
+        if len(valid_results) == 0:
+            return
+        conflict_constraint, update_columns = get_upsert_conflict_resolution(upserter_callable(valid_results[0]))
+        copy_upsert_objects_with_files(
+            objects_to_upsert=valid_results,
+            conflict_constraint=conflict_constraint,
+            dependent_attribute="stats" if with_stats else None,
+            extra_file_attributes=extra_file_attributes,
+            conflict_update_columns=update_columns,
+        )
+        return
+
+    logger.info(f"Running bulk_add_or_upsert for {len(results)} results")
+    if with_file:
+        files_to_add = [x.file for x in results if x.file is not None]
+        for attribute in extra_file_attributes:
+            files_to_add.extend({id(f): f for f in (getattr(x, attribute) for x in results) if f is not None}.values())
+        if len(files_to_add) > 0:
+            bulk_add_and_check_objects(
+                objects_to_add=files_to_add,
             )
-        else:
-            bulk_add_or_upsert_objects(objects_to_add=results, upserter_callable=upserter_callable, bulk_insert=True)
 
-    logger.info("All processing is done.")
-    return
+    if is_beamforming:
+        peaks_to_add = []
+        for res in results:
+            peaks_to_add.extend(res.average_abspower_peaks)
+            peaks_to_add.extend(res.average_relpower_peaks)
+            peaks_to_add.extend(res.all_abspower_peaks)
+            peaks_to_add.extend(res.all_relpower_peaks)
+        if len(peaks_to_add) > 0:
+            bulk_add_and_check_objects(
+                objects_to_add=peaks_to_add,
+            )
+
+    if is_event_confirmation:
+        bulk_merge_or_upsert_objects(objects_to_merge=results, upserter_callable=upserter_callable, bulk_insert=True)
+    else:
+        bulk_add_or_upsert_objects(objects_to_add=results, upserter_callable=upserter_callable, bulk_insert=True)
 
 
 def _parse_query_as_dataframe(query: Query) -> pd.DataFrame:
@@ -5,6 +5,8 @@
 import datetime
 import itertools
 from loguru import logger
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import Insert
 
 from noiz.api.helpers import _run_calculate_and_upsert_on_dask, _run_calculate_and_upsert_sequentially
@@ -27,7 +29,11 @@ from noiz.models import (
     StackingSchema,
 )
 from noiz.api.processing_config import fetch_stacking_schema_by_id
-from noiz.processing.stacking import _generate_stacking_timespans, do_linear_stack_of_crosscorrelations_cartesian
+from noiz.processing.stacking import (
+    _generate_stacking_timespans,
+    sum_crosscorrelations_cartesian,
+    assign_items_to_stacking_timespans,
+)
 
 
 def fetch_stacking_timespans(
@@ -161,7 +167,18 @@ def stack_crosscorrelation_cartesian(
     raise_errors: bool = False,
     batch_size: int = 5000,
     parallel: bool = True,
+    incremental: bool = False,
 ) -> None:
+    """
+    Stacks CrosscorrelationCartesians passing QCTwo for all StackingTimespans of a given StackingSchema.
+
+    In the :paramref:`incremental` mode, running sums and member sets persisted with existing CCFStacks are reused.
+    Only the CrosscorrelationCartesians that are not yet members of a stack are loaded and added to it, stacks without
+    new members are not touched.
+    A stack is rebuilt from scratch if it has no running sum persisted or if any of its members stopped passing
+    QCTwo. A change of StackingSchema or QCTwoConfig means a different StackingSchema, so its stacks are always built
+    from scratch. Use non-incremental mode to force a full rebuild.
+    """
     calculation_inputs = _prepare_inputs_for_stacking_ccfs(
         stacking_schema_id=stacking_schema_id,
         starttime=starttime,
@@ -177,6 +194,7 @@ def stack_crosscorrelation_cartesian(
         include_intracorrelation=include_intracorrelation,
         only_autocorrelation=only_autocorrelation,
         only_intracorrelation=only_intracorrelation,
+        incremental=incremental,
     )
 
     if parallel:
@@ -214,7 +232,16 @@ def _prepare_inputs_for_stacking_ccfs(
     include_intracorrelation: Optional[bool] = False,
     only_autocorrelation: Optional[bool] = False,
     only_intracorrelation: Optional[bool] = False,
+    incremental: bool = False,
+    fetch_batch_size: int = 5000,
 ) -> Generator[StackingInputs, None, None]:
+    """
+    Prepares inputs for stacking of CrosscorrelationCartesians.
+    All CrosscorrelationCartesians that are within the stacked period together with their QCTwoResults are fetched
+    in pages of :paramref:`fetch_batch_size` rows, see :func:`_fetch_qctwo_ccfs_in_pages`.
+    They are assigned to StackingTimespans with an in-memory interval join, one ComponentPairCartesian at the time.
+    In the incremental mode, existing CCFStacks of each of the ComponentPairCartesians are fetched and passed along.
+    """
     stacking_schema = fetch_stacking_schema_by_id(id=stacking_schema_id)
     stacking_timespans = fetch_stacking_timespans(
         stacking_schema_id=stacking_schema.id,
@@ -244,45 +271,118 @@ def _prepare_inputs_for_stacking_ccfs(
             "There are no QCTwo results for that QCTwoConfig. Are you sure you ran QCTwo before?"
         )
 
-    for stacking_timespan, componentpair_cartesian in itertools.product(stacking_timespans, componentpairs_cartesian):
-        fetched_qc_ccfs = (
-            db.session.query(QCTwoResults, CrosscorrelationCartesian)
-            .filter(QCTwoResults.qctwo_config_id == qctwo_config.id)
+    if len(stacking_timespans) == 0 or len(componentpairs_cartesian) == 0:
+        return
+
+    componentpairs_by_id = {pair.id: pair for pair in componentpairs_cartesian}
+
+    fetched_qc_ccfs = itertools.chain.from_iterable(
+        _fetch_qctwo_ccfs_in_pages(
+            qctwo_config_id=qctwo_config.id,
+            componentpair_ids=componentpairs_by_id.keys(),
+            starttime=min(x.starttime for x in stacking_timespans),
+            endtime=max(x.endtime for x in stacking_timespans),
+            page_size=fetch_batch_size,
+        )
+    )
+
+    for componentpair_id, rows in itertools.groupby(fetched_qc_ccfs, key=lambda x: x[1].componentpair_id):
+        ccfs_of_pair = [(starttime, endtime, (qcres, ccf)) for qcres, ccf, starttime, endtime in rows]
+
+        existing_stacks = {}
+        if incremental:
+            existing_stacks = {
+                stack.stacking_timespan_id: stack
+                for stack in _fetch_ccfstacks_of_componentpair(
+                    stacking_schema_id=stacking_schema.id, componentpair_id=componentpair_id
+                )
+            }
+
+        for stacking_timespan, qctwo_ccfs_container in assign_items_to_stacking_timespans(
+            stacking_timespans=stacking_timespans,
+            items=ccfs_of_pair,
+        ):
+            yield StackingInputs(
+                qctwo_ccfs_container=qctwo_ccfs_container,
+                componentpair_cartesian=componentpairs_by_id[componentpair_id],
+                stacking_schema=stacking_schema,
+                stacking_timespan=stacking_timespan,
+                existing_stack=existing_stacks.get(stacking_timespan.id),
+            )
+
+
+def _fetch_qctwo_ccfs_in_pages(
+    qctwo_config_id: int,
+    componentpair_ids: Collection[int],
+    starttime: datetime.datetime,
+    endtime: datetime.datetime,
+    page_size: int,
+) -> Generator[List[Tuple[QCTwoResults, CrosscorrelationCartesian, datetime.datetime, datetime.datetime]], None, None]:
+    """
+    Fetches QCTwoResults with their CrosscorrelationCartesians and Timespan bounds ordered by component pair and
+    timespan start.
+    Rows are paged with a keyset on (componentpair_id, starttime, QCTwoResults.id) and every page is fully
+    materialized before it is yielded, so no cursor is kept open while the consumer commits to the database.
+    """
+    last_key: Optional[Tuple[int, datetime.datetime, int]] = None
+    while True:
+        query = (
+            db.session.query(QCTwoResults, CrosscorrelationCartesian, Timespan.starttime, Timespan.endtime)
+            .filter(QCTwoResults.qctwo_config_id == qctwo_config_id)
             .join(
                 CrosscorrelationCartesian, QCTwoResults.crosscorrelation_cartesian_id == CrosscorrelationCartesian.id
             )
             .join(Timespan, CrosscorrelationCartesian.timespan_id == Timespan.id)
             .filter(
-                CrosscorrelationCartesian.componentpair_id == componentpair_cartesian.id,
-                Timespan.starttime >= stacking_timespan.starttime,
-                Timespan.endtime <= stacking_timespan.endtime,
+                CrosscorrelationCartesian.componentpair_id.in_(componentpair_ids),
+                Timespan.starttime >= starttime,
+                Timespan.endtime <= endtime,
+            )
+        )
+        if last_key is not None:
+            query = query.filter(
+                tuple_(
+                    CrosscorrelationCartesian.componentpair_id,
+                    Timespan.starttime,  # type: ignore
+                    QCTwoResults.id,
+                )
+                > last_key
             )
+        page = (
+            query.options(joinedload(CrosscorrelationCartesian.file))
+            .order_by(CrosscorrelationCartesian.componentpair_id, Timespan.starttime, QCTwoResults.id)
+            .limit(page_size)
             .all()
         )
+        if len(page) == 0:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        qcres, ccf, page_starttime, _ = page[-1]
+        last_key = (ccf.componentpair_id, page_starttime, qcres.id)
 
-        if len(fetched_qc_ccfs) == 0:
-            logger.debug("There were no ccfs for that stack")
-            continue
 
-        yield StackingInputs(
-            qctwo_ccfs_container=fetched_qc_ccfs,
-            componentpair_cartesian=componentpair_cartesian,
-            stacking_schema=stacking_schema,
-            stacking_timespan=stacking_timespan,
-        )
+def _fetch_ccfstacks_of_componentpair(stacking_schema_id: int, componentpair_id: int) -> List[CCFStack]:
+    return CCFStack.query.filter(
+        CCFStack.stacking_schema_id == stacking_schema_id,
+        CCFStack.componentpair_id == componentpair_id,
+    ).all()
 
 
 def _validate_and_stack_ccfs_wrapper(
     inputs: StackingInputs,
 ) -> Tuple[Optional[CCFStack], ...]:
-    return (
-        _validate_and_stack_ccfs(
-            qctwo_ccfs_container=inputs["qctwo_ccfs_container"],
-            componentpair_cartesian=inputs["componentpair_cartesian"],
-            stacking_schema=inputs["stacking_schema"],
-            stacking_timespan=inputs["stacking_timespan"],
-        ),
+    stack = _validate_and_stack_ccfs(
+        qctwo_ccfs_container=inputs["qctwo_ccfs_container"],
+        componentpair_cartesian=inputs["componentpair_cartesian"],
+        stacking_schema=inputs["stacking_schema"],
+        stacking_timespan=inputs["stacking_timespan"],
+        existing_stack=inputs.get("existing_stack"),
     )
+    if stack is None:
+        return ()
+    return (stack,)
 
 
 def _validate_and_stack_ccfs(
@@ -290,6 +390,7 @@ def _validate_and_stack_ccfs(
     componentpair_cartesian: ComponentPairCartesian,
     stacking_schema: StackingSchema,
     stacking_timespan: StackingTimespan,
+    existing_stack: Optional[CCFStack] = None,
 ) -> Optional[CCFStack]:
     """
     Takes container of tuples with QCTwoResults and CrosscorrelationCartesian (the same crosscorrelation_cartesian_id),
@@ -298,6 +399,10 @@ def _validate_and_stack_ccfs(
     Before stacking it verifies if there is enough CrosscorrelationCartesians to be stacked, it can be adjusted by setting
     a value of :paramref:`noiz.models.stacking.StackingSchema.minimum_ccf_count`.
 
+    If an :paramref:`existing_stack` with a persisted running sum is provided and all of its members are still
+    passing QCTwo, only the CrosscorrelationCartesians that are not yet its members are loaded and added to the
+    running sum. If there are no new members, None is returned since the existing stack is up to date.
+
     It returns an instance of :py:class:`~noiz.models.stacking.CCFStack` that is ready to be inserted to the database.
 
     :param qctwo_ccfs_container: CrosscorrelationCartesians to be stacked together with associated QCTwoResult instances
@@ -308,6 +413,8 @@ def _validate_and_stack_ccfs(
     :type stacking_schema: StackingSchema
     :param stacking_timespan: StackingTimespan that is defining that stack
     :type stacking_timespan: StackingTimespan
+    :param existing_stack: Previously calculated stack that should be updated incrementally
+    :type existing_stack: Optional[CCFStack]
     :return: Returns None if CrosscorrelationCartesians cannot be stacked or CCFStack if they can
     :rtype: Optional[CCFStack]
     """
@@ -324,13 +431,28 @@ def _validate_and_stack_ccfs(
         )
         return None
 
-    logger.debug(f"Calculating linear stack for {componentpair_cartesian} {stacking_schema} {stacking_timespan}")
-    mean_ccf = do_linear_stack_of_crosscorrelations_cartesian(ccfs=valid_ccfs)
+    valid_ids = {ccf.id for ccf in valid_ccfs}
+    if _can_be_updated_incrementally(existing_stack=existing_stack, valid_ccf_ids=valid_ids):
+        member_ids = set(existing_stack.member_ids)  # type: ignore
+        new_ccfs = [ccf for ccf in valid_ccfs if ccf.id not in member_ids]
+        if len(new_ccfs) == 0:
+            logger.debug(f"There are no new ccfs for stack {existing_stack}. Skipping.")
+            return None
+        logger.debug(f"Adding {len(new_ccfs)} ccfs to running sum of {existing_stack}")
+        stack_sum = sum_crosscorrelations_cartesian(
+            ccfs=new_ccfs,
+            previous_sum=existing_stack.stack_sum,  # type: ignore
+        )
+    else:
+        logger.debug(f"Calculating linear stack for {componentpair_cartesian} {stacking_schema} {stacking_timespan}")
+        stack_sum = sum_crosscorrelations_cartesian(ccfs=valid_ccfs)
 
     stack = CCFStack(
         stacking_timespan_id=stacking_timespan.id,
         stacking_schema_id=stacking_schema.id,
-        stack=mean_ccf,
+        stack=stack_sum / no_ccfs,
+        stack_sum=stack_sum,
+        member_ids=sorted(valid_ids),
         componentpair_id=componentpair_cartesian.id,
         no_ccfs=no_ccfs,
         ccfs=list(valid_ccfs),
@@ -338,6 +460,18 @@ def _validate_and_stack_ccfs(
     return stack
 
 
+def _can_be_updated_incrementally(existing_stack: Optional[CCFStack], valid_ccf_ids: Collection[int]) -> bool:
+    """
+    Checks if the existing stack has a running sum persisted and if all of its members are still valid.
+    """
+    if existing_stack is None or existing_stack.stack_sum is None or existing_stack.member_ids is None:
+        return False
+    if not set(existing_stack.member_ids).issubset(valid_ccf_ids):
+        logger.debug(f"Some of the members of {existing_stack} are not valid anymore. It will be rebuilt.")
+        return False
+    return True
+
+
 def _validate_crosscorrelations_cartesian_with_qctwo(
     qctwo_ccfs_container: Collection[Tuple[QCTwoResults, CrosscorrelationCartesian]],
 ) -> Tuple[CrosscorrelationCartesian, ...]:
@@ -379,12 +513,16 @@ def _generate_ccfstack_upsert_command(stack: CCFStack) -> Insert:
             componentpair_id=stack.componentpair_id,
             stack=stack.stack,
             no_ccfs=stack.no_ccfs,
+            stack_sum=stack.stack_sum,
+            member_ids=stack.member_ids,
         )
         .on_conflict_do_update(
             constraint="unique_stack_per_pair_per_config",
             set_={
                 "stack": stack.stack,
                 "no_ccfs": stack.no_ccfs,
+                "stack_sum": stack.stack_sum,
+                "member_ids": stack.member_ids,
             },
         )
     )
@@ -11,6 +11,7 @@ from typing import List, Collection, Union
 from noiz.exceptions import NoDataException
 from noiz.models.component import Component
 from noiz.models.timeseries import Tsindex
+from noiz.processing.time_utils import get_year_doy_bounds
 from noiz.processing.timeseries import run_mseedindex_on_passed_dir
 from noiz.models.timespan import Timespan
 
@@ -18,12 +19,13 @@ from noiz.models.timespan import Timespan
 def fetch_raw_timeseries(component: Component, execution_date: datetime.datetime) -> Tsindex:
     year = execution_date.year
     day_of_year = execution_date.timetuple().tm_yday
+    day_start, day_end = get_year_doy_bounds(year=year, doy=day_of_year)
     time_series: List[Tsindex] = Tsindex.query.filter(
         Tsindex.network == component.network,
         Tsindex.station == component.station,
         Tsindex.component == component.component,
-        Tsindex.starttime_year == year,
-        Tsindex.starttime_doy == day_of_year,
+        Tsindex.starttime >= day_start,
+        Tsindex.starttime < day_end,
     ).all()
     if len(time_series) > 1:
         raise ValueError(
@@ -13,6 +13,7 @@ from typing import Iterable, List, Union, Optional, Generator, Any, Collection
 
 from noiz.database import db
 from noiz.models.timespan import Timespan
+from noiz.processing.time_utils import get_year_doy_bounds
 from noiz.processing.timespan import generate_timespans
 from noiz.validation_helpers import validate_timestamp_as_pydatetime, validate_to_tuple
 
@@ -117,7 +118,8 @@ def insert_timespans_into_db(timespans: Iterable[Timespan], bulk_insert: bool) -
 def fetch_timespans_for_doy(year: int, doy: int) -> List[Timespan]:
     """
     Fetches all timespans for a given day of year.
-    It's based on timespan's midtime.
+    It's based on timespan's midtime, the day is translated into a half-open UTC time range so the index
+    on midtime can be used.
 
     Warning: It has to be executed withing application context.
 
@@ -128,7 +130,8 @@ def fetch_timespans_for_doy(year: int, doy: int) -> List[Timespan]:
     :return: List of all timespans on given day
     :rtype: List[Timespan]
     """
-    timespans = Timespan.query.filter(Timespan.midtime_year == year, Timespan.midtime_doy == doy).all()
+    day_start, day_end = get_year_doy_bounds(year=year, doy=doy)
+    timespans = Timespan.query.filter(Timespan.midtime >= day_start, Timespan.midtime < day_end).all()
     return timespans
 
 
@@ -161,6 +164,48 @@ def fetch_timespans_between_dates(
     return timespans
 
 
+def fetch_timespans_between_dates_in_batches(
+    starttime: Union[pd.Timestamp, datetime.datetime, np.datetime64, UTCDateTime, str],
+    endtime: Union[pd.Timestamp, datetime.datetime, np.datetime64, UTCDateTime, str],
+    batch_size: int = 100,
+) -> Generator[List[Timespan], None, None]:
+    """
+    Fetches all timespans between two times in batches ordered by id.
+    Every batch is fetched with a separate keyset-paginated query, so only a single batch of Timespans
+    is kept in memory at the time.
+    Selection criteria are the same as in :py:func:`~noiz.api.timespan.fetch_timespans_between_dates`.
+
+    Warning: It has to be executed withing application context.
+
+    :param starttime: Time after which to look for timespans
+    :type starttime: Union[datetime.date, datetime.datetime, UTCDateTime]
+    :param endtime: Time before which to look for timespans
+    :type endtime: Union[datetime.date, datetime.datetime, UTCDateTime],
+    :param batch_size: Count of timespans in a single batch
+    :type batch_size: int
+    :return: Generator of batches of timespans
+    :rtype: Generator[List[Timespan], None, None]
+    """
+
+    py_starttime = validate_timestamp_as_pydatetime(starttime)
+    py_endtime = validate_timestamp_as_pydatetime(endtime)
+
+    last_id = None
+    while True:
+        filters = [
+            Timespan.starttime >= py_starttime,
+            Timespan.endtime <= py_endtime,
+        ]
+        if last_id is not None:
+            filters.append(Timespan.id > last_id)
+
+        timespans = Timespan.query.filter(*filters).order_by(Timespan.id).limit(batch_size).all()
+        if len(timespans) == 0:
+            return
+        yield timespans
+        last_id = timespans[-1].id
+
+
 def fetch_timespans(
     starttime: Optional[Union[pd.Timestamp, datetime.datetime, np.datetime64, UTCDateTime, str]] = None,
     endtime: Optional[Union[pd.Timestamp, datetime.datetime, np.datetime64, UTCDateTime, str]] = None,
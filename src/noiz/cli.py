@@ -602,9 +602,51 @@ def add_soh_files(station, station_type, soh_type, paths, network, **kwargs):
 
 
 @processing_group.group("processing")
-def processing_group():  # type: ignore
+@click.option("--dask_n_workers", nargs=1, type=int, default=None, help="Count of workers of local Dask cluster")
+@click.option(
+    "--dask_threads_per_worker", nargs=1, type=int, default=None, help="Count of threads of each Dask worker"
+)
+@click.option(
+    "--dask_memory_limit", nargs=1, type=str, default="auto", show_default=True, help="Memory limit of each worker"
+)
+@click.option(
+    "--dask_scheduler_address",
+    nargs=1,
+    type=str,
+    default=None,
+    help="Address of existing Dask scheduler. If provided, no local cluster is started.",
+)
+@click.option(
+    "--dask_restart_memory_fraction",
+    nargs=1,
+    type=float,
+    default=0.8,
+    show_default=True,
+    help="Fraction of worker memory limit above which workers are restarted between batches",
+)
+@click.pass_context
+def processing_group(
+    ctx,
+    dask_n_workers,
+    dask_threads_per_worker,
+    dask_memory_limit,
+    dask_scheduler_address,
+    dask_restart_memory_fraction,
+):  # type: ignore
     """Data processing"""
-    pass
+
+    from noiz.api.helpers import DaskRunnerConfig, configure_dask_runner, close_dask_client
+
+    configure_dask_runner(
+        DaskRunnerConfig(
+            n_workers=dask_n_workers,
+            threads_per_worker=dask_threads_per_worker,
+            memory_limit=dask_memory_limit,
+            scheduler_address=dask_scheduler_address,
+            restart_memory_fraction=dask_restart_memory_fraction,
+        )
+    )
+    ctx.call_on_close(close_dask_client)
 
 
 @processing_group.command("prepare_datachunks")
@@ -616,9 +658,36 @@ def processing_group():  # type: ignore
 @click.option("-p", "--datachunk_params_id", nargs=1, type=int, default=1, show_default=True)
 @click.option("-b", "--batch_size", nargs=1, type=int, default=1000, show_default=True)
 @click.option("--parallel/--no_parallel", default=True)
+@click.option(
+    "--group_by_file/--no_group_by_file",
+    default=False,
+    help="Process all components stored in the same raw file within a single task that decodes that file once",
+)
+@click.option(
+    "--compute_stats/--no_compute_stats",
+    default=False,
+    help="Calculate DatachunkStats while preparing datachunks instead of in a separate calc_datachunk_stats run",
+)
+@click.option(
+    "--precheck_availability/--no_precheck_availability",
+    default=False,
+    help="Skip timespans without enough data according to tsindex metadata and report predicted rejection rate",
+)
 @click.option("-v", "--verbose", count=True, callback=_setup_logging_verbosity)
 @click.option("--quiet", is_flag=True, callback=_setup_quiet)
-def prepare_datachunks(station, component, startdate, enddate, datachunk_params_id, batch_size, parallel, **kwargs):
+def prepare_datachunks(
+    station,
+    component,
+    startdate,
+    enddate,
+    datachunk_params_id,
+    batch_size,
+    parallel,
+    group_by_file,
+    compute_stats,
+    precheck_availability,
+    **kwargs,
+):
     """Start preparation of datachunks in linear or parallel fashion"""
 
     from noiz.api.datachunk import run_datachunk_preparation
@@ -631,6 +700,9 @@ def prepare_datachunks(station, component, startdate, enddate, datachunk_params_
         processing_config_id=datachunk_params_id,
         parallel=parallel,
         batch_size=batch_size,
+        group_by_file=group_by_file,
+        compute_stats=compute_stats,
+        precheck_availability=precheck_availability,
     )
 
 
@@ -795,6 +867,12 @@ def run_ppsd(
 @click.option("-b", "--batch_size", nargs=1, type=int, default=1000, show_default=True)
 @click.option("--parallel/--no_parallel", default=True)
 @click.option("--skip_existing/--no_skip_existing", default=True)
+@click.option(
+    "--batch_by",
+    type=click.Choice(["timespan", "component_day"], case_sensitive=False),
+    default=None,
+    help="Process all datachunks of a timespan or of a component-day within a single task as a 2D array",
+)
 @click.option("-v", "--verbose", count=True, callback=_setup_logging_verbosity)
 @click.option("--quiet", is_flag=True, callback=_setup_quiet)
 def process_datachunks(
@@ -806,6 +884,7 @@ def process_datachunks(
     batch_size,
     parallel,
     skip_existing,
+    batch_by,
     **kwargs,
 ):
     """Start processing of datachunks"""
@@ -821,9 +900,62 @@ def process_datachunks(
         batch_size=batch_size,
         parallel=parallel,
         skip_existing=skip_existing,
+        batch_by=batch_by,
     )
 
 
+@processing_group.command("pack_datachunks")
+@with_appcontext
+@click.option("-s", "--station", multiple=True, type=str, callback=_validate_zero_length_as_none)
+@click.option("-c", "--component", multiple=True, type=str, callback=_validate_zero_length_as_none)
+@click.option("-sd", "--startdate", nargs=1, type=str, required=True, callback=_parse_as_date)
+@click.option("-ed", "--enddate", nargs=1, type=str, required=True, callback=_parse_as_date)
+@click.option("-p", "--datachunk_params_id", nargs=1, type=int, default=None)
+@click.option("--processed_datachunk_params_id", nargs=1, type=int, default=None)
+@click.option(
+    "--remove_old_files/--no_remove_old_files",
+    default=False,
+    help="Remove separate MiniSEED files after their content was moved into containers",
+)
+@click.option("-v", "--verbose", count=True, callback=_setup_logging_verbosity)
+@click.option("--quiet", is_flag=True, callback=_setup_quiet)
+def pack_datachunks(
+    station,
+    component,
+    startdate,
+    enddate,
+    datachunk_params_id,
+    processed_datachunk_params_id,
+    remove_old_files,
+    **kwargs,
+):
+    """Move datachunks and processed datachunks stored as separate files into component-day containers"""
+
+    from noiz.api.datachunk import pack_datachunks_into_containers, pack_processed_datachunks_into_containers
+
+    if datachunk_params_id is None and processed_datachunk_params_id is None:
+        raise click.UsageError("You have to provide datachunk_params_id, processed_datachunk_params_id or both.")
+
+    if datachunk_params_id is not None:
+        pack_datachunks_into_containers(
+            stations=station,
+            components=component,
+            starttime=startdate,
+            endtime=enddate,
+            datachunk_params_id=datachunk_params_id,
+            remove_old_files=remove_old_files,
+        )
+    if processed_datachunk_params_id is not None:
+        pack_processed_datachunks_into_containers(
+            stations=station,
+            components=component,
+            starttime=startdate,
+            endtime=enddate,
+            processed_datachunk_params_id=processed_datachunk_params_id,
+            remove_old_files=remove_old_files,
+        )
+
+
 @processing_group.command("run_crosscorrelations_cartesian")
 @with_appcontext
 @click.option("-s", "--station_code", multiple=True, type=str, callback=_validate_zero_length_as_none)
@@ -836,6 +968,14 @@ def process_datachunks(
 @click.option("--raise_errors/--no_raise_errors", default=False)
 @click.option("-b", "--batch_size", nargs=1, type=int, default=1000, show_default=True)
 @click.option("--parallel/--no_parallel", default=True)
+@click.option("--skip_existing/--no_skip_existing", default=True)
+@click.option(
+    "--tile_size",
+    nargs=1,
+    type=int,
+    default=None,
+    help="Split pair matrix of every timespan into tiles of that many components",
+)
 @click.option("-v", "--verbose", count=True, callback=_setup_logging_verbosity)
 @click.option("--quiet", is_flag=True, callback=_setup_quiet)
 def run_crosscorrelations_cartesian(
@@ -849,6 +989,8 @@ def run_crosscorrelations_cartesian(
     raise_errors,
     batch_size,
     parallel,
+    skip_existing,
+    tile_size,
     **kwargs,
 ):
     """Start processing of crosscorrelations_cartesian. Limited amount of pair selection arguments, use API directly if needed."""
@@ -866,6 +1008,8 @@ def run_crosscorrelations_cartesian(
         raise_errors=raise_errors,
         batch_size=batch_size,
         parallel=parallel,
+        skip_existing=skip_existing,
+        tile_size=tile_size,
     )
 
 
@@ -938,6 +1082,11 @@ def run_qctwo(qctwo_config_id, **kwargs):
 @click.option("--raise_errors/--no_raise_errors", default=False)
 @click.option("-b", "--batch_size", nargs=1, type=int, default=1000, show_default=True)
 @click.option("--parallel/--no_parallel", default=True)
+@click.option(
+    "--incremental/--no_incremental",
+    default=False,
+    help="Update existing stacks with new ccfs only, instead of rebuilding them from scratch",
+)
 @click.option("-v", "--verbose", count=True, callback=_setup_logging_verbosity)
 @click.option("--quiet", is_flag=True, callback=_setup_quiet)
 def run_stacking(
@@ -951,6 +1100,7 @@ def run_stacking(
     raise_errors,
     batch_size,
     parallel,
+    incremental,
     **kwargs,
 ):
     """Start stacking of crosscorrelations_cartesian. Limited amount of pair selection arguments, use API directly if needed."""
@@ -968,6 +1118,7 @@ def run_stacking(
         raise_errors=raise_errors,
         batch_size=batch_size,
         parallel=parallel,
+        incremental=incremental,
     )
 
 
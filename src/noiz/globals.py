@@ -5,8 +5,10 @@
 from enum import Enum
 
 import os
+import tempfile
 
 PROCESSED_DATA_DIR = os.environ.get("PROCESSED_DATA_DIR", "")
+RESPONSE_CACHE_DIR = os.environ.get("RESPONSE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "noiz_response_cache"))
 
 
 class ExtendedEnum(Enum):
@@ -29,7 +29,15 @@ from noiz.models.processing_params import (
 )
 from noiz.models.timeseries import Tsindex
 from noiz.models.soh import SohInstrument, SohGps, AveragedSohGps
-from noiz.models.datachunk import Datachunk, DatachunkFile, DatachunkStats, ProcessedDatachunk, ProcessedDatachunkFile
+from noiz.models.datachunk import (
+    Datachunk,
+    DatachunkFile,
+    DatachunkStats,
+    ProcessedDatachunk,
+    ProcessedDatachunkFile,
+    ProcessedDatachunkReference,
+    ProcessedDatachunkSpectrumFile,
+)
 from noiz.models.ppsd import PPSDResult, PPSDFile
 from noiz.models.qc import (
     QCOneConfig,
@@ -48,6 +48,7 @@ class CrosscorrelationCartesian(db.Model):
         db.ForeignKey("crosscorrelation_cartesian_file.id"),
         nullable=True,
     )
+    container_offset = db.Column("container_offset", db.Integer, nullable=True)
 
     componentpair_cartesian = db.relationship("ComponentPairCartesian", foreign_keys=[componentpair_id], lazy="joined")
 
@@ -66,6 +67,11 @@ class CrosscorrelationCartesian(db.Model):
     stacks = db.relationship("CCFStack", secondary=ccf_ccfstack_association_table, back_populates="ccfs")
 
     def load_data(self, crosscorrelation_cartesian_file: Optional[CrosscorrelationCartesianFile] = None):
+        """
+        Loads the ccf from disk.
+        If the ccf is stored inside a container file, the container is memory mapped and
+        only the row under :py:attr:`container_offset` is read.
+        """
         import numpy as np
 
         if crosscorrelation_cartesian_file is None:
@@ -75,16 +81,20 @@ class CrosscorrelationCartesian(db.Model):
             if crosscorrelation_cartesian_file.id != self.crosscorrelation_cartesian_file_id:
                 raise ValueError("You provided wrong datachunk file! Expected id: {self.datachunk_file_id}")
 
-        if filepath.exists():
-            return np.load(file=filepath)
-        else:
+        if not filepath.exists():
             # FIXME remove this workaround when database will be upgraded
             with_suffix = filepath.with_name(f"{filepath.name}.npy")
             if with_suffix.exists():
-                return np.load(file=with_suffix)
+                filepath = with_suffix
             else:
                 raise MissingDataFileException(f"Data file for CrosscorrelationCartesian {self} is missing")
 
+        if self.container_offset is None:
+            return np.load(file=filepath)
+
+        container = np.load(file=filepath, mmap_mode="r")
+        return np.array(container[self.container_offset])
+
     @property
     def ccf(self):
         return self.load_data()
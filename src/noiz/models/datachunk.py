@@ -2,15 +2,34 @@
 # Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
 # Copyright © 2019-2023 Contributors to the Noiz project.
 
-from typing import Optional
+from dataclasses import dataclass
+from typing import Dict, Optional
 
-from noiz.exceptions import MissingDataFileException
+from noiz.exceptions import CorruptedDataException, MissingDataFileException
 from noiz.database import db
+from noiz.processing.chunk_container import load_stream_from_container
+from noiz.processing.miniseed_helpers import read_noiz_miniseed
 
 from pathlib import Path
+import numpy as np
 import obspy
 
 
+def _load_chunk_stream(
+    filepath: Path, container_offset: Optional[int], container_length: Optional[int], chunk: object
+) -> obspy.Stream:
+    """
+    Loads stream of a chunk either from its container, if it has an offset within one, or from its own file.
+    """
+    if container_offset is not None:
+        if container_length is None:
+            raise CorruptedDataException(f"Chunk {chunk} has an offset within a container but no length")
+        return load_stream_from_container(filepath=filepath, offset=container_offset, length=container_length)
+    if not filepath.exists():
+        raise MissingDataFileException(f"Data file for chunk {chunk} is missing")
+    return read_noiz_miniseed(filepath)
+
+
 class DatachunkFile(db.Model):
     __tablename__ = "datachunk_file"
 
@@ -48,6 +67,8 @@ class Datachunk(db.Model):
         nullable=True,
     )
     device_id = db.Column("device_id", db.Integer, db.ForeignKey("device.id"), nullable=True)
+    container_offset = db.Column("container_offset", db.BigInteger, nullable=True)
+    container_length = db.Column("container_length", db.BigInteger, nullable=True)
 
     device = db.relationship("Device", foreign_keys=[device_id], uselist=False, lazy="joined")
     timespan = db.relationship("Timespan", foreign_keys=[timespan_id], back_populates="datachunks")
@@ -69,6 +90,7 @@ class Datachunk(db.Model):
         Loads data from associated :py:attr:`noiz.models.datachunk.Datachunk.datachunk_file`.
         Optionally, it can load data from explicitly provided :py:class:`~noiz.models.datachunk.DatachunkFile`
         after verifying if the provided object has expected id.
+        If the file is a container, only the bytes of this datachunk are read.
 
         :param datachunk_file: DatachunkFile to be loaded
         :type datachunk_file: Optional[noiz.models.datachunk.DatachunkFile]
@@ -82,11 +104,12 @@ class Datachunk(db.Model):
             if datachunk_file.id != self.datachunk_file_id:
                 raise ValueError("You provided wrong datachunk file! Expected id: {self.datachunk_file_id}")
 
-        if filepath.exists:
-            # FIXME when obspy will be released, str(Path) wont be necesary
-            return obspy.read(str(filepath), "MSEED")
-        else:
-            raise MissingDataFileException(f"Data file for chunk {self} is missing")
+        return _load_chunk_stream(
+            filepath=filepath,
+            container_offset=self.container_offset,
+            container_length=self.container_length,
+            chunk=self,
+        )
 
 
 class DatachunkStats(db.Model):
@@ -140,6 +163,15 @@ class ProcessedDatachunk(db.Model):
         db.ForeignKey("processed_datachunk_file.id"),
         nullable=True,
     )
+    processed_datachunk_spectrum_file_id = db.Column(
+        "processed_datachunk_spectrum_file_id",
+        db.BigInteger,
+        db.ForeignKey("processed_datachunk_spectrum_file.id"),
+        nullable=True,
+    )
+    spectrum_offset = db.Column("spectrum_offset", db.Integer, nullable=True)
+    container_offset = db.Column("container_offset", db.BigInteger, nullable=True)
+    container_length = db.Column("container_length", db.BigInteger, nullable=True)
 
     datachunk = db.relationship("Datachunk", foreign_keys=[datachunk_id], back_populates="processed_datachunks")
     datachunk_processing_config = db.relationship(
@@ -152,14 +184,48 @@ class ProcessedDatachunk(db.Model):
         uselist=False,
         lazy="joined",
     )
+    spectrum_file = db.relationship(
+        "ProcessedDatachunkSpectrumFile",
+        foreign_keys=[processed_datachunk_spectrum_file_id],
+        uselist=False,
+        lazy="joined",
+    )
 
     def load_data(self):
         filepath = Path(self.file.filepath)
-        if filepath.exists:
-            # FIXME when obspy will be released, str(Path) wont be necesary
-            return obspy.read(str(filepath), "MSEED")
-        else:
-            raise MissingDataFileException(f"Data file for chunk {self} is missing")
+        return _load_chunk_stream(
+            filepath=filepath,
+            container_offset=self.container_offset,
+            container_length=self.container_length,
+            chunk=self,
+        )
+
+    @property
+    def spectrum_max_lag_samples(self) -> Optional[int]:
+        """
+        Max lag, in samples, of crosscorrelations that can be computed from the stored spectrum without
+        wrap-around. None if the spectrum was not stored.
+        """
+        if self.spectrum_file is None or self.spectrum_offset is None:
+            return None
+        return self.spectrum_file.nfft - self.spectrum_file.npts
+
+    def load_spectrum(self, containers: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """
+        Loads the stored real spectrum of the chunk from its
+        :py:class:`~noiz.models.datachunk.ProcessedDatachunkSpectrumFile`.
+        Containers opened with memory mapping are kept in provided dict, so each of them is opened only once.
+
+        :param containers: Already opened containers keyed by their filepath
+        :type containers: Optional[Dict[str, np.ndarray]]
+        :return: Real spectrum of demeaned processed datachunk
+        :rtype: np.ndarray
+        """
+        if self.spectrum_file is None or self.spectrum_offset is None:
+            raise MissingDataFileException(f"There is no spectrum stored for chunk {self}")
+        return _load_container_row(
+            filepath=self.spectrum_file.filepath, offset=self.spectrum_offset, containers=containers
+        )
 
 
 class ProcessedDatachunkFile(db.Model):
@@ -167,3 +233,73 @@ class ProcessedDatachunkFile(db.Model):
 
     id = db.Column("id", db.BigInteger, primary_key=True)
     filepath = db.Column("filepath", db.UnicodeText, nullable=False)
+
+
+class ProcessedDatachunkSpectrumFile(db.Model):
+    """
+    Container with real spectra of all processed datachunks of a single timespan that have the same
+    number of samples. Spectra of demeaned data are stored as rows of a 2D complex64 `.npy` array,
+    data are zero padded to ``nfft`` samples before the transform.
+    """
+
+    __tablename__ = "processed_datachunk_spectrum_file"
+
+    id = db.Column("id", db.BigInteger, primary_key=True)
+    filepath = db.Column("filepath", db.UnicodeText, nullable=False)
+    npts = db.Column("npts", db.Integer, nullable=False)
+    nfft = db.Column("nfft", db.Integer, nullable=False)
+
+
+def _load_container_row(filepath: str, offset: int, containers: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+    if containers is None:
+        containers = {}
+    if filepath not in containers.keys():
+        if not Path(filepath).exists():
+            raise MissingDataFileException(f"Container file {filepath} is missing")
+        containers[filepath] = np.load(file=filepath, mmap_mode="r")
+    return np.array(containers[filepath][offset])
+
+
+@dataclass(frozen=True)
+class ProcessedDatachunkReference:
+    """
+    Plain data reference to a file of :py:class:`~noiz.models.datachunk.ProcessedDatachunk`.
+    It is used instead of ORM instances when inputs for processing are streamed to workers.
+    """
+
+    id: int
+    component_id: int
+    filepath: str
+    spectrum_filepath: Optional[str] = None
+    spectrum_offset: Optional[int] = None
+    spectrum_npts: Optional[int] = None
+    spectrum_nfft: Optional[int] = None
+    container_offset: Optional[int] = None
+    container_length: Optional[int] = None
+
+    def load_data(self):
+        filepath = Path(self.filepath)
+        return _load_chunk_stream(
+            filepath=filepath,
+            container_offset=self.container_offset,
+            container_length=self.container_length,
+            chunk=self,
+        )
+
+    @property
+    def spectrum_max_lag_samples(self) -> Optional[int]:
+        """
+        Max lag, in samples, of crosscorrelations that can be computed from the stored spectrum without
+        wrap-around. None if the spectrum was not stored.
+        """
+        if self.spectrum_filepath is None or self.spectrum_nfft is None or self.spectrum_npts is None:
+            return None
+        return self.spectrum_nfft - self.spectrum_npts
+
+    def load_spectrum(self, containers: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """
+        Same as :py:meth:`~noiz.models.datachunk.ProcessedDatachunk.load_spectrum`.
+        """
+        if self.spectrum_filepath is None or self.spectrum_offset is None:
+            raise MissingDataFileException(f"There is no spectrum stored for chunk {self}")
+        return _load_container_row(filepath=self.spectrum_filepath, offset=self.spectrum_offset, containers=containers)
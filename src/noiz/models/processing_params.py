@@ -26,6 +26,68 @@ class ZeroPaddingMethod(ExtendedEnum):
     TAPERED_PADDED = "tapered_padded"
 
 
+class DatachunkPreprocessingMode(ExtendedEnum):
+    # filldocs
+    PER_DATACHUNK = "per_datachunk"
+    WHOLE_DAY = "whole_day"
+
+
+class DatachunkResamplingMethod(ExtendedEnum):
+    # filldocs
+    FFT_PADDED = "fft_padded"
+    POLYPHASE = "polyphase"
+
+
+class DatachunkStorage(ExtendedEnum):
+    # filldocs
+    MSEED_PER_CHUNK = "mseed_per_chunk"
+    COMPONENT_DAY_CONTAINER = "component_day_container"
+
+
+class DatachunkSampleDtype(ExtendedEnum):
+    # filldocs
+    FLOAT64 = "float64"
+    FLOAT32 = "float32"
+
+
+class WhiteningMethod(ExtendedEnum):
+    # filldocs
+    FULL_FFT = "full_fft"
+    CACHED_RFFT = "cached_rfft"
+
+
+class CrosscorrelationMethod(ExtendedEnum):
+    # filldocs
+    OBSPY = "obspy"
+    CACHED_SPECTRA = "cached_spectra"
+
+
+class CrosscorrelationStorage(ExtendedEnum):
+    # filldocs
+    NPY_PER_PAIR = "npy_per_pair"
+    TIMESPAN_CONTAINER = "timespan_container"
+
+
+def _validate_datachunk_storage(datachunk_storage: str) -> str:
+    try:
+        return DatachunkStorage(datachunk_storage).value
+    except ValueError as e:
+        raise ValueError(
+            f"Not supported datachunk storage. Supported types are: {list(DatachunkStorage)}, "
+            f"You provided {datachunk_storage}"
+        ) from e
+
+
+def _validate_datachunk_sample_dtype(sample_dtype: str) -> str:
+    try:
+        return DatachunkSampleDtype(sample_dtype).value
+    except ValueError as e:
+        raise ValueError(
+            f"Not supported sample dtype. Supported types are: {list(DatachunkSampleDtype)}, "
+            f"You provided {sample_dtype}"
+        ) from e
+
+
 class DatachunkParams(db.Model):
     __tablename__ = "datachunk_params"
 
@@ -54,6 +116,11 @@ class DatachunkParams(db.Model):
 
     _response_constant_coefficient = db.Column("response_constant_coefficient", db.Float, nullable=True)
 
+    _preprocessing_mode = db.Column("preprocessing_mode", db.UnicodeText, default="per_datachunk", nullable=False)
+    _resampling_method = db.Column("resampling_method", db.UnicodeText, default="fft_padded", nullable=False)
+    _datachunk_storage = db.Column("datachunk_storage", db.UnicodeText, default="mseed_per_chunk", nullable=False)
+    _datachunk_sample_dtype = db.Column("datachunk_sample_dtype", db.UnicodeText, default="float64", nullable=False)
+
     # TODO explore if bac_populates here makes sense
     processed_datachunk_params = db.relationship(
         "ProcessedDatachunkParams", uselist=True, back_populates="datachunk_params"
@@ -104,6 +171,31 @@ class DatachunkParams(db.Model):
 
         self._correlation_max_lag = kwargs.get("correlation_max_lag", 60)  # deprecatethis
 
+        preprocessing_mode = kwargs.get("preprocessing_mode", "per_datachunk")
+        try:
+            preprocessing_mode_valid = DatachunkPreprocessingMode(preprocessing_mode)
+        except ValueError as e:
+            raise ValueError(
+                f"Not supported preprocessing mode. Supported types are: {list(DatachunkPreprocessingMode)}, "
+                f"You provided {preprocessing_mode}"
+            ) from e
+        self._preprocessing_mode = preprocessing_mode_valid.value
+
+        resampling_method = kwargs.get("resampling_method", "fft_padded")
+        try:
+            resampling_method_valid = DatachunkResamplingMethod(resampling_method)
+        except ValueError as e:
+            raise ValueError(
+                f"Not supported resampling method. Supported types are: {list(DatachunkResamplingMethod)}, "
+                f"You provided {resampling_method}"
+            ) from e
+        self._resampling_method = resampling_method_valid.value
+
+        self._datachunk_storage = _validate_datachunk_storage(kwargs.get("datachunk_storage", "mseed_per_chunk"))
+        self._datachunk_sample_dtype = _validate_datachunk_sample_dtype(
+            kwargs.get("datachunk_sample_dtype", "float64")
+        )
+
     def as_dict(self):
         return {
             "datachunk_params_id": self.id,
@@ -123,6 +215,10 @@ class DatachunkParams(db.Model):
             "datachunk_params_padding_taper_type": self.padding_taper_type,
             "datachunk_params_padding_taper_max_length": self.padding_taper_max_length,
             "datachunk_params_padding_taper_max_percentage": self.padding_taper_max_percentage,
+            "datachunk_params_preprocessing_mode": self.preprocessing_mode.value,
+            "datachunk_params_resampling_method": self.resampling_method.value,
+            "datachunk_params_datachunk_storage": self.datachunk_storage.value,
+            "datachunk_params_datachunk_sample_dtype": self.datachunk_sample_dtype.value,
         }
 
     @property
@@ -220,6 +316,58 @@ class DatachunkParams(db.Model):
     def padding_taper_max_percentage(self):
         return self._padding_taper_max_percentage
 
+    @property
+    def preprocessing_mode(self) -> DatachunkPreprocessingMode:
+        """
+        Defines on what data the preprocessing is run.
+        :py:attr:`DatachunkPreprocessingMode.PER_DATACHUNK` preprocesses every sliced datachunk separately,
+        :py:attr:`DatachunkPreprocessingMode.WHOLE_DAY` preprocesses every continuous segment of the whole day once
+        and cuts datachunks from the preprocessed day.
+
+        :return: Selected preprocessing mode
+        :rtype: DatachunkPreprocessingMode
+        """
+        return DatachunkPreprocessingMode(self._preprocessing_mode)
+
+    @property
+    def resampling_method(self) -> DatachunkResamplingMethod:
+        """
+        Defines how data are resampled to the target sampling rate.
+        :py:attr:`DatachunkResamplingMethod.FFT_PADDED` pads data to the next power of two and decimates or resamples
+        them in frequency domain.
+        :py:attr:`DatachunkResamplingMethod.POLYPHASE` uses polyphase FIR filtering when ratio of sampling rates is
+        a rational number with small terms and falls back to the former otherwise.
+
+        :return: Selected resampling method
+        :rtype: DatachunkResamplingMethod
+        """
+        return DatachunkResamplingMethod(self._resampling_method)
+
+    @property
+    def datachunk_storage(self) -> DatachunkStorage:
+        """
+        Defines how datachunks are stored.
+        :py:attr:`DatachunkStorage.MSEED_PER_CHUNK` writes a separate MiniSEED file for every datachunk.
+        :py:attr:`DatachunkStorage.COMPONENT_DAY_CONTAINER` writes all datachunks of a component-day into a single
+        container, see :py:mod:`noiz.processing.chunk_container`.
+
+        :return: Selected storage
+        :rtype: DatachunkStorage
+        """
+        return DatachunkStorage(self._datachunk_storage)
+
+    @property
+    def datachunk_sample_dtype(self) -> DatachunkSampleDtype:
+        """
+        Defines dtype in which samples of datachunks are stored.
+        :py:attr:`DatachunkSampleDtype.FLOAT32` halves size of stored datachunks at cost of precision of samples.
+        Processing is always done in float64.
+
+        :return: Selected dtype
+        :rtype: DatachunkSampleDtype
+        """
+        return DatachunkSampleDtype(self._datachunk_sample_dtype)
+
     def get_correlation_max_lag_samples(self):
         return int(self._correlation_max_lag * self._sampling_rate)
 
@@ -261,6 +409,10 @@ class DatachunkParamsHolder:
     padding_taper_max_length: float
     padding_taper_max_percentage: float
     response_constant_coefficient: Optional[float] = None
+    preprocessing_mode: str = "per_datachunk"
+    resampling_method: str = "fft_padded"
+    datachunk_storage: str = "mseed_per_chunk"
+    datachunk_sample_dtype: str = "float64"
 
     def __post_init__(self):
         if self.response_constant_coefficient is not None:
@@ -289,6 +441,10 @@ class ProcessedDatachunkParamsHolder:
     spectral_whitening: bool
     one_bit: bool
     quefrency: bool
+    whitening_method: str = "full_fft"
+    spectrum_max_lag: Optional[float] = None
+    processed_datachunk_storage: str = "mseed_per_chunk"
+    processed_datachunk_sample_dtype: str = "float64"
 
 
 class ProcessedDatachunkParams(db.Model):
@@ -325,6 +481,14 @@ class ProcessedDatachunkParams(db.Model):
     _spectral_whitening = db.Column("spectral_whitening", db.Boolean, default=True, nullable=False)
     _one_bit = db.Column("one_bit", db.Boolean, default=True, nullable=False)
     _quefrency = db.Column("quefrency", db.Boolean, default=True, nullable=False)
+    _whitening_method = db.Column("whitening_method", db.UnicodeText, default="full_fft", nullable=False)
+    _spectrum_max_lag = db.Column("spectrum_max_lag", db.Float, nullable=True)
+    _processed_datachunk_storage = db.Column(
+        "processed_datachunk_storage", db.UnicodeText, default="mseed_per_chunk", nullable=False
+    )
+    _processed_datachunk_sample_dtype = db.Column(
+        "processed_datachunk_sample_dtype", db.UnicodeText, default="float64", nullable=False
+    )
 
     datachunk_params = db.relationship(
         "DatachunkParams",
@@ -367,6 +531,37 @@ class ProcessedDatachunkParams(db.Model):
         self._one_bit = kwargs.get("one_bit", True)
         self._quefrency = kwargs.get("quefrency", True)
 
+        whitening_method = kwargs.get("whitening_method", "full_fft")
+        try:
+            whitening_method_valid = WhiteningMethod(whitening_method)
+        except ValueError as e:
+            raise ValueError(
+                f"Not supported whitening method. Supported types are: {list(WhiteningMethod)}, "
+                f"You provided {whitening_method}"
+            ) from e
+        self._whitening_method = whitening_method_valid.value
+
+        spectrum_max_lag = kwargs.get("spectrum_max_lag")
+        if spectrum_max_lag is not None and spectrum_max_lag < 0:
+            raise ValueError(f"spectrum_max_lag cannot be negative. You provided {spectrum_max_lag}")
+        self._spectrum_max_lag = spectrum_max_lag
+
+        self._processed_datachunk_storage = _validate_datachunk_storage(
+            kwargs.get("processed_datachunk_storage", "mseed_per_chunk")
+        )
+        if (
+            spectrum_max_lag is not None
+            and self._processed_datachunk_storage == DatachunkStorage.COMPONENT_DAY_CONTAINER.value
+        ):
+            raise ValueError(
+                "spectrum_max_lag cannot be combined with component_day_container storage. "
+                "Spectra need datachunks to be processed in batches of a timespan, "
+                "while component-day containers need batches of a component-day."
+            )
+        self._processed_datachunk_sample_dtype = _validate_datachunk_sample_dtype(
+            kwargs.get("processed_datachunk_sample_dtype", "float64")
+        )
+
     def as_dict(self):
         return {
             "processeddatachunk_params_id": self.id,
@@ -385,6 +580,10 @@ class ProcessedDatachunkParams(db.Model):
             "processeddatachunk_params_spectral_whitening": self.spectral_whitening,
             "processeddatachunk_params_one_bit": self.one_bit,
             "processeddatachunk_params_quefrency": self.quefrency,
+            "processeddatachunk_params_whitening_method": self.whitening_method.value,
+            "processeddatachunk_params_spectrum_max_lag": self.spectrum_max_lag,
+            "processeddatachunk_params_processed_datachunk_storage": self.processed_datachunk_storage.value,
+            "processeddatachunk_params_processed_datachunk_sample_dtype": self.processed_datachunk_sample_dtype.value,
         }
 
     @property
@@ -439,6 +638,55 @@ class ProcessedDatachunkParams(db.Model):
     def quefrency(self):
         return self._quefrency
 
+    @property
+    def whitening_method(self) -> WhiteningMethod:
+        """
+        Defines how spectral whitening is computed.
+        :py:attr:`WhiteningMethod.FULL_FFT` builds all the tapers and kernels for every trace and uses complex FFTs
+        of the length of the trace.
+        :py:attr:`WhiteningMethod.CACHED_RFFT` uses real FFTs of the next fast length and tapers and kernels
+        cached in the worker, see :py:mod:`noiz.processing.whitening`.
+
+        :return: Selected whitening method
+        :rtype: WhiteningMethod
+        """
+        return WhiteningMethod(self._whitening_method)
+
+    @property
+    def spectrum_max_lag(self) -> Optional[float]:
+        """
+        Max lag, in seconds, of crosscorrelations for which real spectra of processed datachunks are stored.
+        Spectra are computed from data zero padded to at least npts plus that lag, so crosscorrelations with the
+        same or shorter max lag can be computed from them directly.
+        None means that spectra are not stored.
+
+        :return: Max lag of stored spectra
+        :rtype: Optional[float]
+        """
+        return self._spectrum_max_lag
+
+    @property
+    def processed_datachunk_storage(self) -> DatachunkStorage:
+        """
+        Defines how processed datachunks are stored, see
+        :py:attr:`~noiz.models.processing_params.DatachunkParams.datachunk_storage`.
+
+        :return: Selected storage
+        :rtype: DatachunkStorage
+        """
+        return DatachunkStorage(self._processed_datachunk_storage)
+
+    @property
+    def processed_datachunk_sample_dtype(self) -> DatachunkSampleDtype:
+        """
+        Defines dtype in which samples of processed datachunks are stored, see
+        :py:attr:`~noiz.models.processing_params.DatachunkParams.datachunk_sample_dtype`.
+
+        :return: Selected dtype
+        :rtype: DatachunkSampleDtype
+        """
+        return DatachunkSampleDtype(self._processed_datachunk_sample_dtype)
+
 
 @dataclass
 class CrosscorrelationCartesianParamsHolder:
@@ -449,6 +697,8 @@ class CrosscorrelationCartesianParamsHolder:
 
     processed_datachunk_params_id: int
     correlation_max_lag: int
+    correlation_method: str = "obspy"
+    ccf_storage: str = "npy_per_pair"
 
 
 class CrosscorrelationCartesianParams(db.Model):
@@ -460,6 +710,8 @@ class CrosscorrelationCartesianParams(db.Model):
     )
     _correlation_max_lag = db.Column("correlation_max_lag", db.Float, nullable=False)
     _sampling_rate = db.Column("sampling_rate", db.Float, default=24, nullable=False)
+    _correlation_method = db.Column("correlation_method", db.UnicodeText, default="obspy", nullable=False)
+    _ccf_storage = db.Column("ccf_storage", db.UnicodeText, default="npy_per_pair", nullable=False)
 
     processed_datachunk_params = db.relationship(
         "ProcessedDatachunkParams",
@@ -479,6 +731,26 @@ class CrosscorrelationCartesianParams(db.Model):
         self._sampling_rate = kwargs.get("sampling_rate")
         self._correlation_max_lag = kwargs.get("correlation_max_lag", 60)
 
+        correlation_method = kwargs.get("correlation_method", "obspy")
+        try:
+            correlation_method_valid = CrosscorrelationMethod(correlation_method)
+        except ValueError as e:
+            raise ValueError(
+                f"Not supported correlation method. Supported types are: {list(CrosscorrelationMethod)}, "
+                f"You provided {correlation_method}"
+            ) from e
+        self._correlation_method = correlation_method_valid.value
+
+        ccf_storage = kwargs.get("ccf_storage", "npy_per_pair")
+        try:
+            ccf_storage_valid = CrosscorrelationStorage(ccf_storage)
+        except ValueError as e:
+            raise ValueError(
+                f"Not supported ccf storage. Supported types are: {list(CrosscorrelationStorage)}, "
+                f"You provided {ccf_storage}"
+            ) from e
+        self._ccf_storage = ccf_storage_valid.value
+
     def as_dict(self):
         """filldocs"""
         return {
@@ -486,6 +758,8 @@ class CrosscorrelationCartesianParams(db.Model):
             "crosscorrelation_cartesian_params_processed_datachunk_params_id": self.processed_datachunk_params_id,
             "crosscorrelation_cartesian_params_sampling_rate": self.sampling_rate,
             "crosscorrelation_cartesian_params_correlation_max_lag": self.correlation_max_lag,
+            "crosscorrelation_cartesian_params_correlation_method": self.correlation_method.value,
+            "crosscorrelation_cartesian_params_ccf_storage": self.ccf_storage.value,
         }
 
     @property
@@ -498,6 +772,32 @@ class CrosscorrelationCartesianParams(db.Model):
         """filldocs"""
         return self._correlation_max_lag
 
+    @property
+    def correlation_method(self) -> CrosscorrelationMethod:
+        """
+        Method used to compute the cartesian crosscorrelations.
+        :py:attr:`CrosscorrelationMethod.OBSPY` calls :py:func:`obspy.signal.cross_correlation.correlate` for
+        every pair, :py:attr:`CrosscorrelationMethod.CACHED_SPECTRA` computes spectrum of each component once per
+        timespan and reuses it for all pairs.
+
+        :return: Selected correlation method
+        :rtype: CrosscorrelationMethod
+        """
+        return CrosscorrelationMethod(self._correlation_method)
+
+    @property
+    def ccf_storage(self) -> CrosscorrelationStorage:
+        """
+        Layout in which computed crosscorrelations are written to disk.
+        :py:attr:`CrosscorrelationStorage.NPY_PER_PAIR` writes a separate `.npy` file for every pair and timespan,
+        :py:attr:`CrosscorrelationStorage.TIMESPAN_CONTAINER` writes all pairs of a timespan into a single 2D `.npy`
+        container and every :py:class:`~noiz.models.crosscorrelation.CrosscorrelationCartesian` keeps its row offset.
+
+        :return: Selected storage layout
+        :rtype: CrosscorrelationStorage
+        """
+        return CrosscorrelationStorage(self._ccf_storage)
+
     @cached_property
     def correlation_max_lag_samples(self) -> int:
         """filldocs"""
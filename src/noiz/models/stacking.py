@@ -152,6 +152,8 @@ class CCFStack(db.Model):
     )
     stack = db.Column("stack", ARRAY(db.Float), nullable=False)
     no_ccfs = db.Column("no_ccfs", db.Integer, nullable=False)
+    stack_sum = db.Column("stack_sum", ARRAY(db.Float), nullable=True)
+    member_ids = db.Column("member_ids", ARRAY(db.BigInteger), nullable=True)
 
     ccfs = db.relationship(
         "CrosscorrelationCartesian", secondary=ccf_ccfstack_association_table, back_populates="stacks"
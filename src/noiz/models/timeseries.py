@@ -8,14 +8,16 @@ from sqlalchemy.dialects.postgresql import HSTORE, ARRAY, NUMRANGE
 from sqlalchemy import func
 from sqlalchemy.ext.hybrid import hybrid_property
 import obspy
+from typing import Optional, Tuple
 
 from noiz.exceptions import MissingDataFileException
 from noiz.database import db
-from noiz.processing.miniseed_helpers import _read_single_miniseed
+from noiz.processing.miniseed_helpers import MiniseedReadStats, read_miniseed_byte_range
 
 
 class Tsindex(db.Model):
     __tablename__ = "tsindex"
+    __table_args__ = (db.Index("tsindex_network_station_starttime_idx", "network", "station", "starttime"),)
     id = db.Column("id", db.BigInteger, primary_key=True)
     network = db.Column("network", db.UnicodeText, nullable=False)
     station = db.Column("station", db.UnicodeText, nullable=False)
@@ -45,17 +47,58 @@ class Tsindex(db.Model):
         """
         return self.load_data()
 
-    def load_data(self) -> obspy.Stream:
+    def load_data(
+        self,
+        starttime: Optional[obspy.UTCDateTime] = None,
+        endtime: Optional[obspy.UTCDateTime] = None,
+    ) -> obspy.Stream:
         """
-        Loads a seismic file associated with an entry.
+        Loads data of the entry from a seismic file associated with it.
+        Only the section of the file described by the entry is read and decoded,
+        so other channels of multiplexed files are not decoded at all.
+        If starttime or endtime are provided, the section is narrowed down with the timeindex of the entry.
+        :param starttime: Time of first sample that is needed
+        :type starttime: Optional[obspy.UTCDateTime]
+        :param endtime: Time of last sample that is needed
+        :type endtime: Optional[obspy.UTCDateTime]
         :return: Returns seismic stream read from file
         :rtype: obspy.Stream
         """
+        st, _ = self.load_data_with_stats(starttime=starttime, endtime=endtime)
+        return st
+
+    def load_data_with_stats(
+        self,
+        starttime: Optional[obspy.UTCDateTime] = None,
+        endtime: Optional[obspy.UTCDateTime] = None,
+    ) -> Tuple[obspy.Stream, MiniseedReadStats]:
+        """
+        Same as :py:meth:`~noiz.models.timeseries.Tsindex.load_data` but returns also number of bytes read and
+        time spent on decoding them.
+        :param starttime: Time of first sample that is needed
+        :type starttime: Optional[obspy.UTCDateTime]
+        :param endtime: Time of last sample that is needed
+        :type endtime: Optional[obspy.UTCDateTime]
+        :return: Returns seismic stream read from file and statistics of the read
+        :rtype: Tuple[obspy.Stream, MiniseedReadStats]
+        """
         try:
-            st = _read_single_miniseed(filename=Path(self.filename), format=self.format)
+            return read_miniseed_byte_range(
+                filename=Path(self.filename),
+                byteoffset=self.byteoffset,
+                nbytes=self.bytes,
+                format=self.format,
+                seed_id=self._make_seed_id(),
+                starttime=starttime,
+                endtime=endtime,
+                timeindex=self.timeindex,
+            )
         except MissingDataFileException as e:
             raise MissingDataFileException(f"Data file for chunk {self} is missing") from e
-        return st
+
+    def _make_seed_id(self) -> str:
+        location = "" if self.location == "--" else self.location
+        return f"{self.network}.{self.station}.{location}.{self.channel}"
 
     @hybrid_property  # type: ignore
     def component(self):
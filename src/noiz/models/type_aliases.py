@@ -9,6 +9,7 @@ from noiz.models import (
     CCFStack,
     DatachunkStats,
     ProcessedDatachunk,
+    ProcessedDatachunkReference,
     QCOneResults,
     QCTwoResults,
     Datachunk,
@@ -25,6 +26,7 @@ from noiz.models import (
     ProcessedDatachunkParams,
     CrosscorrelationCartesianParams,
     ProcessedDatachunkFile,
+    ProcessedDatachunkSpectrumFile,
     BeamformingFile,
     BeamformingResult,
     PPSDParams,
@@ -68,6 +70,7 @@ BulkAddableObjects = Union[
     CrosscorrelationCartesianFile,
     CrosscorrelationCylindricalFile,
     ProcessedDatachunkFile,
+    ProcessedDatachunkSpectrumFile,
     EventDetectionResult,
     EventConfirmationResult,
     EventConfirmationRun,
@@ -78,6 +81,7 @@ BulkAddableFileObjects = Union[
     CrosscorrelationCartesianFile,
     CrosscorrelationCylindricalFile,
     ProcessedDatachunkFile,
+    ProcessedDatachunkSpectrumFile,
     BeamformingFile,
     PPSDFile,
     BeamformingPeakAverageAbspower,
@@ -108,11 +112,30 @@ class ProcessDatachunksInputs(TypedDict):
     params: ProcessedDatachunkParams
 
 
+class ProcessDatachunksBatchInputs(TypedDict):
+    """
+    TypedDict class that describes inputs of
+    :py:func:`noiz.processing.datachunk_processing.process_datachunks_batch`
+    """
+
+    datachunks: Collection[Datachunk]
+    params: ProcessedDatachunkParams
+
+
 class RunDatachunkPreparationInputs(TypedDict):
     component: Component
     timespans: Collection[Timespan]
     time_series: Tsindex
     processing_params: DatachunkParams
+    compute_stats: bool
+
+
+class RunDatachunkPreparationFileGroupInputs(TypedDict):
+    """
+    TypedDict class that describes inputs of all components which raw data are stored in the same file.
+    """
+
+    members: Collection[RunDatachunkPreparationInputs]
 
 
 class QCOneRunnerInputs(TypedDict):
@@ -138,8 +161,10 @@ class PPSDRunnerInputs(TypedDict):
 class CrosscorrelationCartesianRunnerInputs(TypedDict):
     timespan: Timespan
     crosscorrelation_cartesian_params: CrosscorrelationCartesianParams
-    grouped_processed_chunks: Dict[int, ProcessedDatachunk]
+    grouped_processed_chunks: Dict[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]]
     component_pairs_cartesian: Tuple[ComponentPairCartesian, ...]
+    tile: Optional[Tuple[int, int]]
+    tile_size: Optional[int]
 
 
 class CrosscorrelationCylindricalRunnerInputs(TypedDict):
@@ -154,6 +179,7 @@ class StackingInputs(TypedDict):
     componentpair_cartesian: ComponentPairCartesian
     stacking_schema: StackingSchema
     stacking_timespan: StackingTimespan
+    existing_stack: Optional[CCFStack]
 
 
 class EventDetectionRunnerInputs(TypedDict):
@@ -175,10 +201,12 @@ class EventConfirmationRunnerInputs(TypedDict):
 InputsForMassCalculations = Union[
     CalculateDatachunkStatsInputs,
     RunDatachunkPreparationInputs,
+    RunDatachunkPreparationFileGroupInputs,
     BeamformingRunnerInputs,
     PPSDRunnerInputs,
     QCOneRunnerInputs,
     ProcessDatachunksInputs,
+    ProcessDatachunksBatchInputs,
     CrosscorrelationCartesianRunnerInputs,
     CrosscorrelationCylindricalRunnerInputs,
     StackingInputs,
@@ -0,0 +1,134 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+"""
+Container files holding many MiniSEED encoded chunks, for example all datachunks of a component-day.
+
+Layout of a container is::
+
+    magic (8 bytes) | count (uint32) | count x (offset uint64, length uint64) | chunk 0 | chunk 1 | ...
+
+All integers are little endian. Offsets are counted from the beginning of the file.
+Offset and length of every chunk are also kept in the DB, so a single chunk is read with one seek,
+the offset table is there to keep containers self describing.
+"""
+
+import io
+import struct
+from pathlib import Path
+from typing import List, Sequence, Tuple, Union
+
+import obspy
+
+from noiz.exceptions import CorruptedDataException, MissingDataFileException
+from noiz.processing.miniseed_helpers import read_noiz_miniseed
+
+CONTAINER_MAGIC = b"NOIZCC01"
+_HEADER = struct.Struct("<8sI")
+_ENTRY = struct.Struct("<QQ")
+
+
+def serialize_stream(st: obspy.Stream) -> bytes:
+    """
+    Encodes the stream as MiniSEED in memory.
+
+    :param st: Stream to be encoded
+    :type st: obspy.Stream
+    :return: MiniSEED bytes
+    :rtype: bytes
+    """
+    buffer = io.BytesIO()
+    st.write(buffer, format="mseed")
+    return buffer.getvalue()
+
+
+def write_chunk_container(filepath: Union[str, Path], chunks: Sequence[bytes]) -> List[Tuple[int, int]]:
+    """
+    Writes provided chunks into a single container file.
+    The file is created exclusively, an existing container is never overwritten.
+
+    :param filepath: Path of the container
+    :type filepath: Union[str, Path]
+    :param chunks: Encoded chunks
+    :type chunks: Sequence[bytes]
+    :return: Offset and length of every chunk, in the same order as input
+    :rtype: List[Tuple[int, int]]
+    :raises: FileExistsError
+    """
+    table = []
+    offset = _HEADER.size + _ENTRY.size * len(chunks)
+    for chunk in chunks:
+        table.append((offset, len(chunk)))
+        offset += len(chunk)
+
+    with open(filepath, "xb") as f:
+        f.write(_HEADER.pack(CONTAINER_MAGIC, len(chunks)))
+        for entry in table:
+            f.write(_ENTRY.pack(*entry))
+        for chunk in chunks:
+            f.write(chunk)
+    return table
+
+
+def read_chunk_container_table(filepath: Union[str, Path]) -> List[Tuple[int, int]]:
+    """
+    Reads the offset table of a container.
+
+    :param filepath: Path of the container
+    :type filepath: Union[str, Path]
+    :return: Offset and length of every chunk in the container
+    :rtype: List[Tuple[int, int]]
+    :raises: MissingDataFileException, CorruptedDataException
+    """
+    if not Path(filepath).exists():
+        raise MissingDataFileException(f"Container file {filepath} is missing")
+
+    with open(filepath, "rb") as f:
+        magic, count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != CONTAINER_MAGIC:
+            raise CorruptedDataException(f"File {filepath} is not a noiz chunk container")
+        raw_table = f.read(_ENTRY.size * count)
+    return [(offset, length) for offset, length in _ENTRY.iter_unpack(raw_table)]
+
+
+def read_chunk_from_container(filepath: Union[str, Path], offset: int, length: int) -> bytes:
+    """
+    Reads bytes of a single chunk from a container.
+
+    :param filepath: Path of the container
+    :type filepath: Union[str, Path]
+    :param offset: Offset of the chunk
+    :type offset: int
+    :param length: Length of the chunk
+    :type length: int
+    :return: Encoded chunk
+    :rtype: bytes
+    :raises: MissingDataFileException, CorruptedDataException
+    """
+    if not Path(filepath).exists():
+        raise MissingDataFileException(f"Container file {filepath} is missing")
+
+    with open(filepath, "rb") as f:
+        f.seek(offset)
+        chunk = f.read(length)
+    if len(chunk) != length:
+        raise CorruptedDataException(f"Container {filepath} is shorter than expected. Chunk at {offset} is truncated.")
+    return chunk
+
+
+def load_stream_from_container(filepath: Union[str, Path], offset: int, length: int) -> obspy.Stream:
+    """
+    Reads and decodes a single MiniSEED chunk from a container with
+    :py:func:`~noiz.processing.miniseed_helpers.read_noiz_miniseed`.
+
+    :param filepath: Path of the container
+    :type filepath: Union[str, Path]
+    :param offset: Offset of the chunk
+    :type offset: int
+    :param length: Length of the chunk
+    :type length: int
+    :return: Decoded stream
+    :rtype: obspy.Stream
+    """
+    return read_noiz_miniseed(read_chunk_from_container(filepath=filepath, offset=offset, length=length))
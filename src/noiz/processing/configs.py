@@ -271,6 +271,10 @@ def create_datachunkparams(
         padding_taper_type=params_holder.padding_taper_type,
         padding_taper_max_length=params_holder.padding_taper_max_length,
         padding_taper_max_percentage=params_holder.padding_taper_max_percentage,
+        preprocessing_mode=params_holder.preprocessing_mode,
+        resampling_method=params_holder.resampling_method,
+        datachunk_storage=params_holder.datachunk_storage,
+        datachunk_sample_dtype=params_holder.datachunk_sample_dtype,
     )
     return params
 
@@ -312,6 +316,10 @@ def create_processed_datachunk_params(
         spectral_whitening=params_holder.spectral_whitening,
         one_bit=params_holder.one_bit,
         quefrency=params_holder.quefrency,
+        whitening_method=params_holder.whitening_method,
+        spectrum_max_lag=params_holder.spectrum_max_lag,
+        processed_datachunk_storage=params_holder.processed_datachunk_storage,
+        processed_datachunk_sample_dtype=params_holder.processed_datachunk_sample_dtype,
     )
     return params
 
@@ -459,6 +467,8 @@ def create_crosscorrelation_cartesian_params(
         processed_datachunk_params_id=params_holder.processed_datachunk_params_id,
         correlation_max_lag=params_holder.correlation_max_lag,
         sampling_rate=processed_params.datachunk_params.sampling_rate,
+        correlation_method=params_holder.correlation_method,
+        ccf_storage=params_holder.ccf_storage,
     )
     return params
 
@@ -2,18 +2,20 @@
 # Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
 # Copyright © 2019-2023 Contributors to the Noiz project.
 
-from collections import defaultdict
+import threading
+from collections import defaultdict, OrderedDict
 import numpy as np
 import numpy.typing as npt
 import pandas as pd
 
 import obspy
-from typing import Tuple, Dict, DefaultDict, Collection, List, FrozenSet
+from scipy import fft as sp_fft
+from typing import Any, Tuple, Dict, DefaultDict, Collection, List, FrozenSet, Mapping, Optional, Union
 
-from noiz.exceptions import CorruptedDataException
+from noiz.exceptions import CorruptedDataException, InconsistentDataException
 from noiz.models import CrosscorrelationCartesian, CrosscorrelationCartesianParams
 from noiz.models.component_pair import ComponentPairCartesian, ComponentPairCylindrical
-from noiz.models.datachunk import ProcessedDatachunk
+from noiz.models.datachunk import ProcessedDatachunk, ProcessedDatachunkReference
 from noiz.models.timespan import Timespan
 
 
@@ -55,15 +57,17 @@ def group_chunks_by_timespanid_componentid(
     return groupped_chunks
 
 
-def load_data_for_chunks(chunks: Dict[int, ProcessedDatachunk]) -> Dict[int, obspy.Trace]:
+def load_data_for_chunks(
+    chunks: Dict[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]],
+) -> Dict[int, obspy.Trace]:
     """
     Takes a dict of ProcessedDatachunks grouped by
     :py:attr:`noiz.models.datachunk.ProcessedDatachunk.datachunk.component_id` and loads data for them.
     Returns dictionary organized by the sam key but instead of ProcessedDatachunk instances with
     :py:class:`obspy.Trace` loaded from disk.
 
-    :param chunks: Dict with ProcessedDataChunks grouped by some key
-    :type chunks: Dict[int, ProcessedDatachunk]
+    :param chunks: Dict with ProcessedDataChunks or references to them grouped by some key
+    :type chunks: Dict[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]]
     :return: Dict with the same keys but Traces instead
     :rtype: Dict[int, obspy.Trace]
     """
@@ -80,6 +84,236 @@ def load_data_for_chunks(chunks: Dict[int, ProcessedDatachunk]) -> Dict[int, obs
     return traces
 
 
+def compute_real_spectra(
+    traces: Dict[int, obspy.Trace],
+    nfft: int,
+) -> Tuple[Dict[int, int], np.ndarray, np.ndarray]:
+    """
+    Demeans provided traces and computes their real FFT of length nfft in a single batched call.
+    Together with spectra, it returns energy of every demeaned trace, which is required for naive normalization
+    of the crosscorrelation functions.
+
+    All provided traces have to have the same number of samples.
+
+    :param traces: Traces grouped by component_id
+    :type traces: Dict[int, obspy.Trace]
+    :param nfft: Length of the FFT. Has to be at least npts + max lag in samples to avoid wrap-around.
+    :type nfft: int
+    :return: Mapping from component_id to row of spectra array, spectra array and energies of demeaned traces
+    :rtype: Tuple[Dict[int, int], np.ndarray, np.ndarray]
+    """
+    row_index = {cmp_id: i for i, cmp_id in enumerate(traces.keys())}
+    data = np.vstack([np.asarray(tr.data, dtype=np.float64) for tr in traces.values()])
+    data -= data.mean(axis=1, keepdims=True)
+    energies = np.sum(data**2, axis=1)
+    spectra = sp_fft.rfft(data, n=nfft, axis=1)
+    return row_index, spectra, energies
+
+
+def crosscorrelate_with_cached_spectra(
+    traces: Dict[int, obspy.Trace],
+    component_pairs_cartesian: Collection[ComponentPairCartesian],
+    max_lag_samples: int,
+    pair_batch_size: int = 500,
+) -> Dict[int, np.ndarray]:
+    """
+    Computes crosscorrelations for all provided component pairs reusing spectrum of every component.
+    Spectrum of each trace is computed only once, then for every batch of pairs spectra are multiplied
+    and inverse transformed in one vectorized call.
+    Output is numerically equivalent to :py:func:`obspy.signal.cross_correlation.correlate` with default
+    ``demean=True`` and ``normalize='naive'``.
+
+    All of the pairs need to have data for both their components present in traces and both traces of a pair
+    have to be of the same length.
+
+    :param traces: Traces grouped by component_id
+    :type traces: Dict[int, obspy.Trace]
+    :param component_pairs_cartesian: Pairs for which crosscorrelations should be computed
+    :type component_pairs_cartesian: Collection[ComponentPairCartesian]
+    :param max_lag_samples: Max lag of crosscorrelation in samples
+    :type max_lag_samples: int
+    :param pair_batch_size: How many pairs should be inverse transformed at once. Limits peak memory usage.
+    :type pair_batch_size: int
+    :return: Crosscorrelation functions grouped by id of ComponentPairCartesian
+    :rtype: Dict[int, np.ndarray]
+    """
+    pairs_by_npts: DefaultDict[int, List[ComponentPairCartesian]] = defaultdict(list)
+    for pair in component_pairs_cartesian:
+        pairs_by_npts[len(traces[pair.component_a_id].data)].append(pair)
+
+    ccfs: Dict[int, np.ndarray] = {}
+    for npts, pairs in pairs_by_npts.items():
+        component_ids = extract_component_ids_from_component_pairs_cartesian(pairs)
+        nfft = sp_fft.next_fast_len(npts + max_lag_samples, real=True)
+        row_index, spectra, energies = compute_real_spectra(
+            traces={cmp_id: traces[cmp_id] for cmp_id in component_ids},
+            nfft=nfft,
+        )
+        ccfs.update(
+            _crosscorrelate_pairs_from_spectra(
+                pairs=pairs,
+                row_index=row_index,
+                spectra=spectra,
+                energies=energies,
+                nfft=nfft,
+                max_lag_samples=max_lag_samples,
+                pair_batch_size=pair_batch_size,
+            )
+        )
+    return ccfs
+
+
+def compute_lag_padded_spectra(data: np.ndarray, npts: int, max_lag_samples: int) -> Tuple[int, np.ndarray]:
+    """
+    Demeans rows of provided 2D array and computes their real FFT zero padded to the same length as
+    :py:func:`~noiz.processing.crosscorrelations.crosscorrelate_with_cached_spectra` uses for given max lag.
+    Spectra are returned as complex64, as they are meant to be stored.
+
+    :param data: Data of traces, one trace per row
+    :type data: np.ndarray
+    :param npts: Number of samples of each trace
+    :type npts: int
+    :param max_lag_samples: Max lag of crosscorrelations in samples that should be possible to compute from spectra
+    :type max_lag_samples: int
+    :return: Length of the FFT and spectra
+    :rtype: Tuple[int, np.ndarray]
+    """
+    nfft = sp_fft.next_fast_len(npts + max_lag_samples, real=True)
+    demeaned = np.asarray(data, dtype=np.float64)
+    demeaned = demeaned - demeaned.mean(axis=-1, keepdims=True)
+    return nfft, sp_fft.rfft(demeaned, n=nfft, axis=-1).astype(np.complex64)
+
+
+def energies_from_real_spectra(spectra: np.ndarray, nfft: int) -> np.ndarray:
+    """
+    Computes energy of the time domain signals from their real spectra, following Parseval's theorem.
+    Every bin besides the zero frequency and, for even nfft, the Nyquist one represents two bins of the full spectrum.
+
+    :param spectra: Real spectra, one per row
+    :type spectra: np.ndarray
+    :param nfft: Length of the FFT used to compute spectra
+    :type nfft: int
+    :return: Energy of every signal
+    :rtype: np.ndarray
+    """
+    power = np.abs(np.asarray(spectra, dtype=np.complex128)) ** 2
+    weights = np.full(power.shape[-1], 2.0)
+    weights[0] = 1.0
+    if nfft % 2 == 0:
+        weights[-1] = 1.0
+    return power @ weights / nfft
+
+
+def crosscorrelate_with_stored_spectra(
+    spectra: Dict[int, np.ndarray],
+    nfft: Dict[int, int],
+    component_pairs_cartesian: Collection[ComponentPairCartesian],
+    max_lag_samples: int,
+    pair_batch_size: int = 500,
+) -> Dict[int, np.ndarray]:
+    """
+    Same as :py:func:`~noiz.processing.crosscorrelations.crosscorrelate_with_cached_spectra`, but starts from
+    spectra of demeaned traces stored with processed datachunks, see
+    :py:func:`~noiz.processing.crosscorrelations.compute_lag_padded_spectra`.
+    Energies required for normalization are recovered from the spectra.
+
+    Both components of every pair need to have spectra of the same length of FFT and it has to be
+    at least npts + max lag in samples.
+
+    :param spectra: Real spectra grouped by component_id
+    :type spectra: Dict[int, np.ndarray]
+    :param nfft: Length of the FFT of each of the spectra grouped by component_id
+    :type nfft: Dict[int, int]
+    :param component_pairs_cartesian: Pairs for which crosscorrelations should be computed
+    :type component_pairs_cartesian: Collection[ComponentPairCartesian]
+    :param max_lag_samples: Max lag of crosscorrelation in samples
+    :type max_lag_samples: int
+    :param pair_batch_size: How many pairs should be inverse transformed at once. Limits peak memory usage.
+    :type pair_batch_size: int
+    :return: Crosscorrelation functions grouped by id of ComponentPairCartesian
+    :rtype: Dict[int, np.ndarray]
+    """
+    pairs_by_nfft: DefaultDict[int, List[ComponentPairCartesian]] = defaultdict(list)
+    for pair in component_pairs_cartesian:
+        if nfft[pair.component_a_id] != nfft[pair.component_b_id]:
+            raise InconsistentDataException(
+                f"Spectra of components {pair.component_a_id} and {pair.component_b_id} have different lengths."
+            )
+        pairs_by_nfft[nfft[pair.component_a_id]].append(pair)
+
+    ccfs: Dict[int, np.ndarray] = {}
+    for group_nfft, pairs in pairs_by_nfft.items():
+        component_ids = extract_component_ids_from_component_pairs_cartesian(pairs)
+        row_index = {cmp_id: i for i, cmp_id in enumerate(component_ids)}
+        stacked = np.vstack([np.asarray(spectra[cmp_id], dtype=np.complex128) for cmp_id in component_ids])
+        ccfs.update(
+            _crosscorrelate_pairs_from_spectra(
+                pairs=pairs,
+                row_index=row_index,
+                spectra=stacked,
+                energies=energies_from_real_spectra(spectra=stacked, nfft=group_nfft),
+                nfft=group_nfft,
+                max_lag_samples=max_lag_samples,
+                pair_batch_size=pair_batch_size,
+            )
+        )
+    return ccfs
+
+
+def _crosscorrelate_pairs_from_spectra(
+    pairs: List[ComponentPairCartesian],
+    row_index: Dict[int, int],
+    spectra: np.ndarray,
+    energies: np.ndarray,
+    nfft: int,
+    max_lag_samples: int,
+    pair_batch_size: int,
+) -> Dict[int, np.ndarray]:
+    ccfs = {}
+    for start in range(0, len(pairs), pair_batch_size):
+        batch = pairs[start : start + pair_batch_size]
+        idx_a = np.array([row_index[pair.component_a_id] for pair in batch])
+        idx_b = np.array([row_index[pair.component_b_id] for pair in batch])
+
+        circular = sp_fft.irfft(spectra[idx_a] * np.conj(spectra[idx_b]), n=nfft, axis=1)
+        batch_ccfs = np.concatenate(
+            (circular[:, nfft - max_lag_samples :], circular[:, : max_lag_samples + 1]),
+            axis=1,
+        )
+
+        norms = np.sqrt(energies[idx_a] * energies[idx_b])
+        zero_norm = norms <= np.finfo(float).eps
+        batch_ccfs[zero_norm] = 0
+        batch_ccfs[~zero_norm] /= norms[~zero_norm, np.newaxis]
+
+        for pair, ccf in zip(batch, batch_ccfs):
+            ccfs[pair.id] = ccf
+    return ccfs
+
+
+def load_spectra_for_chunks(
+    chunks: Dict[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]],
+) -> Tuple[Dict[int, np.ndarray], Dict[int, int]]:
+    """
+    Loads stored spectra of provided ProcessedDatachunks. Each of the containers is opened only once.
+
+    :param chunks: ProcessedDatachunks or references to them grouped by component_id
+    :type chunks: Dict[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]]
+    :return: Spectra and lengths of FFT used to compute them, both grouped by the same keys as input
+    :rtype: Tuple[Dict[int, np.ndarray], Dict[int, int]]
+    """
+    containers: Dict[str, np.ndarray] = {}
+    spectra = {}
+    nfft = {}
+    for cmp_id, chunk in chunks.items():
+        spectra[cmp_id] = chunk.load_spectrum(containers=containers)
+        if isinstance(chunk, ProcessedDatachunkReference):
+            nfft[cmp_id] = chunk.spectrum_nfft
+        else:
+            nfft[cmp_id] = chunk.spectrum_file.nfft
+    return spectra, nfft  # type: ignore
+
+
 def validate_component_code_pairs(component_pairs_cartesian: Collection[str]) -> Tuple[str, ...]:
     """
     Checks if provided component_code_pairs are strings with two characters only and removes duplicates.
@@ -119,17 +353,282 @@ def extract_component_ids_from_component_pairs_cartesian(
     return single_component_ids
 
 
+def select_missing_component_pairs(
+    component_pairs_cartesian: Collection[ComponentPairCartesian],
+    grouped_processed_chunks: Mapping[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]],
+    existing_componentpair_ids: Collection[int],
+) -> Tuple[Tuple[ComponentPairCartesian, ...], Dict[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]]]:
+    """
+    Restricts inputs of a timespan to component pairs that do not have a crosscorrelation yet.
+    Missing pairs without a ProcessedDatachunk for any of their components are dropped, since they cannot be
+    crosscorrelated anyway.
+    ProcessedDatachunks of components that are not a part of any of the remaining pairs are dropped too,
+    so they are not loaded without need.
+
+    :param component_pairs_cartesian: All component pairs that should be crosscorrelated
+    :type component_pairs_cartesian: Collection[ComponentPairCartesian]
+    :param grouped_processed_chunks: ProcessedDatachunks or their references of the timespan grouped by component id
+    :type grouped_processed_chunks: Mapping[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]]
+    :param existing_componentpair_ids: Ids of component pairs that already have a crosscorrelation
+    :type existing_componentpair_ids: Collection[int]
+    :return: Missing component pairs and ProcessedDatachunks required for them
+    :rtype: Tuple[Tuple[ComponentPairCartesian, ...], Dict[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]]]
+    """
+    existing = set(existing_componentpair_ids)
+    missing_pairs = tuple(
+        pair
+        for pair in component_pairs_cartesian
+        if pair.id not in existing
+        and pair.component_a_id in grouped_processed_chunks
+        and pair.component_b_id in grouped_processed_chunks
+    )
+    required_components = set(extract_component_ids_from_component_pairs_cartesian(missing_pairs))
+    required_chunks = {
+        cmp_id: chunk for cmp_id, chunk in grouped_processed_chunks.items() if cmp_id in required_components
+    }
+    return missing_pairs, required_chunks
+
+
+def split_component_pairs_into_tiles(
+    component_pairs_cartesian: Collection[ComponentPairCartesian],
+    grouped_processed_chunks: Dict[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]],
+    tile_size: int,
+) -> List[Tuple[Tuple[int, int], Tuple[ComponentPairCartesian, ...], Dict[int, Any]]]:
+    """
+    Decomposes pair matrix of a single timespan into 2-D tiles.
+    Components are sorted by their id and split into blocks of :paramref:`tile_size`.
+    Pair goes to the tile placed on the crossing of blocks of its components, so each tile needs data only of
+    components from its row block and its column block. Lower half of the matrix is folded onto the upper one.
+
+    Tiles are returned in a serpentine order, row by row with every second row traversed backwards.
+    That way, every two consecutive tiles share one of their blocks and a worker processing them one after another
+    can reuse already loaded data.
+
+    Pairs for which data of any of the components is missing are dropped.
+
+    :param component_pairs_cartesian: Pairs to be split
+    :type component_pairs_cartesian: Collection[ComponentPairCartesian]
+    :param grouped_processed_chunks: ProcessedDatachunks of the timespan grouped by component id
+    :type grouped_processed_chunks: Dict[int, Union[ProcessedDatachunk, ProcessedDatachunkReference]]
+    :param tile_size: Count of components in one block
+    :type tile_size: int
+    :return: Tiles as tuples of (row block, column block) index, pairs of the tile and chunks required by them
+    :rtype: List[Tuple[Tuple[int, int], Tuple[ComponentPairCartesian, ...], Dict[int, Any]]]
+    """
+    if tile_size < 1:
+        raise ValueError(f"tile_size has to be a positive integer. Got {tile_size}")
+
+    block_of_component = {cmp_id: i // tile_size for i, cmp_id in enumerate(sorted(grouped_processed_chunks.keys()))}
+
+    pairs_of_tile: DefaultDict[Tuple[int, int], List[ComponentPairCartesian]] = defaultdict(list)
+    for pair in component_pairs_cartesian:
+        if pair.component_a_id not in block_of_component or pair.component_b_id not in block_of_component:
+            continue
+        blocks = sorted((block_of_component[pair.component_a_id], block_of_component[pair.component_b_id]))
+        pairs_of_tile[(blocks[0], blocks[1])].append(pair)
+
+    def serpentine_order(tile: Tuple[int, int]) -> Tuple[int, int]:
+        row, col = tile
+        return row, col if row % 2 == 0 else -col
+
+    tiles = []
+    for tile in sorted(pairs_of_tile.keys(), key=serpentine_order):
+        pairs = tuple(pairs_of_tile[tile])
+        required_components = set(extract_component_ids_from_component_pairs_cartesian(pairs))
+        chunks = {cmp_id: chunk for cmp_id, chunk in grouped_processed_chunks.items() if cmp_id in required_components}
+        tiles.append((tile, pairs, chunks))
+    return tiles
+
+
+class TraceLoadCache:
+    """
+    Bounded LRU cache of traces loaded for :py:class:`~noiz.models.datachunk.ProcessedDatachunkReference`.
+    It is meant to be shared between consecutive tiles processed by the same worker, so blocks of components
+    shared between tiles are read from disk only once. Traces kept in the cache must not be modified in place.
+    """
+
+    def __init__(self, max_traces: int):
+        self.max_traces = max_traces
+        self._traces: OrderedDict[ProcessedDatachunkReference, obspy.Trace] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, chunks: Dict[int, ProcessedDatachunkReference]) -> Dict[int, obspy.Trace]:
+        """
+        Loads traces for provided chunks, reusing cached ones where possible.
+
+        :param chunks: References to ProcessedDatachunks grouped by component id
+        :type chunks: Dict[int, ProcessedDatachunkReference]
+        :return: Dict with the same keys but Traces instead
+        :rtype: Dict[int, obspy.Trace]
+        """
+        traces = {}
+        missing = {}
+        with self._lock:
+            for cmp_id, reference in chunks.items():
+                if reference in self._traces:
+                    self._traces.move_to_end(reference)
+                    traces[cmp_id] = self._traces[reference]
+                    self.hits += 1
+                else:
+                    missing[cmp_id] = reference
+                    self.misses += 1
+
+        loaded = load_data_for_chunks(chunks=missing)  # type: ignore
+
+        with self._lock:
+            for cmp_id, trace in loaded.items():
+                self._traces[missing[cmp_id]] = trace
+                self._traces.move_to_end(missing[cmp_id])
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+        traces.update(loaded)
+        return traces
+
+
+_TRACE_LOAD_CACHE: Optional[TraceLoadCache] = None
+
+
+def get_trace_load_cache(max_traces: int) -> TraceLoadCache:
+    """
+    Returns a :py:class:`~noiz.processing.crosscorrelations.TraceLoadCache` shared by all tasks executed in the
+    current process. The cache is recreated if a different size is requested.
+
+    :param max_traces: Max count of traces kept in the cache
+    :type max_traces: int
+    :return: Process-wide cache
+    :rtype: TraceLoadCache
+    """
+    global _TRACE_LOAD_CACHE
+    if _TRACE_LOAD_CACHE is None or _TRACE_LOAD_CACHE.max_traces != max_traces:
+        _TRACE_LOAD_CACHE = TraceLoadCache(max_traces=max_traces)
+    return _TRACE_LOAD_CACHE
+
+
+class SpectraLoadCache:
+    """
+    Bounded LRU cache of real spectra of demeaned traces loaded for
+    :py:class:`~noiz.models.datachunk.ProcessedDatachunkReference`.
+    Spectra are computed for a max lag of crosscorrelations, the same way as in
+    :py:func:`~noiz.processing.crosscorrelations.crosscorrelate_with_cached_spectra`.
+    It is meant to be shared between consecutive tiles processed by the same worker, so blocks of components
+    shared between tiles are neither read from disk nor transformed again.
+    Spectra kept in the cache must not be modified in place.
+    """
+
+    def __init__(self, max_spectra: int):
+        self.max_spectra = max_spectra
+        self._spectra: OrderedDict[Tuple[ProcessedDatachunkReference, int], Tuple[int, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(
+        self, chunks: Dict[int, ProcessedDatachunkReference], max_lag_samples: int
+    ) -> Tuple[Dict[int, np.ndarray], Dict[int, int]]:
+        """
+        Loads spectra for provided chunks, reusing cached ones where possible.
+        Missing chunks are read from disk and transformed in a single batched call per number of samples.
+
+        :param chunks: References to ProcessedDatachunks grouped by component id
+        :type chunks: Dict[int, ProcessedDatachunkReference]
+        :param max_lag_samples: Max lag of crosscorrelations in samples that should be possible to compute
+        :type max_lag_samples: int
+        :return: Spectra and lengths of FFT used to compute them, both grouped by the same keys as input
+        :rtype: Tuple[Dict[int, np.ndarray], Dict[int, int]]
+        """
+        spectra = {}
+        nfft = {}
+        missing = {}
+        with self._lock:
+            for cmp_id, reference in chunks.items():
+                key = (reference, max_lag_samples)
+                if key in self._spectra:
+                    self._spectra.move_to_end(key)
+                    nfft[cmp_id], spectra[cmp_id] = self._spectra[key]
+                    self.hits += 1
+                else:
+                    missing[cmp_id] = reference
+                    self.misses += 1
+
+        traces_by_npts: DefaultDict[int, Dict[int, obspy.Trace]] = defaultdict(dict)
+        for cmp_id, trace in load_data_for_chunks(chunks=missing).items():  # type: ignore
+            traces_by_npts[len(trace.data)][cmp_id] = trace
+
+        loaded: Dict[int, Tuple[int, np.ndarray]] = {}
+        for npts, traces in traces_by_npts.items():
+            group_nfft = sp_fft.next_fast_len(npts + max_lag_samples, real=True)
+            row_index, group_spectra, _ = compute_real_spectra(traces=traces, nfft=group_nfft)
+            for cmp_id, row in row_index.items():
+                loaded[cmp_id] = (group_nfft, group_spectra[row])
+
+        with self._lock:
+            for cmp_id, entry in loaded.items():
+                key = (missing[cmp_id], max_lag_samples)
+                self._spectra[key] = entry
+                self._spectra.move_to_end(key)
+            while len(self._spectra) > self.max_spectra:
+                self._spectra.popitem(last=False)
+
+        for cmp_id, (group_nfft, spectrum) in loaded.items():
+            nfft[cmp_id] = group_nfft
+            spectra[cmp_id] = spectrum
+        return spectra, nfft
+
+
+_SPECTRA_LOAD_CACHE: Optional[SpectraLoadCache] = None
+
+
+def get_spectra_load_cache(max_spectra: int) -> SpectraLoadCache:
+    """
+    Returns a :py:class:`~noiz.processing.crosscorrelations.SpectraLoadCache` shared by all tasks executed in the
+    current process. The cache is recreated if a different size is requested.
+
+    :param max_spectra: Max count of spectra kept in the cache
+    :type max_spectra: int
+    :return: Process-wide cache
+    :rtype: SpectraLoadCache
+    """
+    global _SPECTRA_LOAD_CACHE
+    if _SPECTRA_LOAD_CACHE is None or _SPECTRA_LOAD_CACHE.max_spectra != max_spectra:
+        _SPECTRA_LOAD_CACHE = SpectraLoadCache(max_spectra=max_spectra)
+    return _SPECTRA_LOAD_CACHE
+
+
+def load_crosscorrelations_cartesian_data(
+    crosscorrelations_cartesian: Collection[CrosscorrelationCartesian],
+) -> List[np.ndarray]:
+    """
+    Loads data of all provided :py:class:`~noiz.models.crosscorrelation.CrosscorrelationCartesian`.
+    Crosscorrelations that are stored in a container file are read as slices of a memory mapped container,
+    each container is opened only once, no matter how many of provided ccfs it holds.
+
+    :param crosscorrelations_cartesian: Crosscorrelations to be loaded
+    :type crosscorrelations_cartesian: Collection[CrosscorrelationCartesian]
+    :return: Loaded ccfs in the same order as input
+    :rtype: List[np.ndarray]
+    """
+    containers: Dict[str, np.ndarray] = {}
+    ccf_data = []
+    for ccf in crosscorrelations_cartesian:
+        if ccf.container_offset is None:
+            ccf_data.append(ccf.load_data())
+            continue
+        if ccf.file.filepath not in containers.keys():
+            containers[ccf.file.filepath] = np.load(file=ccf.file.filepath, mmap_mode="r")
+        ccf_data.append(np.array(containers[ccf.file.filepath][ccf.container_offset]))
+    return ccf_data
+
+
 def assembly_ccf_cartesian_dataframe(
     crosscorrelations_cartesian: Collection[CrosscorrelationCartesian],
     crosscorrelation_cartesian_params: CrosscorrelationCartesianParams,
 ) -> pd.DataFrame:
     time_vector = crosscorrelation_cartesian_params.correlation_time_vector
-    midtimes = []
-    ccf_data = []
-    for ccf in crosscorrelations_cartesian:
-        midtimes.append(ccf.timespan.midtime)
-        ccf_data.append(ccf.load_data())
-    ccfs = np.vstack(ccf_data)
+    midtimes = [ccf.timespan.midtime for ccf in crosscorrelations_cartesian]
+    ccfs = np.vstack(load_crosscorrelations_cartesian_data(crosscorrelations_cartesian))
     df = pd.DataFrame(index=midtimes, columns=time_vector, data=ccfs)
     df = df.sort_index()
     return df
@@ -158,175 +657,125 @@ def group_xcrorrcartesian_by_timespanid_componentids(
     return grouped_xcorrcartesian
 
 
-def _fetch_R_T_xcoor(
-    gr_xcors_cart: Dict[FrozenSet[int], CrosscorrelationCartesian],
-    comp_pairs_cyl: ComponentPairCylindrical,
-) -> Tuple[CrosscorrelationCartesian, CrosscorrelationCartesian, CrosscorrelationCartesian, CrosscorrelationCartesian]:
-    """
-    Fetch the cartesian cross-correlations that will be used for computing the cylindrical cross-correlations variant
-     for RR, TT, RT, TR component pairs.
-
-     If cross-correlation for any of the cylindrical component pairs is not available in provided gr_xcors_cart
-     dictionary, a KeyError will be raised.
-
-    :param gr_xcors_cart: Grouped cartesian crosscorrelations
-    :type gr_xcors_cart: DefaultDict[Timespan, Dict[FrozenSet[int], CrosscorrelationCartesian]]
-    :param comp_pairs_cyl: A group of cartesian component pair for which to compute cylindrical variant
-    :type comp_pairs_cyl: ComponentPairCylindrical
-    :return: list of crosscorrelation_cartesian
-    :rtype: Tuple[CrosscorrelationCartesian, CrosscorrelationCartesian]
-    """
-
-    xcorr_aN_bN = gr_xcors_cart[frozenset((comp_pairs_cyl.component_aN_id, comp_pairs_cyl.component_bN_id))]
-    xcorr_aE_bE = gr_xcors_cart[frozenset((comp_pairs_cyl.component_aE_id, comp_pairs_cyl.component_bE_id))]
-    xcorr_aN_bE = gr_xcors_cart[frozenset((comp_pairs_cyl.component_aN_id, comp_pairs_cyl.component_bN_id))]
-    xcorr_aE_bN = gr_xcors_cart[frozenset((comp_pairs_cyl.component_bE_id, comp_pairs_cyl.component_aN_id))]
-
-    return xcorr_aN_bN, xcorr_aE_bE, xcorr_aN_bE, xcorr_aE_bN
-
-
-def _computation_cylindrical_correlation_R_T(code, xcorr_aN_bN, xcorr_aE_bE, xcorr_aN_bE, xcorr_aE_bN, back_az):
-    """
-    Computation of the cylindrical crosscorrelations for either componnentpair RR, TT, RT or TR
+CARTESIAN_TENSOR_COMPONENTS: Tuple[str, ...] = ("E", "N", "Z")
+CYLINDRICAL_CODE_PAIRS: Tuple[str, ...] = ("RR", "TT", "RT", "TR", "RZ", "TZ", "ZR", "ZT")
 
-    :param code: componentpair (RR, TT, TR, RT)
-    :type code: str
-    :param xcorr_aN_bN: cartesian componentpair for station A component N and station B component N
-    :type xcorr_aN_bN: Crosscorrelation_cartesian
-    :param xcorr_aE_bE: cartesian componentpair for station A component E and station B component E
-    :type xcorr_aE_bE: Crosscorrelation_cartesian
-    :param xcorr_aN_bE: cartesian componentpair for station A component N and station B component E
-    :type xcorr_aN_bE: Crosscorrelation_cartesian
-    :param xcorr_aE_bN: cartesian componentpair for station A component E and station B component N
-    :type xcorr_aE_bN: Crosscorrelation_cartesian
-    :param back_az: backazimuth angle measured between station A and B
-    :type back_az: float
-    :return: cylindrical crosscorrelation
-    :rtype: array
-    """
-
-    if code == "RR":
-        xcorr_cylindrical = (
-            np.sin(back_az) ** 2 * xcorr_aE_bE.ccf
-            + np.cos(back_az) * np.sin(back_az) * (xcorr_aE_bN.ccf + xcorr_aN_bE.ccf)
-            + np.cos(back_az) ** 2 * xcorr_aN_bN.ccf
-        )
-
-    elif code == "TT":
-        xcorr_cylindrical = (
-            np.cos(back_az) ** 2 * xcorr_aE_bE.ccf
-            - np.cos(back_az) * np.sin(back_az) * (xcorr_aE_bN.ccf - xcorr_aN_bE.ccf)
-            + np.sin(back_az) ** 2 * xcorr_aN_bN.ccf
-        )
 
-    elif code == "RT":
-        xcorr_cylindrical = (
-            np.cos(back_az) ** 2 * xcorr_aN_bE.ccf
-            + np.cos(back_az) * np.sin(back_az) * (xcorr_aE_bE.ccf - xcorr_aN_bN.ccf)
-            - np.sin(back_az) ** 2 * xcorr_aE_bN.ccf
-        )
-
-    elif code == "TR":
-        xcorr_cylindrical = (
-            np.cos(back_az) ** 2 * xcorr_aE_bN.ccf
-            + np.cos(back_az) * np.sin(back_az) * (xcorr_aE_bE.ccf - xcorr_aN_bN.ccf)
-            - np.sin(back_az) ** 2 * xcorr_aN_bE.ccf
-        )
-
-    return xcorr_cylindrical
-
-
-def _fetch_RT_Z_xcoor(
+def assembly_cartesian_ccf_tensor(
     gr_xcors_cart: Dict[FrozenSet[int], CrosscorrelationCartesian],
     comp_pairs_cyl: ComponentPairCylindrical,
-) -> Tuple[CrosscorrelationCartesian, CrosscorrelationCartesian]:
+) -> Tuple[np.ndarray, np.ndarray, Dict[str, CrosscorrelationCartesian]]:
     """
-    Fetch the cartesian crosscorrelation used for computing the cylindrical crosscorrelation for RZ, TZ componentpairs
-
-    :param gr_xcors_cart: Grouped cartesian crosscorrelations
-    :type gr_xcors_cart: DefaultDict[Timespan, Dict[FrozenSet[int], CrosscorrelationCartesian]]
-    :param comp_pairs_cyl: A group of cartesian component pair for which to compute cylindrical variant
+    Loads all cartesian crosscorrelations of a station pair exactly once and places them in a 3×3×lag tensor.
+    The first axis corresponds to E, N, Z component of station A, the second one to E, N, Z of station B.
+    If a crosscorrelation was stored for the reversed component pair (station B as component_a),
+    it is reversed in time before being placed in the tensor.
+
+    :param gr_xcors_cart: Cartesian crosscorrelations of a timespan grouped by set of component ids
+    :type gr_xcors_cart: Dict[FrozenSet[int], CrosscorrelationCartesian]
+    :param comp_pairs_cyl: Any of the cylindrical component pairs of that station pair
     :type comp_pairs_cyl: ComponentPairCylindrical
-    :return: list of crosscorrelation_cartesian
-    :rtype: Tuple[CrosscorrelationCartesian, CrosscorrelationCartesian]
+    :return: Tensor with crosscorrelations, boolean 3×3 mask of which of them were available and
+        mapping of cartesian code pair (e.g. "NE") to the crosscorrelation object used
+    :rtype: Tuple[np.ndarray, np.ndarray, Dict[str, CrosscorrelationCartesian]]
     """
+    components_a = [getattr(comp_pairs_cyl, f"component_a{x}_id") for x in CARTESIAN_TENSOR_COMPONENTS]
+    components_b = [getattr(comp_pairs_cyl, f"component_b{x}_id") for x in CARTESIAN_TENSOR_COMPONENTS]
+
+    positions = []
+    used_xcorrs: Dict[str, CrosscorrelationCartesian] = {}
+    for i, cmp_a in enumerate(components_a):
+        for j, cmp_b in enumerate(components_b):
+            if cmp_a is None or cmp_b is None:
+                continue
+            xcorr = gr_xcors_cart.get(frozenset((cmp_a, cmp_b)))
+            if xcorr is None:
+                continue
+            positions.append((i, j, xcorr.componentpair_cartesian.component_a_id != cmp_a))
+            used_xcorrs[CARTESIAN_TENSOR_COMPONENTS[i] + CARTESIAN_TENSOR_COMPONENTS[j]] = xcorr
+
+    mask = np.zeros((3, 3), dtype=bool)
+    if len(used_xcorrs) == 0:
+        return np.zeros((3, 3, 0)), mask, used_xcorrs
+
+    loaded = load_crosscorrelations_cartesian_data(list(used_xcorrs.values()))
+    lengths = {len(x) for x in loaded}
+    if len(lengths) != 1:
+        raise InconsistentDataException(
+            f"Cartesian crosscorrelations of {comp_pairs_cyl} have different lengths {lengths}"
+        )
 
-    xcorr_aE_bZ = gr_xcors_cart[frozenset((comp_pairs_cyl.component_aE_id, comp_pairs_cyl.component_bZ_id))]
-    xcorr_aN_bZ = gr_xcors_cart[frozenset((comp_pairs_cyl.component_aN_id, comp_pairs_cyl.component_bZ_id))]
+    tensor = np.zeros((3, 3, lengths.pop()))
+    for (i, j, reversed_pair), data in zip(positions, loaded):
+        tensor[i, j] = data[::-1] if reversed_pair else data
+        mask[i, j] = True
 
-    return xcorr_aE_bZ, xcorr_aN_bZ
+    return tensor, mask, used_xcorrs
 
 
-def _computation_cylindrical_correlation_RT_Z(code, xcorr_aE_bZ, xcorr_aN_bZ, back_az):
+def cylindrical_rotation_weights(back_az: float) -> Dict[str, np.ndarray]:
     """
-    Computation of the cylindrical crosscorrelations for either componnentpair RZ or TZ
+    Returns 3×3 weights applied to the cartesian tensor assembled with
+    :py:func:`~noiz.processing.crosscorrelations.assembly_cartesian_ccf_tensor` for every cylindrical code pair.
+    With ``s`` and ``c`` being sine and cosine of the backazimuth, the rotations are:
+
+    - ``RR = s² EE + cs (EN + NE) + c² NN``
+    - ``TT = c² EE - cs (EN - NE) + s² NN``
+    - ``RT = c² NE + cs (EE - NN) - s² EN``
+    - ``TR = c² EN + cs (EE - NN) - s² NE``
+    - ``RZ = s EZ + c NZ`` and ``TZ = c EZ - s NZ``
+    - ``ZR = s ZE + c ZN`` and ``ZT = c ZE - s ZN``
 
-    :param code: componentpair (RZ, TZ)
-    :type code: str
-    :param xcorr_aE_bZ: Crosscorrelation_cartesian componentpair for station A component E and station B component Z
-    :type xcorr_aE_bZ: _type_
-    :param xcorr_aN_bZ: cartesian componentpair for station A component N and station B component Z
-    :type xcorr_aN_bZ: Crosscorrelation_cartesian
     :param back_az: backazimuth angle measured between station A and B
     :type back_az: float
-    :return: cylindrical crosscorrelation
-    :rtype: array
+    :return: Weights for each of the cylindrical code pairs
+    :rtype: Dict[str, np.ndarray]
     """
-
-    if code == "RZ":
-        xcorr_cylindrical = np.sin(back_az) * xcorr_aE_bZ.ccf + np.cos(back_az) * xcorr_aN_bZ.ccf
-
-    elif code == "TZ":
-        xcorr_cylindrical = np.cos(back_az) * xcorr_aE_bZ.ccf - np.sin(back_az) * xcorr_aN_bZ.ccf
-
-    return xcorr_cylindrical
-
-
-def _fetch_Z_TR_xcoor(
-    gr_xcors_cart: Dict[FrozenSet[int], CrosscorrelationCartesian],
-    comp_pairs_cyl: ComponentPairCylindrical,
-) -> Tuple[CrosscorrelationCartesian, CrosscorrelationCartesian]:
+    s = np.sin(back_az)
+    c = np.cos(back_az)
+    e, n, z = 0, 1, 2
+
+    weights = {code: np.zeros((3, 3)) for code in CYLINDRICAL_CODE_PAIRS}
+
+    weights["RR"][e, e], weights["RR"][e, n], weights["RR"][n, e], weights["RR"][n, n] = s**2, c * s, c * s, c**2
+    weights["TT"][e, e], weights["TT"][e, n], weights["TT"][n, e], weights["TT"][n, n] = c**2, -c * s, c * s, s**2
+    weights["RT"][n, e], weights["RT"][e, e], weights["RT"][n, n], weights["RT"][e, n] = c**2, c * s, -c * s, -(s**2)
+    weights["TR"][e, n], weights["TR"][e, e], weights["TR"][n, n], weights["TR"][n, e] = c**2, c * s, -c * s, -(s**2)
+    weights["RZ"][e, z], weights["RZ"][n, z] = s, c
+    weights["TZ"][e, z], weights["TZ"][n, z] = c, -s
+    weights["ZR"][z, e], weights["ZR"][z, n] = s, c
+    weights["ZT"][z, e], weights["ZT"][z, n] = c, -s
+
+    return weights
+
+
+def rotate_cartesian_ccf_tensor(
+    tensor: np.ndarray,
+    mask: np.ndarray,
+    back_az: float,
+    codes: Collection[str] = CYLINDRICAL_CODE_PAIRS,
+) -> Dict[str, np.ndarray]:
     """
-    Fetch the cartesian crosscorrelation used for computing the cylindrical crosscorrelation for ZR, ZT componentpairs
-
-    :param gr_xcors_cart: Grouped cartesian crosscorrelations
-    :type gr_xcors_cart: DefaultDict[Timespan, Dict[FrozenSet[int], CrosscorrelationCartesian]]
-    :param comp_pairs_cyl: A group of cartesian component pair for which to compute cylindrical variant
-    :type comp_pairs_cyl: ComponentPairCylindrical
-    :return: list of crosscorrelation_cartesian
-    :rtype: Tuple[CrosscorrelationCartesian, CrosscorrelationCartesian]
-    """
-    xcorr_aZ_bE = gr_xcors_cart[frozenset((comp_pairs_cyl.component_aZ_id, comp_pairs_cyl.component_bE_id))]
-    xcorr_aZ_bN = gr_xcors_cart[frozenset((comp_pairs_cyl.component_aZ_id, comp_pairs_cyl.component_bN_id))]
-
-    return xcorr_aZ_bE, xcorr_aZ_bN
-
-
-def _computation_cylindrical_correlation_Z_TR(
-    code,
-    xcorr_aZ_bE,
-    xcorr_aZ_bN,
-    back_az,
-):
-    """
-    Computation of the cylindrical crosscorrelations for either componnentpair ZR or ZT
-
-    :param code: componentpair (ZR, ZT)
-    :type code: str
-    :param xcorr_aZ_bE: Crosscorrelation_cartesian componentpair for station A component Z and station B component E
-    :type xcorr_aZ_bE: Crosscorrelation_cartesian
-    :param xcorr_aZ_bN: cartesian componentpair for station A component Z and station B component N
-    :type xcorr_aZ_bN:  Crosscorrelation_cartesian
+    Computes all requested cylindrical crosscorrelations of a station pair in a single vectorized rotation of
+    the cartesian tensor.
+    Code pairs for which some of the required cartesian crosscorrelations are missing are omitted from the output.
+
+    :param tensor: 3×3×lag tensor with cartesian crosscorrelations
+    :type tensor: np.ndarray
+    :param mask: 3×3 boolean mask of available cartesian crosscorrelations
+    :type mask: np.ndarray
     :param back_az: backazimuth angle measured between station A and B
     :type back_az: float
-    :return: cylindrical crosscorrelation
-    :rtype: array
+    :param codes: Cylindrical code pairs to compute
+    :type codes: Collection[str]
+    :return: Cylindrical crosscorrelations keyed by their code pair
+    :rtype: Dict[str, np.ndarray]
     """
-
-    if code == "ZR":
-        xcorr_cylindrical = np.sin(back_az) * xcorr_aZ_bE.ccf + np.cos(back_az) * xcorr_aZ_bN.ccf
-
-    elif code == "ZT":
-        xcorr_cylindrical = np.cos(back_az) * xcorr_aZ_bE.ccf - np.sin(back_az) * xcorr_aZ_bN.ccf
-
-    return xcorr_cylindrical
+    all_weights = cylindrical_rotation_weights(back_az=back_az)
+    computable = [code for code in codes if not np.any((all_weights[code] != 0) & ~mask)]
+    if len(computable) == 0:
+        return {}
+
+    weights = np.stack([all_weights[code] for code in computable])
+    rotated = np.einsum("kij,ijl->kl", weights, tensor)
+    return {code: rotated[k] for k, code in enumerate(computable)}
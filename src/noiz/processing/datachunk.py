@@ -2,33 +2,57 @@
 # Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
 # Copyright © 2019-2023 Contributors to the Noiz project.
 
-from collections import OrderedDict
+import datetime
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from fractions import Fraction
 from loguru import logger
 import numpy as np
 import obspy
 import scipy
-from typing import Union, Tuple, Dict, Collection, Optional
+import scipy.signal
+from pathlib import Path
+from typing import Callable, Union, Tuple, Dict, Collection, Optional, Generator, Iterable, List, Sequence, Set
 import numpy.typing as npt
 
-from noiz.models.type_aliases import CalculateDatachunkStatsInputs, RunDatachunkPreparationInputs
+from noiz.models.type_aliases import (
+    CalculateDatachunkStatsInputs,
+    RunDatachunkPreparationFileGroupInputs,
+    RunDatachunkPreparationInputs,
+)
 from noiz.exceptions import MissingDataFileException, ResponseRemovalError, CorruptedMiniseedFileException
 from noiz.globals import PROCESSED_DATA_DIR
 from noiz.models.component import Component
 from noiz.models.datachunk import Datachunk, DatachunkFile, DatachunkStats
-from noiz.models.processing_params import DatachunkParams, ZeroPaddingMethod
+from noiz.models.processing_params import (
+    DatachunkParams,
+    DatachunkPreprocessingMode,
+    DatachunkResamplingMethod,
+    DatachunkSampleDtype,
+    DatachunkStorage,
+    ZeroPaddingMethod,
+)
 from noiz.models.timeseries import Tsindex
 from noiz.models.timespan import Timespan
+from noiz.processing.chunk_container import serialize_stream, write_chunk_container
+from noiz.processing.miniseed_helpers import MiniseedReadStats, read_miniseed_byte_range
 from noiz.processing.path_helpers import (
+    assembly_container_filename,
     assembly_filepath,
     assembly_sds_like_dir,
     assembly_preprocessing_filename,
     increment_filename_counter,
     parent_directory_exists_or_create,
 )
+from noiz.processing.response import ResponseCache, load_inventory_cached, remove_response_with_cache
 from noiz.processing.signal_helpers import get_min_sample_count, get_expected_sample_count, get_max_sample_count
+from noiz.processing.time_utils import get_utc_date
 from noiz.validation_helpers import count_consecutive_trues, validate_stream_with_single_trace
 
 
+POLYPHASE_MAX_TERM = 100
+
+
 def next_pow_2(number: Union[int, float]) -> int:
     """
     Finds a number that is a power of two that is next after value provided to that method.
@@ -42,19 +66,38 @@ def next_pow_2(number: Union[int, float]) -> int:
     return int(np.ceil(np.log2(number)))
 
 
-def resample_with_padding(st: obspy.Stream, sampling_rate: Union[int, float]) -> obspy.Stream:
+def resample_with_padding(
+    st: obspy.Stream,
+    sampling_rate: Union[int, float],
+    method: DatachunkResamplingMethod = DatachunkResamplingMethod.FFT_PADDED,
+) -> obspy.Stream:
     """
     Pads data of trace (assumes that stream has only one trace) with zeros up to next power of two
     and resamples it down to provided sampling rate. In the end it trims it to original starttime and endtime.
 
+    If :py:attr:`~noiz.models.processing_params.DatachunkResamplingMethod.POLYPHASE` method is selected and ratio
+    of sampling rates is a rational number with small terms, data are resampled
+    with :py:func:`~noiz.processing.datachunk.resample_polyphase` instead, without padding.
+
     :param st: Stream containing one trace to be resampled
     :type st: obspy.Stream
     :param sampling_rate: Target sampling rate
     :type sampling_rate: Union[int, float]
+    :param method: Resampling method to be used
+    :type method: DatachunkResamplingMethod
     :return: Resampled stream
     :rtype: obspy.Stream
     """
 
+    if method is DatachunkResamplingMethod.POLYPHASE:
+        ratio = find_polyphase_ratio(original_sampling_rate=st[0].stats.sampling_rate, sampling_rate=sampling_rate)
+        if ratio is not None:
+            return resample_polyphase(st=st, sampling_rate=sampling_rate, up=ratio[0], down=ratio[1])
+        logger.warning(
+            f"Ratio of sampling rates {st[0].stats.sampling_rate} and {sampling_rate} is not a rational number "
+            f"with terms up to {POLYPHASE_MAX_TERM}. Falling back to padded FFT resampling."
+        )
+
     tr: obspy.Trace = st[0]
     starttime: obspy.UTCDateTime = tr.stats.starttime
     endtime: obspy.UTCDateTime = tr.stats.endtime
@@ -97,6 +140,64 @@ def resample_with_padding(st: obspy.Stream, sampling_rate: Union[int, float]) ->
     return st
 
 
+def find_polyphase_ratio(
+    original_sampling_rate: Union[int, float],
+    sampling_rate: Union[int, float],
+    max_term: int = POLYPHASE_MAX_TERM,
+) -> Optional[Tuple[int, int]]:
+    """
+    Finds upsampling and downsampling factors that convert original sampling rate to the target one exactly.
+    Returns None if there are no such factors not larger than ``max_term``.
+
+    :param original_sampling_rate: Sampling rate of the data
+    :type original_sampling_rate: Union[int, float]
+    :param sampling_rate: Target sampling rate
+    :type sampling_rate: Union[int, float]
+    :param max_term: Maximal value of any of the factors
+    :type max_term: int
+    :return: Upsampling and downsampling factors
+    :rtype: Optional[Tuple[int, int]]
+    """
+    ratio = Fraction(float(sampling_rate) / float(original_sampling_rate)).limit_denominator(max_term)
+    if ratio.numerator == 0 or ratio.numerator > max_term:
+        return None
+    if not np.isclose(float(original_sampling_rate) * ratio.numerator / ratio.denominator, float(sampling_rate)):
+        return None
+    return ratio.numerator, ratio.denominator
+
+
+def resample_polyphase(st: obspy.Stream, sampling_rate: Union[int, float], up: int, down: int) -> obspy.Stream:
+    """
+    Resamples data of trace (assumes that stream has only one trace) with a polyphase FIR filter
+    by upsampling it ``up`` times and downsampling ``down`` times.
+    The anti-aliasing filter is a zero-phase Kaiser windowed FIR of :func:`scipy.signal.resample_poly`,
+    so its cost is linear with number of samples. In the end it trims data to original starttime and endtime.
+
+    :param st: Stream containing one trace to be resampled
+    :type st: obspy.Stream
+    :param sampling_rate: Target sampling rate
+    :type sampling_rate: Union[int, float]
+    :param up: Upsampling factor
+    :type up: int
+    :param down: Downsampling factor
+    :type down: int
+    :return: Resampled stream
+    :rtype: obspy.Stream
+    """
+    tr: obspy.Trace = st[0]
+    starttime: obspy.UTCDateTime = tr.stats.starttime
+    endtime: obspy.UTCDateTime = tr.stats.endtime
+
+    logger.debug(f"Polyphase resampling with up {up} and down {down}")
+    # A few zeros on the end let the slice below round the endtime the same way as it does after padded resampling
+    data = np.concatenate((tr.data.astype(np.float64), np.zeros(down)))
+    tr.data = scipy.signal.resample_poly(data, up, down)
+    tr.stats.sampling_rate = sampling_rate
+    logger.info(f"New sampling: {tr.stats.sampling_rate}")
+
+    return obspy.Stream(tr.slice(starttime=starttime, endtime=endtime))
+
+
 def preprocess_whole_day(st: obspy.Stream, preprocessing_config: DatachunkParams) -> obspy.Stream:
     logger.info("Trying to merge traces if more than 1")
     st.merge()
@@ -106,7 +207,9 @@ def preprocess_whole_day(st: obspy.Stream, preprocessing_config: DatachunkParams
         raise ValueError(f"There are {len(st)} traces in the stream!")
 
     logger.info(f"Resampling stream to {preprocessing_config.sampling_rate} Hz with padding to next power of 2")
-    st = resample_with_padding(st=st, sampling_rate=preprocessing_config.sampling_rate)
+    st = resample_with_padding(
+        st=st, sampling_rate=preprocessing_config.sampling_rate, method=preprocessing_config.resampling_method
+    )
     logger.info(
         f"Filtering with bandpass to "
         f"low: {preprocessing_config.prefiltering_low};"
@@ -378,11 +481,13 @@ def preprocess_sliced_stream_for_datachunk(
     processing_params: DatachunkParams,
     timespan: Timespan,
     verbose_output: bool = False,
+    response_cache: Optional[ResponseCache] = None,
 ) -> Tuple[obspy.Stream, Dict[str, obspy.Stream]]:
     """
     Applies standard preprocessing to a :class:`~obspy.Stream`.
     It consist of tapering, detrending, response removal, response calibration
     and filtering.
+    Inverted instrument responses are taken from :py:class:`~noiz.processing.response.ResponseCache`.
 
     :param trimmed_st: Stream to be treated
     :type trimmed_st: obspy.Stream
@@ -392,9 +497,99 @@ def preprocess_sliced_stream_for_datachunk(
     :type processing_params: DatachunkParams
     :param timespan: Timespan for which this datachunk is processed for
     :type timespan: Timespan
+    :param response_cache: Cache of inverted responses. If not provided, process-wide one is used.
+    :type response_cache: Optional[ResponseCache]
     :return: Processed Stream
     :rtype: obspy.Stream
     """
+    return _preprocess_continuous_stream(
+        trimmed_st=trimmed_st,
+        inventory=inventory,
+        processing_params=processing_params,
+        expected_samples=get_expected_sample_count(timespan=timespan, sampling_rate=processing_params.sampling_rate),
+        description=f"Timespan {timespan}",
+        verbose_output=verbose_output,
+        response_cache=response_cache,
+    )
+
+
+def preprocess_whole_day_for_datachunks(
+    st: obspy.Stream,
+    inventory: obspy.Inventory,
+    processing_params: DatachunkParams,
+    response_cache: Optional[ResponseCache] = None,
+) -> obspy.Stream:
+    """
+    Applies the same preprocessing as :py:func:`~noiz.processing.datachunk.preprocess_sliced_stream_for_datachunk`
+    to every continuous segment of the whole day, so datachunks can be cut from the preprocessed day afterwards.
+    Overlapping traces are merged first, gaps are left unfilled and segments around them are processed separately.
+    Segments that cannot be preprocessed are skipped.
+
+    In comparison with preprocessing of every datachunk separately, the output differs in the following ways:
+
+    - Tapering before filtering and response removal is applied only on the edges of continuous segments,
+      datachunks are not tapered on their edges. Samples within the taper length from edges of datachunks
+      are therefore not attenuated.
+    - Filtering, resampling and deconvolution transients occur only on the edges of segments instead of
+      edges of every datachunk.
+    - Polynomial detrending is fit to the whole segment instead of every datachunk. Differences are mostly
+      below the prefiltering band and are removed by the bandpass.
+    - Datachunks are validated after resampling, so :py:attr:`~noiz.models.DatachunkParams.max_gap_for_merging`
+      is counted in samples at the target sampling rate. Short gaps are interpolated after preprocessing.
+    - Resampling pads the whole segment to the next power of two, so peak memory is driven by the segment length.
+
+    Interior samples of datachunks agree with per datachunk processing within the tolerance checked in tests.
+
+    :param st: Stream with data of a whole day. It is modified in place.
+    :type st: obspy.Stream
+    :param inventory: Inventory to have the response removed
+    :type inventory: obspy.Inventory
+    :param processing_params: Processing parameters object with all required info.
+    :type processing_params: DatachunkParams
+    :param response_cache: Cache of inverted responses. If not provided, process-wide one is used.
+    :type response_cache: Optional[ResponseCache]
+    :return: Preprocessed stream with a trace for every continuous segment
+    :rtype: obspy.Stream
+    """
+    try:
+        st.merge(method=1)
+    except Exception as e:
+        raise ValueError(f"Cannot merge traces of the day. {e}") from e
+    st = st.split()
+
+    processed = obspy.Stream()
+    for tr in st:
+        description = f"segment {tr.id} {tr.stats.starttime} - {tr.stats.endtime}"
+        logger.debug(f"Preprocessing {description}")
+        try:
+            processed_segment, _ = _preprocess_continuous_stream(
+                trimmed_st=obspy.Stream(traces=[tr]),
+                inventory=inventory,
+                processing_params=processing_params,
+                expected_samples=None,
+                description=description,
+                response_cache=response_cache,
+            )
+        except Exception as e:
+            logger.error(f"Preprocessing of {description} failed. It will be skipped. {e}")
+            continue
+        processed += processed_segment
+    return processed
+
+
+def _preprocess_continuous_stream(
+    trimmed_st: obspy.Stream,
+    inventory: obspy.Inventory,
+    processing_params: DatachunkParams,
+    expected_samples: Optional[int],
+    description: str,
+    verbose_output: bool = False,
+    response_cache: Optional[ResponseCache] = None,
+) -> Tuple[obspy.Stream, Dict[str, obspy.Stream]]:
+    """
+    Runs all the steps of preprocessing on a stream with a single continuous trace.
+    If ``expected_samples`` is provided, samples exceeding it after resampling are removed.
+    """
     # py39 This method should return in annotation OrderedDict but there is issue. It's fixed in Python 3.9
 
     steps_dict: OrderedDict[str, obspy.Stream] = OrderedDict()
@@ -414,13 +609,15 @@ def preprocess_sliced_stream_for_datachunk(
         steps_dict["demeaned"] = trimmed_st.copy()
 
     logger.debug(f"Resampling stream to {processing_params.sampling_rate} Hz with padding to next power of 2")
-    trimmed_st = resample_with_padding(st=trimmed_st, sampling_rate=processing_params.sampling_rate)  # type: ignore
+    trimmed_st = resample_with_padding(
+        st=trimmed_st,
+        sampling_rate=processing_params.sampling_rate,  # type: ignore
+        method=processing_params.resampling_method,
+    )
     if verbose_output:
         steps_dict["resampled"] = trimmed_st.copy()
 
-    expected_samples = get_expected_sample_count(timespan=timespan, sampling_rate=processing_params.sampling_rate)
-
-    if trimmed_st[0].stats.npts > expected_samples:
+    if expected_samples is not None and trimmed_st[0].stats.npts > expected_samples:
         trimmed_st[0].data = trimmed_st[0].data[:expected_samples]
         if verbose_output:
             steps_dict["trimmed_last_sample"] = trimmed_st.copy()
@@ -461,11 +658,16 @@ def preprocess_sliced_stream_for_datachunk(
         taper_percentage = min(taper_percentage, processing_params.preprocessing_taper_max_percentage * 0.01, 0.05)
 
         try:
-            trimmed_st.remove_response(inventory, taper_fraction=taper_percentage)
+            trimmed_st = remove_response_with_cache(
+                st=trimmed_st,
+                inventory=inventory,
+                taper_fraction=taper_percentage,
+                cache=response_cache,
+            )
         except ValueError as e:
             raise ResponseRemovalError(
                 f"There was a problem with response removal from slice {trimmed_st} that was "
-                f"prepared for Timespan {timespan}. Original exception: {e}"
+                f"prepared for {description}. Original exception: {e}"
             ) from e
         if verbose_output:
             steps_dict["removed_response"] = trimmed_st.copy()
@@ -477,7 +679,7 @@ def preprocess_sliced_stream_for_datachunk(
         except ValueError as e:
             raise ResponseRemovalError(
                 f"There was a problem with response removal from slice {trimmed_st} that was "
-                f"prepared for Timespan {timespan}. Original exception: {e}"
+                f"prepared for {description}. Original exception: {e}"
             ) from e
         if verbose_output:
             steps_dict["response_calibrated"] = trimmed_st.copy()
@@ -531,6 +733,50 @@ def _response_constant_calibration(
     return stream
 
 
+def slice_stream_for_timespans(
+    st: obspy.Stream, timespans: Collection[Timespan]
+) -> Generator[Tuple[Timespan, obspy.Stream], None, None]:
+    """
+    Slices provided stream for every of the timespans without copying the samples.
+    Every yielded stream contains new :class:`obspy.Trace` objects with their own stats, but data of the traces are
+    views into the arrays of the provided stream. Before any in-place modification of the sliced data,
+    :py:func:`~noiz.processing.datachunk.own_trace_data` has to be called on the slice.
+
+    :param st: Stream to be sliced, usually containing a whole day of data
+    :type st: obspy.Stream
+    :param timespans: Timespans for which stream should be sliced
+    :type timespans: Collection[Timespan]
+    :return: Pairs of timespan and a stream sliced for it
+    :rtype: Generator[Tuple[Timespan, obspy.Stream], None, None]
+    """
+    for timespan in timespans:
+        yield (
+            timespan,
+            st.slice(
+                starttime=timespan.starttime_obspy,
+                endtime=timespan.remove_last_microsecond(),
+                nearest_sample=False,
+            ),
+        )
+
+
+def own_trace_data(st: obspy.Stream) -> obspy.Stream:
+    """
+    Makes sure that each of the traces in the stream owns its data array.
+    Data of traces that are views into some other array are copied, so only samples of the trace itself are copied.
+    Traces that already own their data, e.g. results of merging or padding, are left untouched.
+
+    :param st: Stream to be checked
+    :type st: obspy.Stream
+    :return: The same stream with data owned by its traces
+    :rtype: obspy.Stream
+    """
+    for tr in st:
+        if not tr.data.flags.owndata:
+            tr.data = tr.data.copy()
+    return st
+
+
 def validate_slice(
     trimmed_st: obspy.Stream,
     timespan: Timespan,
@@ -591,6 +837,7 @@ def validate_slice(
             f"It will be padded with {deficit} zeros to match exact length."
         )
         try:
+            trimmed_st = own_trace_data(trimmed_st)
             trimmed_st = perform_padding_according_to_config(
                 trimmed_st, timespan, expected_no_samples, processing_params
             )
@@ -652,7 +899,7 @@ def validate_sample_count_in_stream(st: obspy.Stream, params: DatachunkParams, t
     min_no_samples = get_min_sample_count(timespan=timespan, params=params, sampling_rate=sampling_rate)
     max_no_samples = get_max_sample_count(timespan=timespan, params=params, sampling_rate=sampling_rate)
 
-    if min_no_samples > samples_in_stream > max_no_samples:
+    if not min_no_samples <= samples_in_stream <= max_no_samples:
         message = (
             f"The number of samples in signal exceed limits. "
             f"Expected more than {min_no_samples}, and less than {max_no_samples} found in stream {samples_in_stream}. "
@@ -706,6 +953,374 @@ def validate_sample_rate(original_samplerate, trimmed_st):
         raise ValueError(message)
 
 
+def prepare_datachunk_streams(
+    st: obspy.Stream,
+    timespans: Collection[Timespan],
+    inventory: obspy.Inventory,
+    processing_params: DatachunkParams,
+    original_samplerate: float,
+    source_description: str = "",
+) -> Generator[Tuple[Timespan, obspy.Stream, int], None, None]:
+    """
+    Slices, validates and preprocesses data of a whole day for every of the timespans.
+    Depending on :py:attr:`~noiz.models.DatachunkParams.preprocessing_mode`, either every slice is preprocessed
+    separately or the whole day is preprocessed once with
+    :py:func:`~noiz.processing.datachunk.preprocess_whole_day_for_datachunks` and slices are cut from it.
+    Slices that do not pass validation or preprocessing are skipped.
+
+    :param st: Stream with data of the whole day
+    :type st: obspy.Stream
+    :param timespans: Timespans for which datachunks should be prepared
+    :type timespans: Collection[Timespan]
+    :param inventory: Inventory to have the response removed
+    :type inventory: obspy.Inventory
+    :param processing_params: Processing parameters object with all required info.
+    :type processing_params: DatachunkParams
+    :param original_samplerate: Sampling rate of the raw data
+    :type original_samplerate: float
+    :param source_description: Description of the source of data used in log messages
+    :type source_description: str
+    :return: Timespan, preprocessed stream and count of padded samples for every valid slice
+    :rtype: Generator[Tuple[Timespan, obspy.Stream, int], None, None]
+    """
+    whole_day = processing_params.preprocessing_mode is DatachunkPreprocessingMode.WHOLE_DAY
+
+    if whole_day:
+        logger.info("Preprocessing whole day before slicing")
+        try:
+            st = preprocess_whole_day_for_datachunks(st=st, inventory=inventory, processing_params=processing_params)
+        except ValueError as e:
+            logger.error(f"Preprocessing of the whole day failed. Occured for {source_description}: {e}")
+            return
+        original_samplerate = float(processing_params.sampling_rate)
+
+    for timespan, trimmed_st in slice_stream_for_timespans(st=st, timespans=timespans):
+        logger.info(f"Sliced timespan {timespan}")
+
+        try:
+            trimmed_st, padded_npts, _ = validate_slice(
+                trimmed_st=trimmed_st,
+                timespan=timespan,
+                processing_params=processing_params,
+                original_samplerate=original_samplerate,
+                verbose_output=False,
+            )
+        except ValueError as e:
+            logger.warning(f"There was a problem with trace validation. There was raised exception {e}")
+            continue
+
+        if whole_day:
+            yield timespan, trimmed_st, padded_npts
+            continue
+
+        logger.debug("Preprocessing timespan")
+        try:
+            trimmed_st, _ = preprocess_sliced_stream_for_datachunk(
+                trimmed_st=own_trace_data(trimmed_st),
+                inventory=inventory,
+                processing_params=processing_params,
+                timespan=timespan,
+                verbose_output=False,
+            )
+        except ResponseRemovalError as e:
+            logger.error(
+                f"There was an error raised during response removal. This slice will be skipped. "
+                f"Occured for timespan.id: {timespan.id}, {source_description}."
+                f": {e}"
+            )
+            continue
+        except Exception as e:
+            logger.error(f"{e}")
+            continue
+
+        yield timespan, trimmed_st, padded_npts
+
+
+def plan_datachunk_preparation(
+    components: Collection[Component],
+    days: Collection[datetime.date],
+    timespans: Iterable[Timespan],
+    time_series: Iterable[Tsindex],
+    existing_datachunks: Iterable[Tuple[int, int]] = (),
+) -> Generator[Tuple[Component, datetime.date, Tsindex, List[Timespan]], None, None]:
+    """
+    Plans datachunk preparation for a whole date range in memory.
+    All inputs are expected to be fetched upfront with a few range queries, this method only matches them together.
+    Timespans are assigned to days by their midtime and raw files by their starttime, both in UTC.
+    Yields component, day, raw file and timespans that do not have a datachunk yet,
+    for every component-day that has a raw file and at least one missing datachunk.
+    Order of yielded elements follows order of provided components and days.
+
+    :param components: Components to be planned
+    :type components: Collection[Component]
+    :param days: Days to be planned
+    :type days: Collection[datetime.date]
+    :param timespans: All timespans within planned days
+    :type timespans: Iterable[Timespan]
+    :param time_series: All raw file entries within planned days
+    :type time_series: Iterable[Tsindex]
+    :param existing_datachunks: Pairs of component id and timespan id of already existing datachunks
+    :type existing_datachunks: Iterable[Tuple[int, int]]
+    :return: Component, day, raw file and missing timespans
+    :rtype: Generator[Tuple[Component, datetime.date, Tsindex, List[Timespan]], None, None]
+    :raises: ValueError
+    """
+    timespans_per_day: Dict[datetime.date, List[Timespan]] = defaultdict(list)
+    for timespan in timespans:
+        timespans_per_day[get_utc_date(timespan.midtime)].append(timespan)
+
+    time_series_per_day: Dict[Tuple[str, str, str, datetime.date], List[Tsindex]] = defaultdict(list)
+    for ts in time_series:
+        day_key = (ts.network, ts.station, ts.component, get_utc_date(ts.starttime))
+        time_series_per_day[day_key].append(ts)  # type: ignore[index]
+
+    existing: Set[Tuple[int, int]] = set(existing_datachunks)
+
+    for component in components:
+        for day in days:
+            day_timespans = timespans_per_day.get(day, [])
+            if len(day_timespans) == 0:
+                continue
+
+            files = time_series_per_day.get((component.network, component.station, component.component, day), [])
+            if len(files) > 1:
+                raise ValueError(
+                    f"There are more then one files for that day in timeseries!"
+                    f" {component._make_station_string()} {day}"
+                )
+            elif len(files) == 0:
+                logger.warning(f"No data for {component} on day {day}. Skipping.")
+                continue
+
+            missing_timespans = [timespan for timespan in day_timespans if (component.id, timespan.id) not in existing]
+            if len(missing_timespans) == 0:
+                logger.debug(f"All datachunks of {component} on day {day} already exist. Skipping")
+                continue
+
+            yield component, day, files[0], missing_timespans
+
+
+@dataclass
+class DataAvailabilityReport:
+    """
+    Number of (component, timespan) combinations planned for datachunk preparation and number of those
+    that were rejected by :py:func:`~noiz.processing.datachunk.precheck_data_availability` without reading any data.
+    Number of datachunks that existed before the run is kept, so prepared ones can be counted afterwards.
+    """
+
+    planned: int = 0
+    predicted_rejected: int = 0
+    existing: int = 0
+
+    def add(self, planned: int, predicted_rejected: int) -> None:
+        self.planned += planned
+        self.predicted_rejected += predicted_rejected
+
+    def summary(self, prepared: int) -> str:
+        """
+        Compares the prediction with the number of datachunks that were actually prepared.
+
+        :param prepared: Number of datachunks prepared out of the planned combinations
+        :type prepared: int
+        :return: Message to be logged
+        :rtype: str
+        """
+        submitted = self.planned - self.predicted_rejected
+        rejected_after_reading = submitted - prepared
+        return (
+            f"Out of {self.planned} planned datachunks, {self.predicted_rejected} "
+            f"({self.predicted_rejected / max(self.planned, 1):.1%}) were predicted to be rejected from tsindex "
+            f"metadata and skipped. Out of remaining {submitted}, {rejected_after_reading} "
+            f"({rejected_after_reading / max(submitted, 1):.1%}) were rejected after reading the data. "
+            f"Total rejection rate was {(self.planned - prepared) / max(self.planned, 1):.1%}."
+        )
+
+
+def _indexed_segments(time_series: Tsindex) -> Optional[List[Tuple[float, float, float]]]:
+    """
+    Returns start, time of last sample and sampling rate of every continuous segment of data described by
+    ``timespans`` and ``timerates`` columns of the tsindex entry, sorted by start.
+    Returns None if the entry was indexed without this metadata.
+    """
+    if not time_series.timespans:
+        return None
+
+    rates = time_series.timerates
+    if rates is None:
+        rates = [time_series.samplerate] * len(time_series.timespans)
+    elif len(rates) != len(time_series.timespans):
+        return None
+
+    return sorted(
+        (float(timespan.lower), float(timespan.upper), float(rate))
+        for timespan, rate in zip(time_series.timespans, rates)
+        if timespan.lower is not None and timespan.upper is not None
+    )
+
+
+def predict_datachunk_availability(time_series: Tsindex, timespan: Timespan, params: DatachunkParams) -> bool:
+    """
+    Predicts from tsindex metadata only, if the slice of data for the timespan can possibly pass
+    :py:func:`~noiz.processing.datachunk.validate_slice`.
+    The prediction is conservative, number of available samples is overestimated and gaps are underestimated,
+    so only slices that would certainly be rejected are predicted as unavailable.
+    Slices are predicted to be rejected if there are no samples within the timespan, if any of the gaps between
+    segments is longer than :py:attr:`~noiz.models.DatachunkParams.max_gap_for_merging` or if there are less samples
+    than required by :py:attr:`~noiz.models.DatachunkParams.datachunk_sample_tolerance`.
+    If the entry does not contain segments metadata or its segments have different sampling rates,
+    slice is predicted to be available and the decision is left to the validation.
+
+    :param time_series: Tsindex entry with raw data of the timespan
+    :type time_series: Tsindex
+    :param timespan: Timespan to be checked
+    :type timespan: Timespan
+    :param params: DatachunkParams with which datachunk would be prepared
+    :type params: DatachunkParams
+    :return: False if datachunk for the timespan cannot be prepared
+    :rtype: bool
+    """
+    segments = _indexed_segments(time_series)
+    if segments is None:
+        return True
+
+    original_samplerate = float(time_series.samplerate)
+    if any(rate != original_samplerate for _, _, rate in segments):
+        return True
+
+    # In whole day mode, slices are validated after resampling
+    if params.preprocessing_mode is DatachunkPreprocessingMode.WHOLE_DAY:
+        sampling_rate = float(params.sampling_rate)
+    else:
+        sampling_rate = original_samplerate
+
+    starttime = timespan.starttime_obspy.timestamp
+    endtime = timespan.endtime_obspy.timestamp
+
+    available_samples = 0
+    previous_end: Optional[float] = None
+    for segment_start, segment_end, _ in segments:
+        if segment_end < starttime or segment_start >= endtime:
+            continue
+        if previous_end is not None and segment_start > previous_end:
+            missing_samples = int(np.floor((segment_start - previous_end) * sampling_rate)) - 1
+            if missing_samples > params.max_gap_for_merging:
+                return False
+        covered_seconds = min(segment_end, endtime) - max(segment_start, starttime)
+        available_samples += int(np.floor(covered_seconds * sampling_rate)) + 1
+        previous_end = segment_end if previous_end is None else max(previous_end, segment_end)
+
+    if available_samples == 0:
+        return False
+
+    return available_samples >= get_min_sample_count(params=params, timespan=timespan, sampling_rate=sampling_rate)
+
+
+def precheck_data_availability(
+    time_series: Tsindex,
+    timespans: Iterable[Timespan],
+    params: DatachunkParams,
+) -> Tuple[List[Timespan], List[Timespan]]:
+    """
+    Splits timespans into those for which datachunks can possibly be prepared from the raw file and those
+    which would be rejected for sure, as predicted by
+    :py:func:`~noiz.processing.datachunk.predict_datachunk_availability`.
+    Raw file is not accessed.
+
+    :param time_series: Tsindex entry with raw data of the timespans
+    :type time_series: Tsindex
+    :param timespans: Timespans to be checked
+    :type timespans: Iterable[Timespan]
+    :param params: DatachunkParams with which datachunks would be prepared
+    :type params: DatachunkParams
+    :return: Timespans that can be prepared and timespans predicted to be rejected
+    :rtype: Tuple[List[Timespan], List[Timespan]]
+    """
+    available: List[Timespan] = []
+    rejected: List[Timespan] = []
+    for timespan in timespans:
+        if predict_datachunk_availability(time_series=time_series, timespan=timespan, params=params):
+            available.append(timespan)
+        else:
+            rejected.append(timespan)
+    return available, rejected
+
+
+def group_datachunk_preparation_inputs_by_file(
+    inputs: Iterable[RunDatachunkPreparationInputs],
+) -> List[RunDatachunkPreparationFileGroupInputs]:
+    """
+    Groups preparation inputs of all components which raw data are stored in the same file,
+    so the file can be read and decoded once for all of them.
+    Groups are ordered by first appearance of their file, members keep their order.
+
+    :param inputs: Preparation inputs to be grouped
+    :type inputs: Iterable[RunDatachunkPreparationInputs]
+    :return: Groups of inputs sharing a raw file
+    :rtype: List[RunDatachunkPreparationFileGroupInputs]
+    """
+    groups: Dict[str, List[RunDatachunkPreparationInputs]] = OrderedDict()
+    for single_input in inputs:
+        groups.setdefault(single_input["time_series"].filename, []).append(single_input)
+    return [RunDatachunkPreparationFileGroupInputs(members=members) for members in groups.values()]
+
+
+def create_datachunks_for_file_group_wrapper(inputs: RunDatachunkPreparationFileGroupInputs) -> Tuple[Datachunk, ...]:
+    return tuple(create_datachunks_for_file_group(members=inputs["members"]))
+
+
+def create_datachunks_for_file_group(members: Collection[RunDatachunkPreparationInputs]) -> List[Datachunk]:
+    """
+    Creates datachunks of all components which raw data are stored in a single, possibly multiplexed, file.
+    Bytes spanning sections of all members are read and decoded once,
+    afterwards data of every component is selected from the decoded stream.
+    It saves the files to the drive but it doesn't add entries to DB.
+
+    :param members: Preparation inputs that share a raw file
+    :type members: Collection[RunDatachunkPreparationInputs]
+    :return: Datachunks ready to be sent to DB.
+    :rtype: List[Datachunk]
+    :raises: ValueError
+    """
+    if len(members) == 0:
+        return []
+
+    all_time_series = [member["time_series"] for member in members]
+    filename = all_time_series[0].filename
+    if any(ts.filename != filename for ts in all_time_series):
+        raise ValueError("All members of a file group have to point to the same file.")
+
+    byteoffset = min(ts.byteoffset for ts in all_time_series)
+    if any(ts.bytes is None for ts in all_time_series):
+        nbytes = None
+    else:
+        nbytes = max(ts.byteoffset + ts.bytes for ts in all_time_series) - byteoffset
+
+    logger.info(f"Reading {filename} shared by {len(members)} components")
+    loaded = _read_raw_data_for_datachunks(
+        read=lambda: read_miniseed_byte_range(
+            filename=Path(filename), byteoffset=byteoffset, nbytes=nbytes, format=all_time_series[0].format
+        ),
+        description=filename,
+        datachunk_count=sum(len(member["timespans"]) for member in members),
+    )
+    if loaded is None:
+        return []
+
+    finished_datachunks = []
+    for member in members:
+        finished_datachunks.extend(
+            _create_datachunks_from_stream(
+                component=member["component"],
+                timespans=member["timespans"],
+                time_series=member["time_series"],
+                processing_params=member["processing_params"],
+                st=loaded.select(id=member["time_series"]._make_seed_id()),
+                compute_stats=member["compute_stats"],
+            )
+        )
+    return finished_datachunks
+
+
 def create_datachunks_for_component_wrapper(inputs: RunDatachunkPreparationInputs) -> Tuple[Datachunk, ...]:
     return tuple(
         create_datachunks_for_component(
@@ -713,12 +1328,17 @@ def create_datachunks_for_component_wrapper(inputs: RunDatachunkPreparationInput
             timespans=inputs["timespans"],
             time_series=inputs["time_series"],
             processing_params=inputs["processing_params"],
+            compute_stats=inputs["compute_stats"],
         )
     )
 
 
 def create_datachunks_for_component(
-    component: Component, timespans: Collection[Timespan], time_series: Tsindex, processing_params: DatachunkParams
+    component: Component,
+    timespans: Collection[Timespan],
+    time_series: Tsindex,
+    processing_params: DatachunkParams,
+    compute_stats: bool = False,
 ) -> Collection[Datachunk]:
     """
     All around method that is takes prepared Component, Tsindex,
@@ -739,91 +1359,126 @@ def create_datachunks_for_component(
     :type time_series: Tsindex
     :param processing_params:
     :type processing_params: DatachunkParams
+    :param compute_stats: If DatachunkStats should be calculated and attached to the datachunks
+    :type compute_stats: bool
     :return: Datachunks ready to be sent to DB.
     :rtype: Collection[Datachunk]
     """
 
     logger.info("Reading timeseries and inventory")
+    # Whole day mode preprocesses continuous segments, so they cannot be cut to the requested timespans upfront.
+    if processing_params.preprocessing_mode is DatachunkPreprocessingMode.PER_DATACHUNK and len(timespans) > 0:
+        read_starttime: Optional[obspy.UTCDateTime] = min(ts.starttime_obspy for ts in timespans)
+        read_endtime: Optional[obspy.UTCDateTime] = max(ts.endtime_obspy for ts in timespans)
+    else:
+        read_starttime, read_endtime = None, None
+
+    loaded = _read_raw_data_for_datachunks(
+        read=lambda: time_series.load_data_with_stats(starttime=read_starttime, endtime=read_endtime),
+        description=f"tsindex.id {time_series.id}",
+        datachunk_count=len(timespans),
+    )
+    if loaded is None:
+        return []
+
+    return _create_datachunks_from_stream(
+        component=component,
+        timespans=timespans,
+        time_series=time_series,
+        processing_params=processing_params,
+        st=loaded,
+        compute_stats=compute_stats,
+    )
+
+
+def _read_raw_data_for_datachunks(
+    read: Callable[[], Tuple[obspy.Stream, MiniseedReadStats]],
+    description: str,
+    datachunk_count: int,
+) -> Optional[obspy.Stream]:
+    """
+    Calls provided reader of raw data and logs its statistics.
+    Returns None if reading failed, so the caller can skip the data.
+    """
     import warnings
 
     warnings.filterwarnings("error", message="(?s).* Data integrity check for Steim1 failed")
     try:
-        st: obspy.Stream = time_series.read_file()
+        st, read_stats = read()
     except MissingDataFileException as e:
         logger.error(f"Data file is missing. Skipping. {e}")
-        return []
+        return None
     except CorruptedMiniseedFileException as e:
         logger.error(f"Data integrity check for Steim1 failed. Skipping file. {e}")
-        return []
+        return None
     except Exception as e:
         logger.error(f"There was some general exception from obspy.Stream.read function. Here it is: {e} ")
-        return []
+        return None
     warnings.resetwarnings()
+    logger.debug(
+        f"Read {read_stats.bytes_read} bytes of {description} and decoded them in "
+        f"{read_stats.decode_time:.4f}s. That is {read_stats.bytes_read / max(datachunk_count, 1):.0f} bytes and "
+        f"{read_stats.decode_time / max(datachunk_count, 1):.5f}s per datachunk."
+    )
+    return st
 
-    inventory: obspy.Inventory = component.read_inventory()
+
+def _create_datachunks_from_stream(
+    component: Component,
+    timespans: Collection[Timespan],
+    time_series: Tsindex,
+    processing_params: DatachunkParams,
+    st: obspy.Stream,
+    compute_stats: bool = False,
+) -> List[Datachunk]:
+    """
+    Slices already loaded raw data of a component into datachunks and writes them to the drive.
+    If ``compute_stats`` is set, stats are calculated from samples that are already in memory
+    and attached to the datachunks.
+    With :py:attr:`~noiz.models.processing_params.DatachunkStorage.COMPONENT_DAY_CONTAINER` storage, datachunks are
+    kept in memory and written together into a container per component-day after all of them are prepared.
+    With :py:attr:`~noiz.models.processing_params.DatachunkSampleDtype.FLOAT32`, samples are stored as float32.
+    """
+    inventory: obspy.Inventory = load_inventory_cached(component)
+    use_container = processing_params.datachunk_storage is DatachunkStorage.COMPONENT_DAY_CONTAINER
 
     finished_datachunks = []
+    encoded_chunks = []
 
     logger.info(f"Splitting full day into timespans for {component}")
-    for timespan in timespans:
-        logger.info(f"Slicing timespan {timespan}")
-        trimmed_st: obspy.Stream = st.copy().slice(
-            starttime=timespan.starttime_obspy,
-            endtime=timespan.remove_last_microsecond(),
-            nearest_sample=False,
-        )
-
-        try:
-            trimmed_st, padded_npts, _ = validate_slice(
-                trimmed_st=trimmed_st,
-                timespan=timespan,
-                processing_params=processing_params,
-                original_samplerate=float(time_series.samplerate),
-                verbose_output=False,
-            )
-        except ValueError as e:
-            logger.warning(f"There was a problem with trace validation. There was raised exception {e}")
-            continue
-
-        logger.debug("Preprocessing timespan")
-        try:
-            trimmed_st, _ = preprocess_sliced_stream_for_datachunk(
-                trimmed_st=trimmed_st,
-                inventory=inventory,
-                processing_params=processing_params,
-                timespan=timespan,
-                verbose_output=False,
-            )
-        except ResponseRemovalError as e:
-            logger.error(
-                f"There was an error raised during response removal. This slice will be skipped. "
-                f"Occured for timespan.id: {timespan.id}, component: {component} "
-                f"and tsindex.id {time_series.id}."
-                f": {e}"
+    for timespan, trimmed_st, padded_npts in prepare_datachunk_streams(
+        st=st,
+        timespans=timespans,
+        inventory=inventory,
+        processing_params=processing_params,
+        original_samplerate=float(time_series.samplerate),
+        source_description=f"component: {component} and tsindex.id {time_series.id}",
+    ):
+        if processing_params.datachunk_sample_dtype is DatachunkSampleDtype.FLOAT32:
+            trimmed_st[0].data = trimmed_st[0].data.astype(np.float32)
+
+        datachunk_file: Optional[DatachunkFile] = None
+        if use_container:
+            encoded_chunks.append((component, timespan, serialize_stream(trimmed_st)))
+        else:
+            filepath = assembly_filepath(
+                PROCESSED_DATA_DIR,  # type: ignore
+                "datachunk",
+                assembly_sds_like_dir(component, timespan).joinpath(
+                    assembly_preprocessing_filename(component=component, timespan=timespan, count=0)
+                ),
             )
-            continue
-        except Exception as e:
-            logger.error(f"{e}")
-            continue
 
-        filepath = assembly_filepath(
-            PROCESSED_DATA_DIR,  # type: ignore
-            "datachunk",
-            assembly_sds_like_dir(component, timespan).joinpath(
-                assembly_preprocessing_filename(component=component, timespan=timespan, count=0)
-            ),
-        )
-
-        if filepath.exists():
-            logger.debug(f"Filepath {filepath} exists. Trying to find next free one.")
-            filepath = increment_filename_counter(filepath=filepath, extension=False)
-            logger.debug(f"Free filepath found. Datachunk will be saved to {filepath}")
+            if filepath.exists():
+                logger.debug(f"Filepath {filepath} exists. Trying to find next free one.")
+                filepath = increment_filename_counter(filepath=filepath, extension=False)
+                logger.debug(f"Free filepath found. Datachunk will be saved to {filepath}")
 
-        logger.info(f"Chunk will be written to {str(filepath)}")
-        parent_directory_exists_or_create(filepath)
+            logger.info(f"Chunk will be written to {str(filepath)}")
+            parent_directory_exists_or_create(filepath)
 
-        datachunk_file = DatachunkFile(filepath=str(filepath))
-        trimmed_st.write(datachunk_file.filepath, format="mseed")
+            datachunk_file = DatachunkFile(filepath=str(filepath))
+            trimmed_st.write(datachunk_file.filepath, format="mseed")
 
         sampling_rate: Union[str, float] = trimmed_st[0].stats.sampling_rate
         npts: int = trimmed_st[0].stats.npts
@@ -838,12 +1493,75 @@ def create_datachunks_for_component(
             padded_npts=padded_npts,
             device_id=component.device_id,
         )
+        if compute_stats:
+            datachunk.stats = calculate_signal_stats(data=trimmed_st[0].data)
 
         finished_datachunks.append(datachunk)
 
+    if use_container and len(encoded_chunks) > 0:
+        locations = write_chunks_to_component_day_containers(
+            chunks=encoded_chunks, params_id=processing_params.id, processing_type="datachunk"
+        )
+        files: Dict[str, DatachunkFile] = {}
+        for datachunk, (container_filepath, offset, length) in zip(finished_datachunks, locations):
+            datachunk.file = files.setdefault(container_filepath, DatachunkFile(filepath=container_filepath))
+            datachunk.container_offset = offset
+            datachunk.container_length = length
+
+    logger.info(f"Prepared {len(finished_datachunks)} out of {len(timespans)} datachunks for {component}")
     return finished_datachunks
 
 
+def write_chunks_to_component_day_containers(
+    chunks: Sequence[Tuple[Component, Timespan, bytes]],
+    params_id: int,
+    processing_type: str,
+) -> List[Tuple[str, int, int]]:
+    """
+    Writes encoded chunks into containers, one per component and day of midtime of their timespans,
+    see :py:mod:`noiz.processing.chunk_container`.
+
+    :param chunks: Component, timespan and encoded data of every chunk
+    :type chunks: Sequence[Tuple[Component, Timespan, bytes]]
+    :param params_id: Id of params used to prepare the chunks, it is a part of the filename
+    :type params_id: int
+    :param processing_type: Name of the processing step, used as a directory within processed data dir
+    :type processing_type: str
+    :return: Filepath of the container, offset and length of each of the chunks, in the same order as input
+    :rtype: List[Tuple[str, int, int]]
+    """
+    members: Dict[Tuple[int, datetime.date], List[int]] = OrderedDict()
+    for i, (component, timespan, _) in enumerate(chunks):
+        members.setdefault((component.id, get_utc_date(timespan.midtime)), []).append(i)
+
+    locations: List[Tuple[str, int, int]] = [("", 0, 0)] * len(chunks)
+    for indices in members.values():
+        component, timespan, _ = chunks[indices[0]]
+        filepath = assembly_filepath(
+            PROCESSED_DATA_DIR,  # type: ignore
+            processing_type,
+            assembly_sds_like_dir(component, timespan).joinpath(
+                assembly_container_filename(component=component, timespan=timespan, params_id=params_id, count=0)
+            ),
+        )
+
+        parent_directory_exists_or_create(filepath)
+
+        # Container is created exclusively, so a task writing the same component-day concurrently
+        # cannot take over the filepath between finding a free one and writing to it.
+        while True:
+            try:
+                table = write_chunk_container(filepath=filepath, chunks=[chunks[i][2] for i in indices])
+                break
+            except FileExistsError:
+                logger.debug(f"Filepath {filepath} exists. Trying to find next free one.")
+                filepath = increment_filename_counter(filepath=filepath, extension=True)
+        logger.info(f"Container with {len(indices)} chunks was written to {str(filepath)}")
+        for i, (offset, length) in zip(indices, table):
+            locations[i] = (str(filepath), offset, length)
+    return locations
+
+
 def calculate_datachunk_stats_wrapper(inputs: CalculateDatachunkStatsInputs) -> Tuple[DatachunkStats, ...]:
     return (
         calculate_datachunk_stats(
@@ -870,11 +1588,27 @@ def calculate_datachunk_stats(
     :rtype: DatachunkStats
     """
     st = datachunk.load_data(datachunk_file=datachunk_file)
+    ret = calculate_signal_stats(data=st[0].data)
+    ret.datachunk_id = datachunk.id
+    return ret
+
+
+def calculate_signal_stats(data: np.ndarray) -> DatachunkStats:
+    """
+    Calculates statistics of provided samples of a datachunk.
+    It calculates energy as a sum of squared values of the signal normalized by sample count.
+    It also calculates set of statistics with use of :func:`scipy.stats.describe`.
+    Returned object is not associated with any datachunk.
+
+    :param data: Samples of the datachunk
+    :type data: np.ndarray
+    :return: Signal statistics
+    :rtype: DatachunkStats
+    """
     # noinspection PyUnresolvedReferences
-    descibed_stats: scipy.stats.stats.DescribeResult = scipy.stats.describe(st[0].data)
-    energy = np.sum(np.power(st[0].data, 2)) / descibed_stats.nobs
+    descibed_stats: scipy.stats.stats.DescribeResult = scipy.stats.describe(data)
+    energy = np.sum(np.power(data, 2)) / descibed_stats.nobs
     ret = DatachunkStats(
-        datachunk_id=datachunk.id,
         energy=energy,
         min=descibed_stats.minmax[0],
         max=descibed_stats.minmax[1],
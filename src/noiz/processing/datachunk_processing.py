@@ -2,15 +2,30 @@
 # Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
 # Copyright © 2019-2023 Contributors to the Noiz project.
 
-from typing import Tuple, Optional
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Collection, Dict, Hashable, Iterable, List, Tuple, Optional
 
 from loguru import logger
 import obspy
+from obspy.signal.filter import bandpass
 import numpy as np
 
-from noiz.models.type_aliases import ProcessDatachunksInputs
-from noiz.models.datachunk import Datachunk, ProcessedDatachunk, ProcessedDatachunkFile, DatachunkFile
-from noiz.models.processing_params import ProcessedDatachunkParams, DatachunkParams
+from noiz.models.type_aliases import ProcessDatachunksBatchInputs, ProcessDatachunksInputs
+from noiz.models.datachunk import (
+    Datachunk,
+    ProcessedDatachunk,
+    ProcessedDatachunkFile,
+    ProcessedDatachunkSpectrumFile,
+    DatachunkFile,
+)
+from noiz.models.processing_params import (
+    ProcessedDatachunkParams,
+    DatachunkParams,
+    DatachunkSampleDtype,
+    DatachunkStorage,
+    WhiteningMethod,
+)
 from noiz.models.timespan import Timespan
 from noiz.models.component import Component
 from noiz.processing.path_helpers import (
@@ -20,8 +35,15 @@ from noiz.processing.path_helpers import (
     assembly_sds_like_dir,
     increment_filename_counter,
 )
+from noiz.processing.chunk_container import serialize_stream
+from noiz.processing.crosscorrelations import compute_lag_padded_spectra
+from noiz.processing.datachunk import write_chunks_to_component_day_containers
+from noiz.processing.time_utils import get_utc_date
+from noiz.processing.whitening import get_whitening_kernels, whiten_data, whiten_trace_cached
 from noiz.globals import PROCESSED_DATA_DIR
 
+DATACHUNK_PROCESSING_BATCH_KEYS = ("timespan", "component_day")
+
 
 def whiten_trace(
     tr: obspy.Trace,
@@ -188,14 +210,7 @@ def process_datachunk(
     :rtype: noiz.models.datachunk.ProcessedDatachunk
     """
 
-    if not isinstance(datachunk.timespan, Timespan):
-        msg = "The Timespan is not loaded with the Datachunk. Correct that."
-        logger.error("The Timespan is not loaded with the Datachunk. Correct that.")
-        raise ValueError(msg)
-    if not isinstance(datachunk.component, Component):
-        msg = "The Component is not loaded with the Datachunk. Correct that."
-        logger.error(msg)
-        raise ValueError(msg)
+    _validate_datachunk_relations_loaded(datachunk)
 
     logger.info(f"Starting processing of {datachunk}")
 
@@ -207,22 +222,14 @@ def process_datachunk(
         logger.error(msg)
         raise ValueError(msg)
 
-    if params.spectral_whitening:
+    st[0].data = st[0].data.astype(np.float64, copy=False)
+
+    if params.spectral_whitening and params.whitening_method is WhiteningMethod.CACHED_RFFT:
+        logger.debug("Performing spectral whitening with cached kernels")
+        st[0] = whiten_trace_cached(st[0], params)
+    elif params.spectral_whitening:
         logger.debug("Performing spectral whitening")
-        st[0] = whiten_trace(
-            st[0],
-            st[0].stats.sampling_rate,
-            params.waterlevel_ratio_to_max,
-            params.filtering_low,
-            params.filtering_high,
-            params.convolution_sliding_window_min_samples,
-            params.convolution_sliding_window_max_ratio_to_fmin,
-            params.convolution_sliding_window_ratio_to_bandwidth,
-            params.quefrency_filter_lowpass_pct,
-            params.quefrency_filter_taper_min_samples,
-            params.quefrency_filter_taper_length_ratio_to_length_cepstrum,
-            params.quefrency,
-        )
+        st[0] = _whiten_trace_with_params(st[0], params)
         logger.debug("Performing bandpass filter")
     st[0].filter(
         type="bandpass",
@@ -235,6 +242,311 @@ def process_datachunk(
         logger.debug("Performing one bit normalization")
         st[0] = one_bit_normalization(st[0])
 
+    return _write_processed_datachunks(streams=[(st, datachunk)], params=params)[0]
+
+
+def process_datachunks_batch_wrapper(
+    inputs: ProcessDatachunksBatchInputs,
+) -> Tuple[ProcessedDatachunk, ...]:
+    """
+    Thin wrapper around :py:meth:`noiz.processing.datachunk_processing.process_datachunks_batch` that converts
+    a single TypedDict of input to standard keyword arguments and its output to tuple.
+
+    :param inputs: TypedDict with all required inputs
+    :type inputs: noiz.api.type_aliases.ProcessDatachunksBatchInputs
+    :return: Tuple with processing results
+    :rtype: Tuple[noiz.models.datachunk.ProcessedDatachunk, ...]
+    """
+    return tuple(process_datachunks_batch(datachunks=inputs["datachunks"], params=inputs["params"]))
+
+
+def process_datachunks_batch(
+    datachunks: Collection[Datachunk],
+    params: ProcessedDatachunkParams,
+) -> List[ProcessedDatachunk]:
+    """
+    Processes many datachunks at once, for example all datachunks of a timespan or of a component-day.
+    Data of datachunks with the same number of samples and sampling rate are stacked into a single 2D array and
+    whitening, bandpass filtering and one bit normalization are applied along its last axis in a single
+    vectorized pass. Results are the same as if every datachunk was processed with
+    :py:func:`~noiz.processing.datachunk_processing.process_datachunk`.
+
+    Vectorized whitening is done only with :py:attr:`~noiz.models.processing_params.WhiteningMethod.CACHED_RFFT`,
+    with :py:attr:`~noiz.models.processing_params.WhiteningMethod.FULL_FFT` every row is whitened separately.
+    Datachunks that cannot be loaded are skipped.
+
+    If :py:attr:`~noiz.models.processing_params.ProcessedDatachunkParams.spectrum_max_lag` is set, lag padded real
+    spectra of processed data are written too, one container per timespan.
+
+    :param datachunks: Datachunks to be processed
+    :type datachunks: Collection[~noiz.models.datachunk.Datachunk]
+    :param params: Processing parameters
+    :type params: ~noiz.models.processing_params.ProcessedDatachunkParams
+    :return: Processed datachunks ready to be sent to DB
+    :rtype: List[noiz.models.datachunk.ProcessedDatachunk]
+    """
+    loaded: Dict[Tuple[int, float], List[Tuple[Datachunk, obspy.Stream]]] = defaultdict(list)
+    for datachunk in datachunks:
+        _validate_datachunk_relations_loaded(datachunk)
+        try:
+            st = datachunk.load_data()
+        except Exception as e:
+            logger.error(f"Loading data of {datachunk} failed. It will be skipped. {e}")
+            continue
+        if len(st) != 1:
+            logger.error(f"There are more than one trace in stream in {datachunk}. It will be skipped.")
+            continue
+        loaded[(st[0].stats.npts, st[0].stats.sampling_rate)].append((datachunk, st))
+
+    processed_datachunks = []
+    for (npts, sampling_rate), group in loaded.items():
+        logger.info(f"Processing {len(group)} datachunks of {npts} samples at once")
+        data = np.vstack([st[0].data.astype(np.float64) for _, st in group])
+        data = process_data_2d(data=data, params=params, sampling_rate=sampling_rate)
+
+        for (_, st), row in zip(group, data):
+            st[0].data = row
+        group_processed = _write_processed_datachunks(
+            streams=[(st, datachunk) for datachunk, st in group],
+            params=params,
+        )
+
+        if params.spectrum_max_lag is not None:
+            _write_spectra_to_timespan_containers(
+                datachunks=[datachunk for datachunk, _ in group],
+                processed_datachunks=group_processed,
+                data=data,
+                params=params,
+                sampling_rate=sampling_rate,
+            )
+        processed_datachunks.extend(group_processed)
+
+    return processed_datachunks
+
+
+def assembly_spectra_container_filename(params: ProcessedDatachunkParams, timespan: Timespan, count: int = 0) -> str:
+    """
+    Assembles a filename of a container holding spectra of all processed datachunks of a single timespan.
+
+    :param params: Params used to process datachunks
+    :type params: ProcessedDatachunkParams
+    :param timespan: Timespan object containing information about time
+    :type timespan: Timespan
+    :param count: counter for increasing if filename exists, defaults to 0
+    :type count: int
+    :return: Filename of the container
+    :rtype: str
+    """
+    year = str(timespan.starttime.year)
+    doy_time = timespan.starttime.strftime("%j.%H%M")
+    return ".".join(["spectra_container", f"params{params.id}", year, doy_time, str(count), "npy"])
+
+
+def assembly_spectra_container_dir(timespan: Timespan) -> Path:
+    """
+    Assembles a Path object of directory containing spectra containers. Object consists of year/month/containers.
+
+    :param timespan: Timespan object containing information about time
+    :type timespan: Timespan
+    :return: Path object containing directory hierarchy
+    :rtype: Path
+    """
+    return Path(str(timespan.starttime.year)).joinpath(str(timespan.starttime.month)).joinpath("containers")
+
+
+def _write_spectra_to_timespan_containers(
+    datachunks: List[Datachunk],
+    processed_datachunks: List[ProcessedDatachunk],
+    data: np.ndarray,
+    params: ProcessedDatachunkParams,
+    sampling_rate: float,
+) -> None:
+    """
+    Computes lag padded real spectra of processed data and writes spectra of each timespan into a single
+    2D complex64 `.npy` container.
+    Every ProcessedDatachunk gets :py:attr:`~noiz.models.datachunk.ProcessedDatachunk.spectrum_file` pointing to
+    the container and :py:attr:`~noiz.models.datachunk.ProcessedDatachunk.spectrum_offset` with its row.
+    """
+    npts = data.shape[-1]
+    max_lag_samples = int(round(params.spectrum_max_lag * sampling_rate))  # type: ignore
+    nfft, spectra = compute_lag_padded_spectra(data=data, npts=npts, max_lag_samples=max_lag_samples)
+
+    rows_of_timespan: Dict[int, List[int]] = OrderedDict()
+    for i, datachunk in enumerate(datachunks):
+        rows_of_timespan.setdefault(datachunk.timespan_id, []).append(i)
+
+    for rows in rows_of_timespan.values():
+        timespan = datachunks[rows[0]].timespan
+        filepath = assembly_filepath(
+            PROCESSED_DATA_DIR,  # type: ignore
+            "processed_datachunk_spectra",
+            assembly_spectra_container_dir(timespan=timespan).joinpath(
+                assembly_spectra_container_filename(params=params, timespan=timespan, count=0)
+            ),
+        )
+
+        if filepath.exists():
+            logger.debug(f"Filepath {filepath} exists. Trying to find next free one.")
+            filepath = increment_filename_counter(filepath=filepath, extension=True)
+            logger.debug(f"Free filepath found. Spectra container will be saved to {filepath}")
+
+        logger.info(f"Spectra container with {len(rows)} spectra will be written to {str(filepath)}")
+        parent_directory_exists_or_create(filepath)
+
+        spectrum_file = ProcessedDatachunkSpectrumFile(filepath=str(filepath), npts=npts, nfft=nfft)
+        np.save(file=spectrum_file.filepath, arr=spectra[rows])
+
+        for offset, row in enumerate(rows):
+            processed_datachunks[row].spectrum_file = spectrum_file
+            processed_datachunks[row].spectrum_offset = offset
+
+
+def group_datachunk_processing_inputs(
+    inputs: Iterable[ProcessDatachunksInputs],
+    batch_by: str,
+) -> List[ProcessDatachunksBatchInputs]:
+    """
+    Groups inputs of datachunk processing into batches for
+    :py:func:`~noiz.processing.datachunk_processing.process_datachunks_batch`.
+    With ``batch_by="timespan"`` all datachunks of a timespan are processed together, with
+    ``batch_by="component_day"`` all datachunks of a component which timespans have midtime within the same day.
+    Batches are ordered by first appearance of their key, members keep their order.
+
+    :param inputs: Inputs to be grouped
+    :type inputs: Iterable[ProcessDatachunksInputs]
+    :param batch_by: One of :py:data:`~noiz.processing.datachunk_processing.DATACHUNK_PROCESSING_BATCH_KEYS`
+    :type batch_by: str
+    :return: Batches of datachunks
+    :rtype: List[ProcessDatachunksBatchInputs]
+    :raises: ValueError
+    """
+    if batch_by not in DATACHUNK_PROCESSING_BATCH_KEYS:
+        raise ValueError(f"Unknown batch key {batch_by}. Supported are {DATACHUNK_PROCESSING_BATCH_KEYS}")
+
+    groups: Dict[Hashable, List[Datachunk]] = OrderedDict()
+    params: Dict[Hashable, ProcessedDatachunkParams] = {}
+    for single_input in inputs:
+        datachunk = single_input["datachunk"]
+        if batch_by == "timespan":
+            key: Hashable = (single_input["params"].id, datachunk.timespan_id)
+        else:
+            key = (single_input["params"].id, datachunk.component_id, get_utc_date(datachunk.timespan.midtime))
+        groups.setdefault(key, []).append(datachunk)
+        params[key] = single_input["params"]
+    return [ProcessDatachunksBatchInputs(datachunks=members, params=params[key]) for key, members in groups.items()]
+
+
+def process_data_2d(data: np.ndarray, params: ProcessedDatachunkParams, sampling_rate: float) -> np.ndarray:
+    """
+    Applies spectral whitening, bandpass filtering and one bit normalization, as selected in params,
+    along the last axis of provided array. Every row is treated as a separate trace.
+
+    :param data: Array of shape (number of traces, number of samples)
+    :type data: np.ndarray
+    :param params: Processing parameters
+    :type params: ~noiz.models.processing_params.ProcessedDatachunkParams
+    :param sampling_rate: Sampling rate of all the traces
+    :type sampling_rate: float
+    :return: Processed array of the same shape
+    :rtype: np.ndarray
+    """
+    if params.spectral_whitening and params.whitening_method is WhiteningMethod.CACHED_RFFT:
+        kernels = get_whitening_kernels(params=params, npts=data.shape[-1], sampling_rate=sampling_rate)
+        data = whiten_data(data=data, kernels=kernels, waterlevel_ratio_to_max=params.waterlevel_ratio_to_max)
+    elif params.spectral_whitening:
+        data = np.vstack(
+            [
+                _whiten_trace_with_params(obspy.Trace(data=row, header={"sampling_rate": sampling_rate}), params).data
+                for row in data
+            ]
+        )
+
+    data = bandpass(
+        data,
+        freqmin=params.filtering_low,
+        freqmax=params.filtering_high,
+        df=sampling_rate,
+        corners=params.filtering_order,
+    )
+
+    if params.one_bit:
+        data = np.sign(data)
+
+    return data
+
+
+def _whiten_trace_with_params(tr: obspy.Trace, params: ProcessedDatachunkParams) -> obspy.Trace:
+    return whiten_trace(
+        tr,
+        tr.stats.sampling_rate,
+        params.waterlevel_ratio_to_max,
+        params.filtering_low,
+        params.filtering_high,
+        params.convolution_sliding_window_min_samples,
+        params.convolution_sliding_window_max_ratio_to_fmin,
+        params.convolution_sliding_window_ratio_to_bandwidth,
+        params.quefrency_filter_lowpass_pct,
+        params.quefrency_filter_taper_min_samples,
+        params.quefrency_filter_taper_length_ratio_to_length_cepstrum,
+        params.quefrency,
+    )
+
+
+def _validate_datachunk_relations_loaded(datachunk: Datachunk) -> None:
+    if not isinstance(datachunk.timespan, Timespan):
+        msg = "The Timespan is not loaded with the Datachunk. Correct that."
+        logger.error("The Timespan is not loaded with the Datachunk. Correct that.")
+        raise ValueError(msg)
+    if not isinstance(datachunk.component, Component):
+        msg = "The Component is not loaded with the Datachunk. Correct that."
+        logger.error(msg)
+        raise ValueError(msg)
+
+
+def _write_processed_datachunks(
+    streams: List[Tuple[obspy.Stream, Datachunk]],
+    params: ProcessedDatachunkParams,
+) -> List[ProcessedDatachunk]:
+    """
+    Writes processed streams of datachunks according to
+    :py:attr:`~noiz.models.processing_params.ProcessedDatachunkParams.processed_datachunk_storage`
+    and creates ProcessedDatachunks pointing to them.
+    Samples are cast to float32 first if it is the selected
+    :py:attr:`~noiz.models.processing_params.ProcessedDatachunkParams.processed_datachunk_sample_dtype`.
+    """
+    if params.processed_datachunk_sample_dtype is DatachunkSampleDtype.FLOAT32:
+        for st, _ in streams:
+            st[0].data = st[0].data.astype(np.float32)
+
+    if params.processed_datachunk_storage is not DatachunkStorage.COMPONENT_DAY_CONTAINER:
+        return [_write_processed_datachunk(st=st, datachunk=datachunk, params=params) for st, datachunk in streams]
+
+    locations = write_chunks_to_component_day_containers(
+        chunks=[(datachunk.component, datachunk.timespan, serialize_stream(st)) for st, datachunk in streams],
+        params_id=params.id,
+        processing_type="processed_datachunk",
+    )
+    files: Dict[str, ProcessedDatachunkFile] = {}
+    return [
+        ProcessedDatachunk(
+            processed_datachunk_params_id=params.id,
+            datachunk_id=datachunk.id,
+            file=files.setdefault(filepath, ProcessedDatachunkFile(filepath=filepath)),
+            container_offset=offset,
+            container_length=length,
+        )
+        for (_, datachunk), (filepath, offset, length) in zip(streams, locations)
+    ]
+
+
+def _write_processed_datachunk(
+    st: obspy.Stream,
+    datachunk: Datachunk,
+    params: ProcessedDatachunkParams,
+) -> ProcessedDatachunk:
+    """
+    Writes processed stream of a datachunk to a free file path and creates ProcessedDatachunk pointing to it.
+    """
     filepath = assembly_filepath(
         PROCESSED_DATA_DIR,  # type: ignore
         "processed_datachunk",
@@ -286,11 +598,11 @@ def _taper_function(
     :rtype: np.ndarray
     """
 
-    for i_im in range(w):
-        val_wid = np.sin((i_im) / (w - 1) * np.pi / 2) ** 2
-        indice = idx + (-w + i_im + 1) * factor
-        taper_f[indice] = val_wid
-        taper_f[-indice] = val_wid
+    i_im = np.arange(w)
+    val_wid = np.sin(i_im / (w - 1) * np.pi / 2) ** 2
+    indice = idx + (-w + i_im + 1) * factor
+    # Interleaved, so in case of repeated indices the last written value wins, same as if it was written in a loop
+    taper_f[np.stack((indice, -indice), axis=1).ravel()] = np.repeat(val_wid, 2)
 
     return taper_f
 
@@ -1,11 +1,36 @@
+from dataclasses import dataclass
+import io
 from pathlib import Path
+import struct
+import time
 
 from loguru import logger
+import numpy as np
 import obspy
+from typing import Dict, Optional, Tuple, Union
 
 from noiz.exceptions import MissingDataFileException, CorruptedMiniseedFileException
 from noiz.processing.warning_handling import CatchWarningAsError
 
+_FIXED_HEADER = struct.Struct(">6sss5s2s3s2sHHBBBBHHhhBBBBiHH")
+_BLOCKETTE_HEADER = struct.Struct(">HH")
+_BLOCKETTE_1000 = struct.Struct(">HHBBBB")
+_FLOAT_ENCODINGS: Dict[int, np.dtype] = {4: np.dtype(">f4"), 5: np.dtype(">f8")}
+
+
+@dataclass
+class MiniseedReadStats:
+    """
+    Amount of bytes read from the drive and time spent on decoding them into a stream.
+    """
+
+    bytes_read: int = 0
+    decode_time: float = 0.0
+
+    def add(self, other: "MiniseedReadStats") -> None:
+        self.bytes_read += other.bytes_read
+        self.decode_time += other.decode_time
+
 
 def _read_single_miniseed(
     filename: Path,
@@ -24,3 +49,279 @@ def _read_single_miniseed(
             raise CorruptedMiniseedFileException(
                 f"File {filename} is corrupted. Steim1 integrity check failed."
             ) from e
+
+
+def read_miniseed_byte_range(
+    filename: Path,
+    byteoffset: int,
+    nbytes: Optional[int],
+    format: Optional[str] = None,
+    seed_id: Optional[str] = None,
+    starttime: Optional[obspy.UTCDateTime] = None,
+    endtime: Optional[obspy.UTCDateTime] = None,
+    timeindex: Optional[Dict[str, str]] = None,
+) -> Tuple[obspy.Stream, MiniseedReadStats]:
+    """
+    Reads and decodes only a section of a MiniSEED file, as described by a row of mseedindex's tsindex table.
+    If a ``timeindex`` is provided together with ``starttime`` or ``endtime``, the section is narrowed down
+    to records that can contain samples between these times.
+    Records of channels other than ``seed_id``, if any, are dropped after decoding.
+    The returned stream is not trimmed, it contains whole records.
+
+    :param filename: File to be read
+    :type filename: Path
+    :param byteoffset: Offset of first record of the section
+    :type byteoffset: int
+    :param nbytes: Length of the section. If None, section lasts until the end of the file.
+    :type nbytes: Optional[int]
+    :param format: Format passed to obspy.read
+    :type format: Optional[str]
+    :param seed_id: Id of the channel to be kept
+    :type seed_id: Optional[str]
+    :param starttime: Time of first sample that is needed
+    :type starttime: Optional[obspy.UTCDateTime]
+    :param endtime: Time of last sample that is needed
+    :type endtime: Optional[obspy.UTCDateTime]
+    :param timeindex: Mapping of epoch time to offset of a record starting at that time
+    :type timeindex: Optional[Dict[str, str]]
+    :return: Decoded stream and statistics of the read
+    :rtype: Tuple[obspy.Stream, MiniseedReadStats]
+    :raises: MissingDataFileException, CorruptedMiniseedFileException
+    """
+    filename = Path(filename)
+    if not filename.exists():
+        raise MissingDataFileException("Data file is missing")
+
+    section_end = byteoffset + nbytes if nbytes is not None else filename.stat().st_size
+    start, end = _narrow_byte_range_with_timeindex(
+        timeindex=timeindex, start=byteoffset, end=section_end, starttime=starttime, endtime=endtime
+    )
+
+    with open(filename, "rb") as f:
+        f.seek(start)
+        buffer = f.read(end - start)
+
+    decode_start = time.perf_counter()
+    with CatchWarningAsError(
+        warning_filter_action="error", warning_filter_message="(?s).* Data integrity check for Steim1 failed"
+    ):
+        try:
+            st = obspy.read(io.BytesIO(buffer), format)
+        except Warning as e:
+            logger.warning("Data integrity check for Steim1 failed")
+            raise CorruptedMiniseedFileException(
+                f"File {filename} is corrupted. Steim1 integrity check failed."
+            ) from e
+    if seed_id is not None:
+        st = st.select(id=seed_id)
+    stats = MiniseedReadStats(bytes_read=len(buffer), decode_time=time.perf_counter() - decode_start)
+
+    return st, stats
+
+
+def _narrow_byte_range_with_timeindex(
+    timeindex: Optional[Dict[str, str]],
+    start: int,
+    end: int,
+    starttime: Optional[obspy.UTCDateTime],
+    endtime: Optional[obspy.UTCDateTime],
+) -> Tuple[int, int]:
+    """
+    Narrows ``[start, end)`` byte range of a section to records between the latest indexed record starting not later
+    than ``starttime`` and the first indexed record starting after ``endtime``.
+    Keys of the timeindex that are not epoch times, such as ``latest``, are ignored.
+    """
+    if timeindex is None or (starttime is None and endtime is None):
+        return start, end
+
+    index = []
+    for key, value in timeindex.items():
+        try:
+            index.append((float(key), int(value)))
+        except ValueError:
+            continue
+    index.sort()
+
+    narrowed_start, narrowed_end = start, end
+    for record_time, offset in index:
+        if not start <= offset < end:
+            continue
+        if starttime is not None and record_time <= starttime.timestamp:
+            narrowed_start = max(narrowed_start, offset)
+        if endtime is not None and record_time > endtime.timestamp:
+            narrowed_end = min(narrowed_end, offset)
+            break
+
+    if narrowed_start >= narrowed_end:
+        return start, end
+    return narrowed_start, narrowed_end
+
+
+def read_noiz_miniseed(source: Union[Path, str, bytes]) -> obspy.Stream:
+    """
+    Reads MiniSEED in the layout noiz writes datachunks and processed datachunks in, that is a single channel of
+    contiguous big endian FLOAT32 or FLOAT64 records of equal length.
+    Headers of all records are parsed at once and samples are mapped from the records straight into a numpy array,
+    without format autodetection and per-record decoding of :py:func:`obspy.read`.
+    Anything that does not follow this layout, such as compressed encodings, gaps or several channels,
+    is passed to :py:func:`obspy.read`.
+    Contrary to :py:func:`obspy.read`, returned traces do not have ``stats.mseed``.
+
+    :param source: Path to a file or its content
+    :type source: Union[Path, str, bytes]
+    :return: Decoded stream
+    :rtype: obspy.Stream
+    :raises: MissingDataFileException
+    """
+    if isinstance(source, bytes):
+        content = source
+    else:
+        if not Path(source).exists():
+            raise MissingDataFileException(f"Data file {source} is missing")
+        content = Path(source).read_bytes()
+
+    tr = _map_float_miniseed_records(content)
+    if tr is None:
+        logger.debug("Data do not follow layout of noiz MiniSEED files. Decoding with obspy.read.")
+        return obspy.read(io.BytesIO(content), "MSEED")
+    return obspy.Stream([tr])
+
+
+def _map_float_miniseed_records(content: bytes) -> Optional[obspy.Trace]:
+    """
+    Decodes content of a noiz MiniSEED file into a single trace.
+    Returns None if the content does not follow the layout expected by
+    :py:func:`~noiz.processing.miniseed_helpers.read_noiz_miniseed`.
+    """
+    if len(content) < 64:
+        return None
+
+    (
+        _,
+        quality,
+        _,
+        station,
+        location,
+        channel,
+        network,
+        year,
+        _,
+        _,
+        _,
+        _,
+        _,
+        _,
+        _,
+        samprate_factor,
+        samprate_multiplier,
+        _,
+        _,
+        _,
+        blockette_count,
+        time_correction,
+        data_offset,
+        blockette_offset,
+    ) = _FIXED_HEADER.unpack_from(content, 0)
+    if quality not in b"DRQM" or not 1900 <= year <= 2100 or time_correction != 0:
+        return None
+    blockette_offsets = _find_blockettes(content, blockette_offset, blockette_count)
+    if blockette_offsets is None or 1000 not in blockette_offsets:
+        return None
+
+    b1000_offset = blockette_offsets[1000]
+    _, _, encoding, word_order, record_length_exponent, _ = _BLOCKETTE_1000.unpack_from(content, b1000_offset)
+    if word_order != 1 or encoding not in _FLOAT_ENCODINGS:
+        return None
+    record_length = 2**record_length_exponent
+    if record_length < 128 or len(content) % record_length != 0 or max(blockette_offsets.values()) + 8 > data_offset:
+        return None
+    microseconds_offset = blockette_offsets[1001] + 5 if 1001 in blockette_offsets else None
+
+    records = np.frombuffer(content, dtype=np.uint8).reshape(-1, record_length)
+    # Identifiers, sampling rate, blockette layout and blockette 1000 have to be the same in all records
+    for start, stop in ((8, 20), (32, 36), (39, 48), (b1000_offset, b1000_offset + _BLOCKETTE_1000.size)):
+        if np.any(records[:, start:stop] != records[0, start:stop]):
+            return None
+
+    sampling_rate = _sampling_rate_from_factors(samprate_factor, samprate_multiplier)
+    if sampling_rate <= 0:
+        return None
+
+    sample_counts = _big_endian_uint16(records, 30).astype(np.int64)
+    record_starts = _record_starttimes_ns(records, microseconds_offset)
+    sample_interval_ns = 1e9 / sampling_rate
+    expected_starts = record_starts[:-1] + np.round(sample_counts[:-1] * sample_interval_ns).astype(np.int64)
+    if np.any(np.abs(record_starts[1:] - expected_starts) > sample_interval_ns / 2):
+        return None
+
+    dtype = _FLOAT_ENCODINGS[encoding]
+    max_samples = int(sample_counts.max())
+    if data_offset + max_samples * dtype.itemsize > record_length:
+        return None
+
+    samples = np.ascontiguousarray(records[:, data_offset : data_offset + max_samples * dtype.itemsize]).view(dtype)
+    if np.all(sample_counts == max_samples):
+        data = samples.ravel()
+    else:
+        data = samples[np.arange(max_samples) < sample_counts[:, None]]
+
+    header = {
+        "network": network.decode().strip(),
+        "station": station.decode().strip(),
+        "location": location.decode().strip(),
+        "channel": channel.decode().strip(),
+        "sampling_rate": sampling_rate,
+        "starttime": obspy.UTCDateTime(ns=int(record_starts[0])),
+    }
+    return obspy.Trace(data=data.astype(dtype.newbyteorder("=")), header=header)
+
+
+def _find_blockettes(content: bytes, first_offset: int, count: int) -> Optional[Dict[int, int]]:
+    """
+    Follows the chain of blockettes of the first record. Returns offsets of blockettes 1000 and 1001 or None
+    if there are any other blockettes.
+    """
+    offsets: Dict[int, int] = {}
+    offset = first_offset
+    for _ in range(count):
+        if offset < _FIXED_HEADER.size or offset + _BLOCKETTE_1000.size > len(content):
+            return None
+        blockette_type, next_offset = _BLOCKETTE_HEADER.unpack_from(content, offset)
+        if blockette_type not in (1000, 1001) or blockette_type in offsets:
+            return None
+        offsets[blockette_type] = offset
+        offset = next_offset
+    if offset != 0:
+        return None
+    return offsets
+
+
+def _big_endian_uint16(records: np.ndarray, offset: int) -> np.ndarray:
+    return records[:, offset].astype(np.uint16) << 8 | records[:, offset + 1]
+
+
+def _record_starttimes_ns(records: np.ndarray, microseconds_offset: Optional[int]) -> np.ndarray:
+    """
+    Returns start times, in nanoseconds since epoch, from BTIME fields of the fixed header of every record
+    and, if present, microseconds of blockette 1001.
+    """
+    years = _big_endian_uint16(records, 20).astype(np.int64)
+    days_of_year = _big_endian_uint16(records, 22).astype(np.int64)
+    days = (years - 1970).astype("datetime64[Y]").astype("datetime64[D]").astype(np.int64) + days_of_year - 1
+    seconds = records[:, 24].astype(np.int64) * 3600 + records[:, 25].astype(np.int64) * 60 + records[:, 26]
+    microseconds = _big_endian_uint16(records, 28).astype(np.int64) * 100
+    if microseconds_offset is not None:
+        microseconds += records[:, microseconds_offset].view(np.int8)
+    return (days * 86400 + seconds) * 1_000_000_000 + microseconds * 1000
+
+
+def _sampling_rate_from_factors(factor: int, multiplier: int) -> float:
+    if factor == 0 or multiplier == 0:
+        return 0.0
+    if factor > 0 and multiplier > 0:
+        return float(factor * multiplier)
+    if factor > 0 and multiplier < 0:
+        return -float(factor) / multiplier
+    if factor < 0 and multiplier > 0:
+        return -float(multiplier) / factor
+    return 1.0 / (factor * multiplier)
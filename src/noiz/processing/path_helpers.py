@@ -20,6 +20,30 @@ def assembly_preprocessing_filename(component: Component, timespan: Timespan, co
     return fname
 
 
+def assembly_container_filename(component: Component, timespan: Timespan, params_id: int, count: int = 0) -> str:
+    """
+    Assembles a filename of a container holding all chunks of a component-day prepared with given params.
+    Day is the day of the midtime of provided timespan.
+
+    :param component: Component object containing information about used channel
+    :type component: Component
+    :param timespan: Any of the timespans of the day
+    :type timespan: Timespan
+    :param params_id: Id of params used to prepare the chunks
+    :type params_id: int
+    :param count: counter for increasing if filename exists, defaults to 0
+    :type count: int
+    :return: Filename of the container
+    :rtype: str
+    """
+    year = str(timespan.midtime.year)
+    doy = timespan.midtime.strftime("%j")
+
+    return ".".join(
+        [component.network, component.station, component.component, year, doy, f"params{params_id}", str(count), "ncc"]
+    )
+
+
 def assembly_sds_like_dir(component: Component, timespan: Timespan) -> Path:
     """
     Asembles a Path object in a SDS manner. Object consists of year/network/station/component codes.
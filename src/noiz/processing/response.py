@@ -0,0 +1,426 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+"""
+Cached instrument response removal.
+
+Evaluating the full instrument response is the most expensive part of :meth:`obspy.Trace.remove_response`,
+even though for all datachunks of a component it is the same as long as the response epoch, number of samples
+and sampling rate are the same. Here, the inverted frequency response, with water level and pre-filter already
+applied, is kept in memory of the worker and on the local disk, so deconvolution is reduced to a single
+spectral multiply.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import obspy
+from loguru import logger
+from obspy.core.inventory import PolynomialResponseStage, Response
+from obspy.signal.invsim import cosine_sac_taper, cosine_taper, invert_spectrum
+from obspy.signal.util import _npts2nfft
+from typing import Dict, Optional, Tuple, Union
+
+from noiz.exceptions import MissingDataFileException
+from noiz.globals import RESPONSE_CACHE_DIR
+from noiz.models.component import Component
+
+PreFilter = Optional[Tuple[float, float, float, float]]
+
+
+class ResponseCache:
+    """
+    Cache of inverted frequency responses.
+    Entries are kept in a bounded in-memory LRU and, if a directory is provided, as ``.npy`` files in it,
+    so they survive between runs and can be shared by all workers on the same machine.
+
+    Entries are keyed by a digest of SEED id of the channel, its response epoch, fingerprint of the response,
+    number of samples, sampling rate and all the parameters of deconvolution.
+    """
+
+    def __init__(self, directory: Optional[Union[str, Path]] = None, max_items: int = 64):
+        self.directory = Path(directory) if directory else None
+        self.max_items = max_items
+        self._responses: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get_inverted_response(
+        self,
+        response: Response,
+        seed_id: str,
+        epoch: Tuple[Optional[obspy.UTCDateTime], Optional[obspy.UTCDateTime]],
+        npts: int,
+        sampling_rate: float,
+        output: str = "VEL",
+        water_level: Optional[float] = 60,
+        pre_filt: PreFilter = None,
+        response_fingerprint: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Returns inverted frequency response of length of a real FFT of :py:func:`obspy.signal.util._npts2nfft`
+        samples. Water level and pre-filter are already applied. If the response is not cached, it is evaluated
+        and stored.
+
+        :param response: Response to be evaluated
+        :type response: Response
+        :param seed_id: SEED id of the channel
+        :type seed_id: str
+        :param epoch: Start and end date of the channel epoch the response belongs to
+        :type epoch: Tuple[Optional[obspy.UTCDateTime], Optional[obspy.UTCDateTime]]
+        :param npts: Number of samples of deconvolved data
+        :type npts: int
+        :param sampling_rate: Sampling rate of deconvolved data
+        :type sampling_rate: float
+        :param output: Output units, same as in :meth:`obspy.Trace.remove_response`
+        :type output: str
+        :param water_level: Water level in dB, same as in :meth:`obspy.Trace.remove_response`
+        :type water_level: Optional[float]
+        :param pre_filt: Frequency domain pre-filter, same as in :meth:`obspy.Trace.remove_response`
+        :type pre_filt: Optional[Tuple[float, float, float, float]]
+        :param response_fingerprint: Precomputed :py:func:`~noiz.processing.response.fingerprint_response` of
+            the response. It is computed if not provided.
+        :type response_fingerprint: Optional[str]
+        :return: Inverted frequency response
+        :rtype: np.ndarray
+        """
+        if response_fingerprint is None:
+            response_fingerprint = fingerprint_response(response)
+        key = _response_cache_key(
+            response_fingerprint=response_fingerprint,
+            seed_id=seed_id,
+            epoch=epoch,
+            npts=npts,
+            sampling_rate=sampling_rate,
+            output=output,
+            water_level=water_level,
+            pre_filt=pre_filt,
+        )
+
+        with self._lock:
+            if key in self._responses:
+                self._responses.move_to_end(key)
+                self.hits += 1
+                return self._responses[key]
+
+        inverted_response = self._read_from_disk(key)
+        if inverted_response is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            inverted_response = evaluate_inverted_response(
+                response=response,
+                npts=npts,
+                sampling_rate=sampling_rate,
+                output=output,
+                water_level=water_level,
+                pre_filt=pre_filt,
+            )
+            self._write_to_disk(key, inverted_response)
+
+        with self._lock:
+            self._responses[key] = inverted_response
+            while len(self._responses) > self.max_items:
+                self._responses.popitem(last=False)
+        return inverted_response
+
+    def _read_from_disk(self, key: str) -> Optional[np.ndarray]:
+        if self.directory is None:
+            return None
+        filepath = self.directory.joinpath(f"{key}.npy")
+        if not filepath.exists():
+            return None
+        try:
+            return np.load(filepath)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cached response {filepath} could not be read. It will be evaluated again. {e}")
+            return None
+
+    def _write_to_disk(self, key: str, inverted_response: np.ndarray) -> None:
+        if self.directory is None:
+            return
+        filepath = self.directory.joinpath(f"{key}.npy")
+        temporary_filepath = self.directory.joinpath(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp.npy")
+        try:
+            np.save(temporary_filepath, inverted_response)
+            os.replace(temporary_filepath, filepath)
+        except OSError as e:
+            logger.warning(f"Response could not be cached on disk in {filepath}. {e}")
+
+
+_RESPONSE_CACHE: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Returns a :py:class:`~noiz.processing.response.ResponseCache` shared by all tasks executed in the current
+    process. It persists its entries in a directory set with ``RESPONSE_CACHE_DIR`` environment variable.
+    If the variable is set to an empty string, responses are cached only in memory.
+
+    :return: Process-wide response cache
+    :rtype: ResponseCache
+    """
+    global _RESPONSE_CACHE
+    if _RESPONSE_CACHE is None:
+        _RESPONSE_CACHE = ResponseCache(directory=RESPONSE_CACHE_DIR)
+    return _RESPONSE_CACHE
+
+
+@dataclass
+class _CachedInventory:
+    mtime_ns: int
+    inventory: obspy.Inventory
+    response_fingerprints: Dict[Tuple[str, str, str], str] = field(default_factory=dict)
+
+
+_MAX_CACHED_INVENTORIES = 32
+_INVENTORIES: OrderedDict[str, _CachedInventory] = OrderedDict()
+_INVENTORIES_LOCK = threading.Lock()
+
+
+def load_inventory_cached(component: Component) -> obspy.Inventory:
+    """
+    Loads inventory of the component, parsing every StationXML file only once per process.
+    The file is parsed again if it was modified and the outdated inventory is dropped.
+    At most ``_MAX_CACHED_INVENTORIES`` least recently used inventories are kept.
+    Returned inventory is shared between tasks so it must not be modified.
+
+    :param component: Component to load inventory of
+    :type component: Component
+    :return: Inventory of the component
+    :rtype: obspy.Inventory
+    """
+    filepath = Path(component.component_file.filepath)
+    try:
+        mtime_ns = filepath.stat().st_mtime_ns
+    except OSError as e:
+        raise MissingDataFileException(f"Inventory file for component {component} is missing") from e
+
+    key = str(filepath)
+    with _INVENTORIES_LOCK:
+        cached = _INVENTORIES.get(key)
+        if cached is not None and cached.mtime_ns == mtime_ns:
+            _INVENTORIES.move_to_end(key)
+            return cached.inventory
+
+    inventory = component.load_data()
+
+    with _INVENTORIES_LOCK:
+        _INVENTORIES[key] = _CachedInventory(mtime_ns=mtime_ns, inventory=inventory)
+        _INVENTORIES.move_to_end(key)
+        while len(_INVENTORIES) > _MAX_CACHED_INVENTORIES:
+            _INVENTORIES.popitem(last=False)
+    return inventory
+
+
+def _find_response_fingerprints(inventory: obspy.Inventory) -> Dict[Tuple[str, str, str], str]:
+    """
+    Returns fingerprints of responses memoized next to the inventory, if it was loaded with
+    :py:func:`~noiz.processing.response.load_inventory_cached`, or a new empty dict otherwise.
+    """
+    with _INVENTORIES_LOCK:
+        for cached in _INVENTORIES.values():
+            if cached.inventory is inventory:
+                return cached.response_fingerprints
+    return {}
+
+
+def fingerprint_response(response: Response) -> str:
+    """
+    Computes digest of the whole response, so responses corrected in the inventory without change of the epoch
+    are not served from a stale cache.
+
+    :param response: Response to compute fingerprint of
+    :type response: Response
+    :return: Hex digest of the response
+    :rtype: str
+    """
+    return hashlib.sha1(pickle.dumps(response, protocol=4)).hexdigest()
+
+
+def evaluate_inverted_response(
+    response: Response,
+    npts: int,
+    sampling_rate: float,
+    output: str = "VEL",
+    water_level: Optional[float] = 60,
+    pre_filt: PreFilter = None,
+) -> np.ndarray:
+    """
+    Evaluates frequency response and inverts it the same way as :meth:`obspy.Trace.remove_response` does.
+    Pre-filter is multiplied into the inverted response.
+
+    :param response: Response to be evaluated
+    :type response: Response
+    :param npts: Number of samples of deconvolved data
+    :type npts: int
+    :param sampling_rate: Sampling rate of deconvolved data
+    :type sampling_rate: float
+    :param output: Output units
+    :type output: str
+    :param water_level: Water level in dB
+    :type water_level: Optional[float]
+    :param pre_filt: Frequency domain pre-filter
+    :type pre_filt: Optional[Tuple[float, float, float, float]]
+    :return: Inverted frequency response
+    :rtype: np.ndarray
+    """
+    nfft = _npts2nfft(npts)
+    freq_response, freqs = response.get_evalresp_response(1.0 / sampling_rate, nfft, output=output)
+
+    if water_level is None:
+        freq_response[0] = 0.0
+        freq_response[1:] = 1.0 / freq_response[1:]
+    else:
+        invert_spectrum(freq_response, water_level)
+
+    if pre_filt:
+        freq_response *= cosine_sac_taper(freqs, flimit=pre_filt)
+
+    return freq_response
+
+
+def remove_response_with_cache(
+    st: obspy.Stream,
+    inventory: obspy.Inventory,
+    taper_fraction: float = 0.05,
+    output: str = "VEL",
+    water_level: Optional[float] = 60,
+    pre_filt: PreFilter = None,
+    cache: Optional[ResponseCache] = None,
+) -> obspy.Stream:
+    """
+    Removes instrument response from all traces of the stream, equivalently to :meth:`obspy.Stream.remove_response`
+    with ``zero_mean=True`` and ``taper=True``, but the inverted frequency response is taken from the cache.
+    Responses that are defined as polynomials are removed with obspy directly.
+
+    :param st: Stream to remove response from. It is modified in place.
+    :type st: obspy.Stream
+    :param inventory: Inventory containing the response
+    :type inventory: obspy.Inventory
+    :param taper_fraction: Fraction of the time domain taper
+    :type taper_fraction: float
+    :param output: Output units
+    :type output: str
+    :param water_level: Water level in dB
+    :type water_level: Optional[float]
+    :param pre_filt: Frequency domain pre-filter
+    :type pre_filt: Optional[Tuple[float, float, float, float]]
+    :param cache: Cache to be used. If not provided, process-wide one is used.
+    :type cache: Optional[ResponseCache]
+    :return: Stream with response removed
+    :rtype: obspy.Stream
+    :raises ValueError: If response of any of the traces cannot be found in the inventory
+    """
+    if cache is None:
+        cache = get_response_cache()
+    response_fingerprints = _find_response_fingerprints(inventory)
+
+    for tr in st:
+        channel = _find_channel_of_trace(inventory=inventory, tr=tr)
+        response = channel.response
+
+        if _is_polynomial_response(response):
+            tr.remove_response(
+                inventory=inventory,
+                output=output,
+                water_level=water_level,
+                pre_filt=pre_filt,
+                taper_fraction=taper_fraction,
+            )
+            continue
+
+        data = tr.data.astype(np.float64)
+        npts = len(data)
+        data -= data.mean()
+        data *= cosine_taper(npts, taper_fraction, sactaper=True, halfcosine=False)
+
+        epoch = (channel.start_date, channel.end_date)
+        fingerprint_key = (tr.id, str(epoch[0]), str(epoch[1]))
+        if fingerprint_key not in response_fingerprints:
+            response_fingerprints[fingerprint_key] = fingerprint_response(response)
+
+        inverted_response = cache.get_inverted_response(
+            response=response,
+            seed_id=tr.id,
+            epoch=epoch,
+            npts=npts,
+            sampling_rate=tr.stats.sampling_rate,
+            output=output,
+            water_level=water_level,
+            pre_filt=pre_filt,
+            response_fingerprint=response_fingerprints[fingerprint_key],
+        )
+
+        spectrum = np.fft.rfft(data, n=_npts2nfft(npts))
+        spectrum *= inverted_response
+        spectrum[-1] = abs(spectrum[-1]) + 0.0j
+        tr.data = np.fft.irfft(spectrum)[0:npts]
+    return st
+
+
+def _find_channel_of_trace(inventory: obspy.Inventory, tr: obspy.Trace) -> obspy.core.inventory.Channel:
+    """
+    Finds channel epoch of the inventory that is valid for the start of provided trace.
+    """
+    stats = tr.stats
+    selected = inventory.select(
+        network=stats.network,
+        station=stats.station,
+        location=stats.location,
+        channel=stats.channel,
+        time=stats.starttime,
+    )
+    channels = [channel for network in selected for station in network for channel in station]
+    channels = [channel for channel in channels if channel.response is not None]
+    if len(channels) == 0:
+        raise ValueError(f"No response information found for {tr.id} at {stats.starttime}")
+    if len(channels) > 1:
+        raise ValueError(f"Found more than one matching response for {tr.id} at {stats.starttime}")
+    return channels[0]
+
+
+def _is_polynomial_response(response: Response) -> bool:
+    if not response.response_stages and response.instrument_polynomial:
+        return True
+    return len(response.response_stages) == 1 and isinstance(response.response_stages[0], PolynomialResponseStage)
+
+
+def _response_cache_key(
+    response_fingerprint: str,
+    seed_id: str,
+    epoch: Tuple[Optional[obspy.UTCDateTime], Optional[obspy.UTCDateTime]],
+    npts: int,
+    sampling_rate: float,
+    output: str,
+    water_level: Optional[float],
+    pre_filt: PreFilter,
+) -> str:
+    """
+    Computes digest identifying the inverted response. Fingerprint of the response itself is included,
+    so responses corrected in the inventory without change of the epoch are not served from a stale cache.
+    """
+    parts = [
+        seed_id,
+        str(epoch[0]),
+        str(epoch[1]),
+        response_fingerprint,
+        str(npts),
+        repr(float(sampling_rate)),
+        output,
+        repr(water_level),
+        repr(tuple(pre_filt) if pre_filt else None),
+    ]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
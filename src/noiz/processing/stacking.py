@@ -2,14 +2,20 @@
 # Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
 # Copyright © 2019-2023 Contributors to the Noiz project.
 
+import bisect
+import datetime
 import numpy as np
-from typing import Generator, Collection
+from typing import Generator, Collection, List, Optional, Sequence, Tuple, TypeVar
 import numpy.typing as npt
 import pandas as pd
 
+from noiz.exceptions import InconsistentDataException
 from noiz.models import CrosscorrelationCartesian, StackingSchema, StackingTimespan
+from noiz.processing.crosscorrelations import load_crosscorrelations_cartesian_data
 from noiz.processing.timespan import generate_starttimes_endtimes
 
+T = TypeVar("T")
+
 
 def _generate_stacking_timespans(stacking_schema: StackingSchema) -> Generator[StackingTimespan, None, None]:
     """
@@ -49,5 +55,63 @@ def do_linear_stack_of_crosscorrelations_cartesian(ccfs: Collection[Crosscorrela
     :return: Array with stacked crosscorrelation_cartesian
     :rtype: np.array
     """
-    mean_ccf = np.array([x.ccf for x in ccfs]).mean(axis=0)
+    mean_ccf = np.array(load_crosscorrelations_cartesian_data(ccfs)).mean(axis=0)
     return mean_ccf
+
+
+def sum_crosscorrelations_cartesian(
+    ccfs: Collection[CrosscorrelationCartesian],
+    previous_sum: Optional[npt.ArrayLike] = None,
+) -> np.ndarray:
+    """
+    Takes a collection of :py:class:`~noiz.models.crosscorrelation.CrosscorrelationCartesian` objects and sums them.
+    If a :paramref:`previous_sum` is provided, the new CrosscorrelationCartesians are added to it, so already
+    summed ones do not have to be loaded again.
+
+    :param ccfs: CrosscorrelationCartesians to sum
+    :type ccfs: Collection[CrosscorrelationCartesian]
+    :param previous_sum: Running sum to which the CrosscorrelationCartesians should be added
+    :type previous_sum: Optional[npt.ArrayLike]
+    :return: Array with summed crosscorrelation_cartesian
+    :rtype: np.ndarray
+    """
+    ccf_sum = np.array(load_crosscorrelations_cartesian_data(ccfs)).sum(axis=0)
+    if previous_sum is not None:
+        previous_sum = np.asarray(previous_sum)
+        if previous_sum.shape != ccf_sum.shape:
+            raise InconsistentDataException(
+                f"Running sum has shape {previous_sum.shape} while new ccfs have shape {ccf_sum.shape}."
+            )
+        ccf_sum = ccf_sum + previous_sum
+    return ccf_sum
+
+
+def assign_items_to_stacking_timespans(
+    stacking_timespans: Sequence[StackingTimespan],
+    items: Sequence[Tuple[datetime.datetime, datetime.datetime, T]],
+) -> Generator[Tuple[StackingTimespan, List[T]], None, None]:
+    """
+    Performs an in-memory interval join between StackingTimespans and items described by their start and end times.
+    An item belongs to a StackingTimespan if it is entirely contained within it, i.e. its starttime is not earlier
+    than the starttime of StackingTimespan and its endtime is not later than endtime of StackingTimespan.
+    With overlapping StackingTimespans a single item can be assigned to more than one of them.
+
+    Only StackingTimespans that have at least one item assigned are yielded.
+
+    :param stacking_timespans: StackingTimespans to which items should be assigned
+    :type stacking_timespans: Sequence[StackingTimespan]
+    :param items: Tuples of starttime, endtime and the item itself
+    :type items: Sequence[Tuple[datetime.datetime, datetime.datetime, T]]
+    :return: Generator of StackingTimespans with items assigned to them
+    :rtype: Generator[Tuple[StackingTimespan, List[T]], None, None]
+    """
+    sorted_items = sorted(items, key=lambda x: x[0])
+    starttimes = [x[0] for x in sorted_items]
+
+    for stacking_timespan in sorted(stacking_timespans, key=lambda x: x.starttime):
+        first = bisect.bisect_left(starttimes, stacking_timespan.starttime)
+        last = bisect.bisect_right(starttimes, stacking_timespan.endtime)
+        assigned = [item for _, endtime, item in sorted_items[first:last] if endtime <= stacking_timespan.endtime]
+        if len(assigned) == 0:
+            continue
+        yield stacking_timespan, assigned
@@ -22,6 +22,56 @@ def get_year_doy(date: datetime.datetime) -> Tuple[int, int]:
     return year, day_of_year
 
 
+def get_day_bounds(date: Union[datetime.date, datetime.datetime]) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    Returns a half-open UTC range ``[start, end)`` covering the whole day of a provided date.
+    Filtering a timestamp column with such range can use an index on that column, contrary to comparing
+    ``date_part`` of it.
+
+    :param date: Date of which bounds should be found
+    :type date: Union[datetime.date, datetime.datetime]
+    :return: Start of the day and start of the next day
+    :rtype: Tuple[datetime.datetime, datetime.datetime]
+    """
+    if isinstance(date, datetime.datetime):
+        date = get_utc_date(date)
+    start = datetime.datetime.combine(date, datetime.time(), tzinfo=datetime.timezone.utc)
+    return start, start + datetime.timedelta(days=1)
+
+
+def get_year_doy_bounds(year: int, doy: int) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    Translates year and day of year into a half-open UTC range ``[start, end)`` covering that day.
+
+    :param year: Year
+    :type year: int
+    :param doy: Day of year, starting from 1
+    :type doy: int
+    :return: Start of the day and start of the next day
+    :rtype: Tuple[datetime.datetime, datetime.datetime]
+    :raises: ValueError
+    """
+    date = datetime.date(year, 1, 1) + datetime.timedelta(days=doy - 1)
+    if doy < 1 or date.year != year:
+        raise ValueError(f"Day of year {doy} is out of range for year {year}")
+    return get_day_bounds(date)
+
+
+def get_utc_date(time: datetime.datetime) -> datetime.date:
+    """
+    Returns a date of a provided datetime. Timezone aware datetimes are converted to UTC first,
+    naive ones are assumed to already be in UTC.
+
+    :param time: Datetime to get date of
+    :type time: datetime.datetime
+    :return: UTC date
+    :rtype: datetime.date
+    """
+    if time.tzinfo is not None:
+        time = time.astimezone(datetime.timezone.utc)
+    return time.date()
+
+
 def calculate_window_step_or_overlap(
     stacking_length: Union[pd.Timedelta, datetime.timedelta],
     stacking_step_or_overlap: Union[pd.Timedelta, datetime.timedelta],
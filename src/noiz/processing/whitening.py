@@ -0,0 +1,202 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+"""
+Spectral whitening with real FFTs and cached kernels.
+
+:py:func:`~noiz.processing.datachunk_processing.whiten_trace` builds the time domain taper, the frequency
+taper and the smoothing kernel for every trace and transforms data with full complex FFTs.
+All of these depend only on :class:`~noiz.models.processing_params.ProcessedDatachunkParams`,
+number of samples and sampling rate, so here they are built once per worker process and kept in a bounded cache.
+Data are transformed with real FFTs of the next fast length and the spectrum is smoothed with a moving sum
+instead of an explicit convolution.
+
+For traces which length is already a fast FFT length, results agree with
+:py:func:`~noiz.processing.datachunk_processing.whiten_trace` up to floating point rounding.
+Other traces are zero padded to the next fast length before transforming, which slightly changes
+the frequency grid on which the spectrum is smoothed.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import obspy
+import scipy.fft
+
+from noiz.models.processing_params import ProcessedDatachunkParams
+
+
+@dataclass(frozen=True)
+class WhiteningKernels:
+    """
+    Everything needed for whitening of traces with the same parameters, number of samples and sampling rate.
+    Frequency domain arrays have length of a real FFT of ``fft_length`` samples.
+    """
+
+    npts: int
+    fft_length: int
+    time_taper: np.ndarray
+    frequency_taper: np.ndarray
+    smoothing_window_length: int
+
+
+def get_whitening_kernels(params: ProcessedDatachunkParams, npts: int, sampling_rate: float) -> WhiteningKernels:
+    """
+    Returns cached :class:`~noiz.processing.whitening.WhiteningKernels` for provided parameters.
+    Cache is keyed by values of parameters, so different instances of the same params share the entry.
+
+    :param params: Processing parameters
+    :type params: ProcessedDatachunkParams
+    :param npts: Number of samples of whitened traces
+    :type npts: int
+    :param sampling_rate: Sampling rate of whitened traces
+    :type sampling_rate: float
+    :return: Kernels for whitening
+    :rtype: WhiteningKernels
+    """
+    return _build_whitening_kernels(
+        npts=int(npts),
+        sampling_rate=float(sampling_rate),
+        filtering_low=float(params.filtering_low),
+        filtering_high=float(params.filtering_high),
+        convolution_sliding_window_min_samples=int(params.convolution_sliding_window_min_samples),
+        convolution_sliding_window_max_ratio_to_fmin=float(params.convolution_sliding_window_max_ratio_to_fmin),
+        convolution_sliding_window_ratio_to_bandwidth=float(params.convolution_sliding_window_ratio_to_bandwidth),
+        quefrency=bool(params.quefrency),
+    )
+
+
+@lru_cache(maxsize=32)
+def _build_whitening_kernels(
+    npts: int,
+    sampling_rate: float,
+    filtering_low: float,
+    filtering_high: float,
+    convolution_sliding_window_min_samples: int,
+    convolution_sliding_window_max_ratio_to_fmin: float,
+    convolution_sliding_window_ratio_to_bandwidth: float,
+    quefrency: bool,
+) -> WhiteningKernels:
+    from noiz.processing.datachunk_processing import _convolution_kernel_def, _taper_to_timedomaine
+
+    fft_length = scipy.fft.next_fast_len(npts, real=True)
+    rfft_length = fft_length // 2 + 1
+
+    tr = obspy.Trace(data=np.ones(npts), header={"sampling_rate": sampling_rate})
+    time_taper = tr.taper(0.5, max_length=1 / filtering_low).data
+
+    if quefrency:
+        f_niquist = sampling_rate / 2
+        smoothing_window_length, _ = _convolution_kernel_def(
+            convolution_sliding_window_ratio_to_bandwidth,
+            filtering_high - filtering_low,
+            filtering_low * convolution_sliding_window_max_ratio_to_fmin,
+            convolution_sliding_window_min_samples,
+            f_niquist,
+            fft_length,
+        )
+        full_taper = _taper_to_timedomaine(
+            fft_length, filtering_low, filtering_high, f_niquist, smoothing_window_length
+        )
+        # Only the Hermitian part of the taper contributes to the real part of the inverse transform
+        mirrored = full_taper[(fft_length - np.arange(rfft_length)) % fft_length]
+        frequency_taper = 0.5 * (full_taper[:rfft_length] + mirrored)
+    else:
+        smoothing_window_length = 0
+        frequency_taper = np.ones(rfft_length)
+
+    time_taper.setflags(write=False)
+    frequency_taper.setflags(write=False)
+
+    return WhiteningKernels(
+        npts=npts,
+        fft_length=fft_length,
+        time_taper=time_taper,
+        frequency_taper=frequency_taper,
+        smoothing_window_length=smoothing_window_length,
+    )
+
+
+def _moving_average_same(data: np.ndarray, window_length: int) -> np.ndarray:
+    """
+    Same as ``np.convolve(data, np.ones(window_length), mode="same") / window_length`` applied along the last axis,
+    but computed with a cumulative sum, so its cost does not depend on the window length.
+    """
+    length = data.shape[-1]
+    start = (window_length - 1) // 2
+    cumulative = np.concatenate((np.zeros(data.shape[:-1] + (1,)), np.cumsum(data, axis=-1)), axis=-1)
+    upper = np.clip(np.arange(length) + start + 1, 0, length)
+    lower = np.clip(np.arange(length) + start + 1 - window_length, 0, length)
+    return (cumulative[..., upper] - cumulative[..., lower]) / window_length
+
+
+def _smooth_log_spectrum(log_spectrum: np.ndarray, fft_length: int, window_length: int) -> np.ndarray:
+    """
+    Smooths one sided log spectra along the last axis the same way as the full spectrum is smoothed in
+    :py:func:`~noiz.processing.datachunk_processing.whiten_trace`.
+    The full, symmetric, spectrum is restored first, so the edges are treated identically.
+    """
+    rfft_length = log_spectrum.shape[-1]
+    full = np.concatenate((log_spectrum, log_spectrum[..., 1 : fft_length - rfft_length + 1][..., ::-1]), axis=-1)
+    smoothed = _moving_average_same(full[..., 1:], window_length)
+    smoothed = 0.5 * (smoothed + smoothed[..., ::-1])
+    return np.concatenate((log_spectrum[..., :1], smoothed[..., : rfft_length - 1]), axis=-1)
+
+
+def whiten_data(data: np.ndarray, kernels: WhiteningKernels, waterlevel_ratio_to_max: float) -> np.ndarray:
+    """
+    Spectrally whitens provided samples with precomputed kernels.
+    If a 2D array is provided, every row is whitened separately, in a single vectorized pass.
+
+    :param data: Samples to be whitened, last axis of length ``kernels.npts``
+    :type data: np.ndarray
+    :param kernels: Kernels obtained with :py:func:`~noiz.processing.whitening.get_whitening_kernels`
+    :type kernels: WhiteningKernels
+    :param waterlevel_ratio_to_max: Value to apply for waterlevel filter
+    :type waterlevel_ratio_to_max: float
+    :return: Whitened samples
+    :rtype: np.ndarray
+    """
+    if data.shape[-1] != kernels.npts:
+        raise ValueError(f"Whitening kernels were prepared for {kernels.npts} samples, got {data.shape[-1]}.")
+
+    spectrum = scipy.fft.rfft(data * kernels.time_taper, n=kernels.fft_length, axis=-1)
+
+    amplitude = np.abs(spectrum)
+    waterlevel = waterlevel_ratio_to_max * np.max(amplitude, axis=-1, keepdims=True)
+    amplitude_waterlevel = np.where(amplitude <= waterlevel, waterlevel, amplitude)
+    amplitude_waterlevel[..., 0] = amplitude[..., 0]
+
+    if kernels.smoothing_window_length > 0:
+        log_amplitude = np.log(amplitude_waterlevel)
+        min_log_amplitude = np.min(log_amplitude, axis=-1, keepdims=True)
+        smoothed = _smooth_log_spectrum(
+            log_spectrum=log_amplitude - min_log_amplitude,
+            fft_length=kernels.fft_length,
+            window_length=kernels.smoothing_window_length,
+        )
+        amplitude_waterlevel = np.exp(smoothed + min_log_amplitude)
+
+    whitened = scipy.fft.irfft(
+        spectrum / amplitude_waterlevel * kernels.frequency_taper, n=kernels.fft_length, axis=-1
+    )
+    return whitened[..., : kernels.npts]
+
+
+def whiten_trace_cached(tr: obspy.Trace, params: ProcessedDatachunkParams) -> obspy.Trace:
+    """
+    Spectrally whitens the trace in the same way as :py:func:`~noiz.processing.datachunk_processing.whiten_trace`,
+    but with real FFTs and kernels cached with :py:func:`~noiz.processing.whitening.get_whitening_kernels`.
+
+    :param tr: Trace to be whitened
+    :type tr: obspy.Trace
+    :param params: Processing parameters
+    :type params: ProcessedDatachunkParams
+    :return: Spectrally whitened trace
+    :rtype: obspy.Trace
+    """
+    kernels = get_whitening_kernels(params=params, npts=tr.stats.npts, sampling_rate=tr.stats.sampling_rate)
+    tr.data = whiten_data(data=tr.data, kernels=kernels, waterlevel_ratio_to_max=params.waterlevel_ratio_to_max)
+    return tr
@@ -0,0 +1,218 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+import datetime
+import io
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sqlalchemy.dialects.postgresql import insert
+
+from noiz.api.bulk_copy import (
+    _assign_returned_ids,
+    _build_merge_statement,
+    _extract_column_values,
+    _find_conflict_constraint,
+    _format_copy_value,
+    _get_copied_columns,
+    _serialize_copy_rows,
+    get_upsert_conflict_resolution,
+)
+from noiz.api.crosscorrelations import _prepare_upsert_command_crosscorrelation_cartesian
+from noiz.api.event_detection import _prepare_upsert_command_event_detection
+from noiz.exceptions import InconsistentDataException
+from noiz.models import (
+    CrosscorrelationCartesian,
+    CrosscorrelationCartesianFile,
+    Datachunk,
+    DatachunkFile,
+    DatachunkStats,
+    EventDetectionResult,
+    QCOneResults,
+)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, r"\N"),
+        (True, "t"),
+        (np.bool_(False), "f"),
+        (5, "5"),
+        (np.int64(7), "7"),
+        (0.5, "0.5"),
+        (np.float32(0.25), "0.25"),
+        (float("nan"), "NaN"),
+        (float("-inf"), "-Infinity"),
+        (datetime.datetime(2020, 1, 2, 3, 4, 5), "2020-01-02T03:04:05"),
+        (Path("/some/dir/file.npz"), "/some/dir/file.npz"),
+        ("tab\there", "tab\\there"),
+        ("back\\slash\nnewline", "back\\\\slash\\nnewline"),
+        ([1.0, 2.5], "{1.0,2.5}"),
+        (np.array([1, 2]), "{1,2}"),
+    ],
+)
+def test_format_copy_value(value, expected):
+    assert expected == _format_copy_value(value)
+
+
+def test_serialize_copy_rows_appends_row_number():
+    buffer = io.StringIO()
+    _serialize_copy_rows(buffer=buffer, rows=[(1, None, "a"), (2, 0.5, "b")])
+
+    assert "1\t\\N\ta\t0\n2\t0.5\tb\t1\n" == buffer.getvalue()
+
+
+def test_find_conflict_constraint():
+    constraint = _find_conflict_constraint(table=Datachunk.__table__)
+
+    assert "unique_datachunk_per_timespan_per_station_per_processing" == constraint.name
+
+
+def test_find_conflict_constraint_missing():
+    with pytest.raises(ValueError):
+        _find_conflict_constraint(table=DatachunkFile.__table__)
+
+    with pytest.raises(ValueError):
+        _find_conflict_constraint(table=Datachunk.__table__, constraint_name="nonexistent")
+
+
+def test_build_merge_statement():
+    table = QCOneResults.__table__
+    statement = _build_merge_statement(
+        table=table,
+        staging_table='"staging"',
+        columns=_get_copied_columns(table),
+        constraint=_find_conflict_constraint(table=table),
+    )
+
+    assert statement.startswith('INSERT INTO "qcone_results" (')
+    assert '"id"' not in statement
+    assert 'SELECT DISTINCT ON ("datachunk_id", "qcone_config_id")' in statement
+    assert 'ON CONFLICT ON CONSTRAINT "unique_qcone_results_per_config_per_datachunk" DO UPDATE SET' in statement
+    assert '"datachunk_id" = EXCLUDED' not in statement
+
+
+def test_extract_column_values_takes_foreign_key_from_relationship():
+    file = DatachunkFile(filepath=Path("/some/file.mseed"))
+    file.id = 42
+    datachunk = Datachunk(
+        datachunk_params_id=1,
+        component_id=2,
+        timespan_id=3,
+        sampling_rate=24.0,
+        npts=100,
+        padded_npts=120,
+        file=file,
+    )
+
+    columns = _get_copied_columns(Datachunk.__table__)
+    values = dict(zip([col.name for col in columns], _extract_column_values(obj=datachunk, columns=columns)))
+
+    assert 42 == values["datachunk_file_id"]
+    assert 100 == values["npts"]
+
+
+def test_build_merge_statement_returning():
+    table = Datachunk.__table__
+    statement = _build_merge_statement(
+        table=table,
+        staging_table='"staging"',
+        columns=_get_copied_columns(table),
+        constraint=_find_conflict_constraint(table=table),
+        returning=True,
+    )
+
+    assert statement.endswith('RETURNING "id", "timespan_id", "component_id", "datachunk_params_id"')
+
+
+def test_assign_returned_ids_lets_dependents_take_foreign_key():
+    table = Datachunk.__table__
+    columns = _get_copied_columns(table)
+    constraint = _find_conflict_constraint(table=table)
+    datachunks = [
+        Datachunk(datachunk_params_id=1, component_id=2, timespan_id=timespan_id, sampling_rate=24.0, npts=10)
+        for timespan_id in (3, 4)
+    ]
+    for datachunk in datachunks:
+        datachunk.stats = DatachunkStats(energy=1.0)
+    rows = [_extract_column_values(obj=obj, columns=columns) for obj in datachunks]
+
+    _assign_returned_ids(
+        objects=datachunks, columns=columns, rows=rows, constraint=constraint, returned=[(11, 4, 2, 1), (10, 3, 2, 1)]
+    )
+
+    assert [10, 11] == [datachunk.id for datachunk in datachunks]
+    stats_columns = _get_copied_columns(DatachunkStats.__table__)
+    stats_row = _extract_column_values(obj=datachunks[1].stats, columns=stats_columns)
+    stats_values = dict(zip([col.name for col in stats_columns], stats_row))
+    assert 11 == stats_values["datachunk_id"]
+
+    with pytest.raises(InconsistentDataException):
+        _assign_returned_ids(objects=datachunks, columns=columns, rows=rows, constraint=constraint, returned=[])
+
+
+def test_get_upsert_conflict_resolution():
+    xcorr = CrosscorrelationCartesian(
+        crosscorrelation_cartesian_params_id=1,
+        componentpair_id=2,
+        timespan_id=3,
+        file=CrosscorrelationCartesianFile(filepath="/some/ccf.npy"),
+    )
+
+    constraint_name, update_columns = get_upsert_conflict_resolution(
+        _prepare_upsert_command_crosscorrelation_cartesian(xcorr)
+    )
+
+    assert "unique_ccfn_per_timespan_per_componentpair_per_config" == constraint_name
+    assert ["crosscorrelation_cartesian_file_id", "container_offset"] == update_columns
+
+
+def test_get_upsert_conflict_resolution_event_detection():
+    constraint_name, update_columns = get_upsert_conflict_resolution(
+        _prepare_upsert_command_event_detection(EventDetectionResult())
+    )
+
+    assert "unique_detection_per_timespan_per_datachunk_per_param_per_time" == constraint_name
+    assert ["event_detection_file_id"] == update_columns
+
+
+def test_get_upsert_conflict_resolution_without_on_conflict():
+    assert (None, None) == get_upsert_conflict_resolution(insert(Datachunk).values(npts=1))
+
+
+def test_get_upsert_conflict_resolution_unreadable_command():
+    with pytest.raises(ValueError):
+        get_upsert_conflict_resolution(object())  # type: ignore
+
+
+def test_build_merge_statement_updates_only_selected_columns():
+    table = Datachunk.__table__
+    statement = _build_merge_statement(
+        table=table,
+        staging_table='"staging"',
+        columns=_get_copied_columns(table),
+        constraint=_find_conflict_constraint(table=table),
+        update_column_names=["npts", "datachunk_file_id"],
+    )
+
+    assert statement.endswith(
+        'DO UPDATE SET "npts" = EXCLUDED."npts", "datachunk_file_id" = EXCLUDED."datachunk_file_id"'
+    )
+
+
+@pytest.mark.parametrize("returning, expected_action", [(False, "DO NOTHING"), (True, 'DO UPDATE SET "timespan_id"')])
+def test_build_merge_statement_without_updated_columns(returning, expected_action):
+    table = Datachunk.__table__
+    statement = _build_merge_statement(
+        table=table,
+        staging_table='"staging"',
+        columns=_get_copied_columns(table),
+        constraint=_find_conflict_constraint(table=table),
+        update_column_names=[],
+        returning=returning,
+    )
+
+    assert expected_action in statement
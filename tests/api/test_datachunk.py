@@ -0,0 +1,44 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+import pytest
+
+from noiz.api.datachunk import _validate_processing_batch_by
+from noiz.models import ProcessedDatachunkParams
+
+
+@pytest.mark.parametrize(
+    "storage, spectrum_max_lag, batch_by, expected",
+    [
+        ("mseed_per_chunk", None, None, None),
+        ("mseed_per_chunk", None, "component_day", "component_day"),
+        ("mseed_per_chunk", 10.0, None, "timespan"),
+        ("mseed_per_chunk", 10.0, "timespan", "timespan"),
+        ("component_day_container", None, None, "component_day"),
+        ("component_day_container", None, "component_day", "component_day"),
+    ],
+)
+def test_validate_processing_batch_by(storage, spectrum_max_lag, batch_by, expected):
+    params = ProcessedDatachunkParams(processed_datachunk_storage=storage, spectrum_max_lag=spectrum_max_lag)
+
+    assert expected == _validate_processing_batch_by(params=params, batch_by=batch_by)
+
+
+@pytest.mark.parametrize(
+    "storage, spectrum_max_lag, batch_by",
+    [
+        ("mseed_per_chunk", 10.0, "component_day"),
+        ("component_day_container", None, "timespan"),
+    ],
+)
+def test_validate_processing_batch_by_raises(storage, spectrum_max_lag, batch_by):
+    params = ProcessedDatachunkParams(processed_datachunk_storage=storage, spectrum_max_lag=spectrum_max_lag)
+
+    with pytest.raises(ValueError):
+        _validate_processing_batch_by(params=params, batch_by=batch_by)
+
+
+def test_processed_datachunk_params_reject_spectra_in_containers():
+    with pytest.raises(ValueError):
+        ProcessedDatachunkParams(processed_datachunk_storage="component_day_container", spectrum_max_lag=10.0)
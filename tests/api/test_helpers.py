@@ -140,3 +140,72 @@ def test_extract_object_ids():
     input = [TestingClassWithID(id=i) for i in expected_ids]
 
     assert expected_ids == extract_object_ids(instances=input)
+
+
+@pytest.mark.parametrize(
+    "workers_info, expected",
+    [
+        ({}, []),
+        ({"tcp://a": {"memory_limit": 100, "metrics": {"memory": 50}}}, []),
+        ({"tcp://a": {"memory_limit": 100, "metrics": {"memory": 81}}}, ["tcp://a"]),
+        ({"tcp://a": {"memory_limit": 0, "metrics": {"memory": 1000}}}, []),
+        (
+            {
+                "tcp://a": {"memory_limit": 100, "metrics": {"memory": 10}},
+                "tcp://b": {"memory_limit": 100, "metrics": {"memory": 90}},
+            },
+            ["tcp://b"],
+        ),
+    ],
+)
+def test_find_workers_exceeding_memory_threshold(workers_info, expected):
+    from noiz.api.helpers import _find_workers_exceeding_memory_threshold
+
+    assert expected == _find_workers_exceeding_memory_threshold(workers_info=workers_info, memory_fraction=0.8)
+
+
+class _RecordingClient:
+    def __init__(self, worker_addresses):
+        self.worker_addresses = worker_addresses
+        self.submitted = []
+
+    def scheduler_info(self):
+        return {"workers": {address: {} for address in self.worker_addresses}}
+
+    def submit(self, func, input_dict, **kwargs):
+        self.submitted.append((input_dict["name"], kwargs))
+
+
+def test_submit_task_to_client_pins_inputs_with_the_same_key(monkeypatch):
+    import dask.distributed
+    from noiz.api.helpers import _submit_task_to_client_and_add_results_to_db
+
+    class _NoResults:
+        def batches(self):
+            return []
+
+    monkeypatch.setattr(dask.distributed, "as_completed", lambda *args, **kwargs: _NoResults())
+    client = _RecordingClient(worker_addresses=["tcp://b", "tcp://a"])
+    inputs = [
+        {"name": "first", "key": 1},
+        {"name": "second", "key": 2},
+        {"name": "third", "key": 1},
+        {"name": "free", "key": None},
+        {"name": "fourth", "key": 3},
+    ]
+
+    _submit_task_to_client_and_add_results_to_db(
+        client=client,
+        inputs_to_process=inputs,
+        calculation_task=lambda x: (),
+        upserter_callable=lambda x: None,  # type: ignore
+        worker_key=lambda x: x["key"],
+    )
+
+    assert [
+        ("first", {"workers": ["tcp://a"], "allow_other_workers": True}),
+        ("second", {"workers": ["tcp://b"], "allow_other_workers": True}),
+        ("third", {"workers": ["tcp://a"], "allow_other_workers": True}),
+        ("free", {}),
+        ("fourth", {"workers": ["tcp://a"], "allow_other_workers": True}),
+    ] == client.submitted
@@ -0,0 +1,171 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+import datetime
+
+import numpy as np
+import obspy
+import pytest
+
+from noiz.exceptions import CorruptedDataException, MissingDataFileException
+from noiz.models import Component, Datachunk, DatachunkFile, Timespan
+from noiz.processing import datachunk as datachunk_processing
+from noiz.processing.chunk_container import (
+    load_stream_from_container,
+    read_chunk_container_table,
+    read_chunk_from_container,
+    serialize_stream,
+    write_chunk_container,
+)
+from noiz.processing.path_helpers import assembly_container_filename
+
+
+def _prepare_stream(seed: int, npts: int = 2000) -> obspy.Stream:
+    rng = np.random.default_rng(seed)
+    tr = obspy.Trace(
+        data=rng.standard_normal(npts),
+        header={"network": "TD", "station": "TD03", "channel": "HHZ", "sampling_rate": 50.0},
+    )
+    return obspy.Stream([tr])
+
+
+def test_write_and_read_chunk_container(tmp_path):
+    filepath = tmp_path.joinpath("container.ncc")
+    chunks = [serialize_stream(_prepare_stream(seed)) for seed in range(3)]
+
+    table = write_chunk_container(filepath=filepath, chunks=chunks)
+
+    assert table == read_chunk_container_table(filepath)
+    for chunk, (offset, length) in zip(chunks, table):
+        assert chunk == read_chunk_from_container(filepath=filepath, offset=offset, length=length)
+
+
+def test_load_stream_from_container(tmp_path):
+    filepath = tmp_path.joinpath("container.ncc")
+    streams = [_prepare_stream(seed) for seed in range(3)]
+    table = write_chunk_container(filepath=filepath, chunks=[serialize_stream(st) for st in streams])
+
+    loaded = load_stream_from_container(filepath=filepath, offset=table[1][0], length=table[1][1])
+
+    np.testing.assert_array_equal(streams[1][0].data, loaded[0].data)
+
+
+def test_write_chunk_container_does_not_overwrite(tmp_path):
+    filepath = tmp_path.joinpath("container.ncc")
+    table = write_chunk_container(filepath=filepath, chunks=[serialize_stream(_prepare_stream(1))])
+
+    with pytest.raises(FileExistsError):
+        write_chunk_container(filepath=filepath, chunks=[serialize_stream(_prepare_stream(2))])
+
+    assert table == read_chunk_container_table(filepath)
+
+
+def test_write_chunks_to_component_day_containers_twice(tmp_path, monkeypatch):
+    monkeypatch.setattr(datachunk_processing, "PROCESSED_DATA_DIR", str(tmp_path))
+    component = Component(
+        id=1,
+        network="TD",
+        station="TD03",
+        component="Z",
+        lat=32.5,
+        lon=8.2,
+        start_date=datetime.datetime(2016, 1, 1),
+        end_date=datetime.datetime(2030, 1, 1),
+    )
+    timespans = [
+        Timespan(
+            starttime=datetime.datetime(2023, 2, 2, hour),
+            midtime=datetime.datetime(2023, 2, 2, hour, 30),
+            endtime=datetime.datetime(2023, 2, 2, hour + 1),
+        )
+        for hour in range(4)
+    ]
+    streams = [_prepare_stream(seed) for seed in range(4)]
+    batches = [
+        [(component, timespan, serialize_stream(st)) for timespan, st in zip(timespans[:2], streams[:2])],
+        [(component, timespan, serialize_stream(st)) for timespan, st in zip(timespans[2:], streams[2:])],
+    ]
+
+    locations = [
+        location
+        for batch in batches
+        for location in datachunk_processing.write_chunks_to_component_day_containers(
+            chunks=batch, params_id=4, processing_type="processed_datachunk"
+        )
+    ]
+
+    filepaths = [filepath for filepath, _, _ in locations]
+    assert filepaths[0] == filepaths[1]
+    assert filepaths[2] == filepaths[3]
+    assert filepaths[0] != filepaths[2]
+    assert filepaths[0].endswith("params4.0.ncc")
+    assert filepaths[2].endswith("params4.1.ncc")
+    for st, (filepath, offset, length) in zip(streams, locations):
+        loaded = load_stream_from_container(filepath=filepath, offset=offset, length=length)
+        np.testing.assert_array_equal(st[0].data, loaded[0].data)
+
+
+def test_datachunk_load_data_from_container(tmp_path):
+    filepath = tmp_path.joinpath("container.ncc")
+    st = _prepare_stream(5)
+    table = write_chunk_container(
+        filepath=filepath, chunks=[serialize_stream(_prepare_stream(4)), serialize_stream(st)]
+    )
+    datachunk = Datachunk(
+        file=DatachunkFile(filepath=str(filepath)), container_offset=table[1][0], container_length=table[1][1]
+    )
+
+    np.testing.assert_array_equal(st[0].data, datachunk.load_data()[0].data)
+
+
+def test_datachunk_load_data_from_container_without_length(tmp_path):
+    filepath = tmp_path.joinpath("container.ncc")
+    table = write_chunk_container(filepath=filepath, chunks=[serialize_stream(_prepare_stream(4))])
+    datachunk = Datachunk(file=DatachunkFile(filepath=str(filepath)), container_offset=table[0][0])
+
+    with pytest.raises(CorruptedDataException):
+        datachunk.load_data()
+
+
+def test_read_chunk_container_table_wrong_magic(tmp_path):
+    filepath = tmp_path.joinpath("not_a_container.mseed")
+    filepath.write_bytes(serialize_stream(_prepare_stream(1)))
+
+    with pytest.raises(CorruptedDataException):
+        read_chunk_container_table(filepath)
+
+
+def test_read_chunk_from_container_truncated(tmp_path):
+    filepath = tmp_path.joinpath("container.ncc")
+    table = write_chunk_container(filepath=filepath, chunks=[serialize_stream(_prepare_stream(1))])
+    filepath.write_bytes(filepath.read_bytes()[:-10])
+
+    with pytest.raises(CorruptedDataException):
+        read_chunk_from_container(filepath=filepath, offset=table[0][0], length=table[0][1])
+
+
+def test_read_chunk_from_container_missing(tmp_path):
+    with pytest.raises(MissingDataFileException):
+        read_chunk_from_container(filepath=tmp_path.joinpath("missing.ncc"), offset=0, length=10)
+
+
+def test_assembly_container_filename():
+    component = Component(
+        network="TD",
+        station="TD03",
+        component="Z",
+        lat=32.5,
+        lon=8.2,
+        start_date=datetime.datetime(2016, 1, 1),
+        end_date=datetime.datetime(2030, 1, 1),
+    )
+    timespan = Timespan(
+        starttime=datetime.datetime(2023, 2, 1, 23, 30),
+        midtime=datetime.datetime(2023, 2, 2, 0, 30),
+        endtime=datetime.datetime(2023, 2, 2, 1, 30),
+    )
+
+    assert "TD.TD03.Z.2023.033.params4.2.ncc" == assembly_container_filename(
+        component=component, timespan=timespan, params_id=4, count=2
+    )
@@ -0,0 +1,381 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+import numpy as np
+import obspy
+import pytest
+from obspy.signal.cross_correlation import correlate
+
+from noiz.models.component_pair import ComponentPairCartesian
+from noiz.processing.crosscorrelations import crosscorrelate_with_cached_spectra
+
+
+def _prepare_traces_and_pairs(npts, component_count, seed=42):
+    rng = np.random.default_rng(seed)
+    traces = {cmp_id: obspy.Trace(data=rng.standard_normal(npts)) for cmp_id in range(component_count)}
+    pairs = []
+    pair_id = 0
+    for cmp_a_id in range(component_count):
+        for cmp_b_id in range(cmp_a_id, component_count):
+            pairs.append(ComponentPairCartesian(id=pair_id, component_a_id=cmp_a_id, component_b_id=cmp_b_id))
+            pair_id += 1
+    return traces, pairs
+
+
+@pytest.mark.parametrize("npts, max_lag_samples", [(1000, 100), (1001, 20), (720, 719), (500, 800), (64, 0)])
+def test_crosscorrelate_with_cached_spectra_matches_obspy(npts, max_lag_samples):
+    traces, pairs = _prepare_traces_and_pairs(npts=npts, component_count=4)
+
+    ccfs = crosscorrelate_with_cached_spectra(
+        traces=traces, component_pairs_cartesian=pairs, max_lag_samples=max_lag_samples, pair_batch_size=3
+    )
+
+    assert len(ccfs) == len(pairs)
+    for pair in pairs:
+        expected = correlate(a=traces[pair.component_a_id], b=traces[pair.component_b_id], shift=max_lag_samples)
+        assert ccfs[pair.id].shape == expected.shape
+        assert np.allclose(ccfs[pair.id], expected, atol=1e-12)
+
+
+def test_crosscorrelate_with_cached_spectra_zero_trace():
+    traces, pairs = _prepare_traces_and_pairs(npts=300, component_count=2)
+    traces[1].data[:] = 5.0
+
+    ccfs = crosscorrelate_with_cached_spectra(traces=traces, component_pairs_cartesian=pairs, max_lag_samples=10)
+
+    for pair in pairs:
+        expected = correlate(a=traces[pair.component_a_id], b=traces[pair.component_b_id], shift=10)
+        assert np.allclose(ccfs[pair.id], expected)
+    assert np.all(ccfs[1] == 0)
+
+
+def test_crosscorrelate_with_cached_spectra_different_lengths_across_pairs():
+    traces, _ = _prepare_traces_and_pairs(npts=400, component_count=2)
+    rng = np.random.default_rng(7)
+    traces[2] = obspy.Trace(data=rng.standard_normal(350))
+    traces[3] = obspy.Trace(data=rng.standard_normal(350))
+    pairs = [
+        ComponentPairCartesian(id=10, component_a_id=0, component_b_id=1),
+        ComponentPairCartesian(id=11, component_a_id=2, component_b_id=3),
+    ]
+
+    ccfs = crosscorrelate_with_cached_spectra(traces=traces, component_pairs_cartesian=pairs, max_lag_samples=50)
+
+    for pair in pairs:
+        expected = correlate(a=traces[pair.component_a_id], b=traces[pair.component_b_id], shift=50)
+        assert np.allclose(ccfs[pair.id], expected, atol=1e-12)
+
+
+def test_load_crosscorrelations_cartesian_data_from_container_and_single_files(tmp_path):
+    from noiz.models.crosscorrelation import CrosscorrelationCartesian, CrosscorrelationCartesianFile
+    from noiz.processing.crosscorrelations import load_crosscorrelations_cartesian_data
+
+    rng = np.random.default_rng(3)
+    container_data = rng.standard_normal((5, 41))
+    single_data = rng.standard_normal(41)
+
+    container_path = tmp_path.joinpath("ccf_container.params1.2021.001.0000.0.npy")
+    single_path = tmp_path.joinpath("single.0.npy")
+    np.save(container_path, container_data)
+    np.save(single_path, single_data)
+
+    container_file = CrosscorrelationCartesianFile(filepath=str(container_path))
+    ccfs = [
+        CrosscorrelationCartesian(file=container_file, container_offset=3),
+        CrosscorrelationCartesian(file=CrosscorrelationCartesianFile(filepath=str(single_path))),
+        CrosscorrelationCartesian(file=container_file, container_offset=0),
+    ]
+
+    loaded = load_crosscorrelations_cartesian_data(ccfs)
+
+    assert np.array_equal(loaded[0], container_data[3])
+    assert np.array_equal(loaded[1], single_data)
+    assert np.array_equal(loaded[2], container_data[0])
+    assert np.array_equal(ccfs[0].load_data(), container_data[3])
+
+
+@pytest.mark.parametrize("back_az", [0.0, 0.3, 2.1, -1.2])
+def test_rotate_cartesian_ccf_tensor_matches_per_code_formulas(back_az):
+    from noiz.processing.crosscorrelations import rotate_cartesian_ccf_tensor
+
+    rng = np.random.default_rng(11)
+    tensor = rng.standard_normal((3, 3, 31))
+    mask = np.ones((3, 3), dtype=bool)
+    mask[2, 2] = False
+    xc = {a + b: tensor["ENZ".index(a), "ENZ".index(b)] for a in "ENZ" for b in "ENZ"}
+    s, c = np.sin(back_az), np.cos(back_az)
+    expected = {
+        "RR": s**2 * xc["EE"] + c * s * (xc["EN"] + xc["NE"]) + c**2 * xc["NN"],
+        "TT": c**2 * xc["EE"] - c * s * (xc["EN"] - xc["NE"]) + s**2 * xc["NN"],
+        "RT": c**2 * xc["NE"] + c * s * (xc["EE"] - xc["NN"]) - s**2 * xc["EN"],
+        "TR": c**2 * xc["EN"] + c * s * (xc["EE"] - xc["NN"]) - s**2 * xc["NE"],
+        "RZ": s * xc["EZ"] + c * xc["NZ"],
+        "TZ": c * xc["EZ"] - s * xc["NZ"],
+        "ZR": s * xc["ZE"] + c * xc["ZN"],
+        "ZT": c * xc["ZE"] - s * xc["ZN"],
+    }
+
+    rotated = rotate_cartesian_ccf_tensor(tensor=tensor, mask=mask, back_az=back_az)
+
+    assert expected.keys() == rotated.keys()
+    for code, expected_ccf in expected.items():
+        np.testing.assert_allclose(expected_ccf, rotated[code])
+
+
+def test_rotate_cartesian_ccf_tensor_skips_codes_with_missing_components():
+    from noiz.processing.crosscorrelations import rotate_cartesian_ccf_tensor
+
+    tensor = np.ones((3, 3, 5))
+    mask = np.zeros((3, 3), dtype=bool)
+    mask[0, 2] = mask[1, 2] = True
+
+    rotated = rotate_cartesian_ccf_tensor(tensor=tensor, mask=mask, back_az=0.5)
+
+    assert {"RZ", "TZ"} == set(rotated.keys())
+
+
+def test_assembly_cartesian_ccf_tensor_loads_once_and_reverses_swapped_pairs(tmp_path):
+    from noiz.models.component_pair import ComponentPairCylindrical
+    from noiz.models.crosscorrelation import CrosscorrelationCartesian, CrosscorrelationCartesianFile
+    from noiz.processing.crosscorrelations import assembly_cartesian_ccf_tensor
+
+    rng = np.random.default_rng(7)
+    data = rng.standard_normal((2, 11))
+    container_path = tmp_path.joinpath("ccf_container.params1.2021.001.0000.0.npy")
+    np.save(container_path, data)
+    container_file = CrosscorrelationCartesianFile(filepath=str(container_path))
+
+    # station A: E=1, N=2, Z=3; station B: E=4, N=5, Z=6
+    xcorr_aZ_bZ = CrosscorrelationCartesian(file=container_file, container_offset=0)
+    xcorr_aZ_bZ.componentpair_cartesian = ComponentPairCartesian(component_a_id=3, component_b_id=6)
+    xcorr_bE_aN = CrosscorrelationCartesian(file=container_file, container_offset=1)
+    xcorr_bE_aN.componentpair_cartesian = ComponentPairCartesian(component_a_id=4, component_b_id=2)
+    grouped = {frozenset((3, 6)): xcorr_aZ_bZ, frozenset((2, 4)): xcorr_bE_aN}
+
+    cp = ComponentPairCylindrical(
+        component_aE_id=1,
+        component_aN_id=2,
+        component_aZ_id=3,
+        component_bE_id=4,
+        component_bN_id=5,
+        component_bZ_id=6,
+    )
+
+    tensor, mask, used = assembly_cartesian_ccf_tensor(gr_xcors_cart=grouped, comp_pairs_cyl=cp)
+
+    assert (3, 3, 11) == tensor.shape
+    assert {"ZZ", "NE"} == set(used.keys())
+    assert [(1, 0), (2, 2)] == [tuple(x) for x in np.argwhere(mask)]
+    np.testing.assert_array_equal(data[0], tensor[2, 2])
+    np.testing.assert_array_equal(data[1][::-1], tensor[1, 0])
+
+
+def test_select_missing_component_pairs():
+    from noiz.processing.crosscorrelations import select_missing_component_pairs
+
+    pairs = (
+        ComponentPairCartesian(id=1, component_a_id=10, component_b_id=11),
+        ComponentPairCartesian(id=2, component_a_id=10, component_b_id=12),
+        ComponentPairCartesian(id=3, component_a_id=11, component_b_id=13),
+    )
+    chunks = {10: "chunk10", 11: "chunk11", 12: "chunk12", 13: "chunk13"}
+
+    missing_pairs, required_chunks = select_missing_component_pairs(
+        component_pairs_cartesian=pairs,
+        grouped_processed_chunks=chunks,  # type: ignore
+        existing_componentpair_ids={1, 3},
+    )
+
+    assert (pairs[1],) == missing_pairs
+    assert {10: "chunk10", 12: "chunk12"} == required_chunks
+
+
+def test_select_missing_component_pairs_without_chunks():
+    from noiz.processing.crosscorrelations import select_missing_component_pairs
+
+    pairs = (
+        ComponentPairCartesian(id=1, component_a_id=10, component_b_id=11),
+        ComponentPairCartesian(id=2, component_a_id=10, component_b_id=12),
+        ComponentPairCartesian(id=3, component_a_id=11, component_b_id=13),
+    )
+    chunks = {10: "chunk10", 11: "chunk11", 13: "chunk13"}
+
+    missing_pairs, required_chunks = select_missing_component_pairs(
+        component_pairs_cartesian=pairs,
+        grouped_processed_chunks=chunks,  # type: ignore
+        existing_componentpair_ids={1},
+    )
+
+    assert (pairs[2],) == missing_pairs
+    assert {11: "chunk11", 13: "chunk13"} == required_chunks
+
+
+def test_load_data_for_chunks_from_references(tmp_path):
+    from noiz.models.datachunk import ProcessedDatachunkReference
+    from noiz.processing.crosscorrelations import load_data_for_chunks
+
+    trace = obspy.Trace(data=np.arange(100, dtype=np.float64))
+    filepath = tmp_path.joinpath("chunk.mseed")
+    trace.write(str(filepath), format="MSEED")
+
+    chunks = {7: ProcessedDatachunkReference(id=1, component_id=7, filepath=str(filepath))}
+    traces = load_data_for_chunks(chunks=chunks)
+
+    np.testing.assert_array_equal(trace.data, traces[7].data)
+
+
+def test_processed_datachunk_reference_missing_file(tmp_path):
+    from noiz.exceptions import MissingDataFileException
+    from noiz.models.datachunk import ProcessedDatachunkReference
+
+    with pytest.raises(MissingDataFileException):
+        ProcessedDatachunkReference(id=1, component_id=7, filepath=str(tmp_path.joinpath("missing.mseed"))).load_data()
+
+
+def test_split_component_pairs_into_tiles():
+    from noiz.processing.crosscorrelations import split_component_pairs_into_tiles
+
+    _, pairs = _prepare_traces_and_pairs(npts=10, component_count=6)
+    chunks = {cmp_id: f"chunk{cmp_id}" for cmp_id in range(5)}
+
+    tiles = split_component_pairs_into_tiles(
+        component_pairs_cartesian=pairs,
+        grouped_processed_chunks=chunks,  # type: ignore
+        tile_size=2,
+    )
+
+    assert [(0, 0), (0, 1), (0, 2), (1, 2), (1, 1), (2, 2)] == [tile for tile, _, _ in tiles]
+    assert 15 == sum(len(tile_pairs) for _, tile_pairs, _ in tiles)
+
+    for (row, col), tile_pairs, tile_chunks in tiles:
+        allowed_components = {x for x in range(5) if x // 2 in (row, col)}
+        assert set(tile_chunks.keys()) <= allowed_components
+        for pair in tile_pairs:
+            assert {pair.component_a_id, pair.component_b_id} <= set(tile_chunks.keys())
+
+    with pytest.raises(ValueError):
+        split_component_pairs_into_tiles(component_pairs_cartesian=pairs, grouped_processed_chunks=chunks, tile_size=0)
+
+
+def test_trace_load_cache_reuses_and_evicts_traces(tmp_path):
+    from noiz.models.datachunk import ProcessedDatachunkReference
+    from noiz.processing.crosscorrelations import TraceLoadCache
+
+    references = {}
+    for cmp_id in range(3):
+        filepath = tmp_path.joinpath(f"chunk{cmp_id}.mseed")
+        obspy.Trace(data=np.full(10, cmp_id, dtype=np.float64)).write(str(filepath), format="MSEED")
+        references[cmp_id] = ProcessedDatachunkReference(id=cmp_id, component_id=cmp_id, filepath=str(filepath))
+
+    cache = TraceLoadCache(max_traces=2)
+    first = cache.load(chunks={0: references[0], 1: references[1]})
+    second = cache.load(chunks={1: references[1], 2: references[2]})
+
+    assert first[1] is second[1]
+    assert (3, 1) == (cache.misses, cache.hits)
+    np.testing.assert_array_equal(np.full(10, 2.0), second[2].data)
+
+    cache.load(chunks={0: references[0]})
+    assert 4 == cache.misses
+
+
+def test_spectra_load_cache_reuses_spectra_and_matches_cached_spectra(tmp_path):
+    from noiz.models.datachunk import ProcessedDatachunkReference
+    from noiz.processing.crosscorrelations import SpectraLoadCache, crosscorrelate_with_stored_spectra
+
+    traces, pairs = _prepare_traces_and_pairs(npts=500, component_count=3)
+    references = {}
+    for cmp_id, trace in traces.items():
+        filepath = tmp_path.joinpath(f"chunk{cmp_id}.mseed")
+        trace.write(str(filepath), format="MSEED")
+        references[cmp_id] = ProcessedDatachunkReference(id=cmp_id, component_id=cmp_id, filepath=str(filepath))
+
+    cache = SpectraLoadCache(max_spectra=3)
+    first_spectra, _ = cache.load(chunks={0: references[0], 1: references[1]}, max_lag_samples=50)
+    spectra, nfft = cache.load(chunks=references, max_lag_samples=50)
+
+    assert first_spectra[1] is spectra[1]
+    assert (3, 2) == (cache.misses, cache.hits)
+
+    ccfs = crosscorrelate_with_stored_spectra(
+        spectra=spectra, nfft=nfft, component_pairs_cartesian=pairs, max_lag_samples=50
+    )
+    expected = crosscorrelate_with_cached_spectra(traces=traces, component_pairs_cartesian=pairs, max_lag_samples=50)
+    for pair in pairs:
+        np.testing.assert_allclose(expected[pair.id], ccfs[pair.id], atol=1e-10)
+
+    cache.load(chunks={0: references[0]}, max_lag_samples=100)
+    assert 4 == cache.misses
+
+
+@pytest.mark.parametrize(
+    "npts, max_lag_samples, stored_max_lag_samples", [(1000, 100, 100), (1001, 20, 150), (64, 0, 5)]
+)
+def test_crosscorrelate_with_stored_spectra_matches_cached_spectra(npts, max_lag_samples, stored_max_lag_samples):
+    from noiz.processing.crosscorrelations import compute_lag_padded_spectra, crosscorrelate_with_stored_spectra
+
+    traces, pairs = _prepare_traces_and_pairs(npts=npts, component_count=4)
+    nfft, stored = compute_lag_padded_spectra(
+        data=np.vstack([tr.data for tr in traces.values()]), npts=npts, max_lag_samples=stored_max_lag_samples
+    )
+
+    ccfs = crosscorrelate_with_stored_spectra(
+        spectra=dict(zip(traces.keys(), stored)),
+        nfft=dict.fromkeys(traces.keys(), nfft),
+        component_pairs_cartesian=pairs,
+        max_lag_samples=max_lag_samples,
+        pair_batch_size=3,
+    )
+    expected = crosscorrelate_with_cached_spectra(
+        traces=traces, component_pairs_cartesian=pairs, max_lag_samples=max_lag_samples
+    )
+
+    assert stored.dtype == np.complex64
+    for pair in pairs:
+        assert ccfs[pair.id].shape == expected[pair.id].shape
+        np.testing.assert_allclose(ccfs[pair.id], expected[pair.id], rtol=0, atol=1e-5)
+
+
+@pytest.mark.parametrize("nfft", [100, 101])
+def test_energies_from_real_spectra(nfft):
+    from scipy import fft as sp_fft
+
+    from noiz.processing.crosscorrelations import energies_from_real_spectra
+
+    data = np.random.default_rng(2).standard_normal((3, 80))
+
+    energies = energies_from_real_spectra(spectra=sp_fft.rfft(data, n=nfft, axis=1), nfft=nfft)
+
+    np.testing.assert_allclose(energies, np.sum(data**2, axis=1), rtol=1e-12)
+
+
+def test_load_spectra_for_chunks_from_container(tmp_path):
+    from noiz.models.datachunk import ProcessedDatachunk, ProcessedDatachunkReference, ProcessedDatachunkSpectrumFile
+    from noiz.processing.crosscorrelations import load_spectra_for_chunks
+
+    spectra = (np.random.default_rng(4).standard_normal((3, 51)) + 1j).astype(np.complex64)
+    container_path = tmp_path.joinpath("spectra_container.params1.2021.001.0000.0.npy")
+    np.save(container_path, spectra)
+
+    spectrum_file = ProcessedDatachunkSpectrumFile(filepath=str(container_path), npts=80, nfft=100)
+    chunks = {
+        5: ProcessedDatachunkReference(
+            id=1,
+            component_id=5,
+            filepath="missing.mseed",
+            spectrum_filepath=str(container_path),
+            spectrum_offset=2,
+            spectrum_npts=80,
+            spectrum_nfft=100,
+        ),
+        6: ProcessedDatachunk(spectrum_file=spectrum_file, spectrum_offset=0),
+    }
+
+    loaded, nfft = load_spectra_for_chunks(chunks=chunks)
+
+    assert np.array_equal(loaded[5], spectra[2])
+    assert np.array_equal(loaded[6], spectra[0])
+    assert {5: 100, 6: 100} == nfft
+    assert 20 == chunks[5].spectrum_max_lag_samples == chunks[6].spectrum_max_lag_samples
+    assert ProcessedDatachunkReference(id=2, component_id=5, filepath="x").spectrum_max_lag_samples is None
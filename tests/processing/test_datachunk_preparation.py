@@ -2,16 +2,25 @@
 # Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
 # Copyright © 2019-2023 Contributors to the Noiz project.
 
-from datetime import timedelta
+from datetime import date, datetime, timedelta, timezone
 import numpy as np
 from noiz.models.timespan import Timespan
-from obspy import Stream
+from obspy import Stream, Trace, UTCDateTime
 import os
 import pytest
 from pandas import Timestamp
+from psycopg2.extras import NumericRange
 
-from noiz.models.processing_params import DatachunkParams
+from noiz.models.component import Component
+from noiz.models.processing_params import DatachunkParams, DatachunkResamplingMethod, DatachunkSampleDtype
+from noiz.models.timeseries import Tsindex
+from noiz.models.datachunk import Datachunk, DatachunkFile
 from noiz.processing.datachunk import (
+    calculate_datachunk_stats,
+    calculate_signal_stats,
+    create_datachunks_for_file_group,
+    find_polyphase_ratio,
+    group_datachunk_preparation_inputs_by_file,
     merge_traces_fill_zeros,
     merge_traces_under_conditions,
     _check_if_gaps_short_enough,
@@ -19,6 +28,12 @@ from noiz.processing.datachunk import (
     _pad_zeros_to_timespan,
     _interpolate_ends_to_zero_to_timespan,
     next_pow_2,
+    own_trace_data,
+    plan_datachunk_preparation,
+    precheck_data_availability,
+    predict_datachunk_availability,
+    resample_with_padding,
+    slice_stream_for_timespans,
     validate_slice,
 )
 
@@ -1000,3 +1015,332 @@ def test__check_and_remove_extra_samples_on_the_end_zero_traces():
 
     with pytest.raises(ValueError):
         _check_and_remove_extra_samples_on_the_end(st=st, expected_no_samples=10)
+
+
+def test_slice_stream_for_timespans_shares_data_until_owned():
+    header = {"sampling_rate": 2, "starttime": UTCDateTime(2016, 1, 7)}
+    day = Stream([Trace(data=np.arange(240, dtype=np.float64), header=header)])
+    original = day[0].data.copy()
+    timespans = [
+        Timespan(
+            starttime=Timestamp("2016-01-07T00:00:00.000000Z") + timedelta(seconds=30 * i),
+            midtime=Timestamp("2016-01-07T00:00:30.000000Z") + timedelta(seconds=30 * i),
+            endtime=Timestamp("2016-01-07T00:01:00.000000Z") + timedelta(seconds=30 * i),
+        )
+        for i in range(3)
+    ]
+
+    slices = list(slice_stream_for_timespans(st=day, timespans=timespans))
+
+    assert [ts for ts, _ in slices] == timespans
+    for i, (ts, sliced) in enumerate(slices):
+        assert 120 == sliced[0].stats.npts
+        assert ts.starttime == sliced[0].stats.starttime
+        assert np.shares_memory(sliced[0].data, day[0].data)
+        np.testing.assert_array_equal(original[60 * i : 60 * i + 120], sliced[0].data)
+
+    for _, sliced in slices:
+        own_trace_data(sliced)
+        assert not np.shares_memory(sliced[0].data, day[0].data)
+        sliced.detrend(type="polynomial", order=3)
+
+    np.testing.assert_array_equal(original, day[0].data)
+
+
+def test_prepare_datachunk_streams_whole_day_matches_per_datachunk_within_tolerance():
+    from noiz.processing.datachunk import prepare_datachunk_streams
+
+    sampling_rate = 50.0
+    rng = np.random.default_rng(1)
+    times = np.arange(int(2 * 3600 * sampling_rate)) / sampling_rate
+    data = sum(np.sin(2 * np.pi * f * times + rng.uniform(0, 6)) for f in rng.uniform(0.2, 5, 10))
+    data += rng.standard_normal(len(times))
+
+    day_start = Timestamp("2016-01-07T00:00:00.000000Z")
+    timespans = [
+        Timespan(
+            starttime=day_start + timedelta(minutes=15 * i),
+            midtime=day_start + timedelta(minutes=15 * i + 15),
+            endtime=day_start + timedelta(minutes=15 * i + 30),
+        )
+        for i in range(7)
+    ]
+
+    results = {}
+    for mode in ("per_datachunk", "whole_day"):
+        params = DatachunkParams(
+            sampling_rate=10,
+            prefiltering_low=0.1,
+            prefiltering_high=4,
+            remove_response=False,
+            response_constant_coefficient=None,
+            preprocessing_mode=mode,
+        )
+        header = {"sampling_rate": sampling_rate, "starttime": UTCDateTime(2016, 1, 7)}
+        st = Stream([Trace(data=data.copy(), header=header)])
+        results[mode] = {
+            ts.starttime: sliced[0].data
+            for ts, sliced, _ in prepare_datachunk_streams(
+                st=st,
+                timespans=timespans,
+                inventory=None,  # type: ignore
+                processing_params=params,
+                original_samplerate=sampling_rate,
+            )
+        }
+
+    assert results["per_datachunk"].keys() == results["whole_day"].keys()
+    assert len(timespans) == len(results["whole_day"])
+
+    edge = 60 * 10
+    for starttime, per_datachunk in results["per_datachunk"].items():
+        whole_day = results["whole_day"][starttime]
+        assert per_datachunk.shape == whole_day.shape
+        interior_difference = per_datachunk[edge:-edge] - whole_day[edge:-edge]
+        assert np.sqrt(np.mean(interior_difference**2)) < 1e-6 * np.sqrt(np.mean(whole_day[edge:-edge] ** 2))
+
+
+def _planned_component(component_id: int, letter: str) -> Component:
+    cmp = Component(
+        network="XX",
+        station="AA",
+        component=letter,
+        lat=48.58,
+        lon=7.75,
+        start_date="2020-01-01",
+        end_date="2021-01-01",
+    )
+    cmp.id = component_id
+    return cmp
+
+
+def test_plan_datachunk_preparation_skips_existing_and_missing_data():
+    components = [_planned_component(1, "Z"), _planned_component(2, "N")]
+
+    days = [date(2020, 1, 1), date(2020, 1, 2), date(2020, 1, 3)]
+    timespans = []
+    for i, day in enumerate(days):
+        for hour in (0, 12):
+            midtime = datetime(day.year, day.month, day.day, hour, 30, tzinfo=timezone.utc)
+            timespan = Timespan(
+                starttime=midtime - timedelta(minutes=30),
+                midtime=midtime,
+                endtime=midtime + timedelta(minutes=30),
+            )
+            timespan.id = 10 * (i + 1) + hour // 12
+            timespans.append(timespan)
+
+    time_series = [
+        Tsindex(
+            network="XX", station="AA", channel=f"HH{letter}", starttime=datetime(2020, 1, day, tzinfo=timezone.utc)
+        )
+        for letter in ("Z", "N")
+        for day in (1, 2)
+    ]
+    time_series.append(
+        Tsindex(network="XX", station="BB", channel="HHZ", starttime=datetime(2020, 1, 3, tzinfo=timezone.utc))
+    )
+
+    existing = [(1, 10), (1, 11), (2, 20)]
+
+    plan = list(
+        plan_datachunk_preparation(
+            components=components,
+            days=days,
+            timespans=timespans,
+            time_series=time_series,
+            existing_datachunks=existing,
+        )
+    )
+
+    assert [(1, date(2020, 1, 2)), (2, date(2020, 1, 1)), (2, date(2020, 1, 2))] == [
+        (cmp.id, day) for cmp, day, _, _ in plan
+    ]
+    assert [[20, 21], [10, 11], [21]] == [[ts.id for ts in missing] for _, _, _, missing in plan]
+    assert all(ts.channel[-1] == cmp.component and ts.starttime.day == day.day for cmp, day, ts, _ in plan)
+
+
+def test_plan_datachunk_preparation_raises_on_many_files_per_day():
+    cmp = _planned_component(1, "Z")
+    timespan = Timespan(
+        starttime=datetime(2020, 1, 1, 0),
+        midtime=datetime(2020, 1, 1, 1),
+        endtime=datetime(2020, 1, 1, 2),
+    )
+    time_series = [
+        Tsindex(network="XX", station="AA", channel="HHZ", starttime=datetime(2020, 1, 1, hour, tzinfo=timezone.utc))
+        for hour in (0, 12)
+    ]
+
+    with pytest.raises(ValueError):
+        list(
+            plan_datachunk_preparation(
+                components=[cmp], days=[date(2020, 1, 1)], timespans=[timespan], time_series=time_series
+            )
+        )
+
+
+def test_group_datachunk_preparation_inputs_by_file():
+    inputs = []
+    for component_id, letter, filename in ((1, "Z", "a.mseed"), (2, "N", "b.mseed"), (3, "E", "a.mseed")):
+        inputs.append(
+            {
+                "component": _planned_component(component_id, letter),
+                "timespans": [],
+                "time_series": Tsindex(filename=filename, channel=f"HH{letter}"),
+                "processing_params": None,
+            }
+        )
+
+    groups = group_datachunk_preparation_inputs_by_file(inputs)
+
+    assert [[1, 3], [2]] == [[member["component"].id for member in group["members"]] for group in groups]
+
+
+def test_create_datachunks_for_file_group_requires_single_file():
+    members = [
+        {
+            "component": _planned_component(component_id, "Z"),
+            "timespans": [],
+            "time_series": Tsindex(filename=filename, byteoffset=0, bytes=512),
+            "processing_params": None,
+        }
+        for component_id, filename in ((1, "a.mseed"), (2, "b.mseed"))
+    ]
+
+    with pytest.raises(ValueError):
+        create_datachunks_for_file_group(members=members)
+
+
+def test_calculate_signal_stats_matches_stats_of_written_datachunk(tmp_path):
+    data = np.random.default_rng(11).standard_normal(3000)
+    filepath = tmp_path.joinpath("datachunk.mseed")
+    Stream([Trace(data=data.copy(), header={"sampling_rate": 10.0})]).write(str(filepath), format="mseed")
+    datachunk = Datachunk(file=DatachunkFile(filepath=str(filepath)))
+    datachunk.id = 7
+
+    in_memory = calculate_signal_stats(data=data)
+    from_file = calculate_datachunk_stats(datachunk=datachunk, datachunk_file=None)
+
+    assert 7 == from_file.datachunk_id
+    assert in_memory.datachunk_id is None
+    for attribute in ("energy", "min", "max", "mean", "variance", "skewness", "kurtosis"):
+        assert getattr(from_file, attribute) == getattr(in_memory, attribute)
+
+
+@pytest.mark.parametrize(
+    ["original", "target", "expected"],
+    [(100, 25, (1, 4)), (100, 24, (6, 25)), (200, 50.0, (1, 4)), (100, 40, (2, 5)), (100, 100 / np.pi, None)],
+)
+def test_find_polyphase_ratio(original, target, expected):
+    assert expected == find_polyphase_ratio(original_sampling_rate=original, sampling_rate=target)
+
+
+@pytest.mark.parametrize(["original", "target"], [(100, 25), (100, 24)])
+def test_resample_with_padding_polyphase_preserves_in_band_signal(original, target):
+    tones = ((0.1, 0.3), (2.3, 1.2), (7.7, 2.1))
+    t = np.arange(3600 * original) / original
+    data = sum(np.sin(2 * np.pi * freq * t + phase) for freq, phase in tones)
+    data += 0.5 * np.sin(2 * np.pi * 0.45 * original * t)
+    st = Stream([Trace(data=data, header={"sampling_rate": original, "starttime": UTCDateTime(2020, 1, 1)})])
+    expected_npts = len(resample_with_padding(st=st.copy(), sampling_rate=target)[0].data)
+
+    resampled = resample_with_padding(st=st, sampling_rate=target, method=DatachunkResamplingMethod.POLYPHASE)[0]
+
+    assert target == resampled.stats.sampling_rate
+    assert UTCDateTime(2020, 1, 1) == resampled.stats.starttime
+    assert expected_npts == resampled.stats.npts
+    edge = 60 * target
+    t_out = (np.arange(resampled.stats.npts) / target)[edge:-edge]
+    reference = sum(np.sin(2 * np.pi * freq * t_out + phase) for freq, phase in tones)
+    error = np.sqrt(np.mean((resampled.data[edge:-edge] - reference) ** 2) / np.mean(reference**2))
+    assert error < 1e-2
+
+
+def test_datachunk_params_rejects_unknown_resampling_method():
+    with pytest.raises(ValueError):
+        DatachunkParams(resampling_method="linear")
+
+
+def test_datachunk_params_sample_dtype():
+    assert DatachunkSampleDtype.FLOAT64 is DatachunkParams().datachunk_sample_dtype
+    assert DatachunkSampleDtype.FLOAT32 is DatachunkParams(datachunk_sample_dtype="float32").datachunk_sample_dtype
+    with pytest.raises(ValueError):
+        DatachunkParams(datachunk_sample_dtype="int32")
+
+
+def _tsindex_with_segments(st: Stream) -> Tsindex:
+    return Tsindex(
+        samplerate=st[0].stats.sampling_rate,
+        timespans=[NumericRange(tr.stats.starttime.timestamp, tr.stats.endtime.timestamp, "[]") for tr in st],
+        timerates=None,
+    )
+
+
+def test_predict_datachunk_availability_agrees_with_validate_slice():
+    sampling_rate = 10.0
+    day_start = UTCDateTime(2016, 1, 7)
+    segments = (
+        (0, 600),  # full first timespan
+        (600.5, 1200),  # gap of 4 samples, mergeable
+        (1300, 1800),  # gap of 99 samples, not mergeable
+        (1900, 1905),  # almost no data in the fourth timespan
+    )
+    st = Stream(
+        [
+            Trace(
+                data=np.ones(int(round((end - start) * sampling_rate)) + 1),
+                header={"sampling_rate": sampling_rate, "starttime": day_start + start},
+            )
+            for start, end in segments
+        ]
+    )
+    time_series = _tsindex_with_segments(st)
+    params = DatachunkParams(
+        max_gap_for_merging=10, sampling_rate=sampling_rate, timespan_length=timedelta(minutes=10)
+    )
+
+    timespans = [
+        Timespan(
+            starttime=Timestamp(str(day_start + 600 * i)),
+            midtime=Timestamp(str(day_start + 600 * i + 300)),
+            endtime=Timestamp(str(day_start + 600 * (i + 1))),
+        )
+        for i in range(5)
+    ]
+
+    predicted = [predict_datachunk_availability(time_series, timespan, params) for timespan in timespans]
+
+    actual = []
+    for timespan, sliced in slice_stream_for_timespans(st=st, timespans=timespans):
+        try:
+            validate_slice(
+                trimmed_st=own_trace_data(sliced),
+                timespan=timespan,
+                processing_params=params,
+                original_samplerate=sampling_rate,
+            )
+            actual.append(True)
+        except ValueError:
+            actual.append(False)
+
+    assert [True, True, False, False, False] == actual
+    assert actual == predicted
+
+
+def test_precheck_data_availability_keeps_timespans_without_segment_metadata():
+    time_series = Tsindex(samplerate=10.0, timespans=None, timerates=None)
+    timespans = [
+        Timespan(
+            starttime=Timestamp("2016-01-07T00:00:00Z"),
+            midtime=Timestamp("2016-01-07T00:05:00Z"),
+            endtime=Timestamp("2016-01-07T00:10:00Z"),
+        )
+    ]
+
+    available, rejected = precheck_data_availability(
+        time_series=time_series, timespans=timespans, params=DatachunkParams(sampling_rate=10)
+    )
+
+    assert timespans == available
+    assert [] == rejected
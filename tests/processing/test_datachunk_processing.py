@@ -0,0 +1,94 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+import datetime
+
+import numpy as np
+import obspy
+import pytest
+
+from noiz.models import Datachunk, Timespan
+from noiz.models.processing_params import ProcessedDatachunkParams
+from noiz.models.type_aliases import ProcessDatachunksInputs
+from noiz.processing.datachunk_processing import (
+    _whiten_trace_with_params,
+    group_datachunk_processing_inputs,
+    process_data_2d,
+)
+from noiz.processing.whitening import get_whitening_kernels, whiten_data, whiten_trace_cached
+
+
+def _prepare_data(rows: int = 4, npts: int = 7200, sampling_rate: float = 25.0) -> np.ndarray:
+    rng = np.random.default_rng(11)
+    t = np.arange(npts) / sampling_rate
+    return rng.standard_normal((rows, npts)) + 20 * np.sin(2 * np.pi * 0.3 * t)
+
+
+def test_whiten_data_2d_matches_rows():
+    params = ProcessedDatachunkParams(filtering_low=0.1, filtering_high=3, filtering_order=4)
+    data = _prepare_data()
+    kernels = get_whitening_kernels(params=params, npts=data.shape[1], sampling_rate=25.0)
+
+    result = whiten_data(data=data, kernels=kernels, waterlevel_ratio_to_max=params.waterlevel_ratio_to_max)
+
+    for row, result_row in zip(data, result):
+        expected = whiten_data(data=row, kernels=kernels, waterlevel_ratio_to_max=params.waterlevel_ratio_to_max)
+        np.testing.assert_allclose(expected, result_row, rtol=0, atol=1e-12 * np.max(np.abs(expected)))
+
+
+@pytest.mark.parametrize("whitening_method", ["full_fft", "cached_rfft"])
+def test_process_data_2d_matches_processing_of_single_traces(whitening_method):
+    params = ProcessedDatachunkParams(
+        filtering_low=0.1, filtering_high=3, filtering_order=4, one_bit=False, whitening_method=whitening_method
+    )
+    whiten = whiten_trace_cached if whitening_method == "cached_rfft" else _whiten_trace_with_params
+    data = _prepare_data()
+
+    result = process_data_2d(data=data.copy(), params=params, sampling_rate=25.0)
+
+    for row, result_row in zip(data, result):
+        tr = whiten(obspy.Trace(data=row.copy(), header={"sampling_rate": 25.0}), params)
+        tr.filter(type="bandpass", freqmin=0.1, freqmax=3, corners=4)
+        np.testing.assert_allclose(tr.data, result_row, rtol=0, atol=1e-10 * np.max(np.abs(tr.data)))
+
+
+def test_process_data_2d_one_bit():
+    params = ProcessedDatachunkParams(filtering_low=0.1, filtering_high=3, filtering_order=4, one_bit=True)
+
+    result = process_data_2d(data=_prepare_data(), params=params, sampling_rate=25.0)
+
+    assert set(np.unique(result)) <= {-1.0, 0.0, 1.0}
+
+
+def test_group_datachunk_processing_inputs():
+    params = ProcessedDatachunkParams()
+    timespans = [
+        Timespan(
+            id=i,
+            starttime=datetime.datetime(2023, 1, 1) + datetime.timedelta(hours=12 * i),
+            midtime=datetime.datetime(2023, 1, 1, 6) + datetime.timedelta(hours=12 * i),
+            endtime=datetime.datetime(2023, 1, 1, 12) + datetime.timedelta(hours=12 * i),
+        )
+        for i in range(3)
+    ]
+    inputs = [
+        ProcessDatachunksInputs(
+            datachunk=Datachunk(component_id=component_id, timespan_id=timespan.id, timespan=timespan),
+            params=params,
+            datachunk_file=None,
+        )
+        for timespan in timespans
+        for component_id in (1, 2)
+    ]
+
+    by_timespan = group_datachunk_processing_inputs(inputs, batch_by="timespan")
+    by_component_day = group_datachunk_processing_inputs(inputs, batch_by="component_day")
+
+    assert [[1, 2]] * 3 == [[chunk.component_id for chunk in batch["datachunks"]] for batch in by_timespan]
+    assert [[0, 1], [0, 1], [2], [2]] == [
+        [chunk.timespan_id for chunk in batch["datachunks"]] for batch in by_component_day
+    ]
+    assert all(batch["params"] is params for batch in by_component_day)
+    with pytest.raises(ValueError):
+        group_datachunk_processing_inputs(inputs, batch_by="station")
@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+import io
+
+import numpy as np
+import obspy
+import pytest
+from obspy.io.mseed.util import get_record_information
+
+from noiz.exceptions import MissingDataFileException
+from noiz.processing.miniseed_helpers import read_miniseed_byte_range, read_noiz_miniseed
+
+
+def _write_multiplexed_file(path, channels=("HHZ", "HHN", "HHE"), npts=20000):
+    rng = np.random.default_rng(3)
+    st = obspy.Stream(
+        [
+            obspy.Trace(
+                data=rng.integers(-1000, 1000, npts).astype(np.int32),
+                header={
+                    "network": "XX",
+                    "station": "AA",
+                    "channel": channel,
+                    "sampling_rate": 10.0,
+                    "starttime": obspy.UTCDateTime(2020, 1, 1),
+                },
+            )
+            for channel in channels
+        ]
+    )
+    st.write(str(path), format="MSEED", reclen=512, encoding="STEIM2")
+    return st
+
+
+def _index_sections(path):
+    """Mimics mseedindex by finding byte offset, length and record start times of every channel section."""
+    sections = {}
+    offset = 0
+    filesize = path.stat().st_size
+    while offset < filesize:
+        info = get_record_information(str(path), offset)
+        section = sections.setdefault(info["channel"], {"byteoffset": offset, "bytes": 0, "timeindex": {}})
+        section["bytes"] += info["record_length"]
+        section["timeindex"][f"{info['starttime'].timestamp:.6f}"] = str(offset)
+        offset += info["record_length"]
+    return sections
+
+
+def test_read_miniseed_byte_range_decodes_only_requested_channel(tmp_path):
+    path = tmp_path.joinpath("multiplexed.mseed")
+    original = _write_multiplexed_file(path)
+    section = _index_sections(path)["HHN"]
+
+    st, stats = read_miniseed_byte_range(
+        filename=path, byteoffset=section["byteoffset"], nbytes=section["bytes"], seed_id="XX.AA..HHN"
+    )
+
+    assert 1 == len(st)
+    np.testing.assert_array_equal(original.select(channel="HHN")[0].data, st[0].data)
+    assert section["bytes"] == stats.bytes_read
+    assert stats.bytes_read < path.stat().st_size
+    assert stats.decode_time > 0
+
+
+def test_read_miniseed_byte_range_narrows_with_timeindex(tmp_path):
+    path = tmp_path.joinpath("multiplexed.mseed")
+    original = _write_multiplexed_file(path)
+    section = _index_sections(path)["HHE"]
+    starttime = obspy.UTCDateTime(2020, 1, 1, 0, 10)
+    endtime = obspy.UTCDateTime(2020, 1, 1, 0, 15)
+
+    st, stats = read_miniseed_byte_range(
+        filename=path,
+        byteoffset=section["byteoffset"],
+        nbytes=section["bytes"],
+        seed_id="XX.AA..HHE",
+        starttime=starttime,
+        endtime=endtime,
+        timeindex={**section["timeindex"], "latest": str(section["byteoffset"])},
+    )
+
+    assert stats.bytes_read < section["bytes"]
+    assert st[0].stats.starttime <= starttime
+    assert st[0].stats.endtime >= endtime
+    expected = original.select(channel="HHE").slice(starttime, endtime)[0].data
+    np.testing.assert_array_equal(expected, st.slice(starttime, endtime)[0].data)
+
+
+def test_read_miniseed_byte_range_missing_file(tmp_path):
+    with pytest.raises(MissingDataFileException):
+        read_miniseed_byte_range(filename=tmp_path.joinpath("missing.mseed"), byteoffset=0, nbytes=512)
+
+
+def _encode(st):
+    buffer = io.BytesIO()
+    st.write(buffer, format="mseed")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("dtype", (np.float64, np.float32))
+@pytest.mark.parametrize("npts", (1, 511, 45000))
+@pytest.mark.parametrize(
+    "starttime", (obspy.UTCDateTime(2023, 1, 1, 0, 30), obspy.UTCDateTime(2023, 12, 31, 23, 59, 59, 123456))
+)
+def test_read_noiz_miniseed_matches_obspy(dtype, npts, starttime):
+    tr = obspy.Trace(
+        data=np.random.default_rng(4).standard_normal(npts).astype(dtype),
+        header={"network": "TD", "station": "TD03", "location": "00", "channel": "HHZ", "sampling_rate": 25.0},
+    )
+    tr.stats.starttime = starttime
+    content = _encode(obspy.Stream([tr]))
+
+    expected = obspy.read(io.BytesIO(content), format="MSEED")[0]
+    obtained = read_noiz_miniseed(content)[0]
+
+    assert expected.id == obtained.id
+    assert expected.stats.starttime == obtained.stats.starttime
+    assert expected.stats.sampling_rate == obtained.stats.sampling_rate
+    assert expected.data.dtype == obtained.data.dtype
+    np.testing.assert_array_equal(expected.data, obtained.data)
+
+
+@pytest.mark.parametrize("shift_second_trace", (0, 1000))
+def test_read_noiz_miniseed_falls_back_to_obspy(shift_second_trace):
+    first = obspy.Trace(data=np.arange(3000, dtype=np.float64), header={"station": "AA", "sampling_rate": 10.0})
+    second = first.copy()
+    second.stats.station = "AA" if shift_second_trace else "BB"
+    second.stats.starttime += shift_second_trace
+    content = _encode(obspy.Stream([first, second]))
+
+    obtained = read_noiz_miniseed(content)
+
+    assert 2 == len(obtained)
+    np.testing.assert_array_equal(first.data, obtained[0].data)
+
+
+def test_read_noiz_miniseed_missing_file(tmp_path):
+    with pytest.raises(MissingDataFileException):
+        read_noiz_miniseed(tmp_path.joinpath("missing.mseed"))
@@ -0,0 +1,137 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+import os
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import obspy
+import pytest
+
+from noiz.processing import response
+from noiz.processing.response import ResponseCache, remove_response_with_cache
+
+INVENTORY_PATH = Path(__file__).parent.joinpath("data/inventory.xml")
+
+
+def _prepare_stream(npts: int = 3001, sampling_rate: float = 25.0) -> obspy.Stream:
+    rng = np.random.default_rng(3)
+    tr = obspy.Trace(
+        data=rng.standard_normal(npts) * 1000,
+        header={
+            "network": "TD",
+            "station": "TD03",
+            "location": "00",
+            "channel": "CHZ",
+            "sampling_rate": sampling_rate,
+            "starttime": obspy.UTCDateTime(2019, 6, 1),
+        },
+    )
+    return obspy.Stream([tr])
+
+
+@pytest.mark.parametrize("pre_filt", [None, (0.05, 0.1, 8.0, 10.0)])
+@pytest.mark.parametrize("water_level", [60, None])
+def test_remove_response_with_cache_matches_obspy(tmp_path, pre_filt, water_level):
+    inventory = obspy.read_inventory(str(INVENTORY_PATH))
+    expected = _prepare_stream().remove_response(
+        inventory, taper_fraction=0.04, water_level=water_level, pre_filt=pre_filt
+    )
+
+    cache = ResponseCache(directory=tmp_path)
+    result = remove_response_with_cache(
+        st=_prepare_stream(),
+        inventory=inventory,
+        taper_fraction=0.04,
+        water_level=water_level,
+        pre_filt=pre_filt,
+        cache=cache,
+    )
+
+    np.testing.assert_allclose(expected[0].data, result[0].data, rtol=1e-10, atol=1e-20)
+
+
+def test_response_cache_reuses_entries_in_memory_and_on_disk(tmp_path):
+    inventory = obspy.read_inventory(str(INVENTORY_PATH))
+
+    cache = ResponseCache(directory=tmp_path)
+    first = remove_response_with_cache(st=_prepare_stream(), inventory=inventory, cache=cache)
+    second = remove_response_with_cache(st=_prepare_stream(), inventory=inventory, cache=cache)
+    remove_response_with_cache(st=_prepare_stream(npts=2000), inventory=inventory, cache=cache)
+
+    assert (2, 1) == (cache.misses, cache.hits)
+    assert 2 == len(list(tmp_path.glob("*.npy")))
+    np.testing.assert_array_equal(first[0].data, second[0].data)
+
+    restarted_cache = ResponseCache(directory=tmp_path)
+    from_disk = remove_response_with_cache(st=_prepare_stream(), inventory=inventory, cache=restarted_cache)
+
+    assert (0, 1) == (restarted_cache.misses, restarted_cache.disk_hits)
+    np.testing.assert_array_equal(first[0].data, from_disk[0].data)
+
+
+def test_remove_response_with_cache_missing_response(tmp_path):
+    inventory = obspy.read_inventory(str(INVENTORY_PATH))
+    st = _prepare_stream()
+    st[0].stats.starttime = obspy.UTCDateTime(2030, 1, 1)
+
+    with pytest.raises(ValueError):
+        remove_response_with_cache(st=st, inventory=inventory, cache=ResponseCache(directory=tmp_path))
+
+
+class _InventoryComponent:
+    def __init__(self, filepath: Path):
+        self.component_file = SimpleNamespace(filepath=str(filepath))
+        self.loads = 0
+
+    def load_data(self) -> obspy.Inventory:
+        self.loads += 1
+        return obspy.read_inventory(self.component_file.filepath)
+
+
+def test_load_inventory_cached_replaces_modified_and_evicts_old(tmp_path, monkeypatch):
+    monkeypatch.setattr(response, "_INVENTORIES", OrderedDict())
+    monkeypatch.setattr(response, "_MAX_CACHED_INVENTORIES", 2)
+    components = []
+    for name in ("a", "b", "c"):
+        filepath = tmp_path.joinpath(f"{name}.xml")
+        shutil.copy(INVENTORY_PATH, filepath)
+        components.append(_InventoryComponent(filepath))
+
+    first = response.load_inventory_cached(components[0])
+    assert first is response.load_inventory_cached(components[0])
+
+    stat = Path(components[0].component_file.filepath).stat()
+    os.utime(components[0].component_file.filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert first is not response.load_inventory_cached(components[0])
+    assert 2 == components[0].loads
+    assert 1 == len(response._INVENTORIES)
+
+    response.load_inventory_cached(components[1])
+    response.load_inventory_cached(components[2])
+    assert [components[1].component_file.filepath, components[2].component_file.filepath] == list(
+        response._INVENTORIES.keys()
+    )
+
+
+def test_remove_response_with_cache_memoizes_fingerprints_of_cached_inventory(tmp_path, monkeypatch):
+    monkeypatch.setattr(response, "_INVENTORIES", OrderedDict())
+    fingerprinted = []
+    original_fingerprint_response = response.fingerprint_response
+
+    def counting_fingerprint_response(resp):
+        fingerprinted.append(resp)
+        return original_fingerprint_response(resp)
+
+    monkeypatch.setattr(response, "fingerprint_response", counting_fingerprint_response)
+    inventory = response.load_inventory_cached(_InventoryComponent(INVENTORY_PATH))
+    cache = ResponseCache(directory=tmp_path)
+
+    remove_response_with_cache(st=_prepare_stream(), inventory=inventory, cache=cache)
+    remove_response_with_cache(st=_prepare_stream(npts=2000), inventory=inventory, cache=cache)
+
+    assert 1 == len(fingerprinted)
@@ -0,0 +1,71 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+import datetime
+
+import numpy as np
+import pytest
+
+from noiz.exceptions import InconsistentDataException
+from noiz.models import StackingTimespan
+from noiz.models.crosscorrelation import CrosscorrelationCartesian, CrosscorrelationCartesianFile
+from noiz.processing.stacking import assign_items_to_stacking_timespans, sum_crosscorrelations_cartesian
+
+
+def _day(day: int, hour: int = 0) -> datetime.datetime:
+    return datetime.datetime(2020, 1, day, hour)
+
+
+def test_assign_items_to_stacking_timespans():
+    stacking_timespans = [
+        StackingTimespan(starttime=_day(3), midtime=_day(4), endtime=_day(5)),
+        StackingTimespan(starttime=_day(1), midtime=_day(2), endtime=_day(3)),
+        StackingTimespan(starttime=_day(2), midtime=_day(3), endtime=_day(4)),
+    ]
+    items = [
+        (_day(1, 1), _day(1, 2), "a"),
+        (_day(2, 23), _day(3, 1), "b"),
+        (_day(3, 0), _day(3, 1), "c"),
+        (_day(4, 23), _day(5, 1), "d"),
+        (_day(2, 0), _day(2, 1), "e"),
+    ]
+
+    assigned = list(assign_items_to_stacking_timespans(stacking_timespans=stacking_timespans, items=items))
+
+    assert [
+        (_day(1), ["a", "e"]),
+        (_day(2), ["e", "b", "c"]),
+        (_day(3), ["c"]),
+    ] == [(ts.starttime, x) for ts, x in assigned]
+
+
+def test_assign_items_to_stacking_timespans_skips_empty():
+    stacking_timespans = [StackingTimespan(starttime=_day(1), midtime=_day(2), endtime=_day(3))]
+
+    assert [] == list(assign_items_to_stacking_timespans(stacking_timespans=stacking_timespans, items=[]))
+    assert [] == list(
+        assign_items_to_stacking_timespans(
+            stacking_timespans=stacking_timespans,
+            items=[(_day(5), _day(6), "a")],
+        )
+    )
+
+
+def test_sum_crosscorrelations_cartesian_with_running_sum(tmp_path):
+    rng = np.random.default_rng(5)
+    data = rng.standard_normal((4, 21))
+    container_path = tmp_path.joinpath("ccf_container.params1.2021.001.0000.0.npy")
+    np.save(container_path, data)
+    container_file = CrosscorrelationCartesianFile(filepath=str(container_path))
+    ccfs = [CrosscorrelationCartesian(file=container_file, container_offset=i) for i in range(4)]
+
+    full_sum = sum_crosscorrelations_cartesian(ccfs=ccfs)
+    running_sum = sum_crosscorrelations_cartesian(ccfs=ccfs[:3])
+    updated_sum = sum_crosscorrelations_cartesian(ccfs=ccfs[3:], previous_sum=list(running_sum))
+
+    np.testing.assert_allclose(data.sum(axis=0), full_sum)
+    np.testing.assert_allclose(full_sum, updated_sum)
+
+    with pytest.raises(InconsistentDataException):
+        sum_crosscorrelations_cartesian(ccfs=ccfs[3:], previous_sum=running_sum[:-1])
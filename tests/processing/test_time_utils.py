@@ -5,9 +5,14 @@
 import pytest
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 
-from noiz.processing.time_utils import get_year_doy, check_if_two_timeperiods_have_any_overlap
+from noiz.processing.time_utils import (
+    check_if_two_timeperiods_have_any_overlap,
+    get_day_bounds,
+    get_year_doy,
+    get_year_doy_bounds,
+)
 from noiz.validation_helpers import validate_timestamp_as_pdtimestamp
 
 
@@ -87,3 +92,33 @@ def test_check_if_two_timeperiods_have_any_overlap(name, first_period, second_pe
         second_starttime=first_period[0],
         second_endtime=first_period[1],
     )
+
+
+@pytest.mark.parametrize(
+    "day",
+    (
+        date(2020, 2, 29),
+        datetime(2020, 2, 29, 23, 59),
+        datetime(2020, 3, 1, 0, 30, tzinfo=timezone(timedelta(hours=1))),
+    ),
+)
+def test_get_day_bounds(day):
+    start, end = get_day_bounds(day)
+
+    assert datetime(2020, 2, 29, tzinfo=timezone.utc) == start
+    assert datetime(2020, 3, 1, tzinfo=timezone.utc) == end
+
+
+@pytest.mark.parametrize("year, doy", ((2020, 60), (2020, 366), (2019, 1)))
+def test_get_year_doy_bounds(year, doy):
+    start, end = get_year_doy_bounds(year=year, doy=doy)
+
+    assert (year, doy) == get_year_doy(start)
+    assert timezone.utc == start.tzinfo
+    assert timedelta(days=1) == end - start
+
+
+@pytest.mark.parametrize("year, doy", ((2019, 366), (2020, 0)))
+def test_get_year_doy_bounds_out_of_range(year, doy):
+    with pytest.raises(ValueError):
+        get_year_doy_bounds(year=year, doy=doy)
@@ -0,0 +1,80 @@
+# SPDX-License-Identifier: CECILL-B
+# Copyright © 2015-2019 EOST UNISTRA, Storengy SAS, Damian Kula
+# Copyright © 2019-2023 Contributors to the Noiz project.
+
+import numpy as np
+import obspy
+import pytest
+
+from noiz.models.processing_params import ProcessedDatachunkParams, WhiteningMethod
+from noiz.processing.datachunk_processing import whiten_trace
+from noiz.processing.whitening import (
+    _build_whitening_kernels,
+    _moving_average_same,
+    get_whitening_kernels,
+    whiten_trace_cached,
+)
+
+
+def _prepare_trace(npts: int = 9000, sampling_rate: float = 25.0) -> obspy.Trace:
+    rng = np.random.default_rng(5)
+    t = np.arange(npts) / sampling_rate
+    data = rng.standard_normal(npts) + 20 * np.sin(2 * np.pi * 0.3 * t) + 5 * np.sin(2 * np.pi * 2.1 * t)
+    return obspy.Trace(data=data, header={"sampling_rate": sampling_rate})
+
+
+def _whiten_with_full_fft(tr: obspy.Trace, params: ProcessedDatachunkParams) -> obspy.Trace:
+    return whiten_trace(
+        tr,
+        tr.stats.sampling_rate,
+        params.waterlevel_ratio_to_max,
+        params.filtering_low,
+        params.filtering_high,
+        params.convolution_sliding_window_min_samples,
+        params.convolution_sliding_window_max_ratio_to_fmin,
+        params.convolution_sliding_window_ratio_to_bandwidth,
+        params.quefrency_filter_lowpass_pct,
+        params.quefrency_filter_taper_min_samples,
+        params.quefrency_filter_taper_length_ratio_to_length_cepstrum,
+        params.quefrency,
+    )
+
+
+@pytest.mark.parametrize("quefrency", [True, False])
+@pytest.mark.parametrize("npts", [9000, 7200, 1500])
+def test_whiten_trace_cached_matches_whiten_trace(quefrency, npts):
+    params = ProcessedDatachunkParams(
+        filtering_low=0.1, filtering_high=3, filtering_order=4, quefrency=quefrency, whitening_method="cached_rfft"
+    )
+
+    expected = _whiten_with_full_fft(_prepare_trace(npts=npts), params)
+    result = whiten_trace_cached(_prepare_trace(npts=npts), params)
+
+    np.testing.assert_allclose(expected.data, result.data, rtol=0, atol=1e-10 * np.max(np.abs(expected.data)))
+
+
+def test_whitening_kernels_are_shared_between_equal_params():
+    _build_whitening_kernels.cache_clear()
+    first = ProcessedDatachunkParams(filtering_low=0.1, filtering_high=3, filtering_order=4)
+    second = ProcessedDatachunkParams(filtering_low=0.1, filtering_high=3, filtering_order=4)
+
+    kernels = get_whitening_kernels(params=first, npts=9000, sampling_rate=25.0)
+    assert kernels is get_whitening_kernels(params=second, npts=9000, sampling_rate=25.0)
+    assert kernels is not get_whitening_kernels(params=first, npts=9001, sampling_rate=25.0)
+    assert (1, 2) == (_build_whitening_kernels.cache_info().hits, _build_whitening_kernels.cache_info().misses)
+    assert 9001 <= get_whitening_kernels(params=first, npts=9001, sampling_rate=25.0).fft_length
+
+
+@pytest.mark.parametrize(["npts", "window_length"], [(100, 10), (100, 11), (7, 3), (12, 1)])
+def test_moving_average_same_matches_convolution(npts, window_length):
+    data = np.random.default_rng(1).random(npts)
+
+    expected = np.convolve(data, np.ones(window_length), mode="same") / window_length
+
+    np.testing.assert_allclose(expected, _moving_average_same(data, window_length), rtol=1e-12)
+
+
+def test_processed_datachunk_params_rejects_unknown_whitening_method():
+    assert WhiteningMethod.FULL_FFT is ProcessedDatachunkParams().whitening_method
+    with pytest.raises(ValueError):
+        ProcessedDatachunkParams(whitening_method="wavelet")